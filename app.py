@@ -6,8 +6,27 @@ import logging
 import time
 import shutil
 import uuid
+import sqlite3
+import json
+import socket
+import collections
+import tempfile
+import base64
+import binascii
+import fcntl
+import hashlib
+import re
+import stat
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import math # <<<--- প্রস্থ গণনার জন্য math.floor ব্যবহার করা যেতে পারে
-from flask import Flask, render_template, send_from_directory, abort, Response, request, redirect, url_for, flash
+from werkzeug.http import http_date
+from flask import Flask, render_template, abort, Response, request, redirect, url_for, flash, jsonify, Request, send_file
+# শেয়ার করা জব ডাটাবেসের কানেকশন ও জবের অবস্থার নাম (jobstore.py)
+from jobstore import (JOBS_DB_PATH, JOB_STATE_QUEUED, JOB_STATE_PROCESSING, JOB_STATE_READY, JOB_STATE_ERROR,
+                      JOB_STATE_ALIAS, JOB_STATE_EVICTED, get_db, get_job)
+import metrics # কাউন্টার, হিস্টোগ্রাম ও /metrics (metrics.py)
+import storage # ডিস্ক ব্যবহারের হিসাব, বাজেট ও সরানো আউটপুট আবার তৈরি (storage.py)
 
 # === Logging Configuration ===
 # লগিং কনফিগারেশন: অ্যাপ্লিকেশন এবং প্রসেসিংয়ের ধাপগুলো লগ করার জন্য
@@ -32,12 +51,12 @@ HLS_DIR = os.path.join(STATIC_DIR, 'hls') # জেনারেট করা HLS
 ALLOWED_EXTENSIONS = {'mp4', 'mov', 'avi', 'mkv', 'webm'} # অনুমোদিত ভিডিও ফাইলের এক্সটেনশন
 SOURCE_VIDEO_BASENAME = "source" # প্রতিটি ভিডিওর আপলোড করা মূল ফাইলের বেস নাম
 MASTER_PLAYLIST_NAME = "master.m3u8" # মাস্টার HLS প্লেলিস্টের ফাইলের নাম
+MEDIA_INFO_FILENAME = "media.json" # সোর্স ভিডিওর পাশে ক্যাশ করা ffprobe তথ্যের ফাইলের নাম
+TRANSCODE_STATE_FILENAME = ".transcode.json" # HLS ডিরেক্টরিতে পরিকল্পিত ও সম্পন্ন রেজোলিউশনের তথ্য (পরের চেষ্টায় আউটপুট আবার ব্যবহারের জন্য)
 
-# State filenames (relative to each video's HLS directory)
-# প্রতিটি ভিডিওর অবস্থা নির্দেশক ফাইলের নাম
-PROCESSING_LOCK_FILENAME = ".processing.lock" # প্রসেসিং চললে এই ফাইল থাকবে
-HLS_READY_FILENAME = ".hls_ready" # প্রসেসিং সফল হলে এই ফাইল থাকবে
-PROCESSING_ERROR_FILENAME = ".processing.error" # প্রসেসিং ব্যর্থ হলে এই ফাইল থাকবে
+# Legacy state marker (relative to each video's HLS directory)
+# জব স্টোর চালু হওয়ার আগে প্রসেস হওয়া ভিডিওগুলোর রেডি মার্কার ফাইল (শুধুমাত্র পুরনো ভিডিও চেনার জন্য)
+LEGACY_HLS_READY_FILENAME = ".hls_ready"
 
 # Define desired output resolutions and bitrates (height, video_bitrate, audio_bitrate)
 # কাঙ্ক্ষিত আউটপুট রেজোলিউশন ও বিটরেট
@@ -46,7 +65,128 @@ RESOLUTIONS = [
     (480, '1400k', '128k'),   # 480p, 1400kbps ভিডিও, 128kbps অডিও
     (720, '2800k', '128k')    # 720p, 2800kbps ভিডিও, 128kbps অডিও
 ]
+# Per-title ladder: candidate rungs (height, min video bitrate, max video bitrate, audio bitrate)
+# প্রতি ভিডিওর জটিলতা বিশ্লেষণ করে এই সিঁড়ি থেকে রেজোলিউশন ও বিটরেট বাছাই হয় (plan_per_title_ladder দেখুন);
+# বন্ধ থাকলে বা বিশ্লেষণ ব্যর্থ হলে সব ভিডিওতে উপরের RESOLUTIONS
+PER_TITLE_LADDER = os.environ.get('PER_TITLE_LADDER', '1') != '0'
+LADDER_RUNGS = [
+    (360, '200k', '1200k', '96k'),
+    (480, '300k', '2000k', '128k'),
+    (720, '600k', '4000k', '128k'),
+    (1080, '1200k', '7000k', '160k'),
+    (1440, '2500k', '12000k', '160k'),
+    (2160, '4500k', '20000k', '160k'),
+]
+VIDEO_CRF = int(os.environ.get('VIDEO_CRF', 23)) # সব ভিডিও এনকোডের গুণমান; বিটরেট শুধু সর্বোচ্চ সীমা (capped CRF)
+LADDER_PROBE_HEIGHTS = (240, 480) # জটিলতা বিশ্লেষণের নমুনা এই উচ্চতাগুলোতে এনকোড হয় (সোর্সের চেয়ে বড়গুলো বাদ)
+LADDER_SAMPLE_COUNT = 4 # ভিডিওর সমান দূরত্বে কয়টি নমুনা নেওয়া হবে
+LADDER_SAMPLE_SECONDS = 4 # প্রতিটি নমুনার দৈর্ঘ্য (সেকেন্ড)
+LADDER_PIXEL_EXPONENT = 0.75 # একটি উচ্চতাতেই মাপা গেলে: পিক্সেল দ্বিগুণ হলে একই গুণমানে বিটরেট প্রায় 2^0.75 গুণ
+LADDER_EXPONENT_RANGE = (0.3, 1.5) # দুই উচ্চতার মাপ থেকে নির্ণয় করা exponent এর সীমা
+LADDER_PEAK_HEADROOM = 1.5 # গড় বিটরেটের অনুমানের উপরে সর্বোচ্চ সীমা (দৃশ্যভেদে ওঠানামার জন্য)
 FFMPEG_TIMEOUT = 1800 # প্রতিটি ffmpeg কমান্ডের জন্য সর্বোচ্চ সময় (সেকেন্ডে), 30 মিনিট
+# ট্রান্সকোডিং মোড: 'single_pass' (একবার ডিকোড করে সব রেজোলিউশন একই ffmpeg প্রসেসে),
+# 'parallel' (প্রতিটি রেজোলিউশনের জন্য আলাদা ffmpeg, সবগুলো একসাথে), 'per_rendition' (আলাদা ffmpeg, একটার পর একটা)
+# অথবা 'chunked' (ভিডিওকে কীফ্রেমে টুকরো করে প্রতিটি টুকরো আলাদা ffmpeg এ একসাথে এনকোড, পরে জোড়া লাগানো)
+TRANSCODE_MODE = os.environ.get('TRANSCODE_MODE', 'single_pass')
+HLS_SEGMENT_SECONDS = 6 # প্রতিটি HLS সেগমেন্টের দৈর্ঘ্য (সেকেন্ড)
+# সেগমেন্টের ধরন: 'mpegts' (.ts, সবচেয়ে পুরনো প্লেয়ারেও চলে) অথবা 'fmp4' (CMAF .m4s, কম মাক্সিং ওভারহেড)
+HLS_SEGMENT_TYPE = 'fmp4' if os.environ.get('HLS_SEGMENT_TYPE', 'mpegts').lower() == 'fmp4' else 'mpegts'
+# প্রতিটি রেজোলিউশনের সব সেগমেন্ট একটি ফাইলে রাখা হবে (প্লেলিস্টে EXT-X-BYTERANGE); শত শত ছোট ফাইলের বদলে একটি
+HLS_SINGLE_FILE = os.environ.get('HLS_SINGLE_FILE', '0') == '1'
+# অডিও প্রতিটি রেজোলিউশনে আলাদা করে এনকোড ও মাক্স না করে একবারই একটি অডিও-রেন্ডিশনে এনকোড হবে
+# (মাস্টার প্লেলিস্টে EXT-X-MEDIA ও AUDIO=), আর রেজোলিউশনগুলো হবে শুধু ভিডিও
+HLS_SHARED_AUDIO = os.environ.get('HLS_SHARED_AUDIO', '0') == '1'
+SHARED_AUDIO_BITRATE = os.environ.get('SHARED_AUDIO_BITRATE', '128k') # শেয়ার করা অডিও-রেন্ডিশনের বিটরেট
+SHARED_AUDIO_NAME = 'audio' # অডিও-রেন্ডিশনের ডিরেক্টরির নাম (রেজোলিউশনের নামের মতো)
+SHARED_AUDIO_GROUP = 'audio' # মাস্টার প্লেলিস্টে অডিও গ্রুপের GROUP-ID
+# দেওয়া থাকলে এর চেয়ে লম্বা ভিডিও যেকোনো মোডেই টুকরো করে এনকোড হবে; ডিফল্ট 0 = শুধু TRANSCODE_MODE='chunked' হলে
+CHUNKED_MIN_DURATION = float(os.environ.get('CHUNKED_MIN_DURATION', 0))
+CHUNK_TARGET_SECONDS = int(os.environ.get('CHUNK_TARGET_SECONDS', 120)) # প্রতিটি টুকরোর সর্বোচ্চ লক্ষ্য দৈর্ঘ্য (সেকেন্ড)
+CHUNK_MIN_SECONDS = 30 # এর চেয়ে ছোট টুকরো করা হবে না (প্রতিটি টুকরোর শুরুতে কিছু বাড়তি খরচ আছে)
+CHUNK_ENCODER_THREADS = int(os.environ.get('CHUNK_ENCODER_THREADS', 2)) # প্রতিটি টুকরোর ffmpeg কতগুলো থ্রেড পাবে (কম থ্রেডে libx264 বেশি দক্ষ)
+PASSTHROUGH_ENABLED = os.environ.get('PASSTHROUGH_ENABLED', '1') != '0' # সোর্স কোনো রেজোলিউশনের সাথে মিলে গেলে রি-এনকোড না করে কপি করা হবে
+PASSTHROUGH_MAX_BITRATE_FACTOR = 1.5 # পাসথ্রুর জন্য সোর্সের ভিডিও বিটরেট রেজোলিউশনের বিটরেটের সর্বোচ্চ কত গুণ হতে পারে
+PASSTHROUGH_H264_PROFILES = {'Constrained Baseline', 'Baseline', 'Main', 'High'} # সব প্লেয়ারে চলে এমন H.264 প্রোফাইল
+PASSTHROUGH_PIX_FMTS = {'yuv420p', 'yuvj420p'} # 8-bit 4:2:0
+PROGRESSIVE_PUBLISH = os.environ.get('PROGRESSIVE_PUBLISH', '1') != '0' # ট্রান্সকোডিং চলাকালীনই HLS প্রকাশ করা হবে (event প্লেলিস্ট)
+PROGRESSIVE_MIN_SEGMENTS = 2 # একটি রেজোলিউশনের কতগুলো সেগমেন্ট তৈরি হলে সেটি মাস্টার প্লেলিস্টে যোগ হবে
+PROGRESSIVE_POLL_INTERVAL = 1.0 # আগাম প্রকাশের জন্য কত সেকেন্ড পরপর রেজোলিউশন প্লেলিস্ট পরীক্ষা করা হবে
+FFMPEG_STDERR_LINES = 200 # ffmpeg এর stderr থেকে শুধু শেষ এতগুলো লাইন মেমরিতে রাখা হবে
+PROGRESS_UPDATE_INTERVAL = 1.0 # প্রতিটি ffmpeg এর অগ্রগতি কত সেকেন্ড পরপর জব স্টোরে লেখা হবে
+SSE_POLL_INTERVAL = 1.0 # লাইভ স্ট্যাটাসের জন্য জব স্টোর কত সেকেন্ড পরপর পড়া হবে (প্রতি প্রসেসে একবার)
+SSE_HEARTBEAT_INTERVAL = 15 # অলস SSE সংযোগে কত সেকেন্ড পরপর keepalive পাঠানো হবে
+SSE_RETRY_MS = 3000 # সংযোগ ভাঙলে ব্রাউজার কত মিলিসেকেন্ড পরে আবার যুক্ত হবে
+FFMPEG_CPU_CORES = int(os.environ.get('FFMPEG_CPU_CORES', os.cpu_count() or 1)) # ffmpeg এনকোডের জন্য মোট কতগুলো কোর ভাগ করা হবে
+
+# Job queue settings
+# জব কিউ সেটিংস: সব gunicorn ওয়ার্কার প্রসেস মিলিয়ে প্রযোজ্য (জব ডাটাবেসের পাথ JOBS_DB_PATH, jobstore.py তে)
+TRANSCODE_WORKERS = int(os.environ.get('TRANSCODE_WORKERS', max(1, (os.cpu_count() or 1) // 2))) # প্রতি হোস্টে একসাথে সর্বোচ্চ কতগুলো জব চলবে
+# ওয়েব প্রসেসের (gunicorn) ভিতরেই ট্রান্সকোডিং ওয়ার্কার থ্রেড চলবে কিনা; আলাদা worker.py চালালে 0 দিন, তখন ওয়েব শুধু কিউতে যোগ করে
+RUN_EMBEDDED_WORKERS = os.environ.get('RUN_EMBEDDED_WORKERS', '1') != '0'
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 90)) # হার্টবিট না এলে কত সেকেন্ড পরে জবটি অন্য ওয়ার্কার নিতে পারবে
+JOB_HEARTBEAT_INTERVAL = max(1, min(15, JOB_LEASE_SECONDS // 3)) # চলমান জবের লিজ কত সেকেন্ড পরপর নবায়ন করা হবে (এবং মেয়াদোত্তীর্ণ লিজ খোঁজা হবে)
+JOB_QUEUE_MAX = int(os.environ.get('JOB_QUEUE_MAX', 50)) # কিউতে সর্বোচ্চ কতগুলো জব অপেক্ষা করতে পারবে
+JOB_DEFAULT_PRIORITY = 0 # বড় সংখ্যা = আগে প্রসেস হবে; একই অগ্রাধিকারে FIFO
+JOB_POLL_INTERVAL = 2 # অলস ওয়ার্কার কত সেকেন্ড পরপর কিউ পরীক্ষা করবে
+QUEUE_FULL_RETRY_AFTER = 30 # কিউ পূর্ণ থাকলে ক্লায়েন্টকে কত সেকেন্ড পরে চেষ্টা করতে বলা হবে
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3)) # প্রসেস মারা গেলে বা ট্রান্সকোডিং ব্যর্থ হলে একটি জব সর্বোচ্চ কতবার চেষ্টা করা হবে
+JOB_RETRY_BACKOFF = int(os.environ.get('JOB_RETRY_BACKOFF', 30)) # প্রথম ব্যর্থতার কত সেকেন্ড পরে আবার চেষ্টা হবে (প্রতিবার দ্বিগুণ)
+JOB_RETRY_BACKOFF_MAX = 900 # পুনরায় চেষ্টার আগে সর্বোচ্চ অপেক্ষা (সেকেন্ড)
+RESUME_MIN_SECONDS = 30 # আগের চেষ্টায় অন্তত এতটুকু তৈরি হয়ে থাকলে রেজোলিউশনটি শুরু থেকে না করে সেখান থেকে চালিয়ে যাওয়া হবে
+HOSTNAME = socket.gethostname() # জবের মালিক প্রসেস কোন হোস্টে চলছে তা চেনার জন্য
+
+# Upload settings
+# আপলোড সেটিংস: ফর্ম আপলোড এবং টুকরো টুকরো (রিজিউমেবল) আপলোড
+UPLOAD_INCOMING_DIR = os.path.join(UPLOAD_DIR, '.incoming') # ফর্ম আপলোড চলাকালীন অস্থায়ী ফাইল (UPLOAD_DIR এর একই ফাইলসিস্টেমে)
+UPLOAD_CHUNK_SIZE = 1024 * 1024 # রিকোয়েস্ট বডি থেকে একবারে কত বাইট পড়ে ডিস্কে লেখা হবে
+DEDUP_ENABLED = os.environ.get('DEDUP_ENABLED', '1') != '0' # একই কনটেন্টের ভিডিও আবার আপলোড হলে নতুন করে ট্রান্সকোড না করা
+CONTENT_HASH_ALGORITHM = 'sha256' # ডুপ্লিকেট চেনার জন্য কনটেন্ট হ্যাশ
+MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 20 * 1024 ** 3)) # একটি আপলোডের সর্বোচ্চ আকার (বাইটে), ডিফল্ট 20 GiB
+FORM_UPLOAD_OVERHEAD = 64 * 1024 # ফর্ম আপলোডে multipart বাউন্ডারি ও হেডারের জন্য অতিরিক্ত অনুমোদিত বাইট
+# Flask নিজেই এর বড় রিকোয়েস্ট বডি 413 দিয়ে প্রত্যাখ্যান করবে (ফর্ম আপলোড ও PATCH দুটোতেই)
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE + FORM_UPLOAD_OVERHEAD
+TUS_VERSION = "1.0.0" # সমর্থিত tus রিজিউমেবল আপলোড প্রোটোকল ভার্সন
+UPLOAD_EXPIRY_SECONDS = int(os.environ.get('UPLOAD_EXPIRY_SECONDS', 24 * 3600)) # শেষ টুকরোর কত সেকেন্ড পরে অসম্পূর্ণ আপলোড মুছে যাবে (0 = কখনো না)
+
+# HLS serving settings
+# HLS সার্ভিং সেটিংস: ফাইলের তথ্যের ক্যাশ, প্রক্সিকে বাইট পাঠানোর দায়িত্ব এবং ব্রাউজার/CDN ক্যাশ হেডার
+HLS_CACHE_MAX_ENTRIES = int(os.environ.get('HLS_CACHE_MAX_ENTRIES', 4096)) # প্রতি প্রসেসে সর্বোচ্চ কতগুলো ফাইলের তথ্য মেমরিতে থাকবে (0 = ক্যাশ বন্ধ)
+HLS_CACHE_TTL = float(os.environ.get('HLS_CACHE_TTL', 2)) # ক্যাশ করা তথ্য কত সেকেন্ড পর্যন্ত আবার পরীক্ষা ছাড়া ব্যবহার হবে
+HLS_PLAYLIST_CACHE_MAX_BYTES = 256 * 1024 # এর চেয়ে ছোট প্লেলিস্টের কনটেন্টও মেমরিতে রাখা হবে
+# '' = অ্যাপ নিজে ফাইল পাঠাবে, 'x-accel' = nginx X-Accel-Redirect, 'x-sendfile' = Apache/lighttpd X-Sendfile
+HLS_SENDFILE_MODE = os.environ.get('HLS_SENDFILE_MODE', '').lower()
+# x-accel মোডে nginx এর internal location, যেমন: location /protected-hls/ { internal; alias /app/static/hls/; }
+HLS_X_ACCEL_PREFIX = os.environ.get('HLS_X_ACCEL_PREFIX', '/protected-hls/')
+HLS_SEGMENT_MAX_AGE = 31536000 # সেগমেন্ট কখনো বদলায় না: এক বছর, immutable
+HLS_PLAYLIST_MAX_AGE = 2 # প্লেলিস্ট প্রসেসিং চলাকালীন বদলাতে পারে, তাই অল্প সময়
+HLS_GROWING_FILE_SECONDS = 30 # এর চেয়ে সম্প্রতি বদলানো মিডিয়া ফাইল এখনও বাড়তে পারে (একক ফাইল মোড), তাই প্লেলিস্টের মতো অল্প সময় ক্যাশ
+HLS_RANGE_READ_SIZE = 256 * 1024 # বাইট-রেঞ্জ রেসপন্সে একবারে কত বাইট পড়ে পাঠানো হবে
+HLS_MIMETYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'video/mp4',
+    '.m4a': 'audio/mp4',
+    '.aac': 'audio/aac',
+    '.vtt': 'text/vtt',
+    '.jpg': 'image/jpeg',
+}
+
+# Preview settings
+# প্রিভিউ সেটিংস: পোস্টার, সিক-প্রিভিউ থাম্বনেইলের স্প্রাইট শিট ও WebVTT ট্র্যাক, ট্রান্সকোডিংয়ের ডিকোড থেকেই তৈরি হয়
+PREVIEWS_ENABLED = os.environ.get('PREVIEWS_ENABLED', '1') != '0'
+PREVIEWS_DIRNAME = 'thumbnails' # HLS ডিরেক্টরির ভিতরে প্রিভিউ ফাইলের ডিরেক্টরি
+POSTER_FILENAME = 'poster.jpg'
+THUMBNAILS_VTT_FILENAME = 'thumbnails.vtt'
+THUMBNAIL_INTERVAL = int(os.environ.get('THUMBNAIL_INTERVAL', 5)) # কত সেকেন্ড পরপর একটি থাম্বনেইল
+THUMBNAIL_WIDTH = 160 # থাম্বনেইলের প্রস্থ (উচ্চতা সোর্সের অনুপাতে)
+THUMBNAIL_SPRITE_GRID = (10, 10) # প্রতিটি স্প্রাইট শিটে কলাম x সারি
+POSTER_MAX_WIDTH = 1280 # পোস্টারের সর্বোচ্চ প্রস্থ (সোর্স ছোট হলে সোর্সের প্রস্থ)
+POSTER_POSITION = 0.1 # ভিডিওর কত অংশে পোস্টারের ফ্রেম নেওয়া হবে (শুরুর কালো ফ্রেম এড়াতে)
+
+# স্টোরেজ লাইফসাইকেলের সেটিংস (SOURCE_RETENTION, STORAGE_BUDGET_BYTES ইত্যাদি) storage.py তে
+# মেট্রিক্সের সেটিংস (METRICS_ENABLED, METRICS_FLUSH_INTERVAL) metrics.py তে
 
 # === Helper Functions ===
 # সহায়ক ফাংশনসমূহ
@@ -73,47 +213,145 @@ def check_command(command_name):
         logging.error(f"{command_name} পরীক্ষা ব্যর্থ: {e}")
         return False
 
-def get_video_dimensions(video_path):
-    """ffprobe ব্যবহার করে ভিডিওর প্রস্থ (width) এবং উচ্চতা (height) বের করে।"""
-    # প্রথমে ffprobe আছে কিনা তা নিশ্চিত করুন
-    if not check_command('ffprobe'):
-        logging.error("ভিডিওর ডাইমেনশন পেতে ffprobe প্রয়োজন কিন্তু এটি উপলব্ধ নেই।")
-        return None, None
+_tool_availability = {} # প্রতি প্রসেসে একবার পরীক্ষা করা কমান্ডের ফলাফল (কমান্ড -> True/False)
+
+def tool_available(command_name):
+    """কমান্ডটি উপলব্ধ কিনা তা রিটার্ন করে; প্রতি প্রসেসে শুধু প্রথমবার '-version' চালিয়ে পরীক্ষা করা হয়।"""
+    if command_name not in _tool_availability:
+        _tool_availability[command_name] = check_command(command_name)
+    return _tool_availability[command_name]
+
+def _parse_rate(value):
+    """ffprobe এর '30000/1001' ধরনের ফ্রেম রেট ভগ্নাংশকে float এ রূপান্তর করে।"""
+    try:
+        num, _, den = str(value).partition('/')
+        rate = float(num) / float(den or 1)
+        return round(rate, 3) if rate > 0 else None
+    except (ValueError, ZeroDivisionError):
+        return None
+
+def _parse_number(value, cast=float):
+    """ffprobe এর স্ট্রিং মান ('N/A' সহ) সংখ্যায় রূপান্তর করে; না পারলে None।"""
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+def _stream_rotation(stream):
+    """ভিডিও স্ট্রিমের রোটেশন (ডিগ্রিতে, 0/90/180/270) বের করে; পুরনো 'rotate' ট্যাগ ও নতুন display matrix দুটোই দেখা হয়।"""
+    rotation = _parse_number(stream.get('tags', {}).get('rotate'))
+    if rotation is None:
+        for side_data in stream.get('side_data_list', []):
+            if 'rotation' in side_data:
+                rotation = _parse_number(side_data['rotation'])
+                break
+    return int(round(rotation or 0)) % 360
+
+def probe_media(video_path):
+    """একটি মাত্র ffprobe JSON কল দিয়ে ভিডিওর সব প্রয়োজনীয় তথ্য বের করে; ব্যর্থ হলে None।
+
+    ডাইমেনশন রোটেশন অনুযায়ী প্রদর্শনের দিক ধরে দেওয়া হয় (ffmpeg ডিফল্টভাবে অটো-রোটেট করে)।
+    """
+    if not tool_available('ffprobe'):
+        logging.error("ভিডিওর তথ্য পেতে ffprobe প্রয়োজন কিন্তু এটি উপলব্ধ নেই।")
+        return None
 
-    # ffprobe কমান্ড তৈরি করুন
     command = [
         'ffprobe',
-        '-v', 'error',               # শুধুমাত্র ত্রুটি দেখান
-        '-select_streams', 'v:0',    # প্রথম ভিডিও স্ট্রিম নির্বাচন করুন
-        '-show_entries', 'stream=width,height', # প্রস্থ ও উচ্চতা দেখান
-        '-of', 'csv=s=x:p=0',         # আউটপুট ফরম্যাট: widthxheight
-        video_path                   # ইনপুট ভিডিও ফাইলের পাথ
+        '-v', 'error',             # শুধুমাত্র ত্রুটি দেখান
+        '-print_format', 'json',   # JSON আউটপুট
+        '-show_format',            # কন্টেইনারের তথ্য (দৈর্ঘ্য, বিটরেট)
+        '-show_streams',           # সব স্ট্রিমের তথ্য (কোডেক, ডাইমেনশন, অডিও)
+        video_path
     ]
     try:
-        # কমান্ডটি চালান
         result = subprocess.run(command, check=True, capture_output=True, text=True, timeout=30)
-        output = result.stdout.strip() # আউটপুট থেকে অতিরিক্ত স্পেস বাদ দিন
-        # আউটপুট পার্স করুন
-        if 'x' in output:
-            width, height = map(int, output.split('x')) # প্রস্থ ও উচ্চতা বের করুন
-            logging.info(f"ভিডিওর ডাইমেনশন সনাক্ত করা হয়েছে ({os.path.basename(video_path)}): {width}x{height}")
-            return width, height
-        else:
-            # যদি আউটপুট প্রত্যাশিত ফরম্যাটে না থাকে
-            logging.error(f"ffprobe আউটপুট থেকে ডাইমেনশন পার্স করা যায়নি: '{output}'")
-            return None, None
+        probe = json.loads(result.stdout or '{}')
     except subprocess.CalledProcessError as e:
-        # যদি ffprobe কমান্ড ব্যর্থ হয়
-        logging.error(f"ffprobe ব্যর্থ হয়েছে ({video_path}, return code {e.returncode}): {e.stderr}")
-        return None, None
-    except FileNotFoundError:
-        # যদি ffprobe কমান্ড খুঁজে না পাওয়া যায়
-        logging.error("ডাইমেনশন পাওয়ার সময় ffprobe কমান্ড খুঁজে পাওয়া যায়নি।")
-        return None, None
-    except Exception as e:
-        # অন্যান্য অপ্রত্যাশিত ত্রুটি
-        logging.error(f"ভিডিও ডাইমেনশন পেতে ত্রুটি ({video_path}): {e}", exc_info=True)
-        return None, None
+        logging.error(f"ffprobe ব্যর্থ হয়েছে ({video_path}, return code {e.returncode}): {e.stderr}")
+        return None
+    except (FileNotFoundError, subprocess.TimeoutExpired, ValueError) as e:
+        logging.error(f"ffprobe দিয়ে ভিডিওর তথ্য পাওয়া যায়নি ({video_path}): {e}")
+        return None
+
+    streams = probe.get('streams', [])
+    fmt = probe.get('format', {})
+    video = next((s for s in streams if s.get('codec_type') == 'video'
+                  and not s.get('disposition', {}).get('attached_pic')), None) # কভার আর্ট বাদ দিন
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+    if video is None:
+        logging.error(f"ফাইলে কোনো ভিডিও স্ট্রিম পাওয়া যায়নি: {video_path}")
+        return None
+
+    width, height = _parse_number(video.get('width'), int), _parse_number(video.get('height'), int)
+    rotation = _stream_rotation(video)
+    if rotation in (90, 270) and width and height:
+        width, height = height, width # প্রদর্শনের দিক অনুযায়ী
+    duration = _parse_number(fmt.get('duration')) or _parse_number(video.get('duration'))
+
+    media = {
+        'width': width,
+        'height': height,
+        'rotation': rotation,
+        'duration': round(duration, 3) if duration else None,
+        'format_name': fmt.get('format_name'),
+        'bit_rate': _parse_number(fmt.get('bit_rate'), int),
+        'video_codec': video.get('codec_name'),
+        'video_profile': video.get('profile'),
+        'pix_fmt': video.get('pix_fmt'),
+        'frame_rate': _parse_rate(video.get('avg_frame_rate')) or _parse_rate(video.get('r_frame_rate')),
+        'video_bit_rate': _parse_number(video.get('bit_rate'), int),
+        'has_audio': audio is not None,
+        'audio_codec': audio.get('codec_name') if audio else None,
+        'audio_channels': _parse_number(audio.get('channels'), int) if audio else None,
+        'audio_sample_rate': _parse_number(audio.get('sample_rate'), int) if audio else None,
+        'audio_bit_rate': _parse_number(audio.get('bit_rate'), int) if audio else None,
+    }
+    logging.info(f"ভিডিওর তথ্য সনাক্ত করা হয়েছে ({os.path.basename(video_path)}): {width}x{height}, "
+                 f"{media['video_codec']}/{media['audio_codec'] or 'অডিও নেই'}, দৈর্ঘ্য: {media['duration']}s")
+    return media
+
+def media_info_path(video_path):
+    """সোর্স ভিডিওর পাশে ক্যাশ করা মিডিয়া তথ্যের (media.json) পাথ।"""
+    return os.path.join(os.path.dirname(video_path), MEDIA_INFO_FILENAME)
+
+def read_media_info(video_path):
+    """ক্যাশ করা মিডিয়া তথ্য পড়ে; ফাইল না থাকলে বা সোর্স ফাইল বদলে গেলে None (ffprobe চালায় না)।"""
+    try:
+        with open(media_info_path(video_path)) as f:
+            media = json.load(f)
+        st = os.stat(video_path)
+    except (OSError, ValueError):
+        return None
+    if media.get('source_size') != st.st_size or media.get('source_mtime') != st.st_mtime:
+        return None # সোর্স ফাইল বদলে গেছে, আবার probe করতে হবে
+    return media
+
+def get_media_info(video_path):
+    """ভিডিওর মিডিয়া তথ্য রিটার্ন করে: ক্যাশ থাকলে সেখান থেকে, নইলে একবার ffprobe চালিয়ে সোর্সের পাশে সেভ করে।"""
+    media = read_media_info(video_path)
+    if media is not None:
+        return media
+    probe_started = time.monotonic()
+    media = probe_media(video_path)
+    metrics.observe('transcode_stage_seconds', time.monotonic() - probe_started, stage='probe')
+    if media is None:
+        return None
+    st = os.stat(video_path)
+    media.update(source_size=st.st_size, source_mtime=st.st_mtime, probed_at=time.time())
+    write_media_info(video_path, media)
+    return media
+
+def write_media_info(video_path, media):
+    """মিডিয়া তথ্য সোর্সের পাশে ক্যাশ ফাইলে লেখে (ব্যর্থ হলে শুধু সতর্কবার্তা)।"""
+    cache_path = media_info_path(video_path)
+    try:
+        # অর্ধেক লেখা ফাইল যেন কেউ না পড়ে, তাই অস্থায়ী ফাইলে লিখে rename করুন
+        with open(cache_path + '.tmp', 'w') as f:
+            json.dump(media, f, indent=2)
+        os.replace(cache_path + '.tmp', cache_path)
+    except OSError as e:
+        logging.warning(f"মিডিয়া তথ্য ক্যাশ করা যায়নি ({cache_path}): {e}")
 
 def allowed_file(filename):
     """আপলোড করা ফাইলের এক্সটেনশন অনুমোদিত কিনা তা পরীক্ষা করে।"""
@@ -143,233 +381,2472 @@ def clear_hls_directory_contents(directory_path):
         # যদি ডিরেক্টরির তালিকা পেতে বা মুছতে সমস্যা হয়
         logging.error(f"ডিরেক্টরি তালিকাভুক্ত বা পরিষ্কার করা যায়নি {directory_path}: {e}")
 
-# === Core Processing Functions ===
-# মূল প্রসেসিং ফাংশনসমূহ
-
-def transcode_to_hls(video_id, input_path, output_base_dir, resolutions):
-    """ভিডিওকে HLS ফরম্যাটে ট্রান্সকোড করে এবং মাস্টার প্লেলিস্টে সঠিক রেজোলিউশন ব্যবহার করে।"""
-    error_file_path = os.path.join(output_base_dir, PROCESSING_ERROR_FILENAME) # ত্রুটি ফাইলের পাথ
-
-    # --- মূল ভিডিওর ডাইমেনশন পান ---
-    original_width, original_height = get_video_dimensions(input_path)
-    if not original_width or not original_height:
-        # যদি ডাইমেনশন না পাওয়া যায়, ত্রুটি লগ করুন এবং ব্যর্থ হোন
-        error_msg = f"[{video_id}] ভিডিও ডাইমেনশন পাওয়া যায়নি ({input_path})। ট্রান্সকোডিং সম্ভব নয়।"
-        logging.error(error_msg)
+def parse_ffmpeg_progress(fields, duration):
+    """ffmpeg -progress এর একটি ব্লক (key=value) থেকে অগ্রগতির তথ্য বের করে।"""
+    def to_float(value):
         try:
-            with open(error_file_path, 'w') as f: f.write(error_msg)
-        except IOError as e:
-             logging.error(f"[{video_id}] ডাইমেনশন ত্রুটি ফাইল লিখতে ব্যর্থ: {error_file_path}: {e}")
-        return False
-    # --- ডাইমেনশন পাওয়া শেষ ---
-
-    # ইনপুট ফাইল আছে এবং খালি নয় তা নিশ্চিত করুন
-    if not os.path.exists(input_path) or os.path.getsize(input_path) == 0:
-        error_msg = f"[{video_id}] ইনপুট ভিডিও ফাইল খুঁজে পাওয়া যায়নি বা খালি: {input_path}"
-        logging.error(error_msg)
-        try:
-            with open(error_file_path, 'w') as f: f.write(error_msg)
-        except IOError as e:
-             logging.error(f"[{video_id}] ইনপুট ফাইল ত্রুটি ফাইল লিখতে ব্যর্থ: {error_file_path}: {e}")
-        return False
-
-    logging.info(f"[{video_id}] HLS ট্রান্সকোডিং শুরু হচ্ছে (সোর্স রেজোলিউশন: {original_width}x{original_height}) ফাইল: {input_path} থেকে ডিরেক্টরি: {output_base_dir}...")
-    ensure_dir(output_base_dir) # ভিডিওর নির্দিষ্ট HLS ডিরেক্টরি তৈরি করুন
+            return float(value.rstrip('x')) # speed এর মান '1.5x' আকারে আসে
+        except (AttributeError, ValueError):
+            return None # 'N/A' বা অনুপস্থিত
+
+    # নতুন ffmpeg 'out_time_us' দেয়; পুরনোগুলোতে 'out_time_ms' (নাম সত্ত্বেও মান মাইক্রোসেকেন্ডে)
+    out_time_us = to_float(fields.get('out_time_us', fields.get('out_time_ms')))
+    out_time = out_time_us / 1000000 if out_time_us is not None and out_time_us >= 0 else None
+    speed = to_float(fields.get('speed'))
+    snapshot = {
+        'out_time': round(out_time, 2) if out_time is not None else None,
+        'fps': to_float(fields.get('fps')),
+        'speed': speed,
+        'percent': None,
+        'eta_seconds': None,
+    }
+    if duration and out_time is not None:
+        snapshot['percent'] = round(min(100.0, out_time / duration * 100), 1)
+        if speed:
+            snapshot['eta_seconds'] = round(max(0.0, duration - out_time) / speed, 1)
+    return snapshot
+
+def wait_with_rusage(proc):
+    """প্রসেস শেষ হওয়ার অপেক্ষা করে এবং তার resource usage (CPU সময়, সর্বোচ্চ RSS) রিটার্ন করে; না পেলে None।
+
+    os.wait4 ব্লক না করে (WNOHANG) অল্প বিরতিতে ডাকা হয়, যাতে gevent ওয়ার্কারে অন্য সংযোগগুলো আটকে না যায়।
+    অন্য কেউ আগেই প্রসেসটি reap করে ফেললে (যেমন gevent এর SIGCHLD হ্যান্ডলার) সাধারণ wait এ ফিরে যায়।
+    """
+    try:
+        while True:
+            pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+            if pid:
+                proc.returncode = os.waitstatus_to_exitcode(status)
+                return rusage
+            time.sleep(0.05)
+    except ChildProcessError:
+        proc.wait()
+        return None
+
+def run_ffmpeg(cmd, timeout=FFMPEG_TIMEOUT, duration=None, on_progress=None, stage=None, rendition=None):
+    """ffmpeg চালায় এবং -progress আউটপুট পড়তে পড়তে on_progress কলব্যাকে অগ্রগতি পাঠায়।
+
+    subprocess.run(check=True) এর মতোই ব্যর্থ হলে CalledProcessError এবং সময় পেরিয়ে গেলে
+    TimeoutExpired রেইজ করে। পুরো stderr জমা না রেখে শুধু শেষ FFMPEG_STDERR_LINES লাইন রাখা হয়।
+    stage দেওয়া হলে সময়, CPU সময়, সর্বোচ্চ RSS ও এনকোডের গতি মেট্রিক্সে লেখা হয় (metrics.record_ffmpeg_metrics দেখুন)।
+    """
+    cmd = [cmd[0], '-progress', 'pipe:1', '-nostats'] + cmd[1:] # অগ্রগতি stdout-এ, stderr-এ শুধু লগ
+    start_time = time.monotonic()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors='replace')
+
+    # stderr আলাদা থ্রেডে পড়ুন, যাতে পাইপ পূর্ণ হয়ে ffmpeg আটকে না যায়
+    stderr_tail = collections.deque(maxlen=FFMPEG_STDERR_LINES)
+    stderr_thread = threading.Thread(target=lambda: stderr_tail.extend(proc.stderr), daemon=True)
+    stderr_thread.start()
+
+    # টাইমআউট হলে প্রসেসটি বন্ধ করুন
+    timed_out = threading.Event()
+    def kill_on_timeout():
+        timed_out.set()
+        proc.kill()
+    timer = threading.Timer(timeout, kill_on_timeout)
+    timer.start()
+
+    rusage, out_time = None, None
+    try:
+        fields = {}
+        for line in proc.stdout:
+            key, sep, value = line.strip().partition('=')
+            if not sep:
+                continue
+            if key == 'progress':
+                # একটি ব্লক শেষ ('continue' বা 'end')
+                snapshot = parse_ffmpeg_progress(fields, duration)
+                out_time = snapshot['out_time'] if snapshot['out_time'] is not None else out_time
+                if on_progress:
+                    try:
+                        on_progress(snapshot)
+                    except Exception as e:
+                        logging.warning(f"অগ্রগতি আপডেট করতে ব্যর্থ: {e}")
+                fields = {}
+            else:
+                fields[key] = value
+        rusage = wait_with_rusage(proc)
+    finally:
+        timer.cancel()
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        stderr_thread.join(timeout=5)
+
+    stderr_text = ''.join(stderr_tail)
+    if stage is not None:
+        result = 'timeout' if timed_out.is_set() else ('ok' if proc.returncode == 0 else 'failed')
+        metrics.record_ffmpeg_metrics(stage, rendition, result, time.monotonic() - start_time, rusage,
+                              out_time if out_time is not None else duration)
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout, stderr=stderr_text)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr_text)
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout='', stderr=stderr_text)
+
+def make_progress_reporter(video_id, rendition_names):
+    """ffmpeg এর অগ্রগতি নির্দিষ্ট সময় পরপর (প্রতিবার নয়) জব স্টোরে লেখার জন্য একটি কলব্যাক তৈরি করে।"""
+    last_write = [0.0]
+    def report(snapshot):
+        now = time.time()
+        if now - last_write[0] < PROGRESS_UPDATE_INTERVAL:
+            return
+        last_write[0] = now
+        update_job_progress(video_id, rendition_names, state='running', percent=snapshot['percent'],
+                            fps=snapshot['fps'], speed=snapshot['speed'], eta_seconds=snapshot['eta_seconds'])
+    return report
 
-    master_playlist_content = "#EXTM3U\n#EXT-X-VERSION:3\n" # মাস্টার প্লেলিস্টের শুরু
-    ffmpeg_commands = [] # ffmpeg কমান্ডগুলো রাখার তালিকা
-    resolution_details_for_master = [] # মাস্টার প্লেলিস্টের জন্য রেজোলিউশনের তথ্য (শুধুমাত্র সফলগুলো থাকবে)
+# === Core Processing Functions ===
+# মূল প্রসেসিং ফাংশনসমূহ
 
-    # --- প্রতিটি কাঙ্ক্ষিত রেজোলিউশনের জন্য কমান্ড প্রস্তুত করুন এবং প্রস্থ গণনা করুন ---
+def measure_complexity(video_id, input_path, media):
+    """ভিডিওর কয়েকটি ছোট নমুনা দুটি কম রেজোলিউশনে VIDEO_CRF দিয়ে এনকোড করে জটিলতা মাপে।
+
+    ফলাফল {'points': [[উচ্চতা, kbps], ...], 'crf'}: প্রতিটি উচ্চতায় একই গুণমানে লাগা গড় বিটরেট। স্থির
+    স্লাইডে এটি খুব কম, দ্রুত নড়াচড়া বা সূক্ষ্ম দৃশ্যে অনেক বেশি; দুই উচ্চতার অনুপাত থেকে বোঝা যায় রেজোলিউশন
+    বাড়লে বিটরেট কত দ্রুত বাড়ে। নমুনাগুলো একবারই ডিকোড হয় (split)। ফলাফল মিডিয়া তথ্যের সাথে ক্যাশ হয়,
+    তাই পরের চেষ্টাগুলো (এবং আগের আউটপুট থেকে চালিয়ে যাওয়া) একই সিঁড়ি পায়। দৈর্ঘ্য অজানা হলে বা
+    ffmpeg ব্যর্থ হলে None।
+    """
+    cached = media.get('complexity')
+    if cached and cached.get('crf') == VIDEO_CRF:
+        return cached
+    duration = media.get('duration')
+    if not duration:
+        return None
+    heights = [h for h in LADDER_PROBE_HEIGHTS if h <= media['height']] or [media['height']]
+
+    # ভিডিও ছোট হলে পুরোটা, নইলে সমান দূরত্বে LADDER_SAMPLE_COUNT টি নমুনা (প্রতিটি আলাদা ইনপুট, দ্রুত সিক)
+    if duration <= LADDER_SAMPLE_COUNT * LADDER_SAMPLE_SECONDS:
+        samples = [(0.0, duration)]
+    else:
+        samples = [((i + 0.5) * duration / LADDER_SAMPLE_COUNT - LADDER_SAMPLE_SECONDS / 2, LADDER_SAMPLE_SECONDS)
+                   for i in range(LADDER_SAMPLE_COUNT)]
+    cmd = ['ffmpeg']
+    for start, length in samples:
+        cmd += ['-ss', f'{start:.3f}', '-t', f'{length:.3f}', '-i', input_path]
+    # [0:v:0][1:v:0]...concat,split=2[c0][c1];[c0]scale=-2:240[v0];[c1]scale=-2:480[v1]
+    filter_parts = [''.join(f'[{i}:v:0]' for i in range(len(samples))) +
+                    f'concat=n={len(samples)}:v=1:a=0,split={len(heights)}' + ''.join(f'[c{i}]' for i in range(len(heights)))]
+    filter_parts += [f'[c{i}]scale=-2:{height},setsar=1[v{i}]' for i, height in enumerate(heights)]
+    cmd += ['-filter_complex', ';'.join(filter_parts)]
+
+    sample_dir = tempfile.mkdtemp(prefix='complexity-')
+    started = time.monotonic()
+    try:
+        for i in range(len(heights)):
+            cmd += ['-map', f'[v{i}]', '-c:v', 'libx264', '-crf', str(VIDEO_CRF), '-preset', 'veryfast', # আসল এনকোডের মতোই
+                    '-f', 'matroska', os.path.join(sample_dir, f'{i}.mkv')]
+        run_ffmpeg(cmd, stage='analysis')
+        seconds = sum(length for _, length in samples)
+        points = [[height, round(os.path.getsize(os.path.join(sample_dir, f'{i}.mkv')) * 8 / 1000 / seconds, 1)]
+                  for i, height in enumerate(heights)]
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+        logging.warning(f"[{video_id}] জটিলতা বিশ্লেষণ ব্যর্থ, নির্দিষ্ট রেজোলিউশন ও বিটরেট ব্যবহার হবে: {e}")
+        return None
+    finally:
+        shutil.rmtree(sample_dir, ignore_errors=True)
+
+    complexity = {'points': points, 'crf': VIDEO_CRF}
+    logging.info(f"[{video_id}] জটিলতা বিশ্লেষণ (CRF {VIDEO_CRF}): {', '.join(f'{h}p এ {k:.0f}kbps' for h, k in points)} "
+                 f"({len(samples)}টি নমুনা, {time.monotonic() - started:.2f} সেকেন্ড)।")
+    media['complexity'] = complexity
+    write_media_info(input_path, media)
+    return complexity
+
+def complexity_exponent(complexity):
+    """পিক্সেল সংখ্যার সাথে বিটরেট কত দ্রুত বাড়ে (বিটরেট ∝ পিক্সেল^exponent), দুই উচ্চতার মাপ থেকে।"""
+    points = complexity['points']
+    if len(points) < 2 or points[0][1] <= 0 or points[-1][1] <= 0:
+        return LADDER_PIXEL_EXPONENT # একটি উচ্চতাতেই মাপা গেছে (সোর্স ছোট)
+    (low_height, low_kbps), (high_height, high_kbps) = points[0], points[-1]
+    exponent = math.log(high_kbps / low_kbps) / math.log((high_height / low_height) ** 2)
+    return min(LADDER_EXPONENT_RANGE[1], max(LADDER_EXPONENT_RANGE[0], exponent))
+
+def plan_per_title_ladder(video_id, input_path, media):
+    """জটিলতা অনুযায়ী এই ভিডিওর রেজোলিউশন ও বিটরেট ঠিক করে, RESOLUTIONS এর আকারে (উচ্চতা, ভিডিও, অডিও)।
+
+    প্রতিটি রেজোলিউশনের বিটরেট = সবচেয়ে কাছের মাপা বিটরেট x (পিক্সেলের অনুপাত)^exponent x LADDER_PEAK_HEADROOM,
+    LADDER_RUNGS এর সীমার মধ্যে। এনকোড CRF এ হয় এবং এই বিটরেট শুধু সর্বোচ্চ সীমা (maxrate), তাই সহজ
+    ভিডিও এর চেয়েও কম জায়গা নেয়। সোর্সের চেয়ে বড় রেজোলিউশন বাদ যায়। মাঝের কোনো রেজোলিউশনের বিটরেটেই
+    পরের উঁচু রেজোলিউশনটি (অনুমানে) এঁটে গেলে (যেমন স্থির স্লাইড) সেটিও বাদ যায়; সবচেয়ে ছোট ও সবচেয়ে বড়
+    রেজোলিউশন সবসময় থাকে। বিশ্লেষণ সম্ভব না হলে None।
+    """
+    complexity = measure_complexity(video_id, input_path, media)
+    if complexity is None:
+        return None
+    exponent = complexity_exponent(complexity)
+    ladder = []
+    for height, min_bitrate, max_bitrate, a_bitrate in LADDER_RUNGS:
+        if height > media['height'] + 10: # plan_renditions এর মতো একই সহনশীলতা
+            continue
+        probe_height, probe_kbps = min(complexity['points'], key=lambda point: abs(math.log(height / point[0])))
+        estimate = probe_kbps * (height / probe_height) ** (2 * exponent) * LADDER_PEAK_HEADROOM
+        v_kbps = int(min(int(max_bitrate[:-1]), max(int(min_bitrate[:-1]), estimate)))
+        ladder.append((height, v_kbps, a_bitrate, estimate))
+    if not ladder:
+        return None # সোর্স সবচেয়ে ছোট রেজোলিউশনের চেয়েও ছোট; plan_renditions নিজেই সামলায়
+
+    # উপর থেকে নিচে: যে দর্শক এই রেজোলিউশনের বিটরেট পায়, সে পরের উঁচুটিও পেলে এটি অপ্রয়োজনীয়
+    selected = [ladder[-1]]
+    for rung in reversed(ladder[1:-1]):
+        if selected[-1][3] > rung[1]:
+            selected.append(rung)
+    if len(ladder) > 1:
+        selected.append(ladder[0])
+    selected.reverse()
+    logging.info(f"[{video_id}] প্রতি-ভিডিও সিঁড়ি (exponent {exponent:.2f}): "
+                 f"{', '.join(f'{h}p@{v}k' for h, v, _, _ in selected)}")
+    return [(height, f'{v_kbps}k', a_bitrate) for height, v_kbps, a_bitrate, _ in selected]
+
+def plan_renditions(video_id, original_width, original_height, resolutions, shared_audio=False):
+    """মূল ভিডিওর ডাইমেনশন অনুযায়ী কোন কোন রেজোলিউশন তৈরি হবে এবং তাদের প্রস্থ কত হবে তা নির্ধারণ করে।
+
+    shared_audio হলে রেজোলিউশনগুলো শুধু ভিডিও; তাদের BANDWIDTH এ শেয়ার করা অডিওর বিটরেট ধরা হয়,
+    কারণ প্লেয়ার ভিডিওর সাথে অডিও-রেন্ডিশনটিও ডাউনলোড করে।
+    """
+    renditions = []
     for target_height, v_bitrate, a_bitrate in resolutions:
-        # >>> গুরুত্বপূর্ণ চেক: যদি টার্গেট রেজোলিউশন মূল ভিডিওর চেয়ে বেশি হয়, তবে সেটি বাদ দিন <<<
+        # >>> গুরুত্বপূর্ণ চেক: যদি টার্গেট রেজোলিউশন মূল ভিডিওর চেয়ে বেশি হয়, তবে সেটি বাদ দিন <<<
         if target_height > original_height + 10: # +10 একটি ছোট মার্জিন সহনশীলতার জন্য
-             logging.warning(f"[{video_id}] {target_height}p বাদ দেওয়া হচ্ছে কারণ এটি মূল উচ্চতা ({original_height}p) থেকে বেশি।")
+             logging.warning(f"[{video_id}] {target_height}p বাদ দেওয়া হচ্ছে কারণ এটি মূল উচ্চতা ({original_height}p) থেকে বেশি।")
              continue # পরবর্তী রেজোলিউশনে যান
 
         # মূল অ্যাসপেক্ট রেশিও ব্যবহার করে টার্গেট প্রস্থ গণনা করুন
         aspect_ratio = original_width / original_height
-        # প্রস্থ গণনা করুন এবং নিশ্চিত করুন এটি একটি জোড় সংখ্যা (ভিডিও কোডেকের জন্য গুরুত্বপূর্ণ)
+        # প্রস্থ গণনা করুন এবং নিশ্চিত করুন এটি একটি জোড় সংখ্যা (ভিডিও কোডেকের জন্য গুরুত্বপূর্ণ)
         target_width = math.floor(target_height * aspect_ratio / 2.0) * 2
-        if target_width == 0: target_width = 2 # প্রস্থ শূন্য হওয়া এড়ান
+        if target_width == 0: target_width = 2 # প্রস্থ শূন্য হওয়া এড়ান
 
         logging.info(f"[{video_id}] গণনা করা টার্গেট রেজোলিউশন: {target_width}x{target_height}")
-
-        # ফাইল ও ডিরেক্টরির পাথ নির্ধারণ করুন
-        res_output_dir = os.path.join(output_base_dir, str(target_height)) # যেমন: static/hls/uuid/360
-        ensure_dir(res_output_dir)
-        relative_playlist_path = os.path.join(str(target_height), 'playlist.m3u8') # মাস্টার প্লেলিস্টের সাপেক্ষে পাথ
-        segment_path_pattern = os.path.join(res_output_dir, 'segment%03d.ts') # সেগমেন্ট ফাইলের প্যাটার্ন
-        absolute_playlist_path = os.path.join(res_output_dir, 'playlist.m3u8') # ffmpeg এর জন্য প্লেলিস্টের পাথ
-
-        # ffmpeg স্কেল ফিল্টার (-2 ব্যবহার করলে ffmpeg স্বয়ংক্রিয়ভাবে প্রস্থ গণনা করে)
-        scale_filter = f'scale=-2:{target_height}'
-
-        # ffmpeg কমান্ড তৈরি করুন
-        cmd = [
-            'ffmpeg', '-i', input_path,           # ইনপুট ফাইল
-            '-vf', scale_filter,                 # ভিডিও ফিল্টার (স্কেলিং)
-            '-c:v', 'libx264', '-crf', '23', '-preset', 'veryfast', # ভিডিও কোডেক ও সেটিংস
-            '-b:v', v_bitrate, '-maxrate', v_bitrate, '-bufsize', f'{int(v_bitrate[:-1])*2}k', # ভিডিও বিটরেট কন্ট্রোল
-            '-c:a', 'aac', '-ar', '48000', '-b:a', a_bitrate, # অডিও কোডেক ও সেটিংস
-            '-f', 'hls',                         # আউটপুট ফরম্যাট HLS
-            '-hls_time', '6',                    # প্রতিটি সেগমেন্টের দৈর্ঘ্য (সেকেন্ড)
-            '-hls_list_size', '0',               # প্লেলিস্টে সব সেগমেন্ট রাখুন
-            '-hls_segment_filename', segment_path_pattern, # সেগমেন্ট ফাইলের নাম প্যাটার্ন
-            '-hls_flags', 'delete_segments',     # আগের সেগমেন্ট মুছে নতুন করে শুরু করুন
-            absolute_playlist_path               # আউটপুট প্লেলিস্ট ফাইলের পাথ
-        ]
-        # এই রেজোলিউশনের জন্য প্রয়োজনীয় তথ্য সংরক্ষণ করুন (কমান্ড এবং প্লেলিস্টের বিবরণ)
-        current_resolution_details = {
-            'bandwidth': int(v_bitrate[:-1]) * 1000 + int(a_bitrate[:-1]) * 1000,
+        rendition = {
+            'name': str(target_height),             # রেজোলিউশনের ডিরেক্টরির নাম, যেমন: 360
             'width': target_width,
             'height': target_height,
-            'playlist_path': relative_playlist_path
+            'v_bitrate': v_bitrate,
+            'a_bitrate': a_bitrate,
+            'bandwidth': int(v_bitrate[:-1]) * 1000 + int(a_bitrate[:-1]) * 1000,
+            'playlist_path': os.path.join(str(target_height), 'playlist.m3u8') # মাস্টার প্লেলিস্টের সাপেক্ষে পাথ
         }
-        # --- ffmpeg কমান্ডগুলো চালান ---
-        # এই লুপটি প্রতিটি রেজোলিউশনের জন্য ffmpeg চালানোর চেষ্টা করবে
-        logging.info(f"[{video_id}] {target_height}p এর জন্য ffmpeg চালানো হচ্ছে...")
-        logging.debug(f"[{video_id}] কমান্ড: {' '.join(cmd)}")
-        start_time_res = time.time() # এই রেজোলিউশনের সময় গণনা শুরু
-        try:
-            # কমান্ড চালান ও আউটপুট ক্যাপচার করুন
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True, timeout=FFMPEG_TIMEOUT)
-            end_time_res = time.time() # এই রেজোলিউশনের সময় গণনা শেষ
-            logging.info(f"[{video_id}] {target_height}p এর জন্য ffmpeg সফলভাবে শেষ হয়েছে ({end_time_res - start_time_res:.2f} সেকেন্ড)।")
-            # সফল হলে, এই রেজোলিউশনের বিবরণ মাস্টার প্লেলিস্টের জন্য যোগ করুন
-            resolution_details_for_master.append(current_resolution_details)
-            # সফল হলেও stderr লগ করুন (ওয়ার্নিং থাকতে পারে)
-            if result.stderr:
-                 logging.debug(f"[{video_id}] ffmpeg stderr ({target_height}p):\n{result.stderr[-1000:]}") # শেষ ১০০০ অক্ষর
-
-        # >>> গুরুত্বপূর্ণ ত্রুটি হ্যান্ডলিং: যদি ffmpeg ব্যর্থ হয় <<<
-        except subprocess.CalledProcessError as e:
-            error_msg = (f"[{video_id}] {target_height}p এর জন্য ট্রান্সকোডিং ব্যর্থ (ffmpeg exit code {e.returncode})।\n"
-                         f"ইনপুট: {input_path}\nCommand: {' '.join(e.cmd)}\n"
-                         f"STDERR (last 1000 chars):\n...{e.stderr[-1000:]}")
-            logging.error(error_msg)
-            try:
-                with open(error_file_path, 'w') as f: f.write(error_msg) # ত্রুটি ফাইল লিখুন
-            except IOError as io_err:
-                logging.error(f"[{video_id}] ffmpeg ত্রুটি ফাইল লিখতে ব্যর্থ: {error_file_path}: {io_err}")
-            # >>> এখানে লুপ ব্রেক করা হচ্ছে, তাই পরবর্তী রেজোলিউশনগুলো চেষ্টা করা হবে না <<<
-            break
-        except subprocess.TimeoutExpired as e:
-            error_msg = (f"[{video_id}] {target_height}p এর জন্য ট্রান্সকোডিং টাইমআউট ({FFMPEG_TIMEOUT} সেকেন্ড)।\n"
-                         f"ইনপুট: {input_path}\nCommand: {' '.join(e.cmd)}")
-            logging.error(error_msg)
-            try:
-                with open(error_file_path, 'w') as f: f.write(error_msg) # ত্রুটি ফাইল লিখুন
-            except IOError as io_err:
-                 logging.error(f"[{video_id}] টাইমআউট ত্রুটি ফাইল লিখতে ব্যর্থ: {error_file_path}: {io_err}")
+        if shared_audio:
+            rendition.update(audio_group=SHARED_AUDIO_GROUP, a_bitrate=SHARED_AUDIO_BITRATE,
+                             bandwidth=int(v_bitrate[:-1]) * 1000 + int(SHARED_AUDIO_BITRATE[:-1]) * 1000)
+        renditions.append(rendition)
+    return renditions
+
+def plan_audio_rendition():
+    """শেয়ার করা অডিও-রেন্ডিশনের তথ্য, ভিডিও রেজোলিউশনের মতো একই আকারে (audio_only চিহ্নসহ)।
+
+    এটি রেজোলিউশনের তালিকাতেই থাকে, তাই ডিরেক্টরি, অগ্রগতি, টুকরো জোড়া লাগানো ও আগাম প্রকাশ আলাদা কোড ছাড়াই কাজ করে।
+    """
+    return {
+        'name': SHARED_AUDIO_NAME,
+        'audio_only': True,
+        'a_bitrate': SHARED_AUDIO_BITRATE,
+        'bandwidth': int(SHARED_AUDIO_BITRATE[:-1]) * 1000,
+        'playlist_path': os.path.join(SHARED_AUDIO_NAME, 'playlist.m3u8')
+    }
+
+def select_passthrough_rendition(video_id, media, renditions):
+    """সোর্স ভিডিও কোনো রেজোলিউশনের সাথে হুবহু মিলে গেলে সেটিকে রি-এনকোড ছাড়াই (-c copy) তৈরির জন্য চিহ্নিত করে।
+
+    শর্ত: H.264 (8-bit 4:2:0, Baseline/Main/High), রোটেশন নেই, অডিও AAC বা অডিও নেই, উচ্চতা হুবহু
+    রেজোলিউশনের উচ্চতা এবং ভিডিও বিটরেট রেজোলিউশনের বিটরেটের PASSTHROUGH_MAX_BITRATE_FACTOR গুণের মধ্যে।
+    চিহ্নিত রেজোলিউশন (অথবা None) রিটার্ন করে।
+    """
+    if not PASSTHROUGH_ENABLED:
+        return None
+    if (media.get('video_codec') != 'h264' or media.get('pix_fmt') not in PASSTHROUGH_PIX_FMTS
+            or media.get('video_profile') not in PASSTHROUGH_H264_PROFILES or media.get('rotation')):
+        return None
+    if media.get('has_audio') and media.get('audio_codec') != 'aac':
+        return None
+
+    video_bit_rate = media.get('video_bit_rate')
+    if not video_bit_rate and media.get('bit_rate'):
+        # কিছু কন্টেইনার (যেমন mkv) স্ট্রিমের বিটরেট দেয় না; মোট বিটরেট থেকে অডিও বাদ দিয়ে অনুমান করুন
+        video_bit_rate = media['bit_rate'] - (media.get('audio_bit_rate') or 0)
+    if not video_bit_rate:
+        return None
+
+    for rendition in renditions:
+        if rendition['height'] != media['height']:
+            continue
+        max_bit_rate = int(rendition['v_bitrate'][:-1]) * 1000 * PASSTHROUGH_MAX_BITRATE_FACTOR
+        if video_bit_rate > max_bit_rate:
+            logging.info(f"[{video_id}] {rendition['name']}p পাসথ্রু করা হচ্ছে না: সোর্সের বিটরেট ({video_bit_rate // 1000}k) অনেক বেশি।")
+            return None
+        # মাস্টার প্লেলিস্টে সোর্সের আসল বিটরেট দেখান (রেজোলিউশনের নির্ধারিত বিটরেটের চেয়ে কম নয়)
+        if rendition.get('audio_group'):
+            source_bandwidth = video_bit_rate + int(SHARED_AUDIO_BITRATE[:-1]) * 1000 # অডিও শেয়ার করা রেন্ডিশন থেকে আসে
+        else:
+            source_bandwidth = video_bit_rate + (media.get('audio_bit_rate') or 0)
+        rendition.update(passthrough=True, width=media['width'], ladder_bandwidth=rendition['bandwidth'],
+                         bandwidth=max(rendition['bandwidth'], source_bandwidth))
+        logging.info(f"[{video_id}] সোর্স ভিডিও {rendition['name']}p এর সাথে মিলে গেছে; এটি রি-এনকোড ছাড়াই (-c copy) তৈরি হবে।")
+        return rendition
+    return None
+
+def ffmpeg_thread_budget(parallel_encodes):
+    """এই জবের প্রতিটি ffmpeg প্রসেস কতগুলো থ্রেড পাবে তা নির্ধারণ করে।
+
+    মেশিনের কোরগুলো একসাথে চলা জব এবং জবের ভিতরে একসাথে চলা এনকোডের মধ্যে সমানভাবে ভাগ করা হয়।
+    """
+    try:
+        concurrent_jobs = max(1, running_job_count(HOSTNAME)) # শুধু এই মেশিনের কোর ভাগ হয়
+    except sqlite3.Error:
+        concurrent_jobs = TRANSCODE_WORKERS # ডাটাবেস পড়া না গেলে সবচেয়ে খারাপ অবস্থা ধরে নিন
+    return max(1, FFMPEG_CPU_CORES // (concurrent_jobs * parallel_encodes))
+
+def hls_output_options(segment_dir, prefix='', progressive=PROGRESSIVE_PUBLISH):
+    """সব HLS আউটপুটের (প্রতি-রেজোলিউশন, একক-পাস, পাসথ্রু, টুকরো) সেগমেন্ট ও প্লেলিস্ট সংক্রান্ত ffmpeg অপশন।
+
+    segment_dir এ '%v' থাকতে পারে (একক-পাস)। prefix সেগমেন্ট ফাইলের নামের শুরুতে বসে (টুকরো মোডে টুকরোর নাম)।
+    HLS_SINGLE_FILE হলে সব সেগমেন্ট একটি media ফাইলে থাকে এবং প্লেলিস্ট বাইট-রেঞ্জ দিয়ে অংশগুলো দেখায়।
+    """
+    fmp4 = HLS_SEGMENT_TYPE == 'fmp4'
+    options = ['-hls_segment_type', HLS_SEGMENT_TYPE]
+    if fmp4 and not HLS_SINGLE_FILE:
+        # ইনিশিয়ালাইজেশন সেগমেন্ট (EXT-X-MAP); একক ফাইলে এটি media ফাইলের শুরুতেই থাকে। একাধিক ভ্যারিয়েন্টে
+        # ffmpeg শুধু ডিফল্ট নামের শেষে নিজে ভ্যারিয়েন্ট নম্বর যোগ করে, অন্য নামে '%v' থাকতে হয়
+        init_name = f'{prefix}init_%v.mp4' if prefix and '%v' in segment_dir else f'{prefix}init.mp4'
+        options += ['-hls_fmp4_init_filename', init_name]
+    if HLS_SINGLE_FILE:
+        # temp_file একক ফাইলের সাথে কাজ করে না (প্লেলিস্টে '.tmp' নাম চলে যায়), আর মোছার মতো পুরনো সেগমেন্টও নেই
+        options += ['-hls_segment_filename', os.path.join(segment_dir, f"{prefix}media{'.mp4' if fmp4 else '.ts'}"),
+                    '-hls_flags', 'single_file']
+    else:
+        # temp_file: সেগমেন্ট ও প্লেলিস্ট অস্থায়ী নামে লিখে rename হয়, তাই দর্শক কখনো অর্ধেক লেখা ফাইল পায় না
+        options += ['-hls_segment_filename', os.path.join(segment_dir, f"{prefix}segment%03d{'.m4s' if fmp4 else '.ts'}"),
+                    '-hls_flags', 'delete_segments+temp_file']
+    if progressive:
+        # 'event' প্লেলিস্ট: প্লেয়ার জানে তালিকাটি বাড়ছে এবং শুরু থেকে চালাতে পারে
+        options += ['-hls_playlist_type', 'event']
+    return options
+
+def build_rendition_command(input_path, output_base_dir, rendition, threads=None, previews=None):
+    """একটি নির্দিষ্ট রেজোলিউশনের জন্য আলাদা ffmpeg কমান্ড তৈরি করে (প্রতি-রেজোলিউশন ও সমান্তরাল মোড)।
+
+    previews দেওয়া হলে একই ডিকোড থেকে পোস্টার ও থাম্বনেইলও লেখা হয় (preview_output_options দেখুন)।
+    """
+    res_output_dir = os.path.join(output_base_dir, rendition['name']) # যেমন: static/hls/uuid/360
+    absolute_playlist_path = os.path.join(res_output_dir, 'playlist.m3u8') # ffmpeg এর জন্য প্লেলিস্টের পাথ
+    v_bitrate, a_bitrate = rendition['v_bitrate'], rendition['a_bitrate']
+
+    # ffmpeg স্কেল ফিল্টার (-2 ব্যবহার করলে ffmpeg স্বয়ংক্রিয়ভাবে প্রস্থ গণনা করে)
+    scale_filter = f"scale=-2:{rendition['height']}"
+
+    cmd = [
+        'ffmpeg', '-i', input_path,           # ইনপুট ফাইল
+        '-vf', scale_filter,                 # ভিডিও ফিল্টার (স্কেলিং)
+        '-c:v', 'libx264', '-crf', str(VIDEO_CRF), '-preset', 'veryfast', # ভিডিও কোডেক ও সেটিংস
+        '-maxrate', v_bitrate, '-bufsize', f'{int(v_bitrate[:-1])*2}k', # CRF এর বিটরেট এই সীমা পার হবে না (capped CRF)
+        *(['-an'] if rendition.get('audio_group') else # অডিও শেয়ার করা অডিও-রেন্ডিশনে থাকে
+          ['-c:a', 'aac', '-ar', '48000', '-b:a', a_bitrate]), # অডিও কোডেক ও সেটিংস
+        '-f', 'hls',                         # আউটপুট ফরম্যাট HLS
+        '-hls_time', str(HLS_SEGMENT_SECONDS), # প্রতিটি সেগমেন্টের দৈর্ঘ্য (সেকেন্ড)
+        '-hls_list_size', '0',               # প্লেলিস্টে সব সেগমেন্ট রাখুন
+        *hls_output_options(res_output_dir), # সেগমেন্টের ধরন ও ফাইলের নাম, আগের সেগমেন্ট মুছে নতুন করে শুরু, প্রয়োজনে event প্লেলিস্ট
+        absolute_playlist_path               # আউটপুট প্লেলিস্ট ফাইলের পাথ
+    ]
+    if threads:
+        cmd[3:3] = ['-threads', str(threads)] # ইনপুটের পরে, আউটপুট অপশন হিসেবে এনকোডারের থ্রেড সীমা
+    if previews is not None:
+        cmd += preview_output_options(previews)
+    return cmd
+
+def build_audio_command(input_path, output_base_dir, rendition):
+    """শেয়ার করা অডিও-রেন্ডিশনের (শুধু অডিও) ffmpeg কমান্ড তৈরি করে (প্রতি-রেজোলিউশন ও সমান্তরাল মোড)।"""
+    res_output_dir = os.path.join(output_base_dir, rendition['name'])
+    return [
+        'ffmpeg', '-i', input_path,
+        '-map', '0:a:0', '-vn',              # শুধু প্রথম অডিও স্ট্রিম
+        '-c:a', 'aac', '-ar', '48000', '-b:a', rendition['a_bitrate'],
+        '-f', 'hls',
+        '-hls_time', str(HLS_SEGMENT_SECONDS),
+        '-hls_list_size', '0',
+        *hls_output_options(res_output_dir),
+        os.path.join(res_output_dir, 'playlist.m3u8')
+    ]
+
+def build_remux_command(input_path, output_base_dir, rendition, has_audio=True):
+    """সোর্স ভিডিও রি-এনকোড না করে (-c copy) শুধু HLS সেগমেন্টে ভাগ করার ffmpeg কমান্ড তৈরি করে (পাসথ্রু রেজোলিউশন)।"""
+    res_output_dir = os.path.join(output_base_dir, rendition['name'])
+    cmd = ['ffmpeg', '-i', input_path, '-map', '0:v:0']
+    if has_audio and not rendition.get('audio_group'):
+        cmd += ['-map', '0:a:0']
+    cmd += [
+        '-c', 'copy',                        # ভিডিও ও অডিও হুবহু কপি
+        '-f', 'hls',
+        '-hls_time', str(HLS_SEGMENT_SECONDS), # সেগমেন্ট কেবল কীফ্রেমে কাটা যায়, তাই দৈর্ঘ্য কিছুটা ভিন্ন হতে পারে
+        '-hls_list_size', '0',
+        *hls_output_options(res_output_dir),
+        os.path.join(res_output_dir, 'playlist.m3u8')
+    ]
+    return cmd
+
+def build_single_pass_command(input_path, output_base_dir, renditions, has_audio, threads=None, chunk=None, previews=None):
+    """একবার ডিকোড করে সব রেজোলিউশন একই ffmpeg প্রসেসে এনকোড করার কমান্ড তৈরি করে।
+
+    filter_complex split দিয়ে ডিকোড করা ফ্রেম প্রতিটি রেজোলিউশনের স্কেলারে পাঠানো হয়,
+    আর -var_stream_map দিয়ে ffmpeg শুধু প্রতিটি রেজোলিউশনের প্লেলিস্ট লেখে; মাস্টার প্লেলিস্ট ffmpeg লেখে না,
+    পরে write_master_playlist বেছে নেওয়া সিঁড়ির BANDWIDTH দিয়ে সেটি লেখে।
+    chunk দেওয়া হলে শুধু সেই টুকরোটুকু এনকোড হয়: সেগমেন্ট ও প্লেলিস্ট টুকরোর নামে লেখা হয়
+    এবং টাইমস্ট্যাম্প মূল ভিডিওর সময়রেখায় সরিয়ে রাখা হয়।
+    renditions এ শেয়ার করা অডিও-রেন্ডিশন থাকলে অডিও একবারই এনকোড হয়ে সেটির আলাদা প্লেলিস্টে যায়।
+    previews দেওয়া হলে একই ডিকোড থেকে (টুকরোর ক্ষেত্রে শুধু সেই অংশের) পোস্টার ও থাম্বনেইলও লেখা হয়।
+    """
+    audio = next((r for r in renditions if r.get('audio_only')), None)
+    renditions = [r for r in renditions if not r.get('audio_only')]
+    # আগের চেষ্টার শেয়ার করা অডিও রাখা হলে ভিডিওগুলো তার গ্রুপেই থাকে, তাই নিজেদের মধ্যে অডিও নেয় না
+    mux_audio = has_audio and audio is None and not any(r.get('audio_group') for r in renditions)
+    count = len(renditions)
+    # [0:v]split=3[s0][s1][s2];[s0]scale=-2:360[v0];...
+    filter_parts = [f"[0:v]split={count}" + ''.join(f'[s{i}]' for i in range(count))]
+    for i, rendition in enumerate(renditions):
+        filter_parts.append(f"[s{i}]scale=-2:{rendition['height']}[v{i}]")
+
+    if chunk is None:
+        cmd = ['ffmpeg', '-i', input_path]
+    else:
+        # টুকরোর শুরু একটি কীফ্রেম, তাই ইনপুট সিক দ্রুত এবং ফ্রেম-নির্ভুল
+        cmd = ['ffmpeg', '-ss', f"{chunk['start']:.6f}", '-i', input_path]
+        if chunk['duration'] is not None:
+            cmd += ['-t', f"{chunk['duration']:.6f}"] # শেষ টুকরো ছাড়া: পরের টুকরোর কীফ্রেমের ঠিক আগে থামুন
+        cmd += ['-output_ts_offset', f"{chunk['start']:.6f}"] # সেগমেন্টের টাইমস্ট্যাম্প মূল ভিডিওর মতোই থাকবে
+    cmd += ['-filter_complex', ';'.join(filter_parts)]
+    for i, rendition in enumerate(renditions):
+        cmd += ['-map', f'[v{i}]']
+        if mux_audio:
+            cmd += ['-map', '0:a:0'] # প্রতিটি ভ্যারিয়েন্টের জন্য একই অডিও স্ট্রিম
+    if audio is not None:
+        cmd += ['-map', '0:a:0'] # সব ভ্যারিয়েন্টের জন্য একটিই অডিও আউটপুট
+
+    cmd += ['-c:v', 'libx264', '-crf', str(VIDEO_CRF), '-preset', 'veryfast', # সব ভিডিও আউটপুটের কোডেক ও সেটিংস
+            '-force_key_frames', f'expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})'] # সব রেজোলিউশনে সেগমেন্টের সীমানা একই রাখুন
+    if threads:
+        cmd += ['-threads', str(threads)]
+    for i, rendition in enumerate(renditions):
+        v_bitrate = rendition['v_bitrate']
+        cmd += [f'-maxrate:v:{i}', v_bitrate, f'-bufsize:v:{i}', f'{int(v_bitrate[:-1])*2}k'] # capped CRF
+    if audio is not None:
+        cmd += ['-c:a', 'aac', '-ar', '48000', '-b:a:0', audio['a_bitrate']]
+    elif mux_audio:
+        cmd += ['-c:a', 'aac', '-ar', '48000']
+        for i, rendition in enumerate(renditions):
+            cmd += [f'-b:a:{i}', rendition['a_bitrate']]
+
+    # ভ্যারিয়েন্ট ম্যাপ: "v:0,a:0,name:360 v:1,a:1,name:480 ..." -> %v এর জায়গায় name বসবে
+    if audio is not None:
+        # "a:0,agroup:audio,name:audio v:0,agroup:audio,name:360 ..." -> অডিওর নিজস্ব প্লেলিস্ট, ভিডিওগুলো শুধু ভিডিও
+        var_stream_map = ' '.join([f"a:0,agroup:{SHARED_AUDIO_GROUP},name:{audio['name']}"] +
+                                  [f"v:{i},agroup:{SHARED_AUDIO_GROUP},name:{r['name']}" for i, r in enumerate(renditions)])
+    elif mux_audio:
+        var_stream_map = ' '.join(f"v:{i},a:{i},name:{r['name']}" for i, r in enumerate(renditions))
+    else:
+        var_stream_map = ' '.join(f"v:{i},name:{r['name']}" for i, r in enumerate(renditions))
+
+    cmd += ['-f', 'hls', '-hls_time', str(HLS_SEGMENT_SECONDS), '-hls_list_size', '0']
+    if chunk is None:
+        cmd += [
+            *hls_output_options(os.path.join(output_base_dir, '%v')),
+            '-var_stream_map', var_stream_map,
+            os.path.join(output_base_dir, '%v', 'playlist.m3u8')
+        ]
+    else:
+        # টুকরোর প্লেলিস্ট শুধু জোড়া লাগানোর জন্য; দর্শক শুধু জোড়া লাগানো playlist.m3u8 দেখে
+        cmd += [
+            *hls_output_options(os.path.join(output_base_dir, '%v'), prefix=f"{chunk['name']}_", progressive=False),
+            '-var_stream_map', var_stream_map,
+            os.path.join(output_base_dir, '%v', f"{chunk['name']}.m3u8")
+        ]
+    if previews is not None:
+        cmd += preview_output_options(previews, *((chunk['start'], chunk['duration']) if chunk else ()))
+    return cmd
+
+def transcode_single_pass(video_id, input_path, output_base_dir, renditions, duration=None, has_audio=True, previews=None):
+    """সব রেজোলিউশন একটি ffmpeg প্রসেসে তৈরি করে। সফল হলে (True, None), ব্যর্থ হলে (False, ত্রুটির বার্তা) রিটার্ন করে।"""
+    cmd = build_single_pass_command(input_path, output_base_dir, renditions, has_audio, ffmpeg_thread_budget(1), previews=previews)
+    heights = ', '.join(f"{r['height']}p" for r in renditions if not r.get('audio_only'))
+
+    logging.info(f"[{video_id}] একক-পাস ffmpeg চালানো হচ্ছে ({heights}, অডিও: {'আছে' if has_audio else 'নেই'})...")
+    logging.debug(f"[{video_id}] কমান্ড: {' '.join(cmd)}")
+    start_time = time.time()
+    try:
+        # একটি ffmpeg সব রেজোলিউশন তৈরি করছে, তাই অগ্রগতি সবগুলোর জন্য একই
+        reporter = make_progress_reporter(video_id, [r['name'] for r in renditions])
+        result = run_ffmpeg(cmd, duration=duration, on_progress=reporter, stage='encode', rendition='all')
+        logging.info(f"[{video_id}] একক-পাস ffmpeg সফলভাবে শেষ হয়েছে ({time.time() - start_time:.2f} সেকেন্ড)।")
+        if result.stderr:
+            logging.debug(f"[{video_id}] ffmpeg stderr (একক-পাস):\n{result.stderr[-1000:]}")
+    except subprocess.CalledProcessError as e:
+        return False, (f"[{video_id}] একক-পাস ট্রান্সকোডিং ব্যর্থ (ffmpeg exit code {e.returncode})।\n"
+                       f"ইনপুট: {input_path}\nCommand: {' '.join(e.cmd)}\n"
+                       f"STDERR (last 1000 chars):\n...{e.stderr[-1000:]}")
+    except subprocess.TimeoutExpired as e:
+        return False, (f"[{video_id}] একক-পাস ট্রান্সকোডিং টাইমআউট ({FFMPEG_TIMEOUT} সেকেন্ড)।\n"
+                       f"ইনপুট: {input_path}\nCommand: {' '.join(e.cmd)}")
+    except Exception as e:
+        return False, f"[{video_id}] একক-পাস ট্রান্সকোডিংয়ের সময় অপ্রত্যাশিত ত্রুটি: {e}\nInput: {input_path}"
+
+    # প্রতিটি রেজোলিউশনের প্লেলিস্ট তৈরি হয়েছে কিনা নিশ্চিত করুন (মাস্টার প্লেলিস্ট পরে write_master_playlist লেখে)
+    missing = [r['name'] for r in renditions if not os.path.isfile(os.path.join(output_base_dir, r['name'], 'playlist.m3u8'))]
+    if missing:
+        return False, f"[{video_id}] একক-পাস ffmpeg শেষ হয়েছে কিন্তু {', '.join(missing)} এর প্লেলিস্ট পাওয়া যায়নি।"
+    return True, None
+
+def encode_rendition(video_id, input_path, output_base_dir, rendition, threads=None, duration=None, has_audio=True, previews=None):
+    """একটি রেজোলিউশনের জন্য ffmpeg চালায়। সফল হলে None, ব্যর্থ হলে ত্রুটির বার্তা রিটার্ন করে।
+
+    পাসথ্রু হিসেবে চিহ্নিত রেজোলিউশন -c copy দিয়ে তৈরি হয়; সেটি ব্যর্থ হলে সাধারণ এনকোডে ফিরে যায়।
+    শেয়ার করা অডিও-রেন্ডিশন (audio_only) শুধু অডিও এনকোড করে।
+    """
+    label = 'অডিও' if rendition.get('audio_only') else f"{rendition['height']}p" # লগ ও ত্রুটির বার্তার জন্য
+    if rendition.get('audio_only'):
+        cmd, stage = build_audio_command(input_path, output_base_dir, rendition), 'audio'
+        logging.info(f"[{video_id}] শেয়ার করা অডিও-রেন্ডিশনের জন্য ffmpeg চালানো হচ্ছে...")
+    elif rendition.get('passthrough'):
+        cmd, stage = build_remux_command(input_path, output_base_dir, rendition, has_audio), 'remux'
+        logging.info(f"[{video_id}] {label} এর জন্য ffmpeg চালানো হচ্ছে (পাসথ্রু, রি-এনকোড ছাড়া)...")
+    else:
+        cmd, stage = build_rendition_command(input_path, output_base_dir, rendition, threads, previews), 'encode'
+        logging.info(f"[{video_id}] {label} এর জন্য ffmpeg চালানো হচ্ছে (থ্রেড: {threads or 'auto'})...")
+    logging.debug(f"[{video_id}] কমান্ড: {' '.join(cmd)}")
+    start_time_res = time.time() # এই রেজোলিউশনের সময় গণনা শুরু
+    try:
+        # কমান্ড চালান, অগ্রগতি জব স্টোরে লিখুন এবং stderr এর শেষ অংশ রাখুন
+        update_job_progress(video_id, [rendition['name']], state='running', percent=0)
+        result = run_ffmpeg(cmd, duration=duration, on_progress=make_progress_reporter(video_id, [rendition['name']]),
+                            stage=stage, rendition=rendition['name'])
+        end_time_res = time.time() # এই রেজোলিউশনের সময় গণনা শেষ
+        logging.info(f"[{video_id}] {label} এর জন্য ffmpeg সফলভাবে শেষ হয়েছে ({end_time_res - start_time_res:.2f} সেকেন্ড)।")
+        update_job_progress(video_id, [rendition['name']], state='done', percent=100.0, eta_seconds=0)
+        mark_renditions_complete(output_base_dir, [rendition]) # প্রসেস এখন মারা গেলেও এটি আবার তৈরি হবে না
+        # সফল হলেও stderr লগ করুন (ওয়ার্নিং থাকতে পারে)
+        if result.stderr:
+             logging.debug(f"[{video_id}] ffmpeg stderr ({label}):\n{result.stderr[-1000:]}") # শেষ ১০০০ অক্ষর
+        return None
+
+    # >>> গুরুত্বপূর্ণ ত্রুটি হ্যান্ডলিং: যদি ffmpeg ব্যর্থ হয় <<<
+    except subprocess.CalledProcessError as e:
+        error_msg = (f"[{video_id}] {label} এর জন্য ট্রান্সকোডিং ব্যর্থ (ffmpeg exit code {e.returncode})।\n"
+                     f"ইনপুট: {input_path}\nCommand: {' '.join(e.cmd)}\n"
+                     f"STDERR (last 1000 chars):\n...{e.stderr[-1000:]}")
+        logging.error(error_msg)
+    except subprocess.TimeoutExpired as e:
+        error_msg = (f"[{video_id}] {label} এর জন্য ট্রান্সকোডিং টাইমআউট ({FFMPEG_TIMEOUT} সেকেন্ড)।\n"
+                     f"ইনপুট: {input_path}\nCommand: {' '.join(e.cmd)}")
+        logging.error(error_msg)
+    except Exception as e:
+        error_msg = f"[{video_id}] {label} এর জন্য ট্রান্সকোডিংয়ের সময় অপ্রত্যাশিত ত্রুটি: {e}\nInput: {input_path}"
+        logging.error(error_msg, exc_info=True)
+    if rendition.get('passthrough'):
+        # কপি করা সম্ভব না হলে (যেমন অস্বাভাবিক বিটস্ট্রিম) এই রেজোলিউশন সাধারণভাবে এনকোড করুন
+        logging.warning(f"[{video_id}] {label} পাসথ্রু ব্যর্থ হয়েছে, সাধারণ এনকোডে ফিরে যাওয়া হচ্ছে।")
+        clear_hls_directory_contents(os.path.join(output_base_dir, rendition['name']))
+        rendition.update(passthrough=False, bandwidth=rendition['ladder_bandwidth'])
+        return encode_rendition(video_id, input_path, output_base_dir, rendition, threads, duration, has_audio)
+    update_job_progress(video_id, [rendition['name']], state='failed')
+    return error_msg
+
+def transcode_per_rendition(video_id, input_path, output_base_dir, renditions, duration=None, has_audio=True, previews=None):
+    """প্রতিটি রেজোলিউশনের জন্য একটার পর একটা আলাদা ffmpeg প্রসেস চালায় এবং সফল রেজোলিউশনগুলোর তালিকা রিটার্ন করে।"""
+    resolution_details_for_master = [] # মাস্টার প্লেলিস্টের জন্য রেজোলিউশনের তথ্য (শুধুমাত্র সফলগুলো থাকবে)
+    threads = ffmpeg_thread_budget(1)
+    preview_carrier = _preview_carrier(renditions, previews)
+
+    for rendition in renditions:
+        error_msg = encode_rendition(video_id, input_path, output_base_dir, rendition, threads, duration, has_audio,
+                                     previews if rendition is preview_carrier else None)
+        if error_msg:
+            set_job_error(video_id, error_msg) # ত্রুটির বার্তা জব স্টোরে লিখুন
             # >>> এখানে লুপ ব্রেক করা হচ্ছে, তাই পরবর্তী রেজোলিউশনগুলো চেষ্টা করা হবে না <<<
             break
-        except Exception as e:
-            error_msg = f"[{video_id}] {target_height}p এর জন্য ট্রান্সকোডিংয়ের সময় অপ্রত্যাশিত ত্রুটি: {e}\nInput: {input_path}"
-            logging.error(error_msg, exc_info=True)
+        # সফল হলে, এই রেজোলিউশনের বিবরণ মাস্টার প্লেলিস্টের জন্য যোগ করুন
+        resolution_details_for_master.append(rendition)
+
+    return resolution_details_for_master
+
+def transcode_parallel(video_id, input_path, output_base_dir, renditions, duration=None, has_audio=True, previews=None):
+    """সব রেজোলিউশনের ffmpeg প্রসেস একসাথে চালায় এবং সফল রেজোলিউশনগুলোর তালিকা রিটার্ন করে।
+
+    প্রতিটি ffmpeg কে -threads দিয়ে CPU কোরের একটি অংশ দেওয়া হয়, যাতে সব রেজোলিউশন ও
+    একসাথে চলা জব মিলিয়ে মেশিনের কোর সংখ্যার বেশি থ্রেড না চলে।
+    """
+    # পাসথ্রু রেজোলিউশন ও অডিও-রেন্ডিশন প্রায় কোনো CPU নেয় না, তাই থ্রেড শুধু এনকোড হওয়া ভিডিওগুলোর মধ্যে ভাগ করুন
+    threads = ffmpeg_thread_budget(max(1, sum(1 for r in renditions if not r.get('passthrough') and not r.get('audio_only'))))
+    logging.info(f"[{video_id}] {len(renditions)}টি রেজোলিউশন একসাথে এনকোড করা হচ্ছে (প্রতিটিতে {threads} থ্রেড)...")
+    start_time = time.time()
+    preview_carrier = _preview_carrier(renditions, previews)
+    with ThreadPoolExecutor(max_workers=len(renditions), thread_name_prefix=f"Encode-{video_id[:8]}") as pool:
+        futures = [pool.submit(encode_rendition, video_id, input_path, output_base_dir, rendition, threads, duration, has_audio,
+                               previews if rendition is preview_carrier else None)
+                   for rendition in renditions]
+        errors = [future.result() for future in futures]
+    logging.info(f"[{video_id}] সমান্তরাল এনকোডিং শেষ ({time.time() - start_time:.2f} সেকেন্ড)।")
+
+    # সফল রেজোলিউশনগুলো মূল ক্রমে রাখুন; প্রথম ত্রুটিটি জব স্টোরে লিখুন
+    failed = [error_msg for error_msg in errors if error_msg]
+    if failed:
+        set_job_error(video_id, failed[0])
+    return [rendition for rendition, error_msg in zip(renditions, errors) if not error_msg]
+
+def probe_keyframes(video_path):
+    """ভিডিও স্ট্রিমের কীফ্রেমগুলোর সময় (সেকেন্ডে, ফাইলের শুরু থেকে) ক্রমানুসারে রিটার্ন করে; ব্যর্থ হলে None।
+
+    শুধু প্যাকেটের তথ্য পড়া হয় (ডিকোড নয়), তাই লম্বা ভিডিওতেও এটি দ্রুত।
+    """
+    command = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags:format=start_time', # প্যাকেট: "pts_time,flags", ফরম্যাট: "start_time"
+        '-of', 'csv=p=0',
+        video_path
+    ]
+    probe_started = time.monotonic()
+    try:
+        result = subprocess.run(command, check=True, capture_output=True, text=True, timeout=FFMPEG_TIMEOUT)
+    except (subprocess.CalledProcessError, FileNotFoundError, subprocess.TimeoutExpired) as e:
+        logging.error(f"কীফ্রেমের তালিকা পাওয়া যায়নি ({video_path}): {e}")
+        return None
+    finally:
+        metrics.observe('transcode_stage_seconds', time.monotonic() - probe_started, stage='keyframe_probe')
+
+    keyframes, start_time = [], 0.0
+    for line in result.stdout.splitlines():
+        pts_time, sep, flags = line.strip().partition(',')
+        if not sep:
+            start_time = _parse_number(pts_time) or 0.0 # ffmpeg এর -ss এই সময়ের সাপেক্ষে কাজ করে
+        elif 'K' in flags:
+            pts = _parse_number(pts_time)
+            if pts is not None:
+                keyframes.append(pts)
+    return sorted(max(0.0, round(pts - start_time, 6)) for pts in keyframes)
+
+def plan_chunks(duration, keyframes, workers, start=0.0):
+    """ভিডিওকে কীফ্রেমের সীমানায় টুকরোতে ভাগ করে: [{'index', 'name', 'start', 'duration'}, ...]।
+
+    টুকরোর দৈর্ঘ্য এমনভাবে ঠিক করা হয় যাতে প্রতিটি ওয়ার্কার কয়েকটি করে টুকরো পায় (শেষের দিকে
+    কোনো ওয়ার্কার অলস বসে না থাকে), এবং এটি সেগমেন্টের দৈর্ঘ্যের গুণিতক যাতে প্রায় সব সেগমেন্ট পূর্ণ হয়।
+    শেষ টুকরোর duration None (ফাইলের শেষ পর্যন্ত)। start দিলে (আগের চেষ্টার আউটপুট চালিয়ে যাওয়া) শুধু
+    সেখান থেকে শেষ পর্যন্ত ভাগ হয়; start কীফ্রেম না হলেও চলে, কারণ এনকোডের সময় ইনপুট সিক ফ্রেম-নির্ভুল।
+    টুকরোর নামে start থাকে, যাতে আগের চেষ্টার রেখে দেওয়া টুকরোর ফাইলের সাথে নাম না মেলে।
+    """
+    chunk_seconds = max(CHUNK_MIN_SECONDS, min(CHUNK_TARGET_SECONDS, (duration - start) / (workers * 2)))
+    chunk_seconds = math.ceil(chunk_seconds / HLS_SEGMENT_SECONDS) * HLS_SEGMENT_SECONDS
+
+    starts = [start]
+    for pts in keyframes:
+        # লক্ষ্য দৈর্ঘ্যের পরের প্রথম কীফ্রেমে কাটুন; শেষে খুব ছোট টুকরো রাখবেন না
+        if pts >= starts[-1] + chunk_seconds and duration - pts >= CHUNK_MIN_SECONDS / 2:
+            starts.append(pts)
+
+    chunks = []
+    for index, chunk_start in enumerate(starts):
+        end = starts[index + 1] if index + 1 < len(starts) else None
+        chunks.append({
+            'index': index,
+            'name': f'chunk{index:04d}' if not start else f'resume{round(start * 1000)}_chunk{index:04d}',
+            'start': chunk_start,
+            'duration': round(end - chunk_start, 6) if end is not None else None,
+        })
+    return chunks
+
+# প্লেলিস্টে যে ট্যাগগুলো নির্দিষ্ট সেগমেন্টের সাথে যায় (আগে জোড়া লাগানো প্লেলিস্টের DISCONTINUITY সহ)
+HLS_SEGMENT_TAGS = ('#EXTINF', '#EXT-X-BYTERANGE', '#EXT-X-MAP', '#EXT-X-DISCONTINUITY')
+
+def read_playlist_segments(playlist_path):
+    """একটি মিডিয়া প্লেলিস্ট পড়ে (ভার্সন, [(দৈর্ঘ্য, [সেগমেন্টের ট্যাগ..., URI]), ...]) রিটার্ন করে।
+
+    EXT-X-MAP (fMP4) ও EXT-X-BYTERANGE (একক ফাইল) এর মতো ট্যাগ পরের সেগমেন্টের লাইনের সাথে রাখা হয়।
+    ফাইল না থাকলে OSError রেইজ করে।
+    """
+    version, segments, pending, duration = 3, [], [], 0.0
+    with open(playlist_path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('#EXT-X-VERSION:'):
+                version = _parse_number(line.split(':', 1)[1], int) or version
+            elif line.startswith('#EXTINF:'):
+                duration = _parse_number(line.split(':', 1)[1].split(',')[0]) or 0.0
+                pending.append(line)
+            elif line.startswith(HLS_SEGMENT_TAGS):
+                pending.append(line)
+            elif line and not line.startswith('#') and pending:
+                segments.append((duration, pending + [line]))
+                pending = []
+    return version, segments
+
+class ChunkStitcher:
+    """আলাদাভাবে এনকোড হওয়া টুকরোগুলোর সেগমেন্ট জোড়া লাগিয়ে প্রতিটি রেজোলিউশনের একটি অবিচ্ছিন্ন playlist.m3u8 লেখে।
+
+    টুকরোগুলো যেকোনো ক্রমে শেষ হতে পারে; শুরু থেকে টানা শেষ হওয়া টুকরোগুলো সাথে সাথে প্লেলিস্টে যোগ হয়,
+    তাই আগাম প্রকাশ (PROGRESSIVE_PUBLISH) এই মোডেও কাজ করে। প্রতিটি টুকরোর শুরুতে #EXT-X-DISCONTINUITY
+    দেওয়া হয়, কারণ প্রতিটি টুকরোর এনকোডার (বিশেষ করে AAC এর শুরুর প্যাডিং) আলাদাভাবে শুরু হয়েছে;
+    টাইমস্ট্যাম্প অবশ্য -output_ts_offset এর কারণে মূল ভিডিওর সময়রেখা অনুযায়ীই থাকে।
+    """
+
+    def __init__(self, video_id, output_base_dir, renditions, chunks):
+        self.video_id = video_id
+        self.output_base_dir = output_base_dir
+        self.renditions = renditions
+        self.chunks = chunks
+        self.segments = {} # টুকরোর index -> {রেজোলিউশনের নাম: (ভার্সন, [(দৈর্ঘ্য, লাইন), ...])}
+        self.stitched = 0 # শুরু থেকে টানা কতগুলো টুকরো প্লেলিস্টে যোগ হয়েছে
+        self._lock = threading.Lock()
+
+    def chunk_done(self, chunk):
+        """একটি টুকরো এনকোড শেষ হলে তার প্লেলিস্টগুলো পড়ে এবং প্রয়োজনে জোড়া লাগানো প্লেলিস্ট আবার লেখে।"""
+        segments = {}
+        for rendition in self.renditions:
+            chunk_playlist = os.path.join(self.output_base_dir, rendition['name'], f"{chunk['name']}.m3u8")
+            segments[rendition['name']] = read_playlist_segments(chunk_playlist)
+            os.remove(chunk_playlist) # আর প্রয়োজন নেই
+        self.add_segments(chunk['index'], segments)
+
+    def add_segments(self, index, segments):
+        """একটি টুকরোর সেগমেন্ট ({রেজোলিউশনের নাম: (ভার্সন, সেগমেন্ট)}) যোগ করে; আগের চেষ্টায় তৈরি অংশও এভাবে আসে।"""
+        with self._lock:
+            self.segments[index] = segments
+            stitched = self.stitched
+            while stitched in self.segments:
+                stitched += 1
+            if stitched != self.stitched:
+                self.stitched = stitched
+                self._write_playlists()
+
+    def _write_playlists(self):
+        complete = self.stitched == len(self.chunks)
+        for rendition in self.renditions:
+            entries = [self.segments[index][rendition['name']] for index in range(self.stitched)]
+            version = max(version for version, _ in entries)
+            durations = [duration for _, chunk_segments in entries for duration, _ in chunk_segments]
+            lines = ['#EXTM3U', f'#EXT-X-VERSION:{version}',
+                     f'#EXT-X-TARGETDURATION:{max([HLS_SEGMENT_SECONDS] + [math.ceil(d) for d in durations])}',
+                     '#EXT-X-MEDIA-SEQUENCE:0']
+            if PROGRESSIVE_PUBLISH or complete:
+                lines.append('#EXT-X-PLAYLIST-TYPE:' + ('VOD' if complete else 'EVENT'))
+            for index, (_, chunk_segments) in enumerate(entries):
+                if index > 0:
+                    lines.append('#EXT-X-DISCONTINUITY') # fMP4 হলে এর পরেই টুকরোর নিজস্ব EXT-X-MAP আসে
+                for _, segment_lines in chunk_segments:
+                    lines += segment_lines
+            if complete:
+                lines.append('#EXT-X-ENDLIST')
+
+            playlist_path = os.path.join(self.output_base_dir, rendition['playlist_path'])
+            with open(playlist_path + '.tmp', 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+            os.replace(playlist_path + '.tmp', playlist_path)
+        hls_cache.invalidate(self.video_id)
+
+def encode_chunk(video_id, input_path, output_base_dir, renditions, chunk, has_audio, threads, previews=None):
+    """একটি টুকরোর সব রেজোলিউশন একটি ffmpeg প্রসেসে এনকোড করে। সফল হলে None, ব্যর্থ হলে ত্রুটির বার্তা রিটার্ন করে।"""
+    cmd = build_single_pass_command(input_path, output_base_dir, renditions, has_audio, threads, chunk=chunk, previews=previews)
+    logging.debug(f"[{video_id}] কমান্ড ({chunk['name']}): {' '.join(cmd)}")
+    try:
+        run_ffmpeg(cmd, duration=chunk['duration'], stage='chunk', rendition='all')
+        return None
+    except subprocess.CalledProcessError as e:
+        return (f"[{video_id}] টুকরো {chunk['index']} ({chunk['start']:.1f}s থেকে) এনকোড ব্যর্থ (ffmpeg exit code {e.returncode})।\n"
+                f"ইনপুট: {input_path}\nCommand: {' '.join(e.cmd)}\n"
+                f"STDERR (last 1000 chars):\n...{e.stderr[-1000:]}")
+    except subprocess.TimeoutExpired as e:
+        return (f"[{video_id}] টুকরো {chunk['index']} এনকোড টাইমআউট ({FFMPEG_TIMEOUT} সেকেন্ড)।\n"
+                f"ইনপুট: {input_path}\nCommand: {' '.join(e.cmd)}")
+    except Exception as e:
+        return f"[{video_id}] টুকরো {chunk['index']} এনকোডের সময় অপ্রত্যাশিত ত্রুটি: {e}\nInput: {input_path}"
+
+def transcode_chunked(video_id, input_path, output_base_dir, renditions, duration=None, has_audio=True, resume=None, previews=None):
+    """ভিডিওকে কীফ্রেমের সীমানায় টুকরো করে, প্রতিটি টুকরো আলাদা ffmpeg প্রসেসে একসাথে এনকোড করে এবং জোড়া লাগায়।
+
+    একটি ffmpeg যত কোর ব্যবহার করতে পারে তার চেয়ে বেশি কোর কাজে লাগে এবং প্রতিটি ffmpeg ছোট
+    থাকে বলে লম্বা ভিডিওতেও FFMPEG_TIMEOUT পার হয় না। সফল রেজোলিউশনগুলোর তালিকা রিটার্ন করে;
+    টুকরো করা সম্ভব না হলে (দৈর্ঘ্য বা কীফ্রেম অজানা, অথবা ভিডিও খুব ছোট) None রিটার্ন করে।
+
+    resume = {'start': সেকেন্ড, 'segments': {নাম: (ভার্সন, সেগমেন্ট)}} দিলে (যেকোনো মোডে আগের চেষ্টার অসম্পূর্ণ
+    রেজোলিউশন) ঐ সেগমেন্টগুলো প্রথম টুকরো হিসেবে রাখা হয় এবং শুধু start থেকে বাকি অংশ এনকোড হয়;
+    তখন টুকরো একটি হলেও চলে এবং None রিটার্ন হয় না।
+    previews দেওয়া হলে প্রতিটি টুকরো নিজের অংশের থাম্বনেইল লেখে (finalize_previews সেগুলো সময়ের ক্রমে জোড়া লাগায়)।
+    """
+    start = resume['start'] if resume else 0.0
+    encoded = [r for r in renditions if not r.get('passthrough')]
+    if all(r.get('audio_only') for r in encoded):
+        encoded = [] # এনকোড করার মতো ভিডিও নেই; শেয়ার করা অডিও (থাকলে) পাসথ্রুর মতো আলাদা ffmpeg এ তৈরি হয়
+    separate = [r for r in renditions if r not in encoded] # টুকরো ছাড়া পুরোটা একবারে তৈরি হয়
+
+    # এই জবের ভাগের কোরগুলো CHUNK_ENCODER_THREADS থ্রেডের ffmpeg প্রসেসগুলোর মধ্যে ভাগ করুন
+    job_cores = ffmpeg_thread_budget(1)
+    workers = max(1, job_cores // CHUNK_ENCODER_THREADS)
+    threads = max(1, job_cores // workers)
+
+    chunks = []
+    if encoded:
+        if not duration:
+            logging.warning(f"[{video_id}] ভিডিওর দৈর্ঘ্য অজানা, তাই টুকরো করে এনকোড করা সম্ভব নয়।")
+            return None
+        keyframes = probe_keyframes(input_path)
+        if not keyframes and not resume:
+            return None
+        chunks = plan_chunks(duration, keyframes or [], workers, start)
+        if len(chunks) < 2 and not resume:
+            logging.info(f"[{video_id}] ভিডিওটি টুকরো করার মতো লম্বা নয় বা যথেষ্ট কীফ্রেম নেই।")
+            return None
+        if len(chunks) < workers:
+            # বাকি অংশ ছোট (চালিয়ে যাওয়ার সময়): কম ffmpeg প্রসেস, প্রতিটিতে বেশি থ্রেড
+            workers = len(chunks)
+            threads = max(1, job_cores // workers)
+
+    logging.info(f"[{video_id}] {len(chunks)}টি টুকরো একসাথে এনকোড করা হচ্ছে "
+                 f"({workers}টি ffmpeg প্রসেস, প্রতিটিতে {threads} থ্রেড)...")
+    start_time = time.time()
+    names = [r['name'] for r in encoded]
+    update_job_progress(video_id, names, state='running', percent=round(start / duration * 100, 1) if start else 0)
+    if resume:
+        # আগের চেষ্টার সেগমেন্টগুলো টুকরো 0; নতুন টুকরোগুলো তার পরে (মাঝে DISCONTINUITY)
+        for chunk in chunks:
+            chunk['index'] += 1
+        stitcher = ChunkStitcher(video_id, output_base_dir, encoded, [None] + chunks)
+        stitcher.add_segments(0, resume['segments'])
+    else:
+        stitcher = ChunkStitcher(video_id, output_base_dir, encoded, chunks)
+    done_seconds = start
+    error_msg = None
+    if chunks:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"Chunk-{video_id[:8]}") as pool:
+            futures = {pool.submit(encode_chunk, video_id, input_path, output_base_dir, encoded, chunk, has_audio, threads, previews): chunk
+                       for chunk in chunks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                error_msg = future.result()
+                if error_msg:
+                    logging.error(error_msg)
+                    for pending in futures:
+                        pending.cancel() # বাকি টুকরোগুলো শুরু করবেন না
+                    break
+                stitcher.chunk_done(chunk)
+                # অগ্রগতি = শেষ হওয়া টুকরোগুলোর মোট দৈর্ঘ্য (টুকরো অনেক, তাই যথেষ্ট মসৃণ)
+                done_seconds += chunk['duration'] if chunk['duration'] is not None else duration - chunk['start']
+                update_job_progress(video_id, names, state='running', percent=round(min(100.0, done_seconds / duration * 100), 1))
+
+    if error_msg:
+        update_job_progress(video_id, names, state='failed')
+        set_job_error(video_id, error_msg)
+        completed = []
+    else:
+        if chunks:
+            logging.info(f"[{video_id}] টুকরো করে এনকোডিং শেষ ({time.time() - start_time:.2f} সেকেন্ড)।")
+        update_job_progress(video_id, names, state='done', percent=100.0, eta_seconds=0)
+        completed = list(encoded)
+
+    for rendition in separate:
+        separate_error = encode_rendition(video_id, input_path, output_base_dir, rendition, threads, duration, has_audio)
+        if separate_error:
+            set_job_error(video_id, separate_error, overwrite=False)
+        else:
+            completed.append(rendition)
+    # মূল ক্রম বজায় রাখুন
+    return [r for r in renditions if r in completed]
+
+class MasterPlaylistPublisher:
+    """ট্রান্সকোডিং চলাকালীন যে রেজোলিউশনগুলোর অন্তত PROGRESSIVE_MIN_SEGMENTS সেগমেন্ট তৈরি হয়েছে
+    সেগুলো দিয়ে মাস্টার প্লেলিস্ট আগেই প্রকাশ করে, যাতে দর্শক পুরো ট্রান্সকোড শেষ হওয়ার আগেই দেখা শুরু করতে পারে।
+
+    রেজোলিউশন প্লেলিস্টগুলো 'event' ধরনের (শেষে #EXT-X-ENDLIST না আসা পর্যন্ত বাড়তে থাকে), তাই প্লেয়ার
+    নতুন সেগমেন্টগুলো নিজে থেকেই পায়। নতুন কোনো রেজোলিউশন তৈরি হলে মাস্টার প্লেলিস্ট আবার লেখা হয়।
+    """
+
+    def __init__(self, video_id, output_base_dir, renditions):
+        self.video_id = video_id
+        self.output_base_dir = output_base_dir
+        self.renditions = renditions
+        self.published = set() # মাস্টার প্লেলিস্টে প্রকাশিত রেজোলিউশনের নাম
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"Publish-{video_id[:8]}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(PROGRESSIVE_POLL_INTERVAL):
             try:
-                 with open(error_file_path, 'w') as f: f.write(error_msg) # ত্রুটি ফাইল লিখুন
-            except IOError as io_err:
-                logging.error(f"[{video_id}] অপ্রত্যাশিত ত্রুটি ফাইল লিখতে ব্যর্থ: {error_file_path}: {io_err}")
-            # >>> এখানে লুপ ব্রেক করা হচ্ছে, তাই পরবর্তী রেজোলিউশনগুলো চেষ্টা করা হবে না <<<
-            break
-        # --- একটি রেজোলিউশনের জন্য ffmpeg চালানো শেষ ---
-
-    # --- রেজোলিউশন লুপ শেষ ---
-
-    # যদি কোনো রেজোলিউশন সফলভাবে তৈরি না হয় (লিস্ট খালি থাকে)
-    if not resolution_details_for_master:
-         # এই বার্তাটি তখনই আসবে যদি প্রথম রেজোলিউশনটিই ব্যর্থ হয় বা কোনোটিই উপযুক্ত না হয়
-         logging.error(f"[{video_id}] কোনো রেজোলিউশন সফলভাবে তৈরি হয়নি। মাস্টার প্লেলিস্ট তৈরি করা সম্ভব নয়।")
-         # ত্রুটি ফাইল আগে তৈরি হয়ে থাকার কথা, তাই এখানে আবার লেখার দরকার নেই যদি না কোনো নতুন ত্রুটি ঘটে
-         return False # ব্যর্থ রিটার্ন করুন
+                self.check()
+            except Exception as e:
+                logging.warning(f"[{self.video_id}] আগাম মাস্টার প্লেলিস্ট প্রকাশ করতে সমস্যা: {e}")
 
-    # --- মাস্টার প্লেলিস্ট তৈরি করুন (শুধুমাত্র সফল রেজোলিউশনগুলো দিয়ে) ---
+    def _segment_count(self, rendition):
+        try:
+            with open(os.path.join(self.output_base_dir, rendition['playlist_path'])) as f:
+                return sum(1 for line in f if line.startswith('#EXTINF'))
+        except OSError:
+            return 0
+
+    def check(self):
+        """নতুন কোনো রেজোলিউশন প্রস্তুত হলে মাস্টার প্লেলিস্ট আবার লেখে।"""
+        with self._lock:
+            ready = [r for r in self.renditions
+                     if r['name'] in self.published or self._segment_count(r) >= PROGRESSIVE_MIN_SEGMENTS]
+            if len(ready) == len(self.published):
+                return
+            # শেয়ার করা অডিও থাকলে সেটি ও অন্তত একটি ভিডিও প্রস্তুত না হওয়া পর্যন্ত কিছু প্রকাশ করা যাবে না
+            if any(r.get('audio_only') for r in self.renditions) and not any(r.get('audio_only') for r in ready):
+                return
+            if all(r.get('audio_only') for r in ready):
+                return
+            write_master_playlist(self.video_id, self.output_base_dir, ready)
+            first_publish = not self.published
+            self.published = {r['name'] for r in ready}
+            update_job_progress(self.video_id, [], info={'published': [r['name'] for r in ready]})
+        if first_publish:
+            logging.info(f"[{self.video_id}] ট্রান্সকোডিং চলাকালীন মাস্টার প্লেলিস্ট প্রকাশিত হয়েছে; প্লেব্যাক শুরু করা যাবে।")
+
+    def reset(self):
+        """প্রকাশিত মাস্টার প্লেলিস্ট সরিয়ে শুরু থেকে আবার গণনা করে (যেমন রেজোলিউশনগুলো নতুন করে তৈরি হলে)।"""
+        with self._lock:
+            try:
+                os.remove(os.path.join(self.output_base_dir, MASTER_PLAYLIST_NAME))
+            except FileNotFoundError:
+                pass
+            hls_cache.invalidate(self.video_id)
+            self.published = set()
+            update_job_progress(self.video_id, [], info={'published': []})
+
+def write_master_playlist(video_id, output_base_dir, resolution_details_for_master):
+    """সফলভাবে তৈরি হওয়া রেজোলিউশনগুলো দিয়ে মাস্টার প্লেলিস্ট লেখে।
+
+    শেয়ার করা অডিও-রেন্ডিশন থাকলে সেটি EXT-X-MEDIA হিসেবে যায় এবং প্রতিটি ভিডিও ভ্যারিয়েন্ট AUDIO= দিয়ে সেটি দেখায়।
+    """
     logging.info(f"[{video_id}] সফলভাবে তৈরি হওয়া রেজোলিউশনগুলো দিয়ে মাস্টার প্লেলিস্ট তৈরি করা হচ্ছে...")
+    master_playlist_content = "#EXTM3U\n#EXT-X-VERSION:3\n" # মাস্টার প্লেলিস্টের শুরু
+    audio = next((d for d in resolution_details_for_master if d.get('audio_only')), None)
+    if audio is not None:
+        master_playlist_content += (f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="{SHARED_AUDIO_GROUP}",NAME="Default",'
+                                    f'DEFAULT=YES,AUTOSELECT=YES,URI="{audio["playlist_path"]}"\n')
     for detail in resolution_details_for_master:
+        if detail.get('audio_only'):
+            continue
         # গণনা করা প্রস্থ ও উচ্চতা ব্যবহার করুন
-        master_playlist_content += f'#EXT-X-STREAM-INF:BANDWIDTH={detail["bandwidth"]},RESOLUTION={detail["width"]}x{detail["height"]}\n'
+        master_playlist_content += f'#EXT-X-STREAM-INF:BANDWIDTH={detail["bandwidth"]},RESOLUTION={detail["width"]}x{detail["height"]}'
+        if audio is not None:
+            master_playlist_content += f',AUDIO="{SHARED_AUDIO_GROUP}"'
+        master_playlist_content += '\n'
         master_playlist_content += f'{detail["playlist_path"]}\n' # রিলেটিভ পাথ যোগ করুন
 
     master_playlist_path = os.path.join(output_base_dir, MASTER_PLAYLIST_NAME) # মাস্টার ফাইলের পাথ
-    ready_file_path = os.path.join(output_base_dir, HLS_READY_FILENAME) # রেডি ফাইলের পাথ
-    try:
-        # মাস্টার প্লেলিস্ট ফাইল লিখুন
-        with open(master_playlist_path, 'w') as f:
-            f.write(master_playlist_content)
-        logging.info(f"[{video_id}] মাস্টার প্লেলিস্ট সফলভাবে তৈরি হয়েছে: {master_playlist_path}")
-
-        # রেডি ফাইল তৈরি করুন (প্রসেসিং সফল নির্দেশক)
-        with open(ready_file_path, 'w') as f:
-             f.write(time.strftime("%Y-%m-%d %H:%M:%S"))
-        logging.info(f"[{video_id}] HLS প্রসেসিং সম্পন্ন। রেডি মার্কার তৈরি হয়েছে: {ready_file_path}")
-        # মোট সময় লগ করার প্রয়োজন নেই কারণ এটি লুপের মধ্যে পরিবর্তিত হতে পারে
+    # দর্শক প্রসেসিং চলাকালীনও এটি পড়তে পারে, তাই অস্থায়ী ফাইলে লিখে rename করুন
+    write_started = time.monotonic()
+    with open(master_playlist_path + '.tmp', 'w') as f:
+        f.write(master_playlist_content)
+    os.replace(master_playlist_path + '.tmp', master_playlist_path)
+    metrics.observe('transcode_stage_seconds', time.monotonic() - write_started, stage='playlist')
+    hls_cache.invalidate(video_id)
+    logging.info(f"[{video_id}] মাস্টার প্লেলিস্ট সফলভাবে তৈরি হয়েছে: {master_playlist_path}")
+
+RESUME_SIGNATURE_KEYS = ('height', 'v_bitrate', 'a_bitrate', 'audio_only', 'audio_group') # এগুলো বদলালে আগের আউটপুট চলবে না
+RESUME_ALIGN_TOLERANCE = 0.1 # সেগমেন্টের সীমানা একই সময়ে ধরা হবে যদি পার্থক্য এর চেয়ে কম হয় (সেকেন্ড)
+_transcode_state_lock = threading.Lock() # সমান্তরাল মোডে একাধিক থ্রেড একসাথে স্টেট ফাইল আপডেট করে
+
+def rendition_signature(rendition):
+    """রেজোলিউশনের যে বৈশিষ্ট্যগুলো (এবং সেগমেন্টের ধরন) বদলালে আগের চেষ্টার আউটপুট আর ব্যবহার করা যায় না।"""
+    signature = {key: rendition.get(key) for key in RESUME_SIGNATURE_KEYS}
+    signature.update(segment_type=HLS_SEGMENT_TYPE, single_file=HLS_SINGLE_FILE)
+    return signature
+
+def read_transcode_state(output_base_dir):
+    """HLS ডিরেক্টরির স্টেট ফাইল পড়ে; না থাকলে বা নষ্ট হলে খালি dict।"""
+    try:
+        with open(os.path.join(output_base_dir, TRANSCODE_STATE_FILENAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_transcode_state(output_base_dir, state):
+    """স্টেট ফাইল অস্থায়ী নামে লিখে rename করে, যাতে প্রসেস মাঝপথে মারা গেলেও ফাইলটি নষ্ট না হয়।"""
+    state_path = os.path.join(output_base_dir, TRANSCODE_STATE_FILENAME)
+    with open(state_path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(state_path + '.tmp', state_path)
+
+def mark_renditions_complete(output_base_dir, renditions):
+    """সম্পন্ন রেজোলিউশনগুলো (পাসথ্রু, প্রস্থ ও BANDWIDTH সহ) স্টেট ফাইলে লেখে, যাতে পরের চেষ্টায় সেগুলো আবার তৈরি না হয়।"""
+    with _transcode_state_lock:
+        try:
+            state = read_transcode_state(output_base_dir)
+            entries = state.setdefault('renditions', {})
+            for rendition in renditions:
+                entries[rendition['name']] = {'signature': rendition_signature(rendition), 'complete': True, 'rendition': rendition}
+            write_transcode_state(output_base_dir, state)
+        except OSError as e:
+            # শুধু পরের চেষ্টায় আবার ব্যবহারের সুবিধা হারায়, এই চেষ্টার ফলাফলে কোনো সমস্যা নেই
+            logging.warning(f"সম্পন্ন রেজোলিউশনের তথ্য স্টেট ফাইলে লেখা যায়নি ({output_base_dir}): {e}")
+
+def _segment_files(lines):
+    """একটি সেগমেন্টের লাইনগুলো থেকে {ফাইলের নাম: ফাইলটির ন্যূনতম আকার} (EXT-X-MAP এর ফাইলসহ)।"""
+    uri = lines[-1]
+    files = {uri: 1}
+    for line in lines[:-1]:
+        if line.startswith('#EXT-X-BYTERANGE:'):
+            length, _, offset = line.split(':', 1)[1].partition('@')
+            files[uri] = max(files[uri], int(offset or 0) + int(length))
+        elif line.startswith('#EXT-X-MAP:'):
+            map_uri = re.search(r'URI="([^"]+)"', line)
+            map_range = re.search(r'BYTERANGE="(\d+)(?:@(\d+))?"', line)
+            if map_uri:
+                size = int(map_range.group(2) or 0) + int(map_range.group(1)) if map_range else 1
+                files[map_uri.group(1)] = max(files.get(map_uri.group(1), 1), size)
+    return files
+
+def read_rendition_output(output_base_dir, rendition):
+    """আগের চেষ্টায় লেখা একটি রেজোলিউশনের প্লেলিস্ট যাচাই করে: (ভার্সন, শুরু থেকে টানা যে সেগমেন্টগুলোর ফাইল ঠিক আছে, সম্পূর্ণ কিনা)।
+
+    সম্পূর্ণ মানে প্লেলিস্টে #EXT-X-ENDLIST আছে (ffmpeg ও ChunkStitcher শুধু সফলভাবে শেষ হলে এটি লেখে) এবং
+    সব সেগমেন্টের ফাইল আছে ও বাইট-রেঞ্জ অনুযায়ী যথেষ্ট বড়।
+    """
+    rendition_dir = os.path.join(output_base_dir, rendition['name'])
+    playlist_path = os.path.join(output_base_dir, rendition['playlist_path'])
+    try:
+        version, segments = read_playlist_segments(playlist_path)
+        with open(playlist_path) as f:
+            ended = '#EXT-X-ENDLIST' in f.read()
+    except OSError:
+        return 3, [], False # প্লেলিস্ট নেই
+    verified = []
+    for segment in segments:
+        try:
+            present = all(os.path.getsize(os.path.join(rendition_dir, name)) >= size
+                          for name, size in _segment_files(segment[1]).items())
+        except (OSError, ValueError):
+            present = False
+        if not present:
+            break # এখান থেকে পরের সেগমেন্টগুলো নেই বা অসম্পূর্ণ
+        verified.append(segment)
+    return version, verified, ended and len(verified) == len(segments)
+
+def _group_resumable(partial):
+    """অসম্পূর্ণ রেজোলিউশনগুলোকে চালিয়ে যাওয়ার সময় অনুযায়ী দলে ভাগ করে: [(start, {নাম: (ভার্সন, সেগমেন্ট)}), ...]।
+
+    একক-পাস ও টুকরো মোডে সব রেজোলিউশনের সেগমেন্টের সীমানা একই সময়ে পড়ে, তাই সবচেয়ে কম এগোনো রেজোলিউশনের
+    সময়ে বাকিগুলো ছেঁটে সবগুলো একসাথে চালানো যায়; সীমানা না মিললে (প্রতি-রেজোলিউশন মোড) প্রতিটি নিজের সময় থেকে চলে।
+    """
+    if not partial:
+        return []
+    ends = {name: sum(duration for duration, _ in segments) for name, (_, segments) in partial.items()}
+    start = min(ends.values())
+    groups = {}
+    for name, (version, segments) in partial.items():
+        cut, end = [], 0.0
+        for segment in segments:
+            if end + segment[0] > start + RESUME_ALIGN_TOLERANCE:
+                break
+            cut.append(segment)
+            end += segment[0]
+        if abs(end - start) <= RESUME_ALIGN_TOLERANCE:
+            groups.setdefault(start, {})[name] = (version, cut)
+        else:
+            groups.setdefault(ends[name], {})[name] = (version, segments)
+    return sorted(groups.items())
+
+def _remove_hls_items(directory_path, keep):
+    """ডিরেক্টরির ভিতরে keep এর বাইরে থাকা সব ফাইল ও ফোল্ডার মুছে ফেলে।"""
+    for item in os.listdir(directory_path):
+        if item in keep:
+            continue
+        item_path = os.path.join(directory_path, item)
+        try:
+            if os.path.isdir(item_path):
+                shutil.rmtree(item_path)
+            else:
+                os.remove(item_path)
+        except OSError as e:
+            logging.error(f"আইটেমটি মুছে ফেলা যায়নি {item_path}: {e}")
+
+def plan_resume(video_id, output_base_dir, renditions, duration):
+    """আগের চেষ্টার আউটপুট থেকে কী রাখা যায় তা ঠিক করে: (সম্পূর্ণ রেজোলিউশন, চালিয়ে যাওয়ার দল) রিটার্ন করে।
+
+    একই বৈশিষ্ট্যে পরিকল্পিত (স্টেট ফাইল অনুযায়ী) এবং যাচাইয়ে টেকা সম্পূর্ণ রেজোলিউশন হুবহু রাখা হয়। অসম্পূর্ণ
+    এনকোড হওয়া ভিডিও রেজোলিউশনের শুরু থেকে টানা ঠিকঠাক সেগমেন্টগুলো (অন্তত RESUME_MIN_SECONDS) রেখে সেখান
+    থেকে চালিয়ে যাওয়া হয় (_group_resumable দেখুন)। বাকি সবকিছু (আগের মাস্টার প্লেলিস্ট, অসম্পূর্ণ সেগমেন্ট ও
+    পরিকল্পনায় নেই এমন ডিরেক্টরি) মুছে ফেলা হয় এবং নতুন পরিকল্পনা স্টেট ফাইলে লেখা হয়। প্রিভিউ ডিরেক্টরি
+    plan_previews এর দায়িত্বে।
+    """
+    previous = read_transcode_state(output_base_dir).get('renditions', {})
+    complete, partial = [], {}
+    for rendition in renditions:
+        entry = previous.get(rendition['name'])
+        if entry is None or entry.get('signature') != rendition_signature(rendition):
+            continue # নতুন রেজোলিউশন বা সেটিংস বদলেছে: শুরু থেকে
+        version, segments, ended = read_rendition_output(output_base_dir, rendition)
+        produced = sum(segment_duration for segment_duration, _ in segments)
+        if ended and (not duration or abs(produced - duration) <= max(1.0, duration * 0.01)):
+            if entry.get('complete'):
+                rendition.update(entry['rendition']) # পাসথ্রু, প্রস্থ ও BANDWIDTH আগের মতোই
+            complete.append(rendition)
+        elif (duration and produced >= RESUME_MIN_SECONDS and not ended
+              and not rendition.get('audio_only') and not rendition.get('passthrough')):
+            # অডিও ও পাসথ্রু দ্রুত তৈরি হয়, তাই সেগুলো শুরু থেকেই করা হয়
+            partial[rendition['name']] = (version, segments)
+
+    groups = _group_resumable(partial)
+    kept_segments = {name: segments for _, group in groups for name, (_, segments) in group.items()}
+    for rendition in renditions:
+        rendition_dir = os.path.join(output_base_dir, rendition['name'])
+        if rendition in complete:
+            continue
+        if rendition['name'] in kept_segments:
+            # রাখা সেগমেন্টগুলোর ফাইল ছাড়া বাকিগুলো (অসম্পূর্ণ বা ছেঁটে ফেলা সেগমেন্ট, অস্থায়ী ফাইল) মুছুন
+            keep = {'playlist.m3u8'}
+            for _, lines in kept_segments[rendition['name']]:
+                keep.update(_segment_files(lines))
+            _remove_hls_items(rendition_dir, keep)
+        else:
+            _remove_hls_items(rendition_dir, set())
+    _remove_hls_items(output_base_dir, {r['name'] for r in renditions} | {TRANSCODE_STATE_FILENAME, PREVIEWS_DIRNAME})
+    hls_cache.invalidate(video_id)
+
+    write_transcode_state(output_base_dir, {'renditions': {
+        r['name']: {'signature': rendition_signature(r), 'complete': r in complete, 'rendition': r} for r in renditions}})
+    if complete or groups:
+        resumed = ', '.join(f"{name} ({start:.1f}s থেকে)" for start, group in groups for name in group)
+        logging.info(f"[{video_id}] আগের চেষ্টার আউটপুট আবার ব্যবহার হচ্ছে — সম্পূর্ণ: "
+                     f"{', '.join(r['name'] for r in complete) or 'নেই'}; চালিয়ে যাওয়া হবে: {resumed or 'নেই'}।")
+    return complete, groups
+
+def _even(value):
+    """ffmpeg এর yuv420p স্কেলারের জন্য মাপকে নিকটতম জোড় সংখ্যায় (অন্তত 2) নামায়।"""
+    return max(2, int(round(value / 2)) * 2)
+
+def plan_previews(output_base_dir, media):
+    """পোস্টার, থাম্বনেইল স্প্রাইট ও WebVTT ট্র্যাকের পরিকল্পনা করে; তৈরি করার দরকার না হলে None রিটার্ন করে।
+
+    আগের চেষ্টায় VTT লেখা হয়ে গেলে প্রিভিউ সম্পূর্ণ, তাই আবার তৈরি হয় না; নইলে প্রিভিউ ডিরেক্টরির
+    আধাআধি ফাইল মুছে নতুন করে শুরু হয়।
+    """
+    if not PREVIEWS_ENABLED:
+        return None
+    previews_dir = os.path.join(output_base_dir, PREVIEWS_DIRNAME)
+    if os.path.isfile(os.path.join(previews_dir, THUMBNAILS_VTT_FILENAME)):
+        return None
+    ensure_dir(previews_dir)
+    clear_hls_directory_contents(previews_dir)
+    width, height = media['width'], media['height'] # প্রদর্শনের দিক অনুযায়ী (probe_media দেখুন)
+    poster_width = min(POSTER_MAX_WIDTH, width)
+    duration = media.get('duration')
+    return {
+        'dir': previews_dir,
+        'thumb_size': (_even(THUMBNAIL_WIDTH), _even(THUMBNAIL_WIDTH * height / width)),
+        'poster_size': (_even(poster_width), _even(poster_width * height / width)),
+        'poster_at': duration * POSTER_POSITION if duration else 0.0,
+    }
+
+def _preview_carrier(renditions, previews):
+    """আলাদা ffmpeg মোডে কোন রেজোলিউশনের ডিকোড প্রিভিউও লিখবে তা বাছাই করে (পাসথ্রু ও অডিও ডিকোড করে না)।"""
+    if previews is None:
+        return None
+    return next((r for r in renditions if not r.get('passthrough') and not r.get('audio_only')), None)
+
+def preview_output_options(previews, start=0.0, duration=None, thumbnails=True, poster=True):
+    """একই ffmpeg কমান্ডে ইনপুটের ভিডিও থেকে থাম্বনেইল ও পোস্টারের অতিরিক্ত আউটপুট যোগ করার অপশন তৈরি করে।
+
+    start ও duration হলো এই কমান্ডে ডিকোড হওয়া অংশ (মূল ভিডিওর সময়রেখায়)। থাম্বনেইলের ফাইলের নামে
+    অংশের শুরু (মিলিসেকেন্ড) থাকে, তাই টুকরোগুলোর থাম্বনেইল পরে সময়ের ক্রমে সাজানো যায়। পোস্টার শুধু
+    সেই অংশ থেকে লেখা হয় যেখানে poster_at পড়ে।
+    """
+    limit = ['-t', f'{duration:.6f}'] if duration is not None else []
+    cmd = []
+    if thumbnails:
+        thumb_w, thumb_h = previews['thumb_size']
+        cmd += ['-map', '0:v:0', *limit,
+                '-vf', f'fps=1/{THUMBNAIL_INTERVAL},scale={thumb_w}:{thumb_h},setsar=1',
+                '-q:v', '5', '-f', 'image2',
+                os.path.join(previews['dir'], f'thumb_{int(round(start * 1000)):010d}_%05d.jpg')]
+    offset = previews['poster_at'] - start
+    if poster and offset >= 0 and (duration is None or offset < duration):
+        poster_w, poster_h = previews['poster_size']
+        cmd += ['-map', '0:v:0', *limit,
+                '-vf', f"select='isnan(prev_selected_t)*gte(t,{offset:.3f})',scale={poster_w}:{poster_h},setsar=1",
+                '-frames:v', '1', '-update', '1', '-q:v', '3', '-f', 'image2',
+                os.path.join(previews['dir'], POSTER_FILENAME)]
+    return cmd
+
+def _vtt_timestamp(seconds):
+    """সেকেন্ডকে WebVTT এর HH:MM:SS.mmm ফরম্যাটে লেখে।"""
+    millis = int(round(seconds * 1000))
+    return f"{millis // 3600000:02d}:{millis // 60000 % 60:02d}:{millis // 1000 % 60:02d}.{millis % 1000:03d}"
+
+def finalize_previews(video_id, input_path, previews, duration):
+    """এনকোডের সাথে লেখা থাম্বনেইলগুলো স্প্রাইট শিটে জোড়া লাগিয়ে WebVTT ট্র্যাক লেখে।
+
+    কোনো ডিকোড প্রিভিউ না লিখলে (যেমন সব রেজোলিউশন পাসথ্রু বা আগের চেষ্টায় সম্পূর্ণ) শুধু কীফ্রেম ডিকোড
+    করে বাকিগুলো তৈরি হয়। প্রিভিউ ঐচ্ছিক, তাই ব্যর্থ হলে শুধু সতর্কবার্তা লগ হয়; ভিডিও তবুও প্রস্তুত।
+    """
+    previews_dir = previews['dir']
+    start_time = time.monotonic()
+    try:
+        thumbs = [name for name in os.listdir(previews_dir) if name.startswith('thumb_')]
+        has_poster = os.path.isfile(os.path.join(previews_dir, POSTER_FILENAME))
+        if not thumbs or not has_poster:
+            logging.info(f"[{video_id}] এনকোডের সাথে প্রিভিউ তৈরি হয়নি, কীফ্রেম থেকে তৈরি করা হচ্ছে...")
+            cmd = ['ffmpeg', '-skip_frame', 'nokey', '-i', input_path,
+                   *preview_output_options(previews, thumbnails=not thumbs, poster=not has_poster)]
+            run_ffmpeg(cmd, duration=duration, stage='previews')
+            thumbs = [name for name in os.listdir(previews_dir) if name.startswith('thumb_')]
+        if not thumbs:
+            logging.warning(f"[{video_id}] কোনো থাম্বনেইল তৈরি হয়নি; থাম্বনেইল ট্র্যাক বাদ দেওয়া হচ্ছে।")
+            return
+
+        # thumb_<অংশের শুরু ms>_<ক্রম>.jpg -> মূল ভিডিওর সময়
+        timed = []
+        for name in thumbs:
+            _, start_ms, number = os.path.splitext(name)[0].split('_')
+            timed.append((int(start_ms) / 1000 + (int(number) - 1) * THUMBNAIL_INTERVAL, name))
+        timed.sort()
+        if duration:
+            timed = [(at, name) for at, name in timed if at < duration] or timed[:1]
+        for index, (_, name) in enumerate(timed):
+            os.replace(os.path.join(previews_dir, name), os.path.join(previews_dir, f'seq_{index + 1:05d}.jpg'))
+        for name in thumbs:
+            if os.path.exists(os.path.join(previews_dir, name)):
+                os.remove(os.path.join(previews_dir, name)) # ভিডিওর দৈর্ঘ্যের বাইরের অতিরিক্ত ফ্রেম
+
+        columns, rows = THUMBNAIL_SPRITE_GRID
+        rows = min(rows, -(-len(timed) // columns)) # ছোট ভিডিওতে একটি শিট, ফাঁকা সারি ছাড়া
+        run_ffmpeg(['ffmpeg', '-framerate', '1', '-i', os.path.join(previews_dir, 'seq_%05d.jpg'),
+                    '-vf', f'tile={columns}x{rows}', '-q:v', '5', '-f', 'image2',
+                    os.path.join(previews_dir, 'sprite_%03d.jpg')], stage='previews')
+
+        thumb_w, thumb_h = previews['thumb_size']
+        per_sheet = columns * rows
+        lines = ['WEBVTT', '']
+        for index, (at, _) in enumerate(timed):
+            end = timed[index + 1][0] if index + 1 < len(timed) else max(duration or 0, at + THUMBNAIL_INTERVAL)
+            cell = index % per_sheet
+            lines += [f"{_vtt_timestamp(at)} --> {_vtt_timestamp(end)}",
+                      f"sprite_{index // per_sheet + 1:03d}.jpg#xywh={cell % columns * thumb_w},{cell // columns * thumb_h},{thumb_w},{thumb_h}",
+                      '']
+        vtt_path = os.path.join(previews_dir, THUMBNAILS_VTT_FILENAME)
+        with open(vtt_path + '.tmp', 'w') as f:
+            f.write('\n'.join(lines))
+        os.replace(vtt_path + '.tmp', vtt_path) # VTT সবশেষে: এটি থাকা মানে প্রিভিউ সম্পূর্ণ (plan_previews দেখুন)
+        for index in range(len(timed)):
+            os.remove(os.path.join(previews_dir, f'seq_{index + 1:05d}.jpg'))
+        metrics.observe('transcode_stage_seconds', time.monotonic() - start_time, stage='previews')
+        logging.info(f"[{video_id}] প্রিভিউ তৈরি হয়েছে ({len(timed)}টি থাম্বনেইল, "
+                     f"{(len(timed) - 1) // per_sheet + 1}টি স্প্রাইট শিট, {time.monotonic() - start_time:.2f} সেকেন্ড)।")
+    except subprocess.CalledProcessError as e:
+        logging.warning(f"[{video_id}] প্রিভিউ তৈরি ব্যর্থ (ffmpeg exit code {e.returncode}):\n...{e.stderr[-1000:]}")
+    except subprocess.TimeoutExpired:
+        logging.warning(f"[{video_id}] প্রিভিউ তৈরি টাইমআউট ({FFMPEG_TIMEOUT} সেকেন্ড)।")
+    except (OSError, ValueError) as e:
+        logging.warning(f"[{video_id}] প্রিভিউ তৈরি ব্যর্থ: {e}")
+
+def preview_urls(video_id, hls_dir):
+    """তৈরি হয়ে থাকা প্রিভিউগুলোর URL রিটার্ন করে ({'poster': ..., 'thumbnails': ...}; না থাকলে None)।"""
+    previews_dir = os.path.join(hls_dir, PREVIEWS_DIRNAME)
+    base = f"/hls/{video_id}/{PREVIEWS_DIRNAME}/"
+    return {
+        'poster': base + POSTER_FILENAME if os.path.isfile(os.path.join(previews_dir, POSTER_FILENAME)) else None,
+        'thumbnails': (base + THUMBNAILS_VTT_FILENAME
+                       if os.path.isfile(os.path.join(previews_dir, THUMBNAILS_VTT_FILENAME)) else None),
+    }
+
+def transcode_to_hls(video_id, input_path, output_base_dir, resolutions):
+    """ভিডিওকে HLS ফরম্যাটে ট্রান্সকোড করে এবং মাস্টার প্লেলিস্টে সঠিক রেজোলিউশন ব্যবহার করে।
+
+    TRANSCODE_MODE 'single_pass' হলে সব রেজোলিউশন একটি ffmpeg প্রসেসে তৈরি হয়;
+    সেটি ব্যর্থ হলে বা মোড 'per_rendition' হলে প্রতিটি রেজোলিউশনের জন্য আলাদা ffmpeg চলে।
+    'parallel' মোডে আলাদা ffmpeg প্রসেসগুলো একসাথে চলে। 'chunked' মোডে (এবং CHUNKED_MIN_DURATION দেওয়া থাকলে
+    তার চেয়ে লম্বা ভিডিওতে যেকোনো মোডে) ভিডিও কীফ্রেমে টুকরো করে টুকরোগুলো একসাথে এনকোড হয়।
+    PER_TITLE_LADDER চালু থাকলে resolutions এর বদলে ভিডিওর জটিলতা থেকে বাছাই করা সিঁড়ি ব্যবহার হয়;
+    resolutions শুধু বিশ্লেষণ সম্ভব না হলে।
+    """
+    # ইনপুট ফাইল আছে এবং খালি নয় তা নিশ্চিত করুন
+    if not os.path.exists(input_path) or os.path.getsize(input_path) == 0:
+        error_msg = f"[{video_id}] ইনপুট ভিডিও ফাইল খুঁজে পাওয়া যায়নি বা খালি: {input_path}"
+        logging.error(error_msg)
+        set_job_error(video_id, error_msg)
+        return False
+
+    # --- মূল ভিডিওর তথ্য পান (একবার ffprobe, পরের চেষ্টাগুলোতে ক্যাশ থেকে) ---
+    media = get_media_info(input_path)
+    if not media or not media.get('width') or not media.get('height'):
+        # যদি ডাইমেনশন না পাওয়া যায়, ত্রুটি লগ করুন এবং ব্যর্থ হোন
+        error_msg = f"[{video_id}] ভিডিও ডাইমেনশন পাওয়া যায়নি ({input_path})। ট্রান্সকোডিং সম্ভব নয়।"
+        logging.error(error_msg)
+        set_job_error(video_id, error_msg)
+        return False
+    original_width, original_height = media['width'], media['height']
+    # --- ভিডিওর তথ্য পাওয়া শেষ ---
+
+    logging.info(f"[{video_id}] HLS ট্রান্সকোডিং শুরু হচ্ছে (সোর্স রেজোলিউশন: {original_width}x{original_height}, মোড: {TRANSCODE_MODE}) ফাইল: {input_path} থেকে ডিরেক্টরি: {output_base_dir}...")
+    ensure_dir(output_base_dir) # ভিডিওর নির্দিষ্ট HLS ডিরেক্টরি তৈরি করুন
+
+    # --- প্রতিটি কাঙ্ক্ষিত রেজোলিউশনের প্রস্থ গণনা করুন এবং ডিরেক্টরি তৈরি করুন ---
+    if PER_TITLE_LADDER:
+        resolutions = plan_per_title_ladder(video_id, input_path, media) or resolutions
+    has_audio = media['has_audio']
+    shared_audio = HLS_SHARED_AUDIO and has_audio
+    renditions = plan_renditions(video_id, original_width, original_height, resolutions, shared_audio)
+    if shared_audio and renditions:
+        # অডিও-রেন্ডিশন তালিকার শুরুতে: প্রতি-রেজোলিউশন মোডে এটি (দ্রুত) আগে তৈরি হয়, তাই আগাম প্রকাশ দেরি হয় না
+        renditions.insert(0, plan_audio_rendition())
+    for rendition in renditions:
+        ensure_dir(os.path.join(output_base_dir, rendition['name']))
+    # অগ্রগতির শতাংশ গণনার জন্য ভিডিওর দৈর্ঘ্য; সব রেজোলিউশন প্রথমে 'pending' অবস্থায়
+    duration = media.get('duration')
+    if not duration:
+        logging.warning(f"[{video_id}] ভিডিওর দৈর্ঘ্য পাওয়া যায়নি। অগ্রগতির শতাংশ দেখানো যাবে না।")
+    update_job_progress(video_id, [r['name'] for r in renditions], info={'duration': duration}, state='pending', percent=0)
+
+    # যদি কোনো রেজোলিউশনই উপযুক্ত না হয়
+    if not renditions:
+        error_msg = f"[{video_id}] কোনো উপযুক্ত রেজোলিউশন পাওয়া যায়নি। মাস্টার প্লেলিস্ট তৈরি করা সম্ভব নয়।"
+        logging.error(error_msg)
+        set_job_error(video_id, error_msg)
+        return False
+
+    # সোর্স কোনো রেজোলিউশনের সাথে হুবহু মিললে সেটি শুধু কপি (রিমাক্স) করা হবে, বাকিগুলো এনকোড হবে
+    passthrough = select_passthrough_rendition(video_id, media, [r for r in renditions if not r.get('audio_only')])
+
+    # আগের চেষ্টার (প্রসেস মারা গেলে বা ব্যর্থ হলে) যাচাই করা সম্পূর্ণ রেজোলিউশন রাখা হয়, অসম্পূর্ণগুলো শেষ
+    # সম্পূর্ণ সেগমেন্ট থেকে চালিয়ে যাওয়া হয়; শুধু বাকিগুলো (fresh) শুরু থেকে তৈরি হয়
+    complete, resume_groups = plan_resume(video_id, output_base_dir, renditions, duration)
+    previews = plan_previews(output_base_dir, media) # নতুন করে তৈরি হওয়া রেজোলিউশনের ডিকোডের সাথেই তৈরি হবে
+    resuming = {name for _, group in resume_groups for name in group}
+    fresh = [r for r in renditions if r not in complete and r['name'] not in resuming]
+    if passthrough not in fresh:
+        passthrough = None # আগের চেষ্টায় সম্পূর্ণ হয়েছে
+    if complete:
+        update_job_progress(video_id, [r['name'] for r in complete], state='done', percent=100.0, eta_seconds=0)
+
+    # ট্রান্সকোডিং চলাকালীন প্রস্তুত রেজোলিউশনগুলো দিয়ে মাস্টার প্লেলিস্ট আগেই প্রকাশ করুন
+    publisher = MasterPlaylistPublisher(video_id, output_base_dir, renditions) if PROGRESSIVE_PUBLISH else None
+    if publisher is not None:
+        publisher.start()
+    # লম্বা ভিডিও টুকরো করে এনকোড করুন, যাতে সব কোর কাজে লাগে এবং কোনো ffmpeg টাইমআউট না হয়
+    mode = TRANSCODE_MODE
+    if CHUNKED_MIN_DURATION and duration and duration >= CHUNKED_MIN_DURATION:
+        mode = 'chunked'
+    try:
+        produced = list(complete) # এই চেষ্টার শেষে যে রেজোলিউশনগুলো প্রস্তুত
+        for start, group_segments in resume_groups:
+            # যেকোনো মোডেই বাকি অংশ টুকরো হিসেবে এনকোড হয়ে আগের সেগমেন্টগুলোর সাথে জোড়া লাগে
+            group = [r for r in renditions if r['name'] in group_segments]
+            logging.info(f"[{video_id}] {', '.join(r['name'] for r in group)} আগের চেষ্টার {start:.1f} সেকেন্ড থেকে চালিয়ে যাওয়া হচ্ছে...")
+            produced += transcode_chunked(video_id, input_path, output_base_dir, group, duration, has_audio,
+                                          resume={'start': start, 'segments': group_segments}) or []
+
+        resolution_details_for_master = None
+        if not fresh:
+            resolution_details_for_master = [] # নতুন করে তৈরি করার কিছু নেই
+        elif mode == 'chunked':
+            resolution_details_for_master = transcode_chunked(video_id, input_path, output_base_dir, fresh, duration, has_audio,
+                                                              previews=previews)
+            if resolution_details_for_master is None:
+                logging.info(f"[{video_id}] টুকরো করা সম্ভব নয়, একক-পাস পদ্ধতিতে এনকোড করা হচ্ছে।")
+                mode = 'single_pass'
+        if resolution_details_for_master is not None:
+            pass # টুকরো করে এনকোড শেষ হয়েছে (অথবা কিছু বাকি নেই)
+        elif mode == 'single_pass':
+            encoded = [r for r in fresh if r is not passthrough]
+            if any(not r.get('audio_only') for r in encoded):
+                ok, error_msg = transcode_single_pass(video_id, input_path, output_base_dir, encoded, duration, has_audio, previews)
+            elif encoded:
+                # একমাত্র ভিডিওটি পাসথ্রু, শুধু শেয়ার করা অডিও এনকোড করতে হবে
+                error_msg = encode_rendition(video_id, input_path, output_base_dir, encoded[0], duration=duration, has_audio=has_audio)
+                ok = error_msg is None
+            else:
+                ok, error_msg = True, None
+            if ok:
+                update_job_progress(video_id, [r['name'] for r in encoded], state='done', percent=100.0, eta_seconds=0)
+                resolution_details_for_master = fresh
+                if passthrough is not None:
+                    # পাসথ্রু রেজোলিউশন আলাদা ffmpeg এ তৈরি হয়
+                    error_msg = encode_rendition(video_id, input_path, output_base_dir, passthrough, ffmpeg_thread_budget(1), duration, has_audio)
+                    if error_msg:
+                        set_job_error(video_id, error_msg)
+                        resolution_details_for_master = encoded
+            else:
+                # একক-পাস ব্যর্থ হলে প্রতি-রেজোলিউশন পদ্ধতিতে আবার চেষ্টা করুন
+                logging.warning(f"{error_msg}\nপ্রতি-রেজোলিউশন পদ্ধতিতে আবার চেষ্টা করা হচ্ছে...")
+                if publisher is not None:
+                    publisher.reset() # আগাম প্রকাশিত প্লেলিস্টগুলো নতুন করে তৈরি হবে
+                for rendition in fresh:
+                    clear_hls_directory_contents(os.path.join(output_base_dir, rendition['name']))
+                if previews is not None:
+                    clear_hls_directory_contents(previews['dir'])
+                resolution_details_for_master = transcode_per_rendition(video_id, input_path, output_base_dir, fresh, duration, has_audio,
+                                                                        previews)
+        elif mode == 'parallel':
+            resolution_details_for_master = transcode_parallel(video_id, input_path, output_base_dir, fresh, duration, has_audio, previews)
+        else:
+            resolution_details_for_master = transcode_per_rendition(video_id, input_path, output_base_dir, fresh, duration, has_audio, previews)
+    finally:
+        if publisher is not None:
+            publisher.stop()
+    # আগের চেষ্টার, চালিয়ে যাওয়া ও নতুন তৈরি রেজোলিউশনগুলো মূল ক্রমে; পরের চেষ্টা যেন এগুলো আবার তৈরি না করে
+    produced += resolution_details_for_master
+    resolution_details_for_master = [r for r in renditions if r in produced]
+    mark_renditions_complete(output_base_dir, resolution_details_for_master)
+
+    # শেয়ার করা অডিও ছাড়া ভিডিওগুলো নিঃশব্দ, আর শুধু অডিও দিয়ে মাস্টার প্লেলিস্ট হয় না
+    if resolution_details_for_master and (
+            (shared_audio and not any(r.get('audio_only') for r in resolution_details_for_master))
+            or all(r.get('audio_only') for r in resolution_details_for_master)):
+        set_job_error(video_id, f"[{video_id}] শেয়ার করা অডিও-রেন্ডিশন বা কোনো ভিডিও রেজোলিউশন তৈরি হয়নি।", overwrite=False)
+        resolution_details_for_master = []
+
+    # যদি কোনো রেজোলিউশন সফলভাবে তৈরি না হয় (লিস্ট খালি থাকে)
+    if not resolution_details_for_master:
+         # এই বার্তাটি তখনই আসবে যদি প্রথম রেজোলিউশনটিই ব্যর্থ হয়
+         logging.error(f"[{video_id}] কোনো রেজোলিউশন সফলভাবে তৈরি হয়নি। মাস্টার প্লেলিস্ট তৈরি করা সম্ভব নয়।")
+         if publisher is not None:
+             publisher.reset() # আগাম প্রকাশিত মাস্টার প্লেলিস্ট সরিয়ে ফেলুন
+         # ত্রুটির বার্তা আগেই জব স্টোরে লেখা হয়ে থাকার কথা, তাই এখানে আবার লেখার দরকার নেই
+         return False # ব্যর্থ রিটার্ন করুন
+
+    try:
+        # --- মাস্টার প্লেলিস্ট তৈরি করুন (শুধুমাত্র সফল রেজোলিউশনগুলো দিয়ে) ---
+        # সবসময় নিজে লিখুন: ffmpeg এর মাস্টারে BANDWIDTH হয় maxrate থেকে, ল্যাডারের বিটরেট থেকে নয়,
+        # আর আগাম প্রকাশিত মাস্টারে সব রেজোলিউশন নাও থাকতে পারে
+        write_master_playlist(video_id, output_base_dir, resolution_details_for_master)
+        if previews is not None:
+            finalize_previews(video_id, input_path, previews, duration)
+        logging.info(f"[{video_id}] HLS প্রসেসিং সম্পন্ন।")
         return True # সফল রিটার্ন করুন
     except IOError as e:
-        # যদি প্লেলিস্ট বা রেডি ফাইল লিখতে সমস্যা হয়
-        error_msg = f"[{video_id}] মাস্টার প্লেলিস্ট বা রেডি মার্কার লিখতে ব্যর্থ: {e}"
+        # যদি প্লেলিস্ট লিখতে সমস্যা হয়
+        error_msg = f"[{video_id}] মাস্টার প্লেলিস্ট লিখতে ব্যর্থ: {e}"
         logging.error(error_msg)
-        try:
-            # যদি আগে কোনো ত্রুটি ফাইল না থাকে, তবে এটি লিখুন
-            if not os.path.exists(error_file_path):
-                 with open(error_file_path, 'w') as f: f.write(error_msg)
-        except IOError as io_err:
-             logging.error(f"[{video_id}] প্লেলিস্ট লেখা ত্রুটি ফাইল লিখতে ব্যর্থ: {error_file_path}: {io_err}")
+        # যদি আগে কোনো ত্রুটির বার্তা না থাকে, তবে এটি লিখুন
+        set_job_error(video_id, error_msg, overwrite=False)
         return False # ব্যর্থ রিটার্ন করুন
     # --- মাস্টার প্লেলিস্ট তৈরি শেষ ---
 
 
 def run_processing_job(video_id, uploaded_video_path, hls_output_dir):
-    """নির্দিষ্ট আপলোড করা ভিডিও ট্রান্সকোড করার মূল থ্রেড ফাংশন।"""
-    lock_file_path = os.path.join(hls_output_dir, PROCESSING_LOCK_FILENAME)   # লক ফাইলের পাথ
-    error_file_path = os.path.join(hls_output_dir, PROCESSING_ERROR_FILENAME) # ত্রুটি ফাইলের পাথ
-    ready_file_path = os.path.join(hls_output_dir, HLS_READY_FILENAME)     # রেডি ফাইলের পাথ
+    """নির্দিষ্ট আপলোড করা ভিডিও ট্রান্সকোড করার মূল ফাংশন। সফল হলে True রিটার্ন করে।
 
-    logging.info(f"[{video_id}] প্রসেসিং থ্রেড শুরু হয়েছে।")
+    জবের চূড়ান্ত অবস্থা (ready বা error) জব স্টোরে লেখা হয়।
+    """
+    logging.info(f"[{video_id}] প্রসেসিং শুরু হয়েছে।")
+    success = False
+    job_started = time.monotonic()
 
     try:
-        # এই ভিডিও আইডির জন্য আগের HLS কনটেন্ট ও স্টেট ফাইল মুছে ফেলুন
-        clear_hls_directory_contents(hls_output_dir)
-        if os.path.exists(error_file_path): os.remove(error_file_path)
-        if os.path.exists(ready_file_path): os.remove(ready_file_path)
+        # আগের চেষ্টার HLS কনটেন্ট মুছে ফেলা হয় না: transcode_to_hls সেটি যাচাই করে যা ব্যবহারযোগ্য তা রাখে, বাকিটা মুছে ফেলে
+        ensure_dir(hls_output_dir)
+        hls_cache.invalidate(video_id) # পুরনো প্লেলিস্ট/সেগমেন্টের তথ্য আর সঠিক নয়
 
-        # ffmpeg উপলব্ধ কিনা তা পরীক্ষা করুন (ffprobe আগে চেক করা হয়েছে)
-        if not check_command('ffmpeg'):
+        # ffmpeg উপলব্ধ কিনা তা পরীক্ষা করুন (প্রসেস শুরুর সময়ের পরীক্ষার ফলাফল থেকে, নতুন প্রসেস না চালিয়ে)
+        if not tool_available('ffmpeg'):
              error_msg = f"[{video_id}] ffmpeg পরীক্ষা ব্যর্থ। প্রসেসিং বাতিল করা হচ্ছে।"
              logging.critical(error_msg)
-             with open(error_file_path, 'w') as f: f.write(error_msg)
-             return # থ্রেড থেকে প্রস্থান করুন
+             set_job_error(video_id, error_msg)
+             return False
 
         # ট্রান্সকোডিং শুরু করুন (যেখানে ডাইমেনশন গণনা অন্তর্ভুক্ত)
         if not transcode_to_hls(video_id, uploaded_video_path, hls_output_dir, RESOLUTIONS):
-            logging.error(f"[{video_id}] ট্রান্সকোডিং ধাপ ব্যর্থ হয়েছে।")
-            # transcode_to_hls ফাংশন ত্রুটি ফাইল লেখার কথা
-            return # থ্রেড থেকে প্রস্থান করুন
+            logging.error(f"[{video_id}] ট্রান্সকোডিং ধাপ ব্যর্থ হয়েছে।")
+            # transcode_to_hls ফাংশন জব স্টোরে ত্রুটির বার্তা লেখার কথা
+            return False
 
         # যদি সব ঠিক থাকে
-        logging.info(f"[{video_id}] প্রসেসিং সফলভাবে সম্পন্ন হয়েছে।")
+        success = True
+        logging.info(f"[{video_id}] প্রসেসিং সফলভাবে সম্পন্ন হয়েছে।")
 
     except Exception as e:
-        # যদি থ্রেডে কোনো অপ্রত্যাশিত ত্রুটি ঘটে
+        # যদি প্রসেসিংয়ের সময় কোনো অপ্রত্যাশিত ত্রুটি ঘটে
         error_msg = f"[{video_id}] প্রসেসিং থ্রেডে মারাত্মক অপ্রত্যাশিত ত্রুটি: {e}"
         logging.error(error_msg, exc_info=True)
+        # যদি আগে কোনো ত্রুটির বার্তা না থাকে তবে এটি লিখুন
+        set_job_error(video_id, error_msg, overwrite=False)
+
+    finally:
+        # প্রসেসিং সফল বা ব্যর্থ যাই হোক না কেন, জবের চূড়ান্ত অবস্থা জব স্টোরে লিখুন
+        metrics.observe('transcode_stage_seconds', time.monotonic() - job_started, stage='job')
+        try:
+            finished = finish_job(video_id, success)
+        except sqlite3.Error as e:
+            finished = False
+            logging.error(f"[{video_id}] জবের চূড়ান্ত অবস্থা লিখতে ব্যর্থ: {e}")
+        # সফল হলে সোর্স রাখার নীতি প্রয়োগ, ডিস্ক ব্যবহারের হিসাব আপডেট এবং প্রয়োজনে বাজেটের জন্য পুরনো আউটপুট সরানো
+        if success and finished:
+            storage.update_video_storage(video_id, uploaded_video_path, hls_output_dir)
+
+    return success
+
+
+# === Job Store & Queue ===
+# জব স্টোর ও কিউ: প্রতিটি ভিডিওর প্রসেসিং অবস্থা, সময়, চেষ্টার সংখ্যা, রেজোলিউশনের অগ্রগতি ও ত্রুটির বার্তা
+# একটি SQLite ডাটাবেসে থাকে (jobstore.py)। সব gunicorn ওয়ার্কার প্রসেস ও আলাদা worker.py প্রসেস একই ডাটাবেস
+# ব্যবহার করে, তাই কিউয়ের সীমা পুরো সার্ভারের জন্য এবং একসাথে চলা জবের সীমা প্রতি হোস্টের জন্য প্রযোজ্য।
+# যে ওয়ার্কার জব নেয় সে একটি লিজ পায় এবং হার্টবিট দিয়ে সেটি নবায়ন করে; ওয়ার্কার মারা গেলে বা আটকে গেলে
+# লিজের মেয়াদ শেষে যেকোনো ওয়ার্কার জবটি আবার কিউতে পাঠায়। ডিফল্ট WAL মোড শুধু একই হোস্টের প্রসেসগুলোর জন্য;
+# একাধিক হোস্টে চালাতে ডাটাবেস ফাইলটি শেয়ার করা স্টোরেজে রেখে JOBS_DB_SHARED=1 দিতে হবে (রোলব্যাক জার্নাল),
+# সেখানে ঠিকমতো POSIX ফাইল লক কাজ করতে হবে এবং হোস্টগুলোর ঘড়ি মোটামুটি মিলতে হবে। এমন স্টোরেজ না থাকলে
+# একাধিক হোস্টে ওয়ার্কার চালানো সমর্থিত নয়।
+
+# জব টেবিলের কলাম (নাম -> SQLite টাইপ); পুরনো ডাটাবেসে না থাকলে স্টার্টআপে যোগ করা হয়
+JOB_COLUMNS = {
+    'video_id': 'TEXT PRIMARY KEY',
+    'source_path': 'TEXT NOT NULL',
+    'hls_dir': 'TEXT NOT NULL',
+    'original_filename': 'TEXT',
+    'priority': 'INTEGER NOT NULL DEFAULT 0',
+    'state': 'TEXT NOT NULL',
+    'enqueued_at': 'REAL NOT NULL',
+    'started_at': 'REAL',
+    'finished_at': 'REAL',
+    'updated_at': 'REAL',
+    'attempts': 'INTEGER NOT NULL DEFAULT 0', # কতবার প্রসেসিং শুরু হয়েছে
+    'progress': 'TEXT',                       # রেজোলিউশনভিত্তিক অগ্রগতি (JSON)
+    'error': 'TEXT',                          # সর্বশেষ ত্রুটির বার্তা
+    'owner_host': 'TEXT',                     # যে হোস্টে জবটি চলছে
+    'owner_pid': 'INTEGER',                   # যে প্রসেসে জবটি চলছে
+    'owner_started': 'TEXT',                  # ঐ প্রসেসের শুরুর সময় (PID পুনর্ব্যবহার ধরার জন্য)
+    'lease_expires_at': 'REAL',               # এই সময়ের মধ্যে হার্টবিট না এলে জবটি মৃত ধরা হয়
+    'content_digest': 'TEXT',                 # সোর্স ফাইলের কনটেন্ট হ্যাশ (ডুপ্লিকেট আপলোড চেনার জন্য)
+    'alias_of': 'TEXT',                       # ডুপ্লিকেট হলে যে ভিডিওর HLS আউটপুট ব্যবহার হয় তার আইডি
+    'retry_at': 'REAL',                       # ব্যর্থ জবটি এই সময়ের আগে আবার নেওয়া হবে না (ব্যাকঅফ)
+}
+
+class QueueFullError(Exception):
+    """জব কিউ পূর্ণ থাকলে নতুন জব যোগ করার সময় এই ত্রুটি রেইজ হয়।"""
+
+_job_wakeup = threading.Event() # নতুন জব যোগ হলে এই প্রসেসের ওয়ার্কারদের জাগিয়ে তোলে
+_workers_started = False
+_workers_lock = threading.Lock()
+_worker_threads = [] # এই প্রসেসের ট্রান্সকোডিং ওয়ার্কার থ্রেডগুলো
+_workers_stop = threading.Event() # সেট হলে ওয়ার্কাররা নতুন জব নেয় না, চলমান জব শেষ করে থামে
+
+def init_job_db():
+    """জব টেবিল ও ইনডেক্স তৈরি করে এবং পুরনো ডাটাবেসে নতুন কলাম যোগ করে।"""
+    conn = get_db()
+    columns_sql = ',\n'.join(f'{name} {sql_type}' for name, sql_type in JOB_COLUMNS.items())
+    conn.execute(f"CREATE TABLE IF NOT EXISTS jobs (\n{columns_sql}\n)")
+    existing = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+    for name, sql_type in JOB_COLUMNS.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {sql_type.replace('NOT NULL ', '')}")
+            logging.info(f"জব টেবিলে নতুন কলাম যোগ করা হয়েছে: {name}")
+    # আগের ভার্সনের অবস্থার নাম ('running'/'done') নতুন নামে রূপান্তর করুন
+    conn.execute("UPDATE jobs SET state = ? WHERE state = 'running'", (JOB_STATE_PROCESSING,))
+    for row in conn.execute("SELECT video_id, hls_dir FROM jobs WHERE state = 'done'").fetchall():
+        done_state = JOB_STATE_READY if os.path.exists(os.path.join(row['hls_dir'], MASTER_PLAYLIST_NAME)) else JOB_STATE_ERROR
+        conn.execute("UPDATE jobs SET state = ? WHERE video_id = ?", (done_state, row['video_id']))
+    # কিউ থেকে পরবর্তী জব বাছাই ও কিউয়ে অবস্থান গণনার জন্য ইনডেক্স
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (state, priority DESC, enqueued_at)")
+    # কনটেন্ট হ্যাশ -> যে ভিডিও ঐ কনটেন্ট প্রসেস করেছে/করছে (ডুপ্লিকেট আপলোড এড়ানোর জন্য)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS content_index (
+            digest     TEXT PRIMARY KEY,
+            video_id   TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )""")
+
+def running_job_count(host=None):
+    """এই মুহূর্তে প্রসেস হওয়া জবের সংখ্যা রিটার্ন করে (সব প্রসেস মিলিয়ে; host দিলে শুধু সেই হোস্টের)।"""
+    if host is None:
+        return get_db().execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (JOB_STATE_PROCESSING,)).fetchone()[0]
+    return get_db().execute("SELECT COUNT(*) FROM jobs WHERE state = ? AND owner_host = ?",
+                            (JOB_STATE_PROCESSING, host)).fetchone()[0]
+
+def queue_depth():
+    """কিউতে অপেক্ষমাণ জবের সংখ্যা রিটার্ন করে।"""
+    return get_db().execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (JOB_STATE_QUEUED,)).fetchone()[0]
+
+def enqueue_job(video_id, source_path, hls_dir, original_filename=None, priority=JOB_DEFAULT_PRIORITY):
+    """জব কিউতে একটি নতুন ট্রান্সকোডিং জব যোগ করে এবং কিউয়ে তার অবস্থান রিটার্ন করে।
+
+    কিউ পূর্ণ থাকলে QueueFullError রেইজ করে।
+    """
+    conn = get_db()
+    conn.execute('BEGIN IMMEDIATE') # গণনা ও যোগ করা একটি লেনদেনে, যাতে অন্য প্রসেস মাঝখানে ঢুকতে না পারে
+    try:
+        position = _insert_queued_job(conn, video_id, source_path, hls_dir, original_filename, priority)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    _job_wakeup.set() # এই প্রসেসের অলস ওয়ার্কারকে সাথে সাথে জাগান
+    logging.info(f"[{video_id}] জব কিউতে যোগ করা হয়েছে (অগ্রাধিকার: {priority}, কিউয়ের দৈর্ঘ্য: {position})।")
+    return position
+
+def _insert_queued_job(conn, video_id, source_path, hls_dir, original_filename, priority, content_digest=None):
+    """চলমান লেনদেনের ভিতরে কিউ পূর্ণ কিনা দেখে নতুন জব যোগ করে এবং কিউয়ে তার অবস্থান রিটার্ন করে।"""
+    depth = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (JOB_STATE_QUEUED,)).fetchone()[0]
+    if depth >= JOB_QUEUE_MAX:
+        raise QueueFullError(f"জব কিউ পূর্ণ ({depth}/{JOB_QUEUE_MAX})")
+    now = time.time()
+    conn.execute(
+        "INSERT OR REPLACE INTO jobs (video_id, source_path, hls_dir, original_filename, priority, state, enqueued_at, updated_at, content_digest) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (video_id, source_path, hls_dir, original_filename, priority, JOB_STATE_QUEUED, now, now, content_digest))
+    return depth + 1
+
+def enqueue_or_alias_job(video_id, source_path, hls_dir, original_filename=None, content_digest=None,
+                         priority=JOB_DEFAULT_PRIORITY):
+    """একই কনটেন্টের ভিডিও আগে থেকে থাকলে (রেডি, কিউতে বা প্রসেসিংয়ে) নতুন জবের বদলে alias তৈরি করে; নইলে কিউতে যোগ করে।
+
+    খোঁজা ও যোগ করা একটি লেনদেনে হয়, তাই একসাথে আসা একই ফাইলের আপলোডগুলো একটি জবেই মিলিত হয়।
+    রিটার্ন: (alias_of, position) — ডুপ্লিকেট হলে (মূল ভিডিও আইডি, None), নইলে (None, কিউয়ে অবস্থান)।
+    এই আইডির জব আগেই থাকলে (যেমন একই আপলোডের দুটি শেষ PATCH একসাথে) কিছু বদলায় না, আগের ফলাফলই রিটার্ন হয়;
+    তবে আগের জবটি ব্যর্থ হয়ে থাকলে (যেমন ইনজেস্ট আবার চালানো হলে) সেটি নতুন জব হিসেবে আবার কিউতে যায়।
+    কিউ পূর্ণ থাকলে QueueFullError রেইজ করে।
+    """
+    conn = get_db()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        existing = conn.execute("SELECT state, alias_of FROM jobs WHERE video_id = ?", (video_id,)).fetchone()
+        if existing is not None and existing['state'] != JOB_STATE_ERROR:
+            conn.execute('COMMIT')
+            logging.info(f"[{video_id}] জব আগেই তৈরি হয়েছে; আবার কিউতে যোগ করা হচ্ছে না।")
+            return existing['alias_of'], None
+        canonical = None
+        if content_digest:
+            # নিজের আগের এন্ট্রি বাদ দিন, নইলে ভিডিওটি নিজেরই alias হয়ে যেতে পারে
+            canonical = conn.execute(
+                "SELECT j.video_id, j.source_path, j.hls_dir FROM content_index AS c JOIN jobs AS j ON j.video_id = c.video_id "
+                "WHERE c.digest = ? AND j.state != ? AND c.video_id != ?",
+                (content_digest, JOB_STATE_ERROR, video_id)).fetchone()
+        if canonical is not None:
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (video_id, source_path, hls_dir, original_filename, priority, state, "
+                "enqueued_at, updated_at, content_digest, alias_of) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (video_id, canonical['source_path'], canonical['hls_dir'], original_filename, priority, JOB_STATE_ALIAS,
+                 now, now, content_digest, canonical['video_id']))
+            position = None
+        else:
+            # ব্যর্থ জবের সারি প্রতিস্থাপিত হয়, তাই আগের চেষ্টার সংখ্যা, ত্রুটি ও ব্যাকঅফ মুছে যায়
+            position = _insert_queued_job(conn, video_id, source_path, hls_dir, original_filename, priority, content_digest)
+            if content_digest:
+                # আগের ব্যর্থ জবের এন্ট্রি থাকলে সেটি এই জব দিয়ে প্রতিস্থাপিত হয়
+                conn.execute("INSERT OR REPLACE INTO content_index (digest, video_id, created_at) VALUES (?, ?, ?)",
+                             (content_digest, video_id, time.time()))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    if canonical is not None:
+        logging.info(f"[{video_id}] একই কনটেন্ট আগেই আপলোড হয়েছে; নতুন ট্রান্সকোডিং ছাড়া {canonical['video_id']} এর আউটপুট ব্যবহার হবে।")
+        return canonical['video_id'], None
+    _job_wakeup.set() # এই প্রসেসের অলস ওয়ার্কারকে সাথে সাথে জাগান
+    if existing is not None:
+        logging.info(f"[{video_id}] আগে ব্যর্থ হওয়া জবটি আবার কিউতে পাঠানো হয়েছে (অগ্রাধিকার: {priority}, কিউয়ের দৈর্ঘ্য: {position})।")
+    else:
+        logging.info(f"[{video_id}] জব কিউতে যোগ করা হয়েছে (অগ্রাধিকার: {priority}, কিউয়ের দৈর্ঘ্য: {position})।")
+    return None, position
+
+def get_queue_position(video_id):
+    """কিউতে জবটির অবস্থান (১ থেকে শুরু) রিটার্ন করে; জবটি অপেক্ষমাণ না থাকলে None।"""
+    row = get_db().execute(
+        """SELECT (SELECT COUNT(*) FROM jobs AS ahead
+                   WHERE ahead.state = j.state
+                     AND (ahead.priority > j.priority
+                          OR (ahead.priority = j.priority AND ahead.enqueued_at < j.enqueued_at))) + 1
+           FROM jobs AS j WHERE j.video_id = ? AND j.state = ?""",
+        (video_id, JOB_STATE_QUEUED)).fetchone()
+    return row[0] if row else None
+
+def _process_start_time(pid):
+    """Linux-এ /proc থেকে প্রসেসের শুরুর সময় (clock ticks) পড়ে; না পেলে খালি স্ট্রিং।"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # দ্বিতীয় ফিল্ড (প্রসেসের নাম) বন্ধনীর ভিতরে থাকে এবং তাতে স্পেস থাকতে পারে
+            return f.read().rsplit(')', 1)[1].split()[19]
+    except (OSError, IndexError):
+        return ''
+
+def claim_next_job():
+    """সর্বোচ্চ অগ্রাধিকারের (একই অগ্রাধিকারে সবচেয়ে পুরনো) জবটি লিজসহ নেয়, যদি এই হোস্টে একসাথে চলা জবের সীমা পূর্ণ না হয়।"""
+    conn = get_db()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        running = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = ? AND owner_host = ?",
+                               (JOB_STATE_PROCESSING, HOSTNAME)).fetchone()[0]
+        if running >= TRANSCODE_WORKERS:
+            conn.execute('COMMIT')
+            return None # সব স্লট ব্যস্ত
+        job = conn.execute(
+            "SELECT * FROM jobs WHERE state = ? AND (retry_at IS NULL OR retry_at <= ?) "
+            "ORDER BY priority DESC, enqueued_at LIMIT 1",
+            (JOB_STATE_QUEUED, time.time())).fetchone() # ব্যাকঅফে অপেক্ষমাণ জবগুলো বাদ
+        if job is not None:
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET state = ?, started_at = ?, updated_at = ?, finished_at = NULL, retry_at = NULL, "
+                "attempts = attempts + 1, progress = NULL, error = NULL, "
+                "owner_host = ?, owner_pid = ?, owner_started = ?, lease_expires_at = ? WHERE video_id = ?",
+                (JOB_STATE_PROCESSING, now, now, HOSTNAME, os.getpid(), _process_start_time(os.getpid()),
+                 now + JOB_LEASE_SECONDS, job['video_id']))
+        conn.execute('COMMIT')
+        if job is not None:
+            status_hub.poke()
+            # ব্যাকঅফে থাকা জবের অপেক্ষা গোনা হয় আবার চেষ্টার সময় থেকে
+            metrics.observe('job_queue_wait_seconds', now - (job['retry_at'] or job['enqueued_at']))
+        return job
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+def set_job_error(video_id, error_msg, overwrite=True):
+    """জবের ত্রুটির বার্তা জব স্টোরে লেখে। overwrite=False হলে আগের বার্তা থাকলে সেটি রাখে।"""
+    query = "UPDATE jobs SET error = ?, updated_at = ? WHERE video_id = ?"
+    if not overwrite:
+        query += " AND error IS NULL"
+    try:
+        get_db().execute(query, (error_msg, time.time(), video_id))
+    except sqlite3.Error as e:
+        logging.error(f"[{video_id}] ত্রুটির বার্তা জব স্টোরে লিখতে ব্যর্থ: {e}")
+
+def update_job_progress(video_id, rendition_names, info=None, **fields):
+    """এক বা একাধিক রেজোলিউশনের অগ্রগতির তথ্য (state, percent, fps, speed, eta_seconds) জবের অগ্রগতির JSON-এ মিশিয়ে দেয়।
+
+    info দেওয়া হলে সেটি পুরো জবের তথ্য হিসেবে (যেমন duration) JSON-এর উপরের স্তরে মেশানো হয়।
+    """
+    conn = get_db()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute("SELECT progress FROM jobs WHERE video_id = ?", (video_id,)).fetchone()
+        progress = json.loads(row['progress']) if row and row['progress'] else {}
+        progress.update(info or {})
+        renditions = progress.setdefault('renditions', {})
+        for name in rendition_names:
+            renditions.setdefault(name, {}).update(fields)
+        conn.execute("UPDATE jobs SET progress = ?, updated_at = ? WHERE video_id = ?",
+                     (json.dumps(progress), time.time(), video_id))
+        conn.execute('COMMIT')
+        status_hub.poke()
+    except sqlite3.Error as e:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        logging.error(f"[{video_id}] রেজোলিউশনের অগ্রগতি লিখতে ব্যর্থ: {e}")
+
+def job_progress_summary(job):
+    """জব রেকর্ড থেকে অগ্রগতির সারাংশ (JSON-যোগ্য dict) তৈরি করে: মোট শতাংশ, ETA ও রেজোলিউশনভিত্তিক তথ্য।"""
+    progress = json.loads(job['progress']) if job['progress'] else {}
+    renditions = progress.get('renditions', {})
+    state = job['state']
+
+    # মোট শতাংশ: সব রেজোলিউশনের শতাংশের গড় (শেষ হওয়াগুলো ১০০%)
+    percents = [100.0 if r.get('state') == 'done' else (r.get('percent') or 0.0) for r in renditions.values()]
+    if state == JOB_STATE_READY:
+        percent = 100.0
+    else:
+        percent = round(sum(percents) / len(percents), 1) if percents else 0.0
+
+    # মোট ETA: এখন পর্যন্ত লাগা সময় ও শতাংশ থেকে অনুমান (সব ট্রান্সকোডিং মোডে কাজ করে)
+    eta_seconds = None
+    if state == JOB_STATE_PROCESSING and job['started_at'] and 0 < percent < 100:
+        elapsed = time.time() - job['started_at']
+        eta_seconds = round(elapsed / percent * (100 - percent), 1)
+
+    summary = {
+        'video_id': job['video_id'],
+        'state': state,
+        'attempts': job['attempts'],
+        'percent': percent,
+        'eta_seconds': eta_seconds,
+        'duration': progress.get('duration'),
+        'renditions': renditions,
+        'published': progress.get('published', []), # আগাম প্রকাশিত রেজোলিউশনগুলো
+        'playable': state == JOB_STATE_READY or bool(progress.get('published')), # মাস্টার প্লেলিস্ট প্রকাশিত হয়েছে কিনা
+        'updated_at': job['updated_at'],
+    }
+    if state == JOB_STATE_QUEUED:
+        summary['queue_position'] = get_queue_position(job['video_id'])
+        if job['retry_at'] and job['retry_at'] > time.time():
+            summary['retry_at'] = job['retry_at'] # আগের চেষ্টা ব্যর্থ, ব্যাকঅফ শেষে আবার চেষ্টা হবে
+    if state == JOB_STATE_ERROR:
+        summary['error'] = job['error']
+    if state == JOB_STATE_READY:
+        summary['previews'] = preview_urls(job['video_id'], os.path.join(HLS_DIR, job['video_id']))
+    return summary
+
+def retry_backoff(attempts):
+    """attempts বার চেষ্টার পর আবার চেষ্টার আগে কত সেকেন্ড অপেক্ষা করতে হবে (প্রতিবার দ্বিগুণ, JOB_RETRY_BACKOFF_MAX পর্যন্ত)।"""
+    return min(JOB_RETRY_BACKOFF_MAX, JOB_RETRY_BACKOFF * 2 ** max(0, attempts - 1))
+
+def finish_job(video_id, success):
+    """জবটি সফল (ready) বা ব্যর্থ (error) হিসেবে চিহ্নিত করে, যাতে এর স্লট অন্য জব পায়। চূড়ান্ত অবস্থা লেখা হলে True।
+
+    ব্যর্থ জবের চেষ্টা JOB_MAX_ATTEMPTS এর কম হলে সেটি ব্যাকঅফসহ আবার কিউতে পাঠানো হয়; পরের চেষ্টা
+    ডিস্কে থাকা যাচাই করা আউটপুট আবার ব্যবহার করে (plan_resume দেখুন)।
+    শুধু জবের বর্তমান মালিক প্রসেসই এটি করতে পারে; লিজ হারানোর পর (জবটি অন্য ওয়ার্কারের কাছে চলে গেলে)
+    দেরিতে শেষ হওয়া পুরনো প্রসেস নতুন ওয়ার্কারের অবস্থা বদলাতে পারে না।
+    """
+    now = time.time()
+    if not success:
+        owner = (video_id, JOB_STATE_PROCESSING, HOSTNAME, os.getpid())
+        job = get_db().execute("SELECT attempts FROM jobs WHERE video_id = ? AND state = ? AND owner_host = ? AND owner_pid = ?",
+                               owner).fetchone()
+        if job is not None and job['attempts'] < JOB_MAX_ATTEMPTS:
+            delay = retry_backoff(job['attempts'])
+            # ত্রুটির বার্তা রাখা হয়, যাতে অপেক্ষার সময় কারণটি দেখা যায়; enqueued_at অপরিবর্তিত থাকে
+            cursor = get_db().execute(
+                "UPDATE jobs SET state = ?, retry_at = ?, updated_at = ?, owner_pid = NULL, lease_expires_at = NULL "
+                "WHERE video_id = ? AND state = ? AND owner_host = ? AND owner_pid = ?",
+                (JOB_STATE_QUEUED, now + delay, now) + owner)
+            if cursor.rowcount:
+                metrics.inc('jobs_finished_total', result='retry')
+                logging.warning(f"[{video_id}] জব ব্যর্থ হয়েছে (চেষ্টা {job['attempts']}/{JOB_MAX_ATTEMPTS}); "
+                                f"{delay} সেকেন্ড পরে আবার চেষ্টা করা হবে।")
+                status_hub.poke()
+                hls_cache.invalidate(video_id)
+                return False
+    cursor = get_db().execute(
+        "UPDATE jobs SET state = ?, finished_at = ?, updated_at = ?, lease_expires_at = NULL, "
+        "error = CASE WHEN ? THEN NULL ELSE COALESCE(error, 'অজানা ত্রুটি') END "
+        "WHERE video_id = ? AND state = ? AND owner_host = ? AND owner_pid = ?",
+        (JOB_STATE_READY if success else JOB_STATE_ERROR, now, now, success, video_id,
+         JOB_STATE_PROCESSING, HOSTNAME, os.getpid()))
+    if cursor.rowcount:
+        metrics.inc('jobs_finished_total', result='ready' if success else 'error')
+    else:
+        logging.warning(f"[{video_id}] জবের লিজ আগেই হারিয়ে গেছে (অন্য ওয়ার্কারের কাছে চলে গেছে); চূড়ান্ত অবস্থা লেখা হয়নি।")
+    _job_wakeup.set() # স্লট খালি হয়েছে, অপেক্ষমাণ ওয়ার্কারকে জাগান
+    status_hub.poke() # দর্শকদের সাথে সাথে জানান
+    hls_cache.invalidate(video_id) # চূড়ান্ত প্লেলিস্ট যেন এই প্রসেসে সাথে সাথে দেখা যায়
+    return cursor.rowcount > 0
+
+def _is_job_owner_alive(job):
+    """জবটি যে প্রসেসে চলছিল সেটি এখনও বেঁচে আছে কিনা পরীক্ষা করে।
+
+    লিজের মেয়াদ শেষ হলে (হার্টবিট বন্ধ) যেকোনো হোস্ট থেকে মৃত ধরা হয়; একই হোস্টে PID দেখে আরও আগেই বোঝা যায়।
+    """
+    if job['lease_expires_at'] and job['lease_expires_at'] < time.time():
+        return False # প্রসেস মারা গেছে, আটকে আছে অথবা হোস্টটিই বন্ধ
+    if not job['owner_host'] or not job['owner_pid']:
+        return False # মালিকের তথ্য নেই (যেমন আগের ভার্সনে শুরু হওয়া জব)
+    if job['owner_host'] != HOSTNAME:
+        return True # অন্য হোস্টের প্রসেস এখান থেকে পরীক্ষা করা যায় না; লিজ এখনও বৈধ
+    try:
+        os.kill(job['owner_pid'], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass # প্রসেস আছে কিন্তু অন্য ব্যবহারকারীর
+    # একই PID অন্য কোনো নতুন প্রসেস পেয়ে থাকতে পারে (যেমন কন্টেইনার রিস্টার্টের পর)
+    return not job['owner_started'] or job['owner_started'] == _process_start_time(job['owner_pid'])
+
+def recover_orphaned_jobs():
+    """যে জবগুলোর প্রসেস মারা গেছে সেগুলো আবার কিউতে পাঠায়, অথবা সর্বোচ্চ চেষ্টার পর ব্যর্থ হিসেবে চিহ্নিত করে।"""
+    conn = get_db()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        orphans = [job for job in conn.execute("SELECT * FROM jobs WHERE state = ?", (JOB_STATE_PROCESSING,)).fetchall()
+                   if not _is_job_owner_alive(job)]
+        now = time.time()
+        for job in orphans:
+            if job['attempts'] < JOB_MAX_ATTEMPTS:
+                # enqueued_at অপরিবর্তিত থাকে, তাই ব্যাকঅফ শেষে জবটি কিউতে তার আগের জায়গা ফিরে পায়
+                conn.execute("UPDATE jobs SET state = ?, owner_pid = NULL, lease_expires_at = NULL, retry_at = ?, updated_at = ? WHERE video_id = ?",
+                             (JOB_STATE_QUEUED, now + retry_backoff(job['attempts']), now, job['video_id']))
+                metrics.inc('jobs_finished_total', result='retry')
+                logging.warning(f"[{job['video_id']}] প্রসেসিং চলাকালীন প্রসেস মারা গেছে বা সাড়া দিচ্ছে না ({job['owner_host']}, PID {job['owner_pid']})। জবটি আবার কিউতে পাঠানো হয়েছে (চেষ্টা {job['attempts']}/{JOB_MAX_ATTEMPTS})।")
+            else:
+                conn.execute(
+                    "UPDATE jobs SET state = ?, finished_at = ?, updated_at = ?, error = ? WHERE video_id = ?",
+                    (JOB_STATE_ERROR, now, now,
+                     f"প্রসেসিং {job['attempts']} বার মাঝপথে বন্ধ হয়ে গেছে (প্রসেস মারা গেছে)। আর চেষ্টা করা হবে না।",
+                     job['video_id']))
+                metrics.inc('jobs_finished_total', result='error')
+                logging.error(f"[{job['video_id']}] সর্বোচ্চ চেষ্টার পরও জব সম্পন্ন হয়নি। ব্যর্থ হিসেবে চিহ্নিত করা হয়েছে।")
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    if orphans:
+        _job_wakeup.set()
+    return len(orphans)
+
+def renew_job_leases():
+    """হার্টবিট: এই প্রসেসের চলমান জবগুলোর লিজ নবায়ন করে।"""
+    get_db().execute(
+        "UPDATE jobs SET lease_expires_at = ? WHERE state = ? AND owner_host = ? AND owner_pid = ?",
+        (time.time() + JOB_LEASE_SECONDS, JOB_STATE_PROCESSING, HOSTNAME, os.getpid()))
+
+def job_heartbeat_loop():
+    """হার্টবিট থ্রেড: নিজের জবগুলোর লিজ নবায়ন করে এবং মারা যাওয়া ওয়ার্কারদের জব আবার কিউতে পাঠায়।"""
+    while True:
+        time.sleep(JOB_HEARTBEAT_INTERVAL)
         try:
-            # যদি আগে কোনো ত্রুটি ফাইল না থাকে তবে এটি লিখুন
-            if not os.path.exists(error_file_path):
-                 with open(error_file_path, 'w') as f: f.write(error_msg)
-        except IOError as io_err: logging.error(f"[{video_id}] মারাত্মক ত্রুটি ফাইল লিখতে ব্যর্থ: {io_err}")
+            renew_job_leases()
+            recover_orphaned_jobs()
+        except sqlite3.Error as e:
+            logging.error(f"জবের লিজ নবায়ন করতে ব্যর্থ: {e}")
+
+def transcode_worker_loop():
+    """ওয়ার্কার থ্রেড: কিউ থেকে একটার পর একটা জব নিয়ে প্রসেস করে (থামার নির্দেশ না আসা পর্যন্ত)।"""
+    logging.info("ট্রান্সকোডিং ওয়ার্কার থ্রেড শুরু হয়েছে।")
+    while not _workers_stop.is_set():
+        try:
+            job = claim_next_job()
+        except sqlite3.Error as e:
+            logging.error(f"কিউ থেকে জব নিতে ব্যর্থ: {e}")
+            job = None
+        if job is None:
+            # নতুন জব বা খালি স্লটের জন্য অপেক্ষা করুন (অন্য প্রসেসের পরিবর্তন ধরতে নির্দিষ্ট সময় পরপর আবার দেখুন)
+            _job_wakeup.wait(JOB_POLL_INTERVAL)
+            _job_wakeup.clear()
+            continue
+        video_id = job['video_id']
+        logging.info(f"[{video_id}] কিউ থেকে জব নেওয়া হয়েছে (অপেক্ষার সময়: {time.time() - job['enqueued_at']:.1f} সেকেন্ড, চেষ্টা: {job['attempts'] + 1})।")
+        run_processing_job(video_id, job['source_path'], job['hls_dir'])
+
+def gevent_patched():
+    """এই প্রসেসে gevent threading মডিউল monkey-patch করেছে কিনা (যেমন gunicorn এর gevent ওয়ার্কার)।
+
+    তখন threading.Thread আসলে একই OS থ্রেডের গ্রিনলেট, তাই ট্রান্সকোডিং/হ্যাশিংয়ের মতো ব্লকিং কাজ
+    পুরো ইভেন্ট লুপ (এবং সেই প্রসেসের সব সংযোগ) আটকে রাখে।
+    """
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+def start_transcode_workers(count=TRANSCODE_WORKERS):
+    """এই প্রসেসে নির্দিষ্ট সংখ্যক ওয়ার্কার থ্রেড এবং একটি হার্টবিট থ্রেড চালু করে (একবারই)।"""
+    global _workers_started
+    with _workers_lock:
+        if _workers_started:
+            return
+        for i in range(count):
+            thread = threading.Thread(target=transcode_worker_loop, name=f"TranscodeWorker-{i}", daemon=True)
+            thread.start()
+            _worker_threads.append(thread)
+        if count:
+            threading.Thread(target=job_heartbeat_loop, name="JobHeartbeat", daemon=True).start()
+            threading.Thread(target=storage.storage_maintenance_loop, args=(sweep_expired_uploads,), name="StorageMaintenance", daemon=True).start()
+        _workers_started = True
+    logging.info(f"{count}টি ট্রান্সকোডিং ওয়ার্কার থ্রেড চালু হয়েছে (কিউয়ের সর্বোচ্চ দৈর্ঘ্য: {JOB_QUEUE_MAX})।")
+
+def stop_transcode_workers():
+    """ওয়ার্কারদের নতুন জব নিতে নিষেধ করে; চলমান জবগুলো শেষ হলে থ্রেডগুলো থামে।"""
+    _workers_stop.set()
+    _job_wakeup.set()
+
+def run_transcode_workers(count=TRANSCODE_WORKERS):
+    """স্বতন্ত্র ওয়ার্কার প্রসেসের (worker.py) মূল লুপ: ওয়ার্কার চালু করে এবং সবগুলো থামা পর্যন্ত অপেক্ষা করে।"""
+    start_transcode_workers(count)
+    for thread in _worker_threads:
+        while thread.is_alive():
+            thread.join(1) # মূল থ্রেড যেন সিগন্যাল (SIGTERM) ধরতে পারে
+    logging.info("সব ট্রান্সকোডিং ওয়ার্কার থেমেছে।")
+
+
+# === Live Status Updates ===
+# লাইভ স্ট্যাটাস আপডেট: প্রতিটি প্রসেসে একটি মাত্র পোলার থ্রেড সব দর্শকের দেখা ভিডিওগুলোর অবস্থা
+# একটি কুয়েরিতে পড়ে এবং পরিবর্তন হলে অপেক্ষমাণ SSE সংযোগগুলোকে জানায়। ফলে হাজার দর্শক থাকলেও
+# ডাটাবেসে প্রতি সেকেন্ডে প্রসেসপ্রতি একটি কুয়েরিই হয়।
+
+class StatusHub:
+    """ভিডিওর অবস্থার পরিবর্তন SSE সংযোগগুলোর কাছে পৌঁছে দেয়।"""
+
+    def __init__(self, poll_interval):
+        self.poll_interval = poll_interval
+        self._condition = threading.Condition()
+        self._watchers = collections.Counter() # video_id -> কতগুলো সংযোগ দেখছে
+        self._snapshots = {}                   # video_id -> (version, updated_at, summary)
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="StatusHubPoller", daemon=True)
+            self._thread.start()
+
+    def subscribe(self, video_id):
+        with self._condition:
+            self._watchers[video_id] += 1
+            self._ensure_thread()
+        self.poke()
+
+    def unsubscribe(self, video_id):
+        with self._condition:
+            self._watchers[video_id] -= 1
+            if self._watchers[video_id] <= 0:
+                del self._watchers[video_id]
+                self._snapshots.pop(video_id, None)
+
+    def poke(self):
+        """এই প্রসেসে কোনো জব আপডেট হলে পোলারকে সাথে সাথে জাগায়।"""
+        self._wakeup.set()
+
+    def wait_for_change(self, video_id, last_version, timeout):
+        """ভিডিওর অবস্থা last_version থেকে বদলানো পর্যন্ত (বা timeout পর্যন্ত) অপেক্ষা করে এবং (version, summary) রিটার্ন করে।"""
+        deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                version, _, summary = self._snapshots.get(video_id, (0, None, None))
+                remaining = deadline - time.time()
+                if version != last_version or remaining <= 0:
+                    return version, summary
+                self._condition.wait(remaining)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            with self._condition:
+                video_ids = list(self._watchers)
+            if not video_ids:
+                continue
+            try:
+                changed = self._refresh(video_ids)
+            except sqlite3.Error as e:
+                logging.error(f"লাইভ স্ট্যাটাসের জন্য জব স্টোর পড়তে ব্যর্থ: {e}")
+                continue
+            if changed:
+                with self._condition:
+                    self._condition.notify_all()
+
+    def _refresh(self, video_ids):
+        changed = False
+        conn = get_db()
+        for start in range(0, len(video_ids), 500): # SQLite প্যারামিটারের সীমার মধ্যে থাকতে ভাগে ভাগে
+            chunk = video_ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(f"SELECT * FROM jobs WHERE video_id IN ({placeholders})", chunk).fetchall()
+            for job in rows:
+                summary = None
+                key = (job['state'], job['updated_at'])
+                if job['state'] == JOB_STATE_QUEUED:
+                    # অন্য জব কিউ থেকে বের হলে এই জবের রেকর্ড না বদলালেও অবস্থান বদলায়
+                    summary = job_progress_summary(job)
+                    key += (summary['queue_position'],)
+                previous = self._snapshots.get(job['video_id'])
+                if previous and previous[1] == key:
+                    continue
+                summary = summary or job_progress_summary(job)
+                with self._condition:
+                    version = previous[0] + 1 if previous else 1
+                    self._snapshots[job['video_id']] = (version, key, summary)
+                changed = True
+        return changed
+
+status_hub = StatusHub(SSE_POLL_INTERVAL)
+
+
+# === Content Deduplication ===
+# কনটেন্ট ডিডুপ্লিকেশন: আপলোডের সময়ই (ডিস্কে লেখার সাথে সাথে) ফাইলের হ্যাশ গণনা করা হয়। একই হ্যাশের
+# ভিডিও আগে থাকলে নতুন আইডিটি সেটির alias হয় এবং HLS ডিরেক্টরি symlink দিয়ে একই আউটপুট দেখায়।
+
+class HashingFile:
+    """একটি ফাইল অবজেক্টে লেখার সময় লেখা বাইটগুলোর হ্যাশও গণনা করে; বাকি সব কাজ মূল ফাইলকে দেয়।"""
+
+    def __init__(self, fileobj):
+        self._file = fileobj
+        self.hasher = hashlib.new(CONTENT_HASH_ALGORITHM)
+
+    def write(self, data):
+        self.hasher.update(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+def hash_file(path):
+    """ডিস্কের ফাইল পড়ে হ্যাশ অবজেক্ট রিটার্ন করে।"""
+    hasher = hashlib.new(CONTENT_HASH_ALGORITHM)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher
+
+_upload_hashers = {} # video_id -> (অফসেট, হ্যাশ অবজেক্ট): এই প্রসেসে চলমান রিজিউমেবল আপলোডের আংশিক হ্যাশ
+_upload_hashers_lock = threading.Lock()
+
+def take_upload_hasher(video_id, offset):
+    """রিজিউমেবল আপলোডের এই অফসেট পর্যন্ত চলমান হ্যাশ অবজেক্ট রিটার্ন করে; না থাকলে None।
+
+    আগের সব টুকরো এই প্রসেসেই এসে থাকলে জমা থাকা হ্যাশ থেকেই চলতে থাকে। কোনো টুকরো অন্য প্রসেসে
+    (বা রিস্টার্টের আগে) এসে থাকলে ধারাবাহিকতা ভেঙে যায়; তখন প্রতি টুকরোয় শুরু থেকে আবার না পড়ে
+    None রিটার্ন হয় এবং শেষে finalize_upload পুরো ফাইল একবার পড়ে হ্যাশ করে।
+    """
+    with _upload_hashers_lock:
+        cached = _upload_hashers.pop(video_id, None)
+    if offset == 0:
+        return hashlib.new(CONTENT_HASH_ALGORITHM)
+    if cached is not None and cached[0] == offset:
+        return cached[1]
+    return None
+
+def keep_upload_hasher(video_id, offset, hasher):
+    """পরের টুকরোর জন্য আংশিক হ্যাশ জমা রাখে।"""
+    with _upload_hashers_lock:
+        _upload_hashers[video_id] = (offset, hasher)
+
+def submit_uploaded_video(video_id, save_path, original_filename, content_digest=None, priority=JOB_DEFAULT_PRIORITY):
+    """আপলোড শেষ হওয়া ভিডিও কিউতে দেয়, অথবা একই কনটেন্ট আগে থাকলে সেটির alias বানায়।
+
+    রিটার্ন: (alias_of, position), enqueue_or_alias_job এর মতো। ডুপ্লিকেট হলে নতুন সোর্স ফাইলটি মুছে ফেলা হয়
+    এবং HLS ডিরেক্টরি মূল ভিডিওর ডিরেক্টরির symlink হয়, যাতে /hls/<নতুন আইডি>/ একই ফাইল সার্ভ করে।
+    """
+    video_hls_dir = os.path.join(HLS_DIR, video_id)
+    alias_of, position = enqueue_or_alias_job(video_id, save_path, video_hls_dir, original_filename,
+                                              content_digest if DEDUP_ENABLED else None, priority)
+    if alias_of is None:
+        return None, position
+    try:
+        os.symlink(alias_of, video_hls_dir) # একই HLS_DIR এর ভিতরে রিলেটিভ লিংক
+    except FileExistsError:
+        pass
+    except OSError as e:
+        logging.warning(f"[{video_id}] HLS ডিরেক্টরির symlink তৈরি করা যায়নি: {e}")
+    shutil.rmtree(os.path.dirname(save_path), ignore_errors=True) # ডুপ্লিকেট সোর্সের আর দরকার নেই
+    return alias_of, None
+
+
+# === Streaming & Resumable Uploads ===
+# স্ট্রিমিং ও রিজিউমেবল আপলোড: বড় ফাইল টুকরো টুকরো করে (tus-এর মতো: POST দিয়ে তৈরি, PATCH দিয়ে
+# নির্দিষ্ট অফসেট থেকে যোগ, HEAD দিয়ে অবস্থা) সরাসরি uploads/<video_id>/source.* এ লেখা হয়।
+# সংযোগ ভেঙে গেলে ক্লায়েন্ট HEAD দিয়ে অফসেট জেনে সেখান থেকে আবার শুরু করতে পারে।
+
+class DirectToDiskRequest(Request):
+    """মাল্টিপার্ট ফর্মের ফাইল অংশ মেমরি/সিস্টেম টেম্প ডিরেক্টরির বদলে সরাসরি আপলোড ডিরেক্টরিতে লেখে।
+
+    ফলে সেভ করার সময় ফাইলটি আবার কপি করতে হয় না; একই ফাইলসিস্টেমে শুধু rename করলেই হয়।
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        ensure_dir(UPLOAD_INCOMING_DIR)
+        # লেখার সাথে সাথে কনটেন্ট হ্যাশ গণনা হয়, যাতে ডুপ্লিকেট চিনতে ফাইলটি আবার পড়তে না হয়
+        return HashingFile(tempfile.NamedTemporaryFile('wb+', dir=UPLOAD_INCOMING_DIR, suffix='.part', delete=False))
+
+    def close(self):
+        # রিকোয়েস্ট শেষে যে অস্থায়ী ফাইল সরানো হয়নি (ত্রুটি, অবৈধ ফাইল ইত্যাদি) তা মুছে ফেলুন
+        spooled_paths = [getattr(f.stream, 'name', None) for f in self.files.values()] if 'files' in self.__dict__ else []
+        super().close()
+        for spooled_path in spooled_paths:
+            if isinstance(spooled_path, str) and os.path.isfile(spooled_path):
+                try: os.remove(spooled_path)
+                except OSError: pass
+
+app.request_class = DirectToDiskRequest
 
+def save_uploaded_file(file, save_path):
+    """ফর্মে আসা ফাইলটি চূড়ান্ত পাথে নিয়ে যায় (সম্ভব হলে rename, নইলে কপি) এবং কনটেন্ট হ্যাশ রিটার্ন করে।"""
+    spooled_path = getattr(file.stream, 'name', None)
+    if isinstance(spooled_path, str) and os.path.isfile(spooled_path):
+        file.stream.flush()
+        os.replace(spooled_path, save_path)
+    else:
+        file.save(save_path)
+    if isinstance(file.stream, HashingFile):
+        return file.stream.hasher.hexdigest()
+    return hash_file(save_path).hexdigest()
+
+def init_upload_db():
+    """রিজিউমেবল আপলোডের তথ্য রাখার টেবিল তৈরি করে।"""
+    get_db().execute("""
+        CREATE TABLE IF NOT EXISTS uploads (
+            video_id          TEXT PRIMARY KEY,
+            original_filename TEXT NOT NULL,
+            file_ext          TEXT NOT NULL,
+            upload_length     INTEGER NOT NULL,
+            created_at        REAL NOT NULL,
+            completed_at      REAL,
+            content_digest    TEXT
+        )""")
+    existing = {row['name'] for row in get_db().execute("PRAGMA table_info(uploads)")}
+    if 'content_digest' not in existing:
+        get_db().execute("ALTER TABLE uploads ADD COLUMN content_digest TEXT")
+
+def get_upload(video_id):
+    """একটি রিজিউমেবল আপলোডের রেকর্ড রিটার্ন করে (না থাকলে None)।"""
+    return get_db().execute("SELECT * FROM uploads WHERE video_id = ?", (video_id,)).fetchone()
+
+def upload_paths(upload):
+    """আপলোডের অসম্পূর্ণ (.part) ফাইল ও চূড়ান্ত সোর্স ফাইলের পাথ রিটার্ন করে।"""
+    save_path = os.path.join(UPLOAD_DIR, upload['video_id'], f"{SOURCE_VIDEO_BASENAME}.{upload['file_ext']}")
+    return save_path + '.part', save_path
+
+def upload_expires_at(upload):
+    """অসম্পূর্ণ আপলোডটি কখন মুছে যাবে (শেষ লেখা টুকরো থেকে UPLOAD_EXPIRY_SECONDS পরে); মেয়াদ না থাকলে None।"""
+    if not UPLOAD_EXPIRY_SECONDS or upload['completed_at']:
+        return None
+    try:
+        last_write = os.path.getmtime(upload_paths(upload)[0])
+    except OSError:
+        last_write = upload['created_at']
+    return max(last_write, upload['created_at']) + UPLOAD_EXPIRY_SECONDS
+
+def delete_upload(upload):
+    """মেয়াদ শেষ হওয়া অসম্পূর্ণ আপলোডের রেকর্ড, .part ফাইল ও হিসাব মুছে ফেলে। মুছলে True রিটার্ন করে।
+
+    ঠিক তখন কোনো PATCH লিখতে থাকলে (.part এর flock ধরা) কিছু মোছা হয় না; সেটি শেষে আবার পরীক্ষা হবে।
+    """
+    video_id = upload['video_id']
+    part_path, _ = upload_paths(upload)
+    try:
+        part_file = open(part_path, 'rb')
+    except FileNotFoundError:
+        part_file = None
+    try:
+        if part_file is not None:
+            try:
+                fcntl.flock(part_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+        # রেকর্ড আগে মুছুন, যাতে লকের অপেক্ষায় থাকা PATCH আপলোডটি আর না পায়
+        if not get_db().execute("DELETE FROM uploads WHERE video_id = ? AND completed_at IS NULL", (video_id,)).rowcount:
+            return False
+        storage.clear_upload_usage(video_id)
+        if get_job(video_id) is None:
+            shutil.rmtree(os.path.join(UPLOAD_DIR, video_id), ignore_errors=True)
     finally:
-        # প্রসেসিং সফল বা ব্যর্থ যাই হোক না কেন, নির্দিষ্ট ভিডিওর লক ফাইলটি মুছে ফেলুন
-        if os.path.exists(lock_file_path):
+        if part_file is not None:
+            part_file.close()
+    logging.info(f"[{video_id}] অসম্পূর্ণ রিজিউমেবল আপলোডের মেয়াদ শেষ; মুছে ফেলা হয়েছে।")
+    return True
+
+def sweep_expired_uploads():
+    """মেয়াদ শেষ হওয়া অসম্পূর্ণ আপলোড এবং ক্র্যাশ করা প্রসেসের রেখে যাওয়া ফর্ম আপলোডের অস্থায়ী ফাইল মুছে ফেলে।
+
+    চলমান অসম্পূর্ণ আপলোড ও ফর্ম আপলোডের অস্থায়ী ফাইলের আকার storage.record_upload_usage দিয়ে লেখা হয়, যাতে
+    ডিস্কের বাজেটে সেগুলোও গোনা হয়। মুছে ফেলা আপলোডের সংখ্যা রিটার্ন করে।
+    """
+    now = time.time()
+    removed = 0
+    pending = []
+    for upload in get_db().execute("SELECT * FROM uploads WHERE completed_at IS NULL").fetchall():
+        expires_at = upload_expires_at(upload)
+        if expires_at is not None and expires_at <= now:
+            removed += delete_upload(upload)
+            continue
+        try:
+            pending.append((upload['video_id'], os.path.getsize(upload_paths(upload)[0])))
+        except OSError:
+            pass # ইতিমধ্যে সোর্স ফাইলে রূপান্তরিত
+
+    spooled = 0
+    if os.path.isdir(UPLOAD_INCOMING_DIR):
+        # চলমান ফর্ম আপলোড প্রতিটি টুকরোয় ফাইলটি বদলায়, তাই অনেকক্ষণ না বদলানো ফাইল ক্র্যাশের অবশিষ্ট
+        for name in os.listdir(UPLOAD_INCOMING_DIR):
+            path = os.path.join(UPLOAD_INCOMING_DIR, name)
             try:
-                os.remove(lock_file_path)
-                logging.info(f"[{video_id}] প্রসেসিং লক ফাইল মুছে ফেলা হয়েছে: {lock_file_path}")
-            except OSError as e:
-                logging.error(f"[{video_id}] প্রসেসিং লক ফাইল মুছতে ব্যর্থ: {e}")
-        # ঐচ্ছিক: প্রসেসিংয়ের পর আপলোড করা সোর্স ফাইল মুছে ফেলা (কমেন্ট আউট করা আছে)
-        # if os.path.exists(uploaded_video_path):
-        #     try: os.remove(uploaded_video_path) ...
+                stat = os.stat(path)
+                if UPLOAD_EXPIRY_SECONDS and stat.st_mtime + UPLOAD_EXPIRY_SECONDS <= now:
+                    os.remove(path)
+                    logging.info(f"পরিত্যক্ত ফর্ম আপলোডের অস্থায়ী ফাইল মুছে ফেলা হয়েছে: {path}")
+                else:
+                    spooled += stat.st_size
+            except OSError:
+                pass
+    storage.record_upload_usage(pending, spooled)
+    return removed
+
+def upload_offset(upload):
+    """এখন পর্যন্ত কত বাইট ডিস্কে লেখা হয়েছে; ডিস্কের ফাইলই আসল হিসাব, তাই ক্র্যাশের পরেও সঠিক থাকে।"""
+    part_path, save_path = upload_paths(upload)
+    if upload['completed_at'] or os.path.exists(save_path):
+        return upload['upload_length']
+    try:
+        return os.path.getsize(part_path)
+    except OSError:
+        return 0
+
+def parse_tus_metadata(header_value):
+    """tus Upload-Metadata হেডার ('key base64value, ...') পার্স করে dict রিটার্ন করে।"""
+    metadata = {}
+    for pair in (header_value or '').split(','):
+        key, _, encoded = pair.strip().partition(' ')
+        if not key:
+            continue
+        try:
+            metadata[key] = base64.b64decode(encoded).decode('utf-8') if encoded else ''
+        except (binascii.Error, UnicodeDecodeError):
+            raise ValueError(f"Upload-Metadata এর '{key}' মান সঠিক base64 নয়")
+    return metadata
+
+def finalize_upload(upload):
+    """শেষ টুকরো পৌঁছালে .part ফাইলকে সোর্স ফাইলে রূপান্তর করে এবং ট্রান্সকোডিং জব কিউতে যোগ করে
+    (একই কনটেন্ট আগে থাকলে সেটির alias হয়)।
+
+    একাধিকবার ডাকলেও নিরাপদ; কিউ পূর্ণ থাকলে QueueFullError রেইজ করে এবং পরে আবার চেষ্টা করা যায়।
+    .part ফাইল থাকলে কলকারী সেটির flock ধরে রাখে (upload_chunk দেখুন), তাই rename একসাথে দুবার হয় না।
+    """
+    video_id = upload['video_id']
+    part_path, save_path = upload_paths(upload)
+    if os.path.exists(part_path):
+        os.replace(part_path, save_path)
+        get_db().execute("UPDATE uploads SET completed_at = ? WHERE video_id = ?", (time.time(), video_id))
+        # এখন থেকে এটি সোর্স; ট্রান্সকোড শেষে storage.account_video_storage সেভাবেই গোনে
+        storage.clear_upload_usage(video_id)
+        # রিজিউমেবল আপলোডের সময়: তৈরি থেকে শেষ টুকরো পর্যন্ত (ক্লায়েন্টের বিরতিসহ)
+        metrics.observe('transcode_stage_seconds', time.time() - upload['created_at'], stage='upload')
+        logging.info(f"[{video_id}] রিজিউমেবল আপলোড সম্পূর্ণ হয়েছে: {save_path}")
+    if get_job(video_id) is None:
+        # আপলোডের সময় গণনা করা হ্যাশ; না থাকলে (টুকরো ভিন্ন প্রসেসে এসেছিল বা পুরনো আপলোড) ফাইল একবার পড়ে গণনা করুন
+        content_digest = upload['content_digest'] or hash_file(save_path).hexdigest()
+        submit_uploaded_video(video_id, save_path, upload['original_filename'], content_digest)
+
+def try_finalize_upload(upload):
+    """finalize_upload চালায়; কিউ পূর্ণ থাকলে ত্রুটিটি রিটার্ন করে (ক্লায়েন্ট পরে খালি PATCH দিয়ে আবার চেষ্টা করবে), নইলে None।"""
+    try:
+        finalize_upload(upload)
+    except QueueFullError as e:
+        logging.warning(f"[{upload['video_id']}] কিউ পূর্ণ থাকায় সম্পূর্ণ আপলোড এখনও কিউতে যোগ করা যায়নি: {e}")
+        return e
+    return None
+
+def upload_expired(upload):
+    """আপলোডের মেয়াদ শেষ হলে সেটি মুছে True রিটার্ন করে (ক্লায়েন্টকে 410 পাঠাতে হবে)।"""
+    expires_at = upload_expires_at(upload)
+    if expires_at is None or expires_at > time.time():
+        return False
+    delete_upload(upload)
+    return True
+
+def tus_headers(upload=None, **extra):
+    """tus প্রোটোকলের সাধারণ রেসপন্স হেডার তৈরি করে।"""
+    headers = {'Tus-Resumable': TUS_VERSION, 'Cache-Control': 'no-store'}
+    if upload is not None:
+        headers['Upload-Offset'] = str(upload_offset(upload))
+        headers['Upload-Length'] = str(upload['upload_length'])
+        headers['X-Video-Status-Url'] = url_for('video_status', video_id=upload['video_id'])
+        expires_at = upload_expires_at(upload)
+        if expires_at is not None:
+            headers['Upload-Expires'] = http_date(expires_at) # tus expiration এক্সটেনশন
+    headers.update({key.replace('_', '-'): str(value) for key, value in extra.items()})
+    return headers
+
+
+# === HLS Serving Layer ===
+# HLS সার্ভিং স্তর: প্রতিটি সেগমেন্ট রিকোয়েস্টে বারবার ফাইলসিস্টেম পরীক্ষা না করে ফাইলের তথ্য (এবং ছোট প্লেলিস্টের
+# কনটেন্ট) মেমরিতে LRU ক্যাশে রাখা হয়। চাইলে বাইট পাঠানোর কাজ সামনের প্রক্সিকে (nginx/Apache) দেওয়া যায়।
+
+class HlsFileCache:
+    """HLS ফাইলের পাথ, আকার, mtime, ETag এবং প্লেলিস্টের কনটেন্ট রাখার সীমিত আকারের LRU ক্যাশ (প্রতি প্রসেসে একটি)।
+
+    এন্ট্রি ttl সেকেন্ড পর্যন্ত বিশ্বাস করা হয়; এই প্রসেসে জব শেষ হলে invalidate() সাথে সাথে মুছে দেয়,
+    অন্য প্রসেসের ক্যাশ ttl শেষে নিজে থেকেই নতুন হয়।
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = collections.OrderedDict() # (video_id, filename) -> এন্ট্রি
+        self._lock = threading.Lock()
+
+    def lookup(self, video_id, filename):
+        """ফাইলটির এন্ট্রি রিটার্ন করে (না থাকলে বা HLS ডিরেক্টরির বাইরে হলে None)।"""
+        key = (video_id, filename)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry['cached_at'] < self.ttl:
+                self._entries.move_to_end(key)
+                metrics.inc('hls_cache_lookups_total', result='hit')
+                return entry
+        metrics.inc('hls_cache_lookups_total', result='miss')
+        entry = self._load(video_id, filename, now)
+        if entry is not None and self.max_entries > 0:
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False) # সবচেয়ে কম ব্যবহৃত এন্ট্রি বাদ দিন
+        return entry
+
+    def invalidate(self, video_id):
+        """একটি ভিডিওর সব এন্ট্রি মুছে ফেলে (যেমন জব শেষ হলে বা আবার ট্রান্সকোড শুরু হলে)।"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == video_id]:
+                del self._entries[key]
+
+    def _load(self, video_id, filename, now):
+        video_hls_dir = os.path.join(HLS_DIR, video_id)
+        file_path = os.path.join(video_hls_dir, filename)
+        # অতিরিক্ত নিরাপত্তা পরীক্ষা: নিশ্চিত করুন যে পাথটি সত্যিই HLS ডিরেক্টরির ভিতরে (ক্যাশে রাখার আগে একবারই)
+        if not os.path.abspath(file_path).startswith(os.path.abspath(video_hls_dir) + os.sep):
+            logging.error(f"[{video_id}] নিরাপত্তা ঝুঁকি: HLS ডিরেক্টরির বাইরের ফাইল অ্যাক্সেসের চেষ্টা: {file_path}")
+            return None
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        extension = os.path.splitext(filename)[1].lower()
+        body = None
+        if extension == '.m3u8' and st.st_size <= HLS_PLAYLIST_CACHE_MAX_BYTES:
+            try:
+                with open(file_path, 'rb') as f:
+                    body = f.read()
+            except OSError:
+                return None
+        return {
+            'path': file_path,
+            'size': st.st_size,
+            'mtime': st.st_mtime,
+            'etag': f'{int(st.st_mtime * 1000):x}-{st.st_size:x}',
+            'mimetype': HLS_MIMETYPES.get(extension, 'application/octet-stream'),
+            'playlist': extension == '.m3u8',
+            'body': body,
+            'cached_at': now,
+        }
+
+hls_cache = HlsFileCache(HLS_CACHE_MAX_ENTRIES, HLS_CACHE_TTL)
+
+def send_hls_byte_range(entry):
+    """একক-রেঞ্জ Range রিকোয়েস্টের জন্য 206 রেসপন্স তৈরি করে: ফাইলটি সরাসরি অফসেটে seek করে শুধু ঐ অংশ পড়া হয়।
+
+    werkzeug এর সাধারণ রেঞ্জ সাপোর্ট gunicorn এর file wrapper এ seek করতে পারে না এবং শুরু থেকে পড়ে ফেলে দেয়,
+    যা একক ফাইল মোডে (বড় media ফাইলের শেষের দিকের সেগমেন্ট) খুব ব্যয়বহুল। একাধিক রেঞ্জ বা মেলেনি এমন
+    If-Range এর জন্য None রিটার্ন করে (তখন send_file পুরো ফাইল পাঠায়)।
+    """
+    f = open(entry['path'], 'rb')
+    try:
+        st = os.fstat(f.fileno()) # বাড়তে থাকা ফাইলের বর্তমান আকার (ক্যাশের আকার কয়েক সেকেন্ড পুরনো হতে পারে)
+        etag = f'{int(st.st_mtime * 1000):x}-{st.st_size:x}'
+        if request.if_range.etag and request.if_range.etag != etag:
+            f.close()
+            return None # ক্লায়েন্টের কাছে থাকা অংশ পুরনো ফাইলের, পুরো ফাইল পাঠাতে হবে
+        if len(request.range.ranges) != 1:
+            f.close()
+            return None # একাধিক রেঞ্জ (multipart) প্লেয়াররা চায় না; send_file পুরো ফাইল পাঠাবে
+        byte_range = request.range.range_for_length(st.st_size)
+        if byte_range is None:
+            f.close()
+            response = Response(status=416) # রেঞ্জটি ফাইলের বাইরে
+            response.headers['Content-Range'] = f'bytes */{st.st_size}'
+            return response
+        start, stop = byte_range
+        f.seek(start)
+    except Exception:
+        f.close()
+        raise
+
+    def generate():
+        with f:
+            remaining = stop - start
+            while remaining > 0:
+                chunk = f.read(min(HLS_RANGE_READ_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    response = Response(generate(), status=206, mimetype=entry['mimetype'], direct_passthrough=True)
+    response.content_length = stop - start
+    response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{st.st_size}'
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.set_etag(etag)
+    response.last_modified = st.st_mtime
+    return response
+
+if HLS_SENDFILE_MODE == 'x-sendfile':
+    app.config['USE_X_SENDFILE'] = True # send_file বাইট না পাঠিয়ে X-Sendfile হেডার দেবে (Apache/lighttpd)
 
 
 # === Flask Routes ===
@@ -384,7 +2861,20 @@ def index():
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """ভিডিও ফাইল আপলোড হ্যান্ডেল করে, আইডি নির্ধারণ করে এবং প্রসেসিং শুরু করে।"""
-    # চেক করুন ফাইল রিকোয়েস্টে আছে কিনা
+    # কিউ পূর্ণ থাকলে রিকোয়েস্ট বডি পড়ার (ফাইল ডিস্কে লেখার) আগেই প্রত্যাখ্যান করুন
+    if queue_depth() >= JOB_QUEUE_MAX:
+        flash('সার্ভার এখন ব্যস্ত, প্রসেসিং কিউ পূর্ণ। কিছুক্ষণ পরে আবার চেষ্টা করুন।', 'error')
+        logging.warning("কিউ পূর্ণ থাকায় আপলোড প্রত্যাখ্যান করা হয়েছে।")
+        return render_template('index.html'), 503, {'Retry-After': str(QUEUE_FULL_RETRY_AFTER)}
+
+    # খুব বড় ফাইল ডিস্কে লেখার আগেই প্রত্যাখ্যান করুন (রিজিউমেবল আপলোডের মতো একই সীমা)
+    if (request.content_length or 0) > MAX_UPLOAD_SIZE + FORM_UPLOAD_OVERHEAD:
+        flash(f'ফাইল খুব বড়। সর্বোচ্চ {MAX_UPLOAD_SIZE / 1024 ** 3:.1f} GiB পর্যন্ত আপলোড করা যায়।', 'error')
+        logging.warning(f"খুব বড় ফর্ম আপলোড প্রত্যাখ্যান করা হয়েছে ({request.content_length} বাইট)।")
+        return render_template('index.html'), 413
+
+    # চেক করুন ফাইল রিকোয়েস্টে আছে কিনা (request.files প্রথমবার পড়ার সময়ই পুরো বডি ডিস্কে লেখা হয়)
+    upload_started = time.monotonic()
     if 'video' not in request.files:
         flash('কোন ফাইল অংশ নেই।') # ব্যবহারকারীকে মেসেজ দেখান
         return redirect(url_for('index')) # ইনডেক্স পেজে ফেরত পাঠান
@@ -406,56 +2896,52 @@ def upload_file():
         video_upload_dir = os.path.join(UPLOAD_DIR, video_id)   # যেমন: uploads/uuid
         video_hls_dir = os.path.join(HLS_DIR, video_id)         # যেমন: static/hls/uuid
         save_path = os.path.join(video_upload_dir, f"{SOURCE_VIDEO_BASENAME}.{file_ext}") # সেভ করার পাথ
-        lock_file_path = os.path.join(video_hls_dir, PROCESSING_LOCK_FILENAME) # লক ফাইলের পাথ
 
         try:
             # প্রয়োজনীয় ডিরেক্টরি তৈরি করুন
             ensure_dir(video_upload_dir)
-            ensure_dir(video_hls_dir) # লক ফাইলের জন্য HLS ডিরেক্টরিও দরকার
 
-            # যদি এই আইডির জন্য ইতিমধ্যে প্রসেসিং চলে (খুব বিরল UUID এর ক্ষেত্রে, কিন্তু ভালো অভ্যাস)
-            if os.path.exists(lock_file_path):
+            # যদি এই আইডির জন্য ইতিমধ্যে জব থাকে (খুব বিরল UUID এর ক্ষেত্রে, কিন্তু ভালো অভ্যাস)
+            if get_job(video_id) is not None:
                 flash(f"ভিডিও আইডি {video_id} ইতিমধ্যে প্রসেস করা হচ্ছে।")
-                logging.warning(f"[{video_id}] লক ফাইল থাকা অবস্থায় আপলোডের চেষ্টা।")
+                logging.warning(f"[{video_id}] জব থাকা অবস্থায় আপলোডের চেষ্টা।")
                 return redirect(url_for('video_status', video_id=video_id)) # স্ট্যাটাস পেজে পাঠান
 
-            # আপলোড করা ফাইল সেভ করুন
-            file.save(save_path)
+            # আপলোড করা ফাইল সেভ করুন (ইতিমধ্যে ডিস্কে থাকা অস্থায়ী ফাইলটি rename করে)
+            content_digest = save_uploaded_file(file, save_path)
             logging.info(f"[{video_id}] ফাইল সেভ করা হয়েছে: {save_path}")
+            metrics.observe('transcode_stage_seconds', time.monotonic() - upload_started, stage='upload')
+            metrics.inc('upload_bytes_total', os.path.getsize(save_path), method='form')
 
-            # থ্রেড শুরু করার *আগে* লক ফাইল তৈরি করুন
-            with open(lock_file_path, 'w') as f:
-                f.write(f'Processing started at: {time.strftime("%Y-%m-%d %H:%M:%S")} for {original_filename}')
-            logging.info(f"[{video_id}] প্রসেসিং লক ফাইল তৈরি হয়েছে: {lock_file_path}")
-
-            # ব্যাকগ্রাউন্ড থ্রেডে ট্রান্সকোডিং প্রসেস শুরু করুন
-            logging.info(f"[{video_id}] ব্যাকগ্রাউন্ড প্রসেসিং থ্রেড শুরু হচ্ছে...")
-            processing_thread = threading.Thread(
-                target=run_processing_job, # যে ফাংশনটি চলবে
-                args=(video_id, save_path, video_hls_dir), # ফাংশনের আর্গুমেন্ট
-                name=f"ProcessingThread-{video_id}", # থ্রেডের নাম
-                daemon=True # অ্যাপ বন্ধ হলে থ্রেডও বন্ধ হবে
-            )
-            processing_thread.start() # থ্রেড শুরু করুন
+            # ট্রান্সকোডিং জব কিউতে যোগ করুন (ওয়ার্কার থ্রেড এটি প্রসেস করবে); একই ফাইল আগে থাকলে সেটির ফলাফল ব্যবহার হবে
+            alias_of, position = submit_uploaded_video(video_id, save_path, original_filename, content_digest)
+            if alias_of is not None:
+                flash(f'"{original_filename}" আপলোড সফল! আইডি: {video_id}. এই ভিডিওটি আগেই আপলোড করা হয়েছিল, তাই আবার প্রসেস করার দরকার নেই।')
+                return redirect(url_for('video_status', video_id=video_id))
 
             # ব্যবহারকারীকে মেসেজ দেখান এবং স্ট্যাটাস পেজে রিডাইরেক্ট করুন
-            flash(f'"{original_filename}" আপলোড সফল! আইডি: {video_id}. ভিডিওটি এখন প্রসেস হচ্ছে।')
+            flash(f'"{original_filename}" আপলোড সফল! আইডি: {video_id}. ভিডিওটি প্রসেসিং কিউতে {position} নম্বরে আছে।')
             return redirect(url_for('video_status', video_id=video_id))
 
         except Exception as e:
-            # যদি ফাইল সেভ বা থ্রেড শুরু করতে কোনো ত্রুটি হয়
-            flash(f'ফাইল সেভ বা প্রসেসিং শুরু করতে ত্রুটি: {e}')
-            logging.error(f"[{video_id or 'UNKNOWN'}] আপলোড হ্যান্ডলিংয়ের সময় ত্রুটি: {e}", exc_info=True)
+            queue_full = isinstance(e, QueueFullError)
+            # যদি ফাইল সেভ বা জব কিউতে যোগ করতে কোনো ত্রুটি হয়
+            if queue_full:
+                flash('সার্ভার এখন ব্যস্ত, প্রসেসিং কিউ পূর্ণ। কিছুক্ষণ পরে আবার চেষ্টা করুন।', 'error')
+                logging.warning(f"[{video_id}] কিউ পূর্ণ থাকায় আপলোড প্রত্যাখ্যান করা হয়েছে: {e}")
+            else:
+                flash(f'ফাইল সেভ বা প্রসেসিং শুরু করতে ত্রুটি: {e}')
+                logging.error(f"[{video_id or 'UNKNOWN'}] আপলোড হ্যান্ডলিংয়ের সময় ত্রুটি: {e}", exc_info=True)
             # ত্রুটি ঘটলে তৈরি হওয়া ফাইল/ডিরেক্টরি পরিষ্কার করার চেষ্টা করুন
-            if 'lock_file_path' in locals() and os.path.exists(lock_file_path):
-                try: os.remove(lock_file_path)
-                except OSError: pass
             if 'video_hls_dir' in locals() and os.path.exists(video_hls_dir):
                  try: shutil.rmtree(video_hls_dir)
                  except OSError: pass
             if 'video_upload_dir' in locals() and os.path.exists(video_upload_dir):
                  try: shutil.rmtree(video_upload_dir)
                  except OSError: pass
+            if queue_full:
+                # ব্যাকপ্রেশার: ক্লায়েন্টকে 503 ও Retry-After দিয়ে জানান
+                return render_template('index.html'), 503, {'Retry-After': str(QUEUE_FULL_RETRY_AFTER)}
             return redirect(url_for('index')) # ইনডেক্স পেজে ফেরত পাঠান
 
     else:
@@ -464,51 +2950,177 @@ def upload_file():
         return redirect(url_for('index'))
 
 
+@app.route('/api/uploads', methods=['OPTIONS'])
+@app.route('/api/uploads/<video_id>', methods=['OPTIONS'])
+def upload_options(video_id=None):
+    """tus ক্লায়েন্টকে সার্ভারের সক্ষমতা জানায়।"""
+    return '', 204, tus_headers(Tus_Version=TUS_VERSION, Tus_Max_Size=MAX_UPLOAD_SIZE, Tus_Extension='creation,expiration')
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """নতুন রিজিউমেবল আপলোড তৈরি করে; বডি ছাড়াই শুধু মোট আকার (Upload-Length) ও ফাইলের নাম নেয়।"""
+    # কিউ পূর্ণ থাকলে কোনো বাইট নেওয়ার আগেই প্রত্যাখ্যান করুন
+    if queue_depth() >= JOB_QUEUE_MAX:
+        logging.warning("কিউ পূর্ণ থাকায় রিজিউমেবল আপলোড তৈরি প্রত্যাখ্যান করা হয়েছে।")
+        return jsonify(error='প্রসেসিং কিউ পূর্ণ'), 503, tus_headers(Retry_After=QUEUE_FULL_RETRY_AFTER)
+
+    try:
+        upload_length = int(request.headers.get('Upload-Length', ''))
+        metadata = parse_tus_metadata(request.headers.get('Upload-Metadata'))
+    except ValueError as e:
+        return jsonify(error=f'অবৈধ Upload-Length বা Upload-Metadata: {e}'), 400, tus_headers()
+    if upload_length <= 0:
+        return jsonify(error='Upload-Length অবশ্যই ধনাত্মক হতে হবে'), 400, tus_headers()
+    if upload_length > MAX_UPLOAD_SIZE:
+        return jsonify(error=f'ফাইল খুব বড় (সর্বোচ্চ {MAX_UPLOAD_SIZE} বাইট)'), 413, tus_headers()
+
+    original_filename = metadata.get('filename', '')
+    if not allowed_file(original_filename):
+        return jsonify(error='অবৈধ ফাইলের প্রকার। অনুমোদিত প্রকারগুলি: ' + ', '.join(ALLOWED_EXTENSIONS)), 415, tus_headers()
+
+    video_id = str(uuid.uuid4()) # ইউনিক ভিডিও আইডি তৈরি করুন
+    file_ext = original_filename.rsplit('.', 1)[1].lower()
+    ensure_dir(os.path.join(UPLOAD_DIR, video_id))
+    get_db().execute(
+        "INSERT INTO uploads (video_id, original_filename, file_ext, upload_length, created_at) VALUES (?, ?, ?, ?, ?)",
+        (video_id, original_filename, file_ext, upload_length, time.time()))
+    upload = get_upload(video_id)
+    open(upload_paths(upload)[0], 'ab').close() # খালি .part ফাইল তৈরি করুন
+    logging.info(f"[{video_id}] রিজিউমেবল আপলোড তৈরি হয়েছে '{original_filename}' ({upload_length} বাইট)।")
+
+    headers = tus_headers(upload, Location=url_for('upload_chunk', video_id=video_id))
+    return '', 201, headers
+
+@app.route('/api/uploads/<video_id>', methods=['HEAD'])
+def upload_head(video_id):
+    """ক্লায়েন্টকে জানায় এখন পর্যন্ত কত বাইট পৌঁছেছে, যাতে সেখান থেকে আপলোড আবার শুরু করা যায়।"""
+    upload = get_upload(video_id)
+    if upload is None:
+        return '', 404, tus_headers()
+    if upload_expired(upload):
+        return '', 410, tus_headers()
+    return '', 200, tus_headers(upload)
+
+@app.route('/api/uploads/<video_id>', methods=['PATCH'])
+def upload_chunk(video_id):
+    """Upload-Offset থেকে শুরু করে রিকোয়েস্ট বডি সরাসরি .part ফাইলে যোগ করে (মেমরিতে পুরো টুকরো না রেখে)।"""
+    upload = get_upload(video_id)
+    if upload is None:
+        return '', 404, tus_headers()
+    if upload_expired(upload):
+        return jsonify(error='আপলোডের মেয়াদ শেষ হয়ে গেছে'), 410, tus_headers()
+    if request.mimetype != 'application/offset+octet-stream':
+        return jsonify(error='Content-Type অবশ্যই application/offset+octet-stream হতে হবে'), 415, tus_headers(upload)
+    try:
+        client_offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify(error='অবৈধ Upload-Offset'), 400, tus_headers(upload)
+
+    part_path, save_path = upload_paths(upload)
+    upload_length = upload['upload_length']
+
+    if not upload['completed_at'] and not os.path.exists(save_path):
+        try:
+            part_file = open(part_path, 'r+b')
+        except FileNotFoundError:
+            return jsonify(error='আপলোডটি আর উপলব্ধ নেই'), 410, tus_headers()
+        with part_file:
+            # একই আপলোডে একসাথে দুটি PATCH যেন একে অপরের বাইট ওভাররাইট না করে
+            fcntl.flock(part_file, fcntl.LOCK_EX)
+            if not os.path.exists(part_path):
+                # লকের অপেক্ষায় থাকার সময় অন্য PATCH আপলোডটি শেষ করেছে (.part এখন সোর্স ফাইল), অথবা মেয়াদ শেষে মুছে গেছে
+                upload = get_upload(video_id)
+                if upload is None:
+                    return jsonify(error='আপলোডটি আর উপলব্ধ নেই'), 410, tus_headers()
+                return '', 204, tus_headers(upload)
+            offset = os.fstat(part_file.fileno()).st_size
+            if client_offset != offset:
+                logging.warning(f"[{video_id}] অফসেট মেলেনি: ক্লায়েন্ট {client_offset}, সার্ভার {offset}")
+                return jsonify(error='Upload-Offset মেলেনি'), 409, tus_headers(upload)
+
+            part_file.seek(offset)
+            start_offset = offset
+            hasher = take_upload_hasher(video_id, offset) # ডুপ্লিকেট চেনার জন্য চলমান হ্যাশ (না থাকলে শেষে একবার)
+            stream = request.stream
+            try:
+                while offset < upload_length:
+                    chunk = stream.read(min(UPLOAD_CHUNK_SIZE, upload_length - offset))
+                    if not chunk:
+                        break
+                    part_file.write(chunk)
+                    part_file.flush() # সংযোগ ভাঙলেও যতটুকু পৌঁছেছে তা ফাইলে থাকবে
+                    if hasher is not None:
+                        hasher.update(chunk)
+                    offset += len(chunk)
+            except (OSError, IOError) as e:
+                # ক্লায়েন্ট মাঝপথে সংযোগ ছেড়ে দিয়েছে; যা লেখা হয়েছে তা থেকে পরে আবার শুরু করা যাবে
+                logging.warning(f"[{video_id}] আপলোড টুকরো মাঝপথে থেমে গেছে ({offset} বাইটে): {e}")
+            logging.debug(f"[{video_id}] আপলোড অগ্রগতি: {offset}/{upload_length} বাইট")
+            metrics.inc('upload_bytes_total', offset - start_offset, method='tus')
+            queue_full = None
+            if offset >= upload_length:
+                os.fsync(part_file.fileno())
+                if hasher is not None:
+                    get_db().execute("UPDATE uploads SET content_digest = ? WHERE video_id = ?", (hasher.hexdigest(), video_id))
+                # .part এর rename ও কিউতে যোগ লক ধরে রেখেই, যাতে একই আপলোডের আরেকটি PATCH এর সাথে না মেলে
+                queue_full = try_finalize_upload(get_upload(video_id))
+            elif hasher is not None:
+                keep_upload_hasher(video_id, offset, hasher)
+    else:
+        # ফাইল আগেই সম্পূর্ণ (যেমন কিউ পূর্ণ থাকার পর খালি PATCH দিয়ে আবার চেষ্টা)
+        queue_full = try_finalize_upload(upload)
+
+    if queue_full is not None:
+        # ফাইল সম্পূর্ণ পৌঁছেছে; কিউতে জায়গা হলে ক্লায়েন্ট খালি PATCH পাঠিয়ে আবার চেষ্টা করবে
+        return jsonify(error='প্রসেসিং কিউ পূর্ণ'), 503, tus_headers(get_upload(video_id), Retry_After=QUEUE_FULL_RETRY_AFTER)
+    return '', 204, tus_headers(get_upload(video_id))
+
+
 @app.route('/video/<video_id>')
 def video_status(video_id):
     """নির্দিষ্ট ভিডিও আইডির স্ট্যাটাস (প্রসেসিং, রেডি, এরর) বা প্লেয়ার দেখায়।"""
     logging.info(f"[{video_id}] স্ট্যাটাস চেকের অনুরোধ এসেছে।")
     video_hls_dir = os.path.join(HLS_DIR, video_id) # এই ভিডিওর HLS ডিরেক্টরি
 
-    # এই ভিডিওর স্টেট ফাইলগুলোর পাথ
-    lock_file_path = os.path.join(video_hls_dir, PROCESSING_LOCK_FILENAME)
-    ready_file_path = os.path.join(video_hls_dir, HLS_READY_FILENAME)
-    error_file_path = os.path.join(video_hls_dir, PROCESSING_ERROR_FILENAME)
-
     status = 'not_found' # ডিফল্ট স্ট্যাটাস
     error_message = None # ত্রুটির বার্তা
     hls_ready = False    # HLS রেডি কিনা
     processing = False   # প্রসেসিং চলছে কিনা
-
-    # ভিডিওর ডিরেক্টরি আছে কিনা তা পরীক্ষা করুন
-    if not os.path.isdir(video_hls_dir) and not os.path.isdir(os.path.join(UPLOAD_DIR, video_id)):
-         logging.warning(f"[{video_id}] HLS এবং আপলোড ডিরেক্টরি খুঁজে পাওয়া যায়নি।")
-         # স্ট্যাটাস 'not_found' থাকবে
-         pass
-    # ত্রুটি ফাইল আছে কিনা পরীক্ষা করুন
-    elif os.path.exists(error_file_path):
+    queue_position = None # কিউতে অবস্থান (শুধুমাত্র অপেক্ষমাণ জবের জন্য)
+    previews = None      # পোস্টার ও থাম্বনেইল ট্র্যাকের URL (রেডি হলে)
+
+    # জব স্টোর থেকে একবারেই এই ভিডিওর অবস্থা পড়ুন
+    job = get_job(video_id)
+    if job is not None and job['state'] == JOB_STATE_EVICTED:
+        # ডিস্কের বাজেটের জন্য আউটপুট সরানো হয়েছিল: আবার তৈরির জন্য কিউতে পাঠিয়ে প্রসেসিং হিসেবে দেখান
+        storage.request_regeneration(video_id)
+        job = get_job(video_id)
+
+    if job is None:
+        # জব স্টোর চালু হওয়ার আগে প্রসেস হওয়া পুরনো ভিডিও হতে পারে
+        if os.path.exists(os.path.join(video_hls_dir, LEGACY_HLS_READY_FILENAME)):
+            status = 'ready'
+            hls_ready = True
+            logging.info(f"[{video_id}] পুরনো রেডি মার্কার পাওয়া গেছে।")
+        else:
+            logging.warning(f"[{video_id}] জব স্টোরে এই ভিডিও খুঁজে পাওয়া যায়নি।")
+            # স্ট্যাটাস 'not_found' থাকবে
+    elif job['state'] == JOB_STATE_ERROR:
         status = 'error'
-        try:
-            with open(error_file_path, 'r') as f:
-                error_message = f.read() # ত্রুটির বার্তা পড়ুন
-            logging.warning(f"[{video_id}] ত্রুটি ফাইল পাওয়া গেছে: {error_file_path}")
-        except Exception as e:
-            error_message = f"ত্রুটি ফাইল পড়তে সমস্যা: {e}"
-            logging.error(f"[{video_id}] {error_message}")
-    # রেডি ফাইল আছে কিনা পরীক্ষা করুন
-    elif os.path.exists(ready_file_path):
+        error_message = job['error']
+        logging.warning(f"[{video_id}] জবটি ব্যর্থ হয়েছে (চেষ্টা: {job['attempts']})।")
+    elif job['state'] == JOB_STATE_READY:
         status = 'ready'
         hls_ready = True
-        logging.info(f"[{video_id}] রেডি ফাইল পাওয়া গেছে: {ready_file_path}")
-    # লক ফাইল আছে কিনা পরীক্ষা করুন
-    elif os.path.exists(lock_file_path):
+        previews = preview_urls(video_id, video_hls_dir)
+    else:
+        # কিউতে অপেক্ষমাণ অথবা প্রসেসিং চলছে
         status = 'processing'
         processing = True
-        logging.info(f"[{video_id}] লক ফাইল পাওয়া গেছে: {lock_file_path}")
-    else:
-         # ডিরেক্টরি আছে কিন্তু কোনো স্টেট ফাইল নেই (সম্ভবত মুছে ফেলা হয়েছে বা প্রসেসিং অসম্পূর্ণ)
-         logging.warning(f"[{video_id}] কোনো স্টেট ফাইল পাওয়া যায়নি ({video_hls_dir})। স্ট্যাটাস 'not_found' ধরা হচ্ছে।")
-         status = 'not_found'
+        queue_position = get_queue_position(job['video_id']) # কিউতে অপেক্ষমাণ হলে অবস্থান, চলমান হলে None
+
+    # সোর্স ভিডিওর ক্যাশ করা তথ্য (প্রসেসিং শুরু হওয়ার পর থেকে উপলব্ধ; এখানে ffprobe চালানো হয় না)
+    media = read_media_info(job['source_path']) if job is not None else None
 
     # টেমপ্লেট রেন্ডার করুন এবং স্ট্যাটাস সম্পর্কিত ভেরিয়েবলগুলো পাস করুন
     logging.info(f"[{video_id}] video_status.html রেন্ডার করা হচ্ছে স্ট্যাটাস: {status}")
@@ -517,59 +3129,141 @@ def video_status(video_id):
                            status=status,
                            hls_ready=hls_ready,
                            processing=processing,
+                           queue_position=queue_position,
+                           media=media,
+                           previews=previews,
                            error=error_message)
 
 
+@app.route('/api/video/<video_id>/progress')
+def video_progress(video_id):
+    """নির্দিষ্ট ভিডিওর ট্রান্সকোডিং অগ্রগতি (শতাংশ, fps, speed, ETA) JSON আকারে রিটার্ন করে।"""
+    job = get_job(video_id)
+    if job is None:
+        return jsonify({'video_id': video_id, 'state': 'not_found'}), 404
+    return jsonify(job_progress_summary(job))
+
+
+@app.route('/api/video/<video_id>/events')
+def video_events(video_id):
+    """Server-Sent Events: ভিডিওর অবস্থা ও অগ্রগতি বদলানোর সাথে সাথে ক্লায়েন্টকে পাঠায়।
+
+    অবস্থা 'ready' বা 'error' হলে স্ট্রিম বন্ধ হয়ে যায়। হাজার হাজার অলস সংযোগের জন্য gunicorn
+    gevent ওয়ার্কার দিয়ে চালাতে হবে (Dockerfile দেখুন), যাতে প্রতিটি সংযোগ একটি ওয়ার্কার আটকে না রাখে।
+    """
+    job = get_job(video_id)
+    if job is None:
+        return jsonify({'video_id': video_id, 'state': 'not_found'}), 404
+    video_id = job['video_id'] # ডুপ্লিকেট আপলোড হলে মূল ভিডিওর অবস্থা অনুসরণ করুন
+
+    def stream():
+        status_hub.subscribe(video_id)
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            version = -1
+            while True:
+                new_version, summary = status_hub.wait_for_change(video_id, version, SSE_HEARTBEAT_INTERVAL)
+                if new_version == version or summary is None:
+                    yield ": keepalive\n\n" # প্রক্সি যেন অলস সংযোগ বন্ধ না করে
+                    continue
+                version = new_version
+                yield f"event: status\ndata: {json.dumps(summary)}\n\n"
+                if summary['state'] in (JOB_STATE_READY, JOB_STATE_ERROR):
+                    return
+        finally:
+            status_hub.unsubscribe(video_id)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'} # nginx যেন বাফার না করে
+    return Response(stream(), mimetype='text/event-stream', headers=headers)
+
+
 @app.route('/hls/<video_id>/<path:filename>')
 def serve_hls_files(video_id, filename):
-    """নির্দিষ্ট ভিডিও আইডির HLS ফাইল (.m3u8, .ts) সার্ভ করে।"""
-    video_hls_dir = os.path.join(HLS_DIR, video_id) # ভিডিওর HLS ডিরেক্টরি
-    logging.debug(f"[{video_id}] HLS ফাইলের অনুরোধ: {filename} ডিরেক্টরি থেকে: {video_hls_dir}")
+    """নির্দিষ্ট ভিডিও আইডির HLS ফাইল (.m3u8, .ts, .m4s, একক ফাইল মোডের media ফাইলের বাইট-রেঞ্জ) সার্ভ করে।
+
+    ফাইলের তথ্য ও প্লেলিস্ট hls_cache থেকে আসে; HLS_SENDFILE_MODE সেট থাকলে সেগমেন্টের বাইট সামনের প্রক্সি পাঠায়।
+    """
+    logging.debug(f"[{video_id}] HLS ফাইলের অনুরোধ: {filename}")
+    started = time.monotonic()
 
     # নিরাপত্তা পরীক্ষা: ডিরেক্টরি ট্র্যাভার্সাল অ্যাটাক প্রতিরোধ
     if '..' in filename or filename.startswith('/') or '..' in video_id or video_id.startswith('/'):
-        logging.warning(f"[{video_id}] ডিরেক্টরি ট্র্যাভার্সাল প্রচেষ্টা ব্লক করা হয়েছে: {filename}")
+        logging.warning(f"[{video_id}] ডিরেক্টরি ট্র্যাভার্সাল প্রচেষ্টা ব্লক করা হয়েছে: {filename}")
         abort(403) # Forbidden
 
-    # ফাইলের সম্পূর্ণ পাথ তৈরি করুন
-    file_path = os.path.join(video_hls_dir, filename)
-
-    # ভিডিওর HLS ডিরেক্টরি আছে কিনা তা নিশ্চিত করুন
-    if not os.path.isdir(video_hls_dir):
-        logging.warning(f"[{video_id}] HLS ডিরেক্টরি খুঁজে পাওয়া যায়নি: {video_hls_dir}")
+    entry = hls_cache.lookup(video_id, filename)
+    if entry is None:
+        if filename == MASTER_PLAYLIST_NAME and storage.request_regeneration(video_id):
+            # ডিস্কের বাজেটের জন্য সরানো ভিডিও: আবার তৈরি শুরু হয়েছে, প্লেয়ার পরে আবার চেষ্টা করবে
+            metrics.record_hls_request(filename, 503, started, None)
+            return Response("Video is being regenerated, try again shortly.\n", status=503, mimetype='text/plain',
+                            headers={'Retry-After': str(QUEUE_FULL_RETRY_AFTER)})
+        logging.debug(f"[{video_id}] HLS ফাইল খুঁজে পাওয়া যায়নি: {filename}")
+        metrics.record_hls_request(filename, 404, started, None)
         abort(404) # Not Found
 
-    # অতিরিক্ত নিরাপত্তা পরীক্ষা: নিশ্চিত করুন যে পাথটি সত্যিই HLS ডিরেক্টরির ভিতরে
-    abs_hls_dir = os.path.abspath(video_hls_dir)
-    abs_file_path = os.path.abspath(file_path)
-    if not abs_file_path.startswith(abs_hls_dir):
-         logging.error(f"[{video_id}] নিরাপত্তা ঝুঁকি: HLS ডিরেক্টরির বাইরের ফাইল অ্যাক্সেসের চেষ্টা: {abs_file_path}")
-         abort(403) # Forbidden
-
-    # নির্দিষ্ট ফাইলটি ঐ ডিরেক্টরিতে আছে কিনা তা পরীক্ষা করুন
-    if not os.path.isfile(file_path):
-        logging.warning(f"[{video_id}] HLS ফাইল খুঁজে পাওয়া যায়নি: {file_path}")
-        abort(404) # Not Found
+    # প্লেলিস্ট বদলাতে পারে (যেমন প্রসেসিং চলাকালীন), সেগমেন্ট একবার লেখা হলে আর বদলায় না;
+    # কিন্তু একক ফাইল মোডে media ফাইল এনকোড চলাকালীন বাড়তে থাকে, তাই সদ্য বদলানো ফাইল অল্প সময় ক্যাশ হয়
+    if entry['playlist'] or time.time() - entry['mtime'] < HLS_GROWING_FILE_SECONDS:
+        cache_control = f'public, max-age={HLS_PLAYLIST_MAX_AGE}'
+    else:
+        cache_control = f'public, max-age={HLS_SEGMENT_MAX_AGE}, immutable'
 
     try:
-        # ফাইলটি সার্ভ করুন (conditional=True ক্যাশিং উন্নত করে)
-        return send_from_directory(video_hls_dir, filename, conditional=True)
+        if entry['body'] is not None:
+            # ছোট প্লেলিস্ট সরাসরি মেমরি থেকে
+            response = Response(entry['body'], mimetype=entry['mimetype'])
+            response.set_etag(entry['etag'])
+            response.last_modified = entry['mtime']
+            response = response.make_conditional(request)
+        elif HLS_SENDFILE_MODE == 'x-accel':
+            # nginx internal location থেকে ফাইলটি পাঠাবে; এই ওয়ার্কার সাথে সাথে মুক্ত হয়
+            response = Response(mimetype=entry['mimetype'])
+            response.headers['X-Accel-Redirect'] = f"{HLS_X_ACCEL_PREFIX.rstrip('/')}/{video_id}/{filename}"
+            response.set_etag(entry['etag'])
+        else:
+            # একক ফাইল মোডে প্লেয়ার বাইট-রেঞ্জে সেগমেন্ট চায়; প্রক্সি (x-accel/x-sendfile) রেঞ্জ নিজেই সামলায়
+            response = None
+            if request.range and HLS_SENDFILE_MODE != 'x-sendfile':
+                response = send_hls_byte_range(entry)
+            if response is None:
+                # সাধারণ মোডে wsgi.file_wrapper (sendfile) দিয়ে; x-sendfile মোডে শুধু হেডার যায়।
+                # werkzeug একাধিক রেঞ্জে 416 দেয়, তাই সেক্ষেত্রে রেঞ্জ উপেক্ষা করে পুরো ফাইল (200) পাঠানো হয়
+                multi_range = request.range is not None and len(request.range.ranges) != 1
+                response = send_file(entry['path'], mimetype=entry['mimetype'], conditional=not multi_range,
+                                     etag=entry['etag'], last_modified=entry['mtime'])
     except FileNotFoundError:
-        # যদিও isfile চেক করা হয়েছে, এটি একটি অতিরিক্ত নিরাপত্তা স্তর
-        logging.warning(f"[{video_id}] send_from_directory দ্বারা HLS ফাইল খুঁজে পাওয়া যায়নি: {file_path}")
+        # ক্যাশের পর ফাইলটি মুছে গেছে (যেমন আবার ট্রান্সকোড শুরু হয়েছে)
+        hls_cache.invalidate(video_id)
+        metrics.record_hls_request(filename, 404, started, None)
         abort(404)
     except Exception as e:
         # ফাইল সার্ভ করার সময় অন্য কোনো ত্রুটি ঘটলে
         logging.error(f"[{video_id}] HLS ফাইল সার্ভ করতে ত্রুটি ({filename}): {e}", exc_info=True)
+        metrics.record_hls_request(filename, 500, started, None)
         abort(500) # Internal Server Error
+    response.headers['Cache-Control'] = cache_control
+    # X-Accel-Redirect এ বাইট প্রক্সি পাঠায়, তখন ফাইলের আকারই পাঠানো বাইট
+    size = response.content_length if response.content_length is not None else entry['size']
+    metrics.record_hls_request(filename, response.status_code, started, 0 if response.status_code == 304 else size)
+    storage.storage_access.touch(video_id, filename) # ডিস্কের বাজেটে কম দেখা রেজোলিউশন আগে সরানোর জন্য
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus স্ক্র্যাপের জন্য সব প্রসেসের সম্মিলিত মেট্রিক্স টেক্সট ফরম্যাটে রিটার্ন করে।"""
+    if not metrics.METRICS_ENABLED:
+        abort(404)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 
 # === Application Startup ===
 # অ্যাপ্লিকেশন শুরু হওয়ার সময় করণীয়
 
 # প্রয়োজনীয় কমান্ডগুলো উপলব্ধ কিনা তা পরীক্ষা করুন
 logging.info("প্রয়োজনীয় কমান্ড পরীক্ষা করা হচ্ছে (ffmpeg, ffprobe)...")
-ffmpeg_ok = check_command('ffmpeg')
-ffprobe_ok = check_command('ffprobe')
+ffmpeg_ok = tool_available('ffmpeg')
+ffprobe_ok = tool_available('ffprobe')
 if not ffmpeg_ok:
     logging.critical("ffmpeg প্রয়োজন কিন্তু উপলব্ধ নেই। প্রসেসিং ব্যর্থ হবে।")
 if not ffprobe_ok:
@@ -582,6 +3276,28 @@ ensure_dir(UPLOAD_DIR)
 ensure_dir(STATIC_DIR)
 ensure_dir(HLS_DIR)
 
+# জব স্টোর ও আপলোড টেবিল প্রস্তুত করুন, মারা যাওয়া প্রসেসের অসম্পূর্ণ জবগুলো উদ্ধার করুন এবং
+# (আলাদা worker.py ব্যবহার না করলে) এই প্রসেসের ওয়ার্কার থ্রেডগুলো চালু করুন
+init_job_db()
+init_upload_db()
+metrics.init_metrics_db()
+storage.configure(
+    rendition_entries=lambda hls_dir: read_transcode_state(hls_dir).get('renditions', {}),
+    remove_output=lambda hls_dir: _remove_hls_items(hls_dir, {TRANSCODE_STATE_FILENAME}),
+    write_master_playlist=write_master_playlist,
+    output_changed=lambda video_id: hls_cache.invalidate(video_id),
+    jobs_changed=lambda: status_hub.poke(),
+    job_queued=_job_wakeup.set)
+storage.init_storage_db()
+recover_orphaned_jobs()
+if RUN_EMBEDDED_WORKERS and gevent_patched():
+    # gevent ওয়ার্কারে এমবেডেড ওয়ার্কার গ্রিনলেট হয়ে চলত এবং ইভেন্ট লুপ আটকে দিত; জবগুলো worker.py এর জন্য কিউতে থাকবে
+    logging.error("gevent ওয়ার্কারের ভিতরে ট্রান্সকোডিং ওয়ার্কার চালু করা হবে না; RUN_EMBEDDED_WORKERS=0 দিন এবং আলাদা worker.py চালান।")
+elif RUN_EMBEDDED_WORKERS:
+    start_transcode_workers()
+else:
+    logging.info("এই প্রসেসে ট্রান্সকোডিং ওয়ার্কার চালু হবে না (RUN_EMBEDDED_WORKERS=0); জবগুলো worker.py প্রসেস করবে।")
+
 # === Main Execution Block ===
 # মূল এক্সিকিউশন ব্লক
 
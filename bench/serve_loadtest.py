@@ -0,0 +1,233 @@
+"""HLS সার্ভিং লোড টেস্ট।
+
+দুইভাবে চালানো যায়:
+
+1. ইন-প্রসেস (ডিফল্ট): একটি অস্থায়ী HLS ডিরেক্টরিতে নকল ভিডিও (মাস্টার + রেজোলিউশন প্লেলিস্ট + সেগমেন্ট) তৈরি করে
+   Flask অ্যাপের serve_hls_files কে সরাসরি WSGI দিয়ে বারবার ডাকে এবং বিভিন্ন কনফিগারেশনে requests/sec তুলনা করে:
+   ক্যাশ ছাড়া (আগের মতো প্রতি রিকোয়েস্টে ফাইলসিস্টেম পরীক্ষা), ক্যাশসহ, এবং ক্যাশ + X-Accel-Redirect।
+
+       python bench/serve_loadtest.py --requests 20000 --threads 8
+
+2. চালু সার্ভারের বিরুদ্ধে HTTP দিয়ে (যেমন gunicorn + nginx):
+
+       python bench/serve_loadtest.py --url http://localhost:8000/hls/<video_id>/ --duration 30 --threads 64
+
+ফলাফল টেবিল আকারে দেখানো হয়; --json দিলে JSON আকারে।
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from urllib.parse import urljoin
+
+RENDITIONS = ['360', '480', '720']
+
+
+def percentile(values, pct):
+    """সাজানো তালিকা থেকে নির্দিষ্ট পার্সেন্টাইলের মান।"""
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def build_fake_hls(hls_dir, video_id, segments, segment_bytes):
+    """নকল HLS আউটপুট তৈরি করে এবং রিকোয়েস্ট করার জন্য ফাইলগুলোর রিলেটিভ পাথ রিটার্ন করে।"""
+    base = os.path.join(hls_dir, video_id)
+    os.makedirs(base, exist_ok=True)
+    paths = ['master.m3u8']
+    with open(os.path.join(base, 'master.m3u8'), 'w') as f:
+        f.write('#EXTM3U\n#EXT-X-VERSION:3\n')
+        for name in RENDITIONS:
+            f.write(f'#EXT-X-STREAM-INF:BANDWIDTH=1000000,RESOLUTION=640x{name}\n{name}/playlist.m3u8\n')
+    payload = os.urandom(segment_bytes)
+    for name in RENDITIONS:
+        rendition_dir = os.path.join(base, name)
+        os.makedirs(rendition_dir, exist_ok=True)
+        with open(os.path.join(rendition_dir, 'playlist.m3u8'), 'w') as f:
+            f.write('#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:6\n#EXT-X-MEDIA-SEQUENCE:0\n')
+            for i in range(segments):
+                f.write(f'#EXTINF:6.000000,\nsegment{i:03d}.ts\n')
+            f.write('#EXT-X-ENDLIST\n')
+        paths.append(f'{name}/playlist.m3u8')
+        for i in range(segments):
+            with open(os.path.join(rendition_dir, f'segment{i:03d}.ts'), 'wb') as f:
+                f.write(payload)
+            paths.append(f'{name}/segment{i:03d}.ts')
+    return paths
+
+
+def request_mix(paths, count, seed=1):
+    """প্লেয়ারের মতো মিশ্রণ: প্রায় ২০% প্লেলিস্ট, বাকিগুলো সেগমেন্ট।"""
+    rng = random.Random(seed)
+    playlists = [p for p in paths if p.endswith('.m3u8')]
+    segments = [p for p in paths if p.endswith('.ts')]
+    return [rng.choice(playlists) if rng.random() < 0.2 else rng.choice(segments) for _ in range(count)]
+
+
+def run_threads(worker, threads, jobs):
+    """jobs তালিকা threads সংখ্যক থ্রেডে ভাগ করে চালায় এবং (মোট সময়, লেটেন্সি তালিকা, ত্রুটি সংখ্যা) রিটার্ন করে।"""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def run(chunk):
+        local, local_errors = [], 0
+        for job in chunk:
+            start = time.perf_counter()
+            if not worker(job):
+                local_errors += 1
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    chunks = [jobs[i::threads] for i in range(threads)]
+    pool = [threading.Thread(target=run, args=(chunk,)) for chunk in chunks]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - start, latencies, errors[0]
+
+
+def summarize(label, elapsed, latencies, errors, total_bytes=None):
+    count = len(latencies)
+    result = {
+        'config': label,
+        'requests': count,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'requests_per_sec': round(count / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+    }
+    if total_bytes is not None:
+        result['mb_per_sec'] = round(total_bytes / elapsed / 1048576, 1) if elapsed else None
+    return result
+
+
+def bench_in_process(args):
+    """অ্যাপটি ইমপোর্ট করে বিভিন্ন সার্ভিং কনফিগারেশনে WSGI স্তরে requests/sec মাপে।"""
+    work_dir = tempfile.mkdtemp(prefix='hls-loadtest-')
+    os.environ.setdefault('JOBS_DB_PATH', os.path.join(work_dir, 'jobs.db'))
+    os.environ.setdefault('TRANSCODE_WORKERS', '0') # লোড টেস্টে ট্রান্সকোডিং ওয়ার্কার দরকার নেই
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import logging
+    import app as app_module
+    logging.disable(logging.WARNING)
+
+    app_module.HLS_DIR = os.path.join(work_dir, 'hls')
+    video_id = 'loadtest'
+    paths = build_fake_hls(app_module.HLS_DIR, video_id, args.segments, args.segment_kb * 1024)
+    jobs = request_mix(paths, args.requests)
+    wsgi = app_module.app.wsgi_app
+
+    def worker(path):
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': f'/hls/{video_id}/{path}', 'SCRIPT_NAME': '',
+            'QUERY_STRING': '', 'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'wsgi.url_scheme': 'http', 'wsgi.input': None, 'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+        }
+        status = []
+        body = wsgi(environ, lambda s, h, exc_info=None: status.append(s))
+        try:
+            for _ in body: # বডি পুরোটা পড়ুন, যেমন সার্ভার পড়ত
+                pass
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        return status and status[0].startswith('200')
+
+    configs = [
+        ('no-cache', 0, ''),          # প্রতি রিকোয়েস্টে ফাইলসিস্টেম পরীক্ষা (আগের আচরণের কাছাকাছি)
+        ('cache', args.cache_entries, ''),
+        ('cache+x-accel', args.cache_entries, 'x-accel'),
+    ]
+    results = []
+    for label, max_entries, sendfile_mode in configs:
+        app_module.hls_cache = app_module.HlsFileCache(max_entries, app_module.HLS_CACHE_TTL)
+        app_module.HLS_SENDFILE_MODE = sendfile_mode
+        run_threads(worker, args.threads, jobs[:min(500, len(jobs))]) # ওয়ার্ম-আপ
+        elapsed, latencies, errors = run_threads(worker, args.threads, jobs)
+        results.append(summarize(label, elapsed, latencies, errors))
+    return results
+
+
+def bench_http(args):
+    """চালু সার্ভারের একটি ভিডিওর মাস্টার প্লেলিস্ট থেকে সব ফাইল খুঁজে নিয়ে নির্দিষ্ট সময় ধরে HTTP রিকোয়েস্ট পাঠায়।"""
+    base_url = args.url if args.url.endswith('/') else args.url + '/'
+
+    def fetch(url):
+        with urllib.request.urlopen(url, timeout=30) as response:
+            return response.read()
+
+    paths = ['master.m3u8']
+    for line in fetch(urljoin(base_url, 'master.m3u8')).decode().splitlines():
+        if line and not line.startswith('#'):
+            paths.append(line)
+            rendition_dir = line.rsplit('/', 1)[0] + '/' if '/' in line else ''
+            for seg in fetch(urljoin(base_url, line)).decode().splitlines():
+                if seg and not seg.startswith('#'):
+                    paths.append(rendition_dir + seg)
+    urls = [urljoin(base_url, p) for p in request_mix(paths, 1000)]
+
+    deadline = time.perf_counter() + args.duration
+    latencies, errors, total_bytes = [], [0], [0]
+    lock = threading.Lock()
+
+    def run(offset):
+        local, local_errors, local_bytes, i = [], 0, 0, offset
+        while time.perf_counter() < deadline:
+            url = urls[i % len(urls)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                local_bytes += len(fetch(url))
+            except Exception:
+                local_errors += 1
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+            total_bytes[0] += local_bytes
+
+    pool = [threading.Thread(target=run, args=(n * 37,)) for n in range(args.threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return [summarize(base_url, time.perf_counter() - start, latencies, errors[0], total_bytes[0])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HLS সেগমেন্ট/প্লেলিস্ট সার্ভিংয়ের লোড টেস্ট')
+    parser.add_argument('--url', help='চালু সার্ভারের ভিডিওর HLS বেস URL, যেমন http://localhost:8000/hls/<video_id>/')
+    parser.add_argument('--duration', type=float, default=20, help='HTTP মোডে কত সেকেন্ড চলবে')
+    parser.add_argument('--requests', type=int, default=20000, help='ইন-প্রসেস মোডে প্রতিটি কনফিগারেশনে মোট রিকোয়েস্ট')
+    parser.add_argument('--threads', type=int, default=8, help='একসাথে কতগুলো ক্লায়েন্ট থ্রেড')
+    parser.add_argument('--segments', type=int, default=50, help='প্রতিটি রেজোলিউশনে নকল সেগমেন্টের সংখ্যা')
+    parser.add_argument('--segment-kb', type=int, default=512, help='প্রতিটি নকল সেগমেন্টের আকার (KB)')
+    parser.add_argument('--cache-entries', type=int, default=4096, help='ক্যাশসহ কনফিগারেশনে ক্যাশের আকার')
+    parser.add_argument('--json', action='store_true', help='ফলাফল JSON আকারে দেখান')
+    args = parser.parse_args()
+
+    results = bench_http(args) if args.url else bench_in_process(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'config':<20}{'requests':>10}{'errors':>8}{'req/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for r in results:
+        print(f"{r['config']:<20}{r['requests']:>10}{r['errors']:>8}{r['requests_per_sec']:>12}{r['p50_ms']:>10}{r['p99_ms']:>10}")
+
+
+if __name__ == '__main__':
+    main()
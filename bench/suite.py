@@ -0,0 +1,416 @@
+"""ট্রান্সকোডিং ও সার্ভিংয়ের পুনরুৎপাদনযোগ্য বেঞ্চমার্ক স্যুট।
+
+ইন্টারনেট ছাড়াই যেকোনো সাধারণ লিনাক্স মেশিনে (ffmpeg/ffprobe থাকলেই) চলে:
+
+1. ffmpeg lavfi (testsrc2 + sine) দিয়ে নির্দিষ্ট রেজোলিউশন ও দৈর্ঘ্যের সিনথেটিক সোর্স তৈরি করে। একই স্পেকের
+   সোর্স সবসময় একই থাকে (bitexact, নির্দিষ্ট এনকোডার সেটিংস) এবং --cache-dir এ রেখে পরের রানে আবার ব্যবহার হয়।
+2. প্রতিটি সোর্সে অ্যাপের transcode_to_hls চালিয়ে মোট সময়, ffmpeg প্রসেসগুলোর CPU সময় এবং প্রতিটি
+   রেজোলিউশনের (বা একক-পাস/টুকরোর) এনকোড গতি (রিয়েলটাইমের কত গুণ), CPU সময় ও সর্বোচ্চ RSS মাপে।
+3. লোকাল HTTP সার্ভারে (werkzeug, থ্রেডেড) ফর্ম ও tus আপলোডের থ্রুপুট মাপে।
+4. একই সার্ভারে তৈরি হওয়া আসল HLS আউটপুটের বিরুদ্ধে serve_loadtest এর HTTP লোড জেনারেটর দিয়ে
+   requests/sec ও লেটেন্সি মাপে।
+
+ফলাফল JSON ফাইলে লেখা হয় (মেশিন, ffmpeg ভার্সন, git কমিট ও কনফিগারেশনসহ), তাই দুটি রান তুলনা করা যায়:
+
+    python bench/suite.py --output before.json
+    python bench/suite.py --output after.json --compare before.json
+    python bench/suite.py --quick                       # শুধু ছোট 360p সোর্স, দ্রুত যাচাইয়ের জন্য
+    python bench/suite.py --sources 720p:30,1080p:120 --modes single_pass,parallel --repeat 3
+
+অ্যাপের কনফিগারেশন (TRANSCODE_MODE, HLS_SEGMENT_TYPE, HLS_SHARED_AUDIO ইত্যাদি) পরিবেশ ভেরিয়েবল থেকেই আসে।
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+HEIGHTS = {'360p': (640, 360), '480p': (854, 480), '720p': (1280, 720), '1080p': (1920, 1080)}
+DEFAULT_SOURCES = '360p:10,720p:10,1080p:10,720p:120' # ছোট (সব রেজোলিউশন) এবং লম্বা (টুকরো মোড ও দীর্ঘ এনকোড)
+QUICK_SOURCES = '360p:10'
+SOURCE_FPS = 30
+UPLOAD_BLOCK = 1024 * 1024 # আপলোডের সময় একবারে কত বাইট পাঠানো হবে
+
+
+def parse_sources(spec):
+    """'720p:30,1080p:120' -> [('720p', 30), ('1080p', 120)]"""
+    sources = []
+    for item in spec.split(','):
+        name, _, seconds = item.strip().partition(':')
+        if name not in HEIGHTS:
+            raise SystemExit(f"অজানা রেজোলিউশন: {name} (সমর্থিত: {', '.join(HEIGHTS)})")
+        sources.append((name, int(seconds or 10)))
+    return sources
+
+
+def make_source(cache_dir, name, seconds):
+    """lavfi দিয়ে নির্ধারিত (deterministic) সিনথেটিক সোর্স তৈরি করে; আগে থেকে থাকলে সেটিই ব্যবহার করে।"""
+    width, height = HEIGHTS[name]
+    path = os.path.join(cache_dir, f'testsrc2-{name}-{seconds}s.mp4')
+    if os.path.isfile(path):
+        return path
+    os.makedirs(cache_dir, exist_ok=True)
+    cmd = [
+        'ffmpeg', '-v', 'error', '-y',
+        '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate={SOURCE_FPS}:duration={seconds}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:beep_factor=4:sample_rate=48000:duration={seconds}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '20', '-g', str(SOURCE_FPS * 2), '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-b:a', '128k', '-ac', '2',
+        '-fflags', '+bitexact', '-flags:v', '+bitexact', '-flags:a', '+bitexact', # একই স্পেক = একই বাইট
+        '-movflags', '+faststart', '-shortest', path + '.tmp.mp4',
+    ]
+    print(f"সোর্স তৈরি হচ্ছে: {os.path.basename(path)} ...", file=sys.stderr)
+    subprocess.run(cmd, check=True)
+    os.replace(path + '.tmp.mp4', path)
+    return path
+
+
+def load_app(work_dir):
+    """অস্থায়ী ডিরেক্টরি ও জব ডাটাবেস দিয়ে অ্যাপ ইমপোর্ট করে (ওয়ার্কার থ্রেড ছাড়া)।"""
+    os.environ['JOBS_DB_PATH'] = os.path.join(work_dir, 'jobs.db')
+    os.environ['RUN_EMBEDDED_WORKERS'] = '0' # আপলোড হওয়া ভিডিও কিউতেই থাকবে, ট্রান্সকোড হবে না
+    sys.path.insert(0, REPO_DIR)
+    import logging
+    import app as app_module
+    logging.disable(logging.WARNING)
+    app_module.UPLOAD_DIR = os.path.join(work_dir, 'uploads')
+    app_module.UPLOAD_INCOMING_DIR = os.path.join(app_module.UPLOAD_DIR, '.incoming')
+    app_module.HLS_DIR = os.path.join(work_dir, 'hls')
+    app_module.JOB_QUEUE_MAX = 1000000 # আপলোড বেঞ্চমার্কে কিউ পূর্ণ হয়ে 503 যেন না আসে
+    for directory in (app_module.UPLOAD_DIR, app_module.HLS_DIR):
+        os.makedirs(directory, exist_ok=True)
+    return app_module
+
+
+def children_cpu_seconds():
+    """এই প্রসেসের শেষ হওয়া চাইল্ড প্রসেসগুলোর (ffmpeg/ffprobe) মোট user + system CPU সময়।"""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def bench_transcode(app_module, source_path, source_name, seconds, mode, repeat):
+    """একটি সোর্স একটি মোডে repeat বার ট্রান্সকোড করে সময়, CPU এবং রেজোলিউশনভিত্তিক গতি রিটার্ন করে।"""
+    # অ্যাপের প্রতিটি ffmpeg রানের মেট্রিক্স হুক থেকে রেজোলিউশনভিত্তিক তথ্য সংগ্রহ করুন
+    runs = []
+    original_record = app_module.metrics.record_ffmpeg_metrics
+
+    def capture(stage, rendition, result, wall_seconds, rusage, media_seconds):
+        runs.append({
+            'stage': stage, 'rendition': rendition, 'result': result, 'wall_seconds': wall_seconds,
+            'cpu_seconds': rusage.ru_utime + rusage.ru_stime if rusage else None,
+            'peak_rss_mb': rusage.ru_maxrss / 1024 if rusage else None,
+            'speed': media_seconds / wall_seconds if result == 'ok' and media_seconds and wall_seconds > 0 else None,
+        })
+        original_record(stage, rendition, result, wall_seconds, rusage, media_seconds)
+
+    app_module.metrics.record_ffmpeg_metrics = capture
+    app_module.TRANSCODE_MODE = mode
+    attempts = []
+    try:
+        for _ in range(repeat):
+            runs.clear()
+            video_id = f'bench-{uuid.uuid4().hex[:8]}'
+            output_dir = os.path.join(app_module.HLS_DIR, video_id)
+            os.makedirs(output_dir)
+            media_cache = app_module.media_info_path(source_path)
+            if os.path.exists(media_cache):
+                os.remove(media_cache) # প্রতিবার probe সহ পুরো পাইপলাইন মাপুন
+            app_module.enqueue_job(video_id, source_path, output_dir)
+            cpu_before, self_before = children_cpu_seconds(), time.process_time()
+            start = time.perf_counter()
+            ok = app_module.transcode_to_hls(video_id, source_path, output_dir, app_module.RESOLUTIONS)
+            wall = time.perf_counter() - start
+            attempts.append({
+                'ok': ok,
+                'wall_seconds': wall,
+                'ffmpeg_cpu_seconds': children_cpu_seconds() - cpu_before,
+                'app_cpu_seconds': time.process_time() - self_before, # প্লেলিস্ট জোড়া, পোলিং ইত্যাদি
+                'outputs': sorted(os.listdir(output_dir)),
+                'ffmpeg_runs': list(runs),
+                'video_id': video_id,
+            })
+    finally:
+        app_module.metrics.record_ffmpeg_metrics = original_record
+
+    walls = [a['wall_seconds'] for a in attempts]
+    median = attempts[walls.index(sorted(walls)[len(walls) // 2])] # মধ্যমা রানের বিস্তারিত রাখা হয়
+    per_rendition = {}
+    for run in median['ffmpeg_runs']:
+        entry = per_rendition.setdefault(f"{run['stage']}:{run['rendition']}", {'runs': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'peak_rss_mb': 0.0})
+        entry['runs'] += 1
+        entry['wall_seconds'] += run['wall_seconds']
+        entry['cpu_seconds'] += run['cpu_seconds'] or 0.0
+        entry['peak_rss_mb'] = max(entry['peak_rss_mb'], run['peak_rss_mb'] or 0.0)
+    for key, entry in per_rendition.items():
+        speeds = [r['speed'] for r in median['ffmpeg_runs'] if f"{r['stage']}:{r['rendition']}" == key and r['speed']]
+        # টুকরো মোডে একই লেবেলের অনেক রান একসাথে চলে, তাই গতি প্রতিটি রানের গড়
+        entry['speed_x_realtime'] = round(statistics.mean(speeds), 2) if speeds else None
+        entry['wall_seconds'] = round(entry['wall_seconds'], 3)
+        entry['cpu_seconds'] = round(entry['cpu_seconds'], 3)
+        entry['peak_rss_mb'] = round(entry['peak_rss_mb'], 1)
+    return {
+        'source': source_name,
+        'source_seconds': seconds,
+        'mode': mode,
+        'ok': all(a['ok'] for a in attempts),
+        'wall_seconds': round(median['wall_seconds'], 3),
+        'wall_seconds_all': [round(w, 3) for w in walls],
+        'speed_x_realtime': round(seconds / median['wall_seconds'], 2),
+        'ffmpeg_cpu_seconds': round(median['ffmpeg_cpu_seconds'], 3),
+        'app_cpu_seconds': round(median['app_cpu_seconds'], 3),
+        'outputs': median['outputs'],
+        'per_rendition': per_rendition,
+    }, median['video_id']
+
+
+def start_server(app_module):
+    """অ্যাপটি একটি লোকাল থ্রেডেড HTTP সার্ভারে (এলোমেলো পোর্ট) চালু করে এবং (সার্ভার, বেস URL) রিটার্ন করে।"""
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='BenchServer', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def send_blocks(conn, path):
+    """ফাইলটি UPLOAD_BLOCK আকারের টুকরোয় সংযোগে লেখে (পুরো ফাইল মেমরিতে না রেখে)।"""
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(UPLOAD_BLOCK)
+            if not block:
+                break
+            conn.send(block)
+
+
+def upload_form(port, path):
+    """multipart ফর্ম আপলোড (/upload); সফল হলে True।"""
+    boundary = uuid.uuid4().hex
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="video"; filename="{os.path.basename(path)}"\r\n'
+            f'Content-Type: video/mp4\r\n\r\n').encode()
+    tail = f'\r\n--{boundary}--\r\n'.encode()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=600)
+    conn.putrequest('POST', '/upload')
+    conn.putheader('Content-Type', f'multipart/form-data; boundary={boundary}')
+    conn.putheader('Content-Length', str(len(head) + os.path.getsize(path) + len(tail)))
+    conn.endheaders()
+    conn.send(head)
+    send_blocks(conn, path)
+    conn.send(tail)
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response.status in (302, 303) # সফল হলে স্ট্যাটাস পেজে রিডাইরেক্ট
+
+
+def upload_tus(port, path):
+    """tus রিজিউমেবল আপলোড (একটি POST + একটি PATCH); সফল হলে True।"""
+    import base64
+    size = os.path.getsize(path)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=600)
+    filename = base64.b64encode(os.path.basename(path).encode()).decode()
+    conn.request('POST', '/api/uploads', headers={'Tus-Resumable': '1.0.0', 'Upload-Length': str(size),
+                                                  'Upload-Metadata': f'filename {filename}'})
+    response = conn.getresponse()
+    response.read()
+    if response.status != 201:
+        conn.close()
+        return False
+    location = response.getheader('Location')
+    conn.putrequest('PATCH', location)
+    for header, value in (('Tus-Resumable', '1.0.0'), ('Upload-Offset', '0'),
+                          ('Content-Type', 'application/offset+octet-stream'), ('Content-Length', str(size))):
+        conn.putheader(header, value)
+    conn.endheaders()
+    send_blocks(conn, path)
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response.status == 204
+
+
+def bench_uploads(port, source_path, repeat):
+    """প্রতিটি আপলোড পদ্ধতিতে repeat বার একই ফাইল আপলোড করে MB/s মাপে (হ্যাশ ও ডিস্কে লেখাসহ)।"""
+    size = os.path.getsize(source_path)
+    results = []
+    for method, upload in (('form', upload_form), ('tus', upload_tus)):
+        timings, errors = [], 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            if not upload(port, source_path):
+                errors += 1
+            timings.append(time.perf_counter() - start)
+        median = statistics.median(timings)
+        results.append({
+            'method': method,
+            'bytes': size,
+            'uploads': repeat,
+            'errors': errors,
+            'seconds': round(median, 4),
+            'mb_per_sec': round(size / median / 1048576, 1),
+        })
+    return results
+
+
+def bench_serving(base_url, video_id, duration, threads):
+    """serve_loadtest এর HTTP লোড জেনারেটর দিয়ে একটি ট্রান্সকোড হওয়া ভিডিওর প্লেলিস্ট ও সেগমেন্ট রিকোয়েস্ট করে।"""
+    sys.path.insert(0, BENCH_DIR)
+    import serve_loadtest
+    args = SimpleNamespace(url=f'{base_url}/hls/{video_id}/', duration=duration, threads=threads)
+    results = serve_loadtest.bench_http(args)
+    for result in results:
+        result['threads'] = threads
+    return results
+
+
+def environment_info(app_module):
+    """তুলনার সময় কাজে লাগে এমন মেশিন ও কনফিগারেশনের তথ্য।"""
+    def command_output(cmd):
+        try:
+            return subprocess.run(cmd, capture_output=True, text=True, timeout=10, cwd=REPO_DIR).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return None
+    ffmpeg_version = command_output(['ffmpeg', '-version'])
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'git_commit': command_output(['git', 'rev-parse', '--short', 'HEAD']),
+        'hostname': platform.node(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'ffmpeg': ffmpeg_version.splitlines()[0] if ffmpeg_version else None,
+        'config': {
+            'TRANSCODE_MODE': app_module.TRANSCODE_MODE,
+            'RESOLUTIONS': app_module.RESOLUTIONS,
+            'PER_TITLE_LADDER': app_module.PER_TITLE_LADDER,
+            'VIDEO_CRF': app_module.VIDEO_CRF,
+            'HLS_SEGMENT_TYPE': app_module.HLS_SEGMENT_TYPE,
+            'HLS_SINGLE_FILE': app_module.HLS_SINGLE_FILE,
+            'HLS_SHARED_AUDIO': app_module.HLS_SHARED_AUDIO,
+            'PROGRESSIVE_PUBLISH': app_module.PROGRESSIVE_PUBLISH,
+            'CHUNKED_MIN_DURATION': app_module.CHUNKED_MIN_DURATION,
+        },
+    }
+
+
+# তুলনার জন্য প্রতিটি ফলাফলের চাবি ও মাপ; higher_is_better অনুযায়ী উন্নতি/অবনতি চিহ্নিত হয়
+COMPARE_FIELDS = (
+    ('transcode', lambda r: f"{r['source']}-{r['source_seconds']}s/{r['mode']}", 'wall_seconds', False),
+    ('transcode', lambda r: f"{r['source']}-{r['source_seconds']}s/{r['mode']}", 'ffmpeg_cpu_seconds', False),
+    ('upload', lambda r: r['method'], 'mb_per_sec', True),
+    ('serving', lambda r: f"{r['threads']} threads", 'requests_per_sec', True),
+    ('serving', lambda r: f"{r['threads']} threads", 'p99_ms', False),
+)
+
+
+def compare(baseline, current):
+    """দুটি রানের ফলাফলের পরিবর্তন (%) টেবিল আকারে দেখায়।"""
+    print(f"\n{'comparison':<56}{'baseline':>12}{'current':>12}{'change':>10}")
+    for section, key, field, higher_is_better in COMPARE_FIELDS:
+        old = {key(r): r for r in baseline.get(section, [])}
+        for result in current.get(section, []):
+            before = old.get(key(result), {}).get(field)
+            after = result.get(field)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            better = change > 0 if higher_is_better else change < 0
+            mark = '' if abs(change) < 3 else (' +' if better else ' -') # ৩% এর কম পরিবর্তন নয়েজ ধরা হয়
+            print(f"{section + ' ' + key(result) + ' ' + field:<56}{before:>12}{after:>12}{change:>9.1f}%{mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ট্রান্সকোডিং, আপলোড ও HLS সার্ভিংয়ের বেঞ্চমার্ক স্যুট')
+    parser.add_argument('--sources', default=DEFAULT_SOURCES, help=f'রেজোলিউশন:সেকেন্ড তালিকা (ডিফল্ট: {DEFAULT_SOURCES})')
+    parser.add_argument('--quick', action='store_true', help=f'শুধু {QUICK_SOURCES} সোর্স, সংক্ষিপ্ত আপলোড ও সার্ভিং')
+    parser.add_argument('--modes', help='কমা দিয়ে আলাদা TRANSCODE_MODE তালিকা (ডিফল্ট: বর্তমান কনফিগারেশন)')
+    parser.add_argument('--repeat', type=int, default=1, help='প্রতিটি ট্রান্সকোড ও আপলোড কতবার চলবে (মধ্যমা রিপোর্ট হয়)')
+    parser.add_argument('--serve-duration', type=float, default=10, help='সার্ভিং লোড টেস্ট কত সেকেন্ড চলবে')
+    parser.add_argument('--serve-threads', default='1,16', help='সার্ভিং লোড টেস্টে একসাথে কতগুলো ক্লায়েন্ট থ্রেড (কমা দিয়ে একাধিক)')
+    parser.add_argument('--skip', default='', help='বাদ দেওয়ার অংশ: transcode, upload, serving (কমা দিয়ে)')
+    parser.add_argument('--cache-dir', default=os.path.join(tempfile.gettempdir(), 'hls-bench-sources'),
+                        help='তৈরি করা সোর্স ফাইল রাখার ডিরেক্টরি (পরের রানে আবার ব্যবহার হয়)')
+    parser.add_argument('--output', help='ফলাফলের JSON ফাইল (ডিফল্ট: bench/results/<সময়>.json)')
+    parser.add_argument('--compare', help='তুলনার জন্য আগের রানের JSON ফাইল')
+    parser.add_argument('--keep', action='store_true', help='অস্থায়ী আউটপুট ডিরেক্টরি মুছে না ফেলা')
+    args = parser.parse_args()
+
+    if shutil.which('ffmpeg') is None or shutil.which('ffprobe') is None:
+        raise SystemExit('ffmpeg ও ffprobe PATH এ থাকতে হবে।')
+    sources = parse_sources(QUICK_SOURCES if args.quick else args.sources)
+    skip = set(filter(None, args.skip.split(',')))
+    serve_duration = min(args.serve_duration, 3) if args.quick else args.serve_duration
+
+    work_dir = tempfile.mkdtemp(prefix='hls-bench-')
+    app_module = load_app(work_dir)
+    modes = args.modes.split(',') if args.modes else [app_module.TRANSCODE_MODE]
+    report = {'environment': environment_info(app_module), 'transcode': [], 'upload': [], 'serving': []}
+    try:
+        source_paths = [(name, seconds, make_source(args.cache_dir, name, seconds)) for name, seconds in sources]
+
+        serve_video_id = None
+        if 'transcode' not in skip or 'serving' not in skip:
+            for name, seconds, path in source_paths:
+                for mode in (modes if 'transcode' not in skip else modes[:1]):
+                    print(f"ট্রান্সকোড: {name} {seconds}s ({mode}) ...", file=sys.stderr)
+                    result, video_id = bench_transcode(app_module, path, name, seconds, mode, args.repeat)
+                    if 'transcode' not in skip:
+                        report['transcode'].append(result)
+                    if result['ok'] and serve_video_id is None:
+                        serve_video_id = video_id # প্রথম সফল আউটপুট দিয়ে সার্ভিং মাপা হবে
+                if 'transcode' in skip and serve_video_id:
+                    break
+
+        if not {'upload', 'serving'} <= skip:
+            server, base_url = start_server(app_module)
+            try:
+                if 'upload' not in skip:
+                    # সবচেয়ে বড় সোর্স দিয়ে আপলোড মাপুন, যাতে প্রতি-রিকোয়েস্ট খরচ ফলাফলকে না ছাপায়
+                    largest = max(source_paths, key=lambda s: os.path.getsize(s[2]))[2]
+                    print(f"আপলোড: {os.path.basename(largest)} ...", file=sys.stderr)
+                    report['upload'] = bench_uploads(server.server_port, largest, args.repeat)
+                if 'serving' not in skip and serve_video_id:
+                    for threads in (int(t) for t in args.serve_threads.split(',')):
+                        print(f"সার্ভিং: {threads} থ্রেড, {serve_duration:g} সেকেন্ড ...", file=sys.stderr)
+                        report['serving'] += bench_serving(base_url, serve_video_id, serve_duration, threads)
+            finally:
+                server.shutdown()
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = args.output or os.path.join(BENCH_DIR, 'results', time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'transcode':<28}{'mode':<14}{'wall s':>9}{'x rt':>7}{'ffmpeg cpu s':>14}")
+    for r in report['transcode']:
+        print(f"{r['source'] + ' ' + str(r['source_seconds']) + 's':<28}{r['mode']:<14}{r['wall_seconds']:>9}{r['speed_x_realtime']:>7}{r['ffmpeg_cpu_seconds']:>14}"
+              + ('' if r['ok'] else '  FAILED'))
+        for key, entry in r['per_rendition'].items():
+            print(f"  {key:<40}{entry['wall_seconds']:>9}{entry['speed_x_realtime'] or '-':>7}{entry['cpu_seconds']:>14}  rss {entry['peak_rss_mb']} MB")
+    for r in report['upload']:
+        print(f"upload {r['method']:<21}{r['mb_per_sec']:>9} MB/s ({r['errors']} errors)")
+    for r in report['serving']:
+        print(f"serving {r['threads']:>3} threads{'':<10}{r['requests_per_sec']:>9} req/s  p50 {r['p50_ms']} ms  p99 {r['p99_ms']} ms ({r['errors']} errors)")
+    print(f"\nফলাফল: {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""বাল্ক ইনজেস্ট: ওয়েব সার্ভার ছাড়াই একটি ডিরেক্টরি বা ম্যানিফেস্টের সব ভিডিও একসাথে ট্রান্সকোড করে।
+
+প্রতিটি ফাইল ওয়েব আপলোডের মতোই uploads/<id>/source.<ext> এ রাখা হয় (ডিফল্টে হার্ডলিংক, তাই কপি লাগে না),
+শেয়ার করা জব কিউতে যোগ হয় এবং এই প্রসেসের --parallel সংখ্যক ওয়ার্কার থ্রেড run_processing_job দিয়ে
+প্রসেস করে। তাই রিট্রাই, আগের চেষ্টার আউটপুট আবার ব্যবহার, ডুপ্লিকেট চেনা, মেট্রিক্স ও স্টোরেজের হিসাব সব
+ওয়েব আপলোডের মতোই কাজ করে, আর চলমান ওয়েব সার্ভার বা worker.py থাকলে তারাও একই কিউ থেকে কাজ নিতে পারে।
+
+ভিডিও আইডি ফাইলের পূর্ণ পাথ থেকে তৈরি হয় (ম্যানিফেস্টে আলাদা আইডিও দেওয়া যায়), তাই একই কমান্ড আবার চালালে
+আগে রেডি হওয়া ফাইলগুলো বাদ যায় এবং বাধা পাওয়া রান যেখানে থেমেছিল সেখান থেকে চলে। কিউ ভরে না ফেলার জন্য
+একসাথে সর্বোচ্চ --parallel এর দ্বিগুণ ফাইল কিউতে থাকে; এই জবগুলো ওয়েব আপলোডের চেয়ে কম অগ্রাধিকার পায়।
+
+ব্যবহার:
+    python ingest.py /mnt/catalogue [more dirs or files...] [--parallel N]
+    python ingest.py --manifest files.txt     # প্রতি লাইনে: পাথ, অথবা পাথ<TAB>ভিডিও আইডি ('#' = মন্তব্য)
+
+প্রথম SIGTERM/SIGINT এ নতুন ফাইল যোগ করা বন্ধ হয় এবং চলমান জবগুলো শেষ হলে থামে (কিউতে থাকা বাকিগুলো
+পরের রানে অথবা অন্য ওয়ার্কার প্রসেস করবে); দ্বিতীয়টিতে সাথে সাথে বেরিয়ে যায়।
+"""
+import argparse
+import logging
+import os
+import shutil
+import signal
+import sys
+import time
+import uuid
+
+# app ইমপোর্ট করার সময় ওয়েব প্রসেসের মতো নিজে থেকে ওয়ার্কার থ্রেড চালু হবে না; এখানে নিচে চালু করা হবে
+os.environ['RUN_EMBEDDED_WORKERS'] = '0'
+
+import app
+
+INGEST_PRIORITY = app.JOB_DEFAULT_PRIORITY - 1 # ওয়েব আপলোড আগে প্রসেস হবে
+INGEST_POLL_INTERVAL = 1.0 # জবগুলোর অবস্থা কত সেকেন্ড পরপর পড়া হবে
+PROGRESS_INTERVAL = 10 # সারাংশ (গতি ও ETA) কত সেকেন্ড পরপর দেখানো হবে
+DONE_STATES = (app.JOB_STATE_READY, app.JOB_STATE_EVICTED, app.JOB_STATE_ERROR) # এই অবস্থায় পৌঁছালে ফাইলটির কাজ শেষ
+
+
+def ingest_video_id(path):
+    """ফাইলের পূর্ণ পাথ থেকে স্থির ভিডিও আইডি (UUID5), যাতে একই ফাইল আবার চালালে চেনা যায়।"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, 'file://' + os.path.abspath(path)))
+
+
+def read_manifest(manifest_path):
+    """ম্যানিফেস্ট থেকে (পাথ, ভিডিও আইডি বা None) এর তালিকা; রিলেটিভ পাথ ম্যানিফেস্টের ডিরেক্টরি থেকে ধরা হয়।"""
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    items = []
+    with open(manifest_path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            path, _, video_id = line.partition('\t')
+            items.append((os.path.join(base, path.strip()), video_id.strip() or None))
+    return items
+
+
+def find_sources(paths):
+    """ফাইল ও ডিরেক্টরির (ভিতরের সব সাবডিরেক্টরিসহ) অনুমোদিত এক্সটেনশনের ভিডিওগুলো ক্রমানুসারে রিটার্ন করে।"""
+    items = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                items.extend((os.path.join(root, name), None) for name in sorted(files) if app.allowed_file(name))
+        else:
+            items.append((path, None))
+    return items
+
+
+def stage_source(path, video_id, link_mode):
+    """ফাইলটি ওয়েব আপলোডের মতো uploads/<id>/source.<ext> এ রাখে এবং সেই পাথ রিটার্ন করে।
+
+    hardlink মোডে অন্য ফাইলসিস্টেম হলে কপি করা হয়। আগের রানের অসম্পূর্ণ কপি থাকলে সেটি বদলে ফেলা হয়।
+    """
+    extension = path.rsplit('.', 1)[1].lower()
+    video_upload_dir = os.path.join(app.UPLOAD_DIR, video_id)
+    app.ensure_dir(video_upload_dir)
+    save_path = os.path.join(video_upload_dir, f"{app.SOURCE_VIDEO_BASENAME}.{extension}")
+    temp_path = save_path + '.part'
+    if os.path.lexists(temp_path):
+        os.remove(temp_path)
+    if link_mode == 'symlink':
+        os.symlink(os.path.abspath(path), temp_path)
+    else:
+        try:
+            if link_mode != 'hardlink':
+                raise OSError('copy requested')
+            os.link(path, temp_path)
+        except OSError:
+            shutil.copyfile(path, temp_path)
+    os.replace(temp_path, save_path)
+    return save_path
+
+
+class IngestProgress:
+    """শেষ হওয়া ফাইলের সংখ্যা, সোর্সের বাইট ও মিডিয়ার দৈর্ঘ্য গুনে গতি (থ্রুপুট) ও ETA দেখায়।"""
+
+    def __init__(self, total):
+        self.total = total
+        self.counts = {'ready': 0, 'duplicate': 0, 'error': 0}
+        self.bytes = 0
+        self.media_seconds = 0.0
+        self.started = time.monotonic()
+        self._last_report = self.started
+
+    @property
+    def finished(self):
+        return sum(self.counts.values())
+
+    def record(self, outcome, video_id, path, source_path=None):
+        """একটি ফাইলের ফলাফল লেখে; ready হলে সোর্সের আকার ও দৈর্ঘ্য থ্রুপুটে যোগ হয়।"""
+        self.counts[outcome] += 1
+        detail = ''
+        if outcome == 'ready' and source_path:
+            try:
+                self.bytes += os.path.getsize(source_path)
+            except OSError:
+                pass # SOURCE_RETENTION=delete হলে সোর্স ইতিমধ্যে মুছে গেছে
+            media = app.read_media_info(source_path) or {}
+            self.media_seconds += media.get('duration') or 0.0
+        elif outcome == 'error':
+            job = app.get_job(video_id)
+            detail = f" — {job['error']}" if job is not None and job['error'] else ''
+        level = logging.ERROR if outcome == 'error' else logging.INFO
+        logging.log(level, f"[{self.finished}/{self.total}] {outcome}: {path} ({video_id}){detail}")
+
+    def report(self, running, queued, force=False):
+        """PROGRESS_INTERVAL পরপর (force হলে সাথে সাথে) এক লাইনের সারাংশ দেখায়।"""
+        now = time.monotonic()
+        if not force and now - self._last_report < PROGRESS_INTERVAL:
+            return
+        self._last_report = now
+        elapsed = max(now - self.started, 1e-6)
+        done = self.finished
+        eta = f"{(self.total - done) * elapsed / done / 60:.1f} মিনিট" if 0 < done < self.total else '-'
+        logging.info(f"অগ্রগতি: {done}/{self.total} শেষ (রেডি {self.counts['ready']}, ডুপ্লিকেট {self.counts['duplicate']}, "
+                     f"ব্যর্থ {self.counts['error']}), চলছে {running}, কিউতে {queued} | "
+                     f"{done / elapsed * 3600:.0f} ফাইল/ঘণ্টা, {self.bytes / app.metrics.MIB / elapsed:.1f} MiB/s সোর্স, "
+                     f"রিয়েলটাইমের {self.media_seconds / elapsed:.2f} গুণ | ETA: {eta}")
+
+
+def poll_tracked(tracked, progress):
+    """কিউতে দেওয়া জবগুলোর মধ্যে শেষ হওয়াগুলোর ফলাফল লিখে tracked থেকে বাদ দেয়; (চলছে, কিউতে) রিটার্ন করে।
+
+    ব্যর্থ হয়ে ব্যাকঅফে অপেক্ষমাণ জব কিউতে ফেরে, তাই সেটি সর্বোচ্চ চেষ্টার পরেই ব্যর্থ হিসেবে গোনা হয়।
+    """
+    running = queued = 0
+    for video_id, path in list(tracked.items()):
+        job = app.get_db().execute("SELECT state, source_path FROM jobs WHERE video_id = ?", (video_id,)).fetchone()
+        if job is None:
+            progress.record('error', video_id, path)
+        elif job['state'] in DONE_STATES:
+            progress.record('error' if job['state'] == app.JOB_STATE_ERROR else 'ready', video_id, path, job['source_path'])
+        else:
+            running += job['state'] == app.JOB_STATE_PROCESSING
+            queued += job['state'] == app.JOB_STATE_QUEUED
+            continue
+        del tracked[video_id]
+    return running, queued
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ওয়েব সার্ভার ছাড়া একটি ডিরেক্টরি বা ম্যানিফেস্টের ভিডিওগুলো HLS এ ট্রান্সকোড করে।")
+    parser.add_argument('paths', nargs='*', help="ভিডিও ফাইল বা ডিরেক্টরি (সাবডিরেক্টরিসহ খোঁজা হয়)")
+    parser.add_argument('--manifest', help="প্রতি লাইনে একটি পাথ, অথবা পাথ<TAB>ভিডিও আইডি")
+    parser.add_argument('--parallel', type=int, default=app.TRANSCODE_WORKERS,
+                        help="একসাথে কতগুলো জব চলবে (ডিফল্ট: TRANSCODE_WORKERS)")
+    parser.add_argument('--link', choices=('hardlink', 'copy', 'symlink'), default='hardlink',
+                        help="সোর্স কীভাবে uploads এ রাখা হবে (hardlink সম্ভব না হলে কপি হয়)")
+    parser.add_argument('--priority', type=int, default=INGEST_PRIORITY,
+                        help="কিউয়ের অগ্রাধিকার (ডিফল্ট: ওয়েব আপলোডের চেয়ে কম)")
+    parser.add_argument('--skip-failed', action='store_true', help="আগে ব্যর্থ হওয়া ফাইল আবার চেষ্টা করা হবে না")
+    parser.add_argument('--dry-run', action='store_true', help="শুধু কোন ফাইলের কী হবে তা দেখায়")
+    args = parser.parse_args()
+    if not args.paths and not args.manifest:
+        parser.error("অন্তত একটি পাথ অথবা --manifest দিতে হবে")
+    if args.parallel < 1:
+        parser.error("--parallel অন্তত 1 হতে হবে")
+
+    items = (read_manifest(args.manifest) if args.manifest else []) + find_sources(args.paths)
+    todo, tracked, seen = [], {}, set() # tracked: ভিডিও আইডি -> পাথ (কিউতে আছে, শেষের অপেক্ষা)
+    skipped = {'ready': 0, 'failed': 0, 'invalid': 0}
+    for path, video_id in items:
+        if not os.path.isfile(path) or not app.allowed_file(os.path.basename(path)):
+            logging.warning(f"বাদ দেওয়া হলো (ফাইল নেই বা অনুমোদিত ভিডিও ফরম্যাট নয়): {path}")
+            skipped['invalid'] += 1
+            continue
+        video_id = video_id or ingest_video_id(path)
+        if video_id in seen:
+            continue
+        seen.add(video_id)
+        job = app.get_job(video_id)
+        if job is None or (job['state'] == app.JOB_STATE_ERROR and not args.skip_failed):
+            todo.append((path, video_id))
+        elif job['state'] in (app.JOB_STATE_QUEUED, app.JOB_STATE_PROCESSING):
+            tracked[job['video_id']] = path # আগের বাধা পাওয়া রানের জব; নতুন করে যোগ না করে শেষের অপেক্ষা
+        else:
+            skipped['failed' if job['state'] == app.JOB_STATE_ERROR else 'ready'] += 1
+
+    logging.info(f"{len(items)}টি ফাইল পাওয়া গেছে: নতুন/আবার চেষ্টা {len(todo)}, আগে থেকেই কিউতে {len(tracked)}, "
+                 f"আগেই প্রসেস হয়েছে {skipped['ready']}, আগে ব্যর্থ (বাদ) {skipped['failed']}, অবৈধ {skipped['invalid']}।")
+    if args.dry_run:
+        for path, video_id in todo:
+            print(f"{video_id}\t{path}")
+        return 0
+    if not todo and not tracked:
+        return 0
+    if not app.tool_available('ffmpeg'):
+        logging.critical("ffmpeg উপলব্ধ নেই; ইনজেস্ট চালু করা সম্ভব নয়।")
+        return 1
+
+    stopping = []
+
+    def handle_signal(signum, frame):
+        if stopping:
+            logging.warning("আবার থামার সিগন্যাল পাওয়া গেছে; চলমান জব শেষ না করেই বের হওয়া হচ্ছে।")
+            os._exit(1)
+        logging.info("থামার সিগন্যাল পাওয়া গেছে; নতুন ফাইল যোগ করা বন্ধ, চলমান জবগুলো শেষ হওয়ার অপেক্ষা...")
+        stopping.append(signum)
+        app.stop_transcode_workers()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    # এই হোস্টে একসাথে চলা জবের সীমা claim_next_job এ TRANSCODE_WORKERS দিয়ে পরীক্ষা হয়
+    app.TRANSCODE_WORKERS = args.parallel
+    app.start_transcode_workers(args.parallel)
+    progress = IngestProgress(len(todo) + len(tracked))
+    window = args.parallel * 2 # একসাথে সর্বোচ্চ কতগুলো ফাইল কিউতে/প্রসেসিংয়ে থাকবে
+    todo.reverse() # pop() যেন মূল ক্রমে নেয়
+
+    while (todo or tracked) and not stopping:
+        # কিউতে জায়গা থাকলে পরের ফাইলগুলো যোগ করুন
+        while todo and len(tracked) < window and not stopping:
+            path, video_id = todo[-1]
+            try:
+                save_path = stage_source(path, video_id, args.link)
+                digest = app.hash_file(save_path).hexdigest() if app.DEDUP_ENABLED else None
+                alias_of, _ = app.submit_uploaded_video(video_id, save_path, os.path.basename(path), digest, args.priority)
+            except app.QueueFullError:
+                break # শেয়ার করা কিউ পূর্ণ; কিছু শেষ হলে আবার চেষ্টা
+            except OSError as e:
+                todo.pop()
+                progress.counts['error'] += 1
+                logging.error(f"[{progress.finished}/{progress.total}] error: {path} ({video_id}) — সোর্স রাখা যায়নি: {e}")
+                continue
+            todo.pop()
+            if alias_of is not None:
+                progress.record('duplicate', video_id, path)
+            else:
+                tracked[video_id] = path
+
+        running, queued = poll_tracked(tracked, progress)
+        progress.report(running, queued)
+        if todo or tracked:
+            time.sleep(INGEST_POLL_INTERVAL)
+
+    app.stop_transcode_workers()
+    for thread in app._worker_threads:
+        while thread.is_alive():
+            thread.join(1) # মূল থ্রেড যেন দ্বিতীয় সিগন্যাল ধরতে পারে
+    progress.report(*poll_tracked(tracked, progress), force=True)
+    if todo or tracked:
+        logging.warning(f"থামানো হয়েছে: {len(todo)}টি ফাইল যোগ করা হয়নি, {len(tracked)}টি কিউতে রয়ে গেছে; "
+                        f"একই কমান্ড আবার চালালে বাকিগুলো প্রসেস হবে।")
+    app.metrics.flush()
+    app.storage.storage_access.flush()
+    return 1 if progress.counts['error'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
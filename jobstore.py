@@ -0,0 +1,56 @@
+"""জব স্টোরের মূল অংশ: শেয়ার করা SQLite জব ডাটাবেসের কানেকশন, জবের অবস্থার নাম এবং জব রেকর্ড পড়া।
+
+app, storage ও metrics সবাই এই মডিউল ব্যবহার করে; এটি নিজে প্রকল্পের অন্য কোনো মডিউল ইমপোর্ট করে না।
+"""
+import os
+import sqlite3
+import threading
+
+# === Configuration Constants ===
+# কনফিগারেশন ধ্রুবক
+BASE_DIR = os.path.dirname(os.path.abspath(__file__)) # অ্যাপ্লিকেশনের মূল ডিরেক্টরি
+JOBS_DB_PATH = os.environ.get('JOBS_DB_PATH', os.path.join(BASE_DIR, 'jobs.db')) # শেয়ার করা জব কিউ ডাটাবেস
+# জব ডাটাবেস একাধিক হোস্টের শেয়ার করা স্টোরেজে (যেমন NFS) থাকলে 1 দিন: তখন WAL এর বদলে রোলব্যাক জার্নাল
+# (journal_mode=DELETE) ব্যবহার হয়, কারণ WAL এর শেয়ার করা মেমরি ইনডেক্স (-shm) শুধু একই হোস্টের প্রসেসগুলোর মধ্যে কাজ করে
+JOBS_DB_SHARED = os.environ.get('JOBS_DB_SHARED', '0') != '0'
+
+# === Job Store ===
+# জব স্টোর: প্রতিটি ভিডিওর প্রসেসিং অবস্থা একটি SQLite ডাটাবেসে থাকে। সব gunicorn ওয়ার্কার প্রসেস ও আলাদা
+# worker.py প্রসেস একই ডাটাবেস ব্যবহার করে। একই হোস্টে WAL মোড চলে (পড়া ও লেখা একে অপরকে আটকায় না); WAL
+# একাধিক হোস্টে নিরাপদ নয়, তাই শেয়ার করা স্টোরেজে JOBS_DB_SHARED=1 দিলে সাধারণ রোলব্যাক জার্নাল ব্যবহার হয়।
+# সেক্ষেত্রেও স্টোরেজে ঠিকমতো POSIX ফাইল লক (fcntl) কাজ করতে হবে; না করলে একাধিক হোস্টে চালানো সমর্থিত নয়।
+
+JOB_STATE_QUEUED = 'queued'         # কিউতে অপেক্ষমাণ
+JOB_STATE_PROCESSING = 'processing' # কোনো ওয়ার্কার প্রসেস করছে
+JOB_STATE_READY = 'ready'           # সফলভাবে সম্পন্ন
+JOB_STATE_ERROR = 'error'           # ব্যর্থ
+JOB_STATE_ALIAS = 'alias'           # ডুপ্লিকেট আপলোড; নিজে প্রসেস হয় না, alias_of জবের ফলাফল ব্যবহার করে
+JOB_STATE_EVICTED = 'evicted'       # ডিস্কের বাজেটের জন্য HLS আউটপুট সরানো হয়েছে; আবার চাওয়া হলে সোর্স থেকে তৈরি হবে
+
+_db_local = threading.local() # প্রতিটি থ্রেডের নিজস্ব SQLite কানেকশন
+
+def get_db():
+    """বর্তমান থ্রেডের জন্য জব ডাটাবেসের কানেকশন রিটার্ন করে (প্রয়োজনে তৈরি করে)।"""
+    conn = getattr(_db_local, 'conn', None)
+    if conn is None:
+        # isolation_level=None: লেনদেন (BEGIN/COMMIT) আমরা নিজেরাই নিয়ন্ত্রণ করি
+        conn = sqlite3.connect(JOBS_DB_PATH, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if JOBS_DB_SHARED:
+            # অন্য হোস্টও লিখতে পারে: শুধু ফাইল লকের উপর নির্ভর করা রোলব্যাক জার্নাল, প্রতিটি কমিট ডিস্কে নিশ্চিত
+            conn.execute('PRAGMA journal_mode=DELETE')
+            conn.execute('PRAGMA synchronous=FULL')
+        else:
+            conn.execute('PRAGMA journal_mode=WAL') # একই হোস্টের একাধিক প্রসেস থেকে একসাথে পড়া ও লেখার জন্য
+            conn.execute('PRAGMA synchronous=NORMAL')
+        _db_local.conn = conn
+    return conn
+
+def get_job(video_id):
+    """একটি ভিডিওর জব রেকর্ড রিটার্ন করে (না থাকলে None)।
+
+    ডুপ্লিকেট আপলোডের (alias) ক্ষেত্রে মূল ভিডিওর জব রিটার্ন করে, কারণ অবস্থা ও আউটপুট সেটারই।
+    """
+    return get_db().execute(
+        "SELECT * FROM jobs WHERE video_id = COALESCE((SELECT alias_of FROM jobs WHERE video_id = ?), ?)",
+        (video_id, video_id)).fetchone()
@@ -0,0 +1,228 @@
+"""মেট্রিক্স: প্রতিটি প্রসেসের কাউন্টার ও হিস্টোগ্রাম শেয়ার করা জব ডাটাবেসে জমা করা এবং /metrics এর জন্য
+Prometheus টেক্সট ফরম্যাটে দেখানো।
+
+ব্যবহার: metrics.inc('নাম', মান, লেবেল=...), metrics.observe('নাম', মান, লেবেল=...)। অন্য মডিউলের গেজ
+(যেমন ডিস্ক ব্যবহার) register_gauges() দিয়ে যোগ করা হয় এবং স্ক্র্যাপের সময় গণনা হয়।
+"""
+import atexit
+import collections
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from jobstore import (JOB_STATE_QUEUED, JOB_STATE_PROCESSING, JOB_STATE_READY, JOB_STATE_ERROR, JOB_STATE_ALIAS,
+                      JOB_STATE_EVICTED, get_db)
+
+# === Configuration Constants ===
+# কনফিগারেশন ধ্রুবক
+# Metrics settings
+# মেট্রিক্স সেটিংস: /metrics এ সব প্রসেস (gunicorn ওয়ার্কার ও worker.py) মিলিয়ে Prometheus টেক্সট ফরম্যাটে
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5)) # প্রতি প্রসেসে জমা হওয়া মান কত সেকেন্ড পরপর শেয়ার করা ডাটাবেসে যোগ হবে
+
+# === Metrics ===
+# মেট্রিক্স: ট্রান্সকোডিংয়ের প্রতিটি ধাপের সময়, ffmpeg এর CPU সময়/সর্বোচ্চ মেমরি/গতি, কিউ এবং HLS সার্ভিংয়ের
+# পরিসংখ্যান /metrics এ Prometheus টেক্সট ফরম্যাটে দেখানো হয়। প্রতিটি প্রসেস কাউন্টার ও হিস্টোগ্রামের বৃদ্ধি
+# মেমরিতে জমিয়ে METRICS_FLUSH_INTERVAL পরপর শেয়ার করা জব ডাটাবেসের metrics টেবিলে যোগ করে, তাই যে gunicorn
+# ওয়ার্কারই স্ক্র্যাপের রিকোয়েস্ট পাক, সব প্রসেসের (worker.py সহ) সম্মিলিত মান দেখায়। কিউয়ের গেজগুলো
+# স্ক্র্যাপের সময় জব টেবিল থেকেই গণনা হয়।
+
+MIB = 1024 * 1024
+# মেট্রিকের নাম -> (ধরন, বিবরণ, হিস্টোগ্রামের বাকেট)
+METRIC_FAMILIES = {
+    'transcode_stage_seconds': ('histogram', 'Wall-clock seconds spent in each processing stage (upload, probe, ffmpeg runs, playlist write, whole job).',
+                                (0.1, 0.5, 1, 5, 15, 60, 300, 900, 1800, 3600, 7200)),
+    'ffmpeg_runs_total': ('counter', 'ffmpeg processes run, by stage and result.', None),
+    'ffmpeg_cpu_seconds_total': ('counter', 'User plus system CPU seconds used by ffmpeg processes.', None),
+    'ffmpeg_peak_rss_bytes': ('histogram', 'Peak resident set size of each ffmpeg process.',
+                              (32 * MIB, 64 * MIB, 128 * MIB, 256 * MIB, 512 * MIB, 1024 * MIB, 2048 * MIB, 4096 * MIB, 8192 * MIB)),
+    'ffmpeg_speed_ratio': ('histogram', 'Media seconds processed per wall-clock second (realtime multiple) of successful ffmpeg runs.',
+                           (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)),
+    'job_queue_wait_seconds': ('histogram', 'Seconds a job waited in the queue (or in retry backoff) before a worker claimed it.',
+                               (1, 5, 15, 60, 300, 900, 1800, 3600, 7200)),
+    'jobs_finished_total': ('counter', 'Processing attempts that ended, by result (ready, retry, error).', None),
+    'upload_bytes_total': ('counter', 'Upload bytes received, by method (form, tus).', None),
+    'hls_request_seconds': ('histogram', 'Seconds spent building the response for an HLS file request.',
+                            (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)),
+    'hls_response_bytes': ('histogram', 'Body bytes of HLS file responses.',
+                           (1024, 16 * 1024, 64 * 1024, 256 * 1024, MIB, 4 * MIB, 16 * MIB, 64 * MIB)),
+    'hls_requests_total': ('counter', 'HLS file requests, by file kind and status code.', None),
+    'hls_cache_lookups_total': ('counter', 'HLS file cache lookups, by result (hit, miss).', None),
+    'job_queue_depth': ('gauge', 'Jobs waiting in the queue.', None),
+    'job_queue_oldest_wait_seconds': ('gauge', 'Seconds the oldest queued job has been waiting since it was enqueued.', None),
+    'jobs': ('gauge', 'Jobs in the job store, by state.', None),
+    'storage_bytes': ('gauge', 'Bytes on disk for sources, unfinished uploads and HLS output, by kind (source, upload, rendition, audio, other).', None),
+    'storage_budget_bytes': ('gauge', 'Configured storage budget in bytes (0 = unlimited).', None),
+    'storage_evictions_total': ('counter', 'HLS output evicted to stay within the storage budget, by scope (rendition, video).', None),
+    'storage_regenerations_total': ('counter', 'Evicted videos re-queued for transcoding because they were requested again.', None),
+}
+
+def _format_labels(labels):
+    """লেবেলগুলোকে Prometheus এর label="value",... আকারে রূপান্তর করে (None মানের লেবেল বাদ)।"""
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{key}="{escape(value)}"' for key, value in labels.items() if value is not None)
+
+_gauge_collectors = [] # স্ক্র্যাপের সময় ডাকা ফাংশন; প্রতিটি (নাম, লেবেল, মান) এর তালিকা রিটার্ন করে
+
+def register_gauges(collector):
+    """স্ক্র্যাপের সময় গণনা হওয়া গেজের একটি উৎস যোগ করে।
+
+    collector(conn) জব ডাটাবেসের কানেকশন পায় এবং (মেট্রিকের নাম, লেবেলের dict, মান) এর তালিকা রিটার্ন করে;
+    নামটি METRIC_FAMILIES এ থাকতে হবে।
+    """
+    _gauge_collectors.append(collector)
+
+class MetricsRegistry:
+    """কাউন্টার ও হিস্টোগ্রামের বৃদ্ধি প্রসেসের মেমরিতে জমায় এবং flush() এ শেয়ার করা ডাটাবেসে যোগ করে।
+
+    হিস্টোগ্রাম Prometheus এর মতোই ক্রমযোজিত _bucket, _sum ও _count কাউন্টার হিসেবে রাখা হয়, তাই
+    সব প্রসেসের মান শুধু যোগ করলেই সঠিক সম্মিলিত হিস্টোগ্রাম পাওয়া যায়।
+    """
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self._pending = collections.defaultdict(float) # (নাম, লেবেল) -> শেষ flush এর পর থেকে বৃদ্ধি
+        self._lock = threading.Lock()
+        self._flusher_pid = None # যে প্রসেসে flush থ্রেড চলছে (fork এর পর নতুন প্রসেসে আবার চালু করতে হয়)
+
+    def inc(self, name, value=1, **labels):
+        """একটি কাউন্টার value পরিমাণ বাড়ায়।"""
+        if not METRICS_ENABLED:
+            return
+        key = (name, _format_labels(labels))
+        with self._lock:
+            self._start_flusher()
+            self._pending[key] += value
+
+    def observe(self, name, value, **labels):
+        """একটি হিস্টোগ্রামে একটি মান যোগ করে (বাকেট METRIC_FAMILIES থেকে)।"""
+        if not METRICS_ENABLED:
+            return
+        label_text = _format_labels(labels)
+        prefix = label_text + ',' if label_text else ''
+        with self._lock:
+            self._start_flusher()
+            for bound in METRIC_FAMILIES[name][2]:
+                # মান বাকেটের বাইরে হলেও 0 যোগ করা হয়, যাতে সব বাকেটের লাইন থাকে
+                self._pending[(f'{name}_bucket', f'{prefix}le="{bound}"')] += 1 if value <= bound else 0
+            self._pending[(f'{name}_bucket', f'{prefix}le="+Inf"')] += 1
+            self._pending[(f'{name}_sum', label_text)] += value
+            self._pending[(f'{name}_count', label_text)] += 1
+
+    def _start_flusher(self):
+        # self._lock ধরে রেখে ডাকতে হবে
+        if self._flusher_pid == os.getpid():
+            return
+        if self._flusher_pid is not None:
+            self._pending.clear() # fork এর আগে জমা হওয়া মান প্যারেন্ট প্রসেস নিজেই লিখবে
+        self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name="MetricsFlush", daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """জমা হওয়া বৃদ্ধিগুলো একটি লেনদেনে metrics টেবিলে যোগ করে; ব্যর্থ হলে পরের বারের জন্য রেখে দেয়।"""
+        with self._lock:
+            pending, self._pending = self._pending, collections.defaultdict(float)
+        if not pending:
+            return
+        conn = get_db()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(
+                "INSERT INTO metrics (name, labels, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value",
+                [(name, labels, value) for (name, labels), value in pending.items()])
+            conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            with self._lock:
+                for key, value in pending.items():
+                    self._pending[key] += value
+            logging.warning(f"মেট্রিক্স ডাটাবেসে লিখতে ব্যর্থ (পরের বার আবার চেষ্টা হবে): {e}")
+
+    def render(self):
+        """সব প্রসেসের সম্মিলিত মান এবং কিউয়ের গেজগুলো Prometheus টেক্সট ফরম্যাটে রিটার্ন করে।"""
+        self.flush() # এই প্রসেসের সদ্য জমা হওয়া মানও যেন দেখা যায়
+        conn = get_db()
+        samples = collections.defaultdict(list) # পরিবারের নাম -> [(নাম, লেবেল, মান)]
+        for row in conn.execute("SELECT name, labels, value FROM metrics"):
+            family = row['name']
+            for suffix in ('_bucket', '_sum', '_count'):
+                if family.endswith(suffix) and family[:-len(suffix)] in METRIC_FAMILIES:
+                    family = family[:-len(suffix)]
+            samples[family].append((row['name'], row['labels'], row['value']))
+
+        now = time.time()
+        states = {row['state']: (row['count'], row['oldest']) for row in conn.execute(
+            "SELECT state, COUNT(*) AS count, MIN(enqueued_at) AS oldest FROM jobs WHERE state != ? GROUP BY state",
+            (JOB_STATE_ALIAS,))}
+        queued, oldest = states.get(JOB_STATE_QUEUED, (0, None))
+        samples['job_queue_depth'].append(('job_queue_depth', '', queued))
+        samples['job_queue_oldest_wait_seconds'].append(('job_queue_oldest_wait_seconds', '', max(0.0, now - oldest) if oldest else 0))
+        for state in (JOB_STATE_QUEUED, JOB_STATE_PROCESSING, JOB_STATE_READY, JOB_STATE_ERROR, JOB_STATE_EVICTED):
+            samples['jobs'].append(('jobs', _format_labels({'state': state}), states.get(state, (0, None))[0]))
+        for collector in _gauge_collectors:
+            for name, labels, value in collector(conn):
+                samples[name].append((name, _format_labels(labels), value))
+
+        def sort_key(sample):
+            # একই লেবেলের বাকেটগুলো le এর সংখ্যাগত ক্রমে, তারপর _sum ও _count
+            name, labels, _ = sample
+            base, _, le = labels.rpartition('le="') if name.endswith('_bucket') else (labels, '', '')
+            bound = float(le.rstrip('"').replace('+Inf', 'inf')) if le else 0.0
+            return (base.rstrip(','), name, bound)
+
+        lines = []
+        for family, (kind, help_text, _) in METRIC_FAMILIES.items():
+            if not samples.get(family):
+                continue
+            lines.append(f'# HELP {family} {help_text}')
+            lines.append(f'# TYPE {family} {kind}')
+            for name, labels, value in sorted(samples[family], key=sort_key):
+                lines.append(f"{name}{{{labels}}} {float(value)!r}" if labels else f"{name} {float(value)!r}")
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry(METRICS_FLUSH_INTERVAL)
+atexit.register(registry.flush) # প্রসেস থামার সময় শেষ মানগুলো হারিয়ে না যায়
+
+# অন্য মডিউলগুলো metrics.inc(...) / metrics.observe(...) হিসেবে এই প্রসেসের রেজিস্ট্রি ব্যবহার করে
+inc = registry.inc
+observe = registry.observe
+flush = registry.flush
+render = registry.render
+
+def init_metrics_db():
+    """সব প্রসেসের সম্মিলিত মেট্রিক্স রাখার টেবিল তৈরি করে।"""
+    get_db().execute("""
+        CREATE TABLE IF NOT EXISTS metrics (
+            name   TEXT NOT NULL,
+            labels TEXT NOT NULL,
+            value  REAL NOT NULL,
+            PRIMARY KEY (name, labels)
+        )""")
+
+def record_ffmpeg_metrics(stage, rendition, result, wall_seconds, rusage, media_seconds):
+    """একটি ffmpeg প্রসেসের সময়, CPU সময়, সর্বোচ্চ RSS ও এনকোডের গতি (রিয়েলটাইমের কত গুণ) মেট্রিক্সে লেখে।"""
+    inc('ffmpeg_runs_total', stage=stage, result=result)
+    observe('transcode_stage_seconds', wall_seconds, stage=stage, rendition=rendition)
+    if rusage is not None:
+        inc('ffmpeg_cpu_seconds_total', rusage.ru_utime + rusage.ru_stime, stage=stage, rendition=rendition)
+        observe('ffmpeg_peak_rss_bytes', rusage.ru_maxrss * 1024, stage=stage, rendition=rendition) # লিনাক্সে ru_maxrss KiB এককে
+    if result == 'ok' and media_seconds and wall_seconds > 0:
+        observe('ffmpeg_speed_ratio', media_seconds / wall_seconds, stage=stage, rendition=rendition)
+
+def record_hls_request(filename, status, started, size):
+    """একটি HLS ফাইল রিকোয়েস্টের সময়, বাইট ও স্ট্যাটাস কোড মেট্রিক্সে লেখে।"""
+    kind = 'playlist' if filename.endswith('.m3u8') else 'media'
+    inc('hls_requests_total', kind=kind, status=status)
+    observe('hls_request_seconds', time.monotonic() - started, kind=kind)
+    if size is not None:
+        observe('hls_response_bytes', size, kind=kind)
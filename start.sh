@@ -0,0 +1,31 @@
+#!/bin/sh
+# Container entrypoint: the gevent web tier plus a transcoding worker process.
+# "./start.sh web" starts only the web tier (run worker.py in other containers).
+set -e
+
+export RUN_EMBEDDED_WORKERS=0 # transcoding never runs inside the gevent web workers
+
+worker_pid=
+if [ "$1" != "web" ]; then
+    python worker.py &
+    worker_pid=$!
+fi
+
+gunicorn --bind 0.0.0.0:8000 --workers "${WORKERS:-4}" --worker-class gevent --worker-connections 2000 app:app &
+web_pid=$!
+
+# Forward stop signals once: the worker finishes running jobs on the first SIGTERM, a second one aborts them
+stopping=
+stop() {
+    [ -n "$stopping" ] && return
+    stopping=1
+    kill -TERM $web_pid $worker_pid 2>/dev/null || true
+}
+trap stop TERM INT
+
+# Exit (and let the container restart) as soon as either process dies
+while kill -0 $web_pid 2>/dev/null && { [ -z "$worker_pid" ] || kill -0 $worker_pid 2>/dev/null; }; do
+    sleep 1
+done
+stop
+wait
@@ -0,0 +1,374 @@
+"""স্টোরেজ লাইফসাইকেল: ভিডিওভিত্তিক ডিস্ক ব্যবহারের হিসাব, সোর্স রাখার নীতি, ডিস্কের বাজেট অনুযায়ী কম দেখা
+রেজোলিউশন সরানো এবং সরানো ভিডিও আবার চাওয়া হলে নতুন করে তৈরির জন্য কিউতে পাঠানো।
+
+HLS আউটপুটের ফাইল ফরম্যাট, ক্যাশ ও লাইভ স্ট্যাটাস app এর অংশ; সেগুলোর যে কাজগুলো এখানে দরকার তা app
+স্টার্টআপে configure() দিয়ে বসিয়ে দেয়, তাই এই মডিউল app ইমপোর্ট করে না।
+"""
+import atexit
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+import metrics
+from jobstore import JOB_STATE_QUEUED, JOB_STATE_READY, JOB_STATE_ERROR, JOB_STATE_EVICTED, get_db, get_job
+
+# === Configuration Constants ===
+# কনফিগারেশন ধ্রুবক
+# Storage lifecycle settings
+# স্টোরেজ লাইফসাইকেল সেটিংস: সোর্স রাখা/মুছে ফেলা এবং ডিস্কের বাজেট পেরোলে কম দেখা রেজোলিউশন সরিয়ে ফেলা
+# 'keep' = সোর্স রাখা হয় (সরিয়ে ফেলা রেজোলিউশন চাইলে আবার তৈরি করা যায়), 'delete' = সফল ট্রান্সকোডের পর সোর্স মুছে ফেলা
+# (সেই ভিডিওর আউটপুট তখন আর কখনো সরানো হয় না, কারণ আবার তৈরি করা সম্ভব নয়)
+SOURCE_RETENTION = os.environ.get('SOURCE_RETENTION', 'keep').lower()
+STORAGE_BUDGET_BYTES = int(os.environ.get('STORAGE_BUDGET_BYTES', 0)) # সোর্স ও HLS আউটপুট মিলিয়ে সর্বোচ্চ ডিস্ক ব্যবহার (0 = সীমা নেই)
+STORAGE_EVICT_TARGET = 0.9 # বাজেট পেরোলে ব্যবহার বাজেটের এই অংশে নামা পর্যন্ত সরানো হয়, যাতে প্রতিটি নতুন জবে আবার সরাতে না হয়
+STORAGE_EVICT_MIN_IDLE = 3600 # এর চেয়ে সম্প্রতি দেখা বা তৈরি হওয়া রেজোলিউশন সরানো হয় না (সদ্য প্রসেস হওয়া ভিডিও সাথে সাথে সরে না যায়)
+STORAGE_CHECK_INTERVAL = 60 # ওয়ার্কার প্রসেস কত সেকেন্ড পরপর বাজেট পরীক্ষা করবে
+STORAGE_ACCESS_FLUSH_INTERVAL = 30 # সার্ভিং প্রসেসে জমা হওয়া শেষ অ্যাক্সেসের সময় কত সেকেন্ড পরপর ডাটাবেসে লেখা হবে
+STORAGE_REGENERATE_PRIORITY = 10 # সরিয়ে ফেলা ভিডিও আবার চাওয়া হলে নতুন আপলোডের আগে তৈরি হবে
+
+# === Storage Lifecycle ===
+# স্টোরেজ লাইফসাইকেল: প্রতিটি ভিডিওর সোর্স ও HLS আউটপুটের (রেজোলিউশনভিত্তিক) আকার storage_usage টেবিলে থাকে।
+# হিসাবটি ধাপে ধাপে আপডেট হয় — জব সফল হলে শুধু সেই ভিডিওর ডিরেক্টরি গোনা হয়, সরানোর সময় সারিগুলো চিহ্নিত হয় —
+# তাই বাজেট পরীক্ষায় পুরো ডিরেক্টরি ট্রি ঘুরতে হয় না। সার্ভিং স্তর রেজোলিউশনের শেষ অ্যাক্সেসের সময় মেমরিতে জমিয়ে
+# নির্দিষ্ট সময় পরপর লেখে। ব্যবহার STORAGE_BUDGET_BYTES পেরোলে সবচেয়ে কম সম্প্রতি দেখা রেজোলিউশন সরানো হয়
+# (মাস্টার প্লেলিস্ট থেকেও); কোনো ভিডিওর শেষ ভিডিও রেজোলিউশন সরাতে হলে পুরো আউটপুট সরিয়ে জবটি 'evicted' হয়,
+# এবং ভিডিওটি আবার চাওয়া হলে সোর্স থেকে নতুন করে তৈরি হয়। যে ভিডিওর সোর্স নেই তার আউটপুট কখনো সরানো হয় না।
+
+STORAGE_SOURCE_ITEM = '@source' # সোর্স ফাইলের সারির নাম
+STORAGE_LOOSE_ITEM = '@hls'     # HLS ডিরেক্টরির উপরের স্তরের ফাইলগুলোর (মাস্টার প্লেলিস্ট, স্টেট ফাইল) সারির নাম
+STORAGE_UPLOAD_ITEM = '@upload' # অসম্পূর্ণ রিজিউমেবল আপলোডের .part ফাইলের সারির নাম
+STORAGE_INCOMING_ID = '@incoming' # চলমান ফর্ম আপলোডের অস্থায়ী ফাইলগুলোর সারির video_id
+
+# app এর দেওয়া কাজগুলো (configure() দেখুন)
+_hooks = {
+    'rendition_entries': None,     # (hls_dir) -> স্টেট ফাইলের রেজোলিউশন এন্ট্রি {ডিরেক্টরির নাম: এন্ট্রি}
+    'remove_output': None,         # (hls_dir) -> স্টেট ফাইল ছাড়া পুরো HLS আউটপুট মোছে
+    'write_master_playlist': None, # (video_id, hls_dir, রেজোলিউশনের তালিকা) -> মাস্টার প্লেলিস্ট আবার লেখে
+    'output_changed': None,        # (video_id) -> HLS আউটপুট বদলেছে (যেমন ফাইল ক্যাশ বাতিল)
+    'jobs_changed': None,          # () -> জবের অবস্থা বদলেছে (লাইভ স্ট্যাটাস)
+    'job_queued': None,            # () -> নতুন জব কিউতে এসেছে (ওয়ার্কার জাগানো)
+}
+
+def configure(**hooks):
+    """HLS আউটপুট, ক্যাশ, লাইভ স্ট্যাটাস ও ওয়ার্কারের যে কাজগুলো এই মডিউলের দরকার সেগুলো বসায় (_hooks দেখুন)।"""
+    unknown = set(hooks) - set(_hooks)
+    if unknown:
+        raise TypeError(f"অজানা স্টোরেজ হুক: {', '.join(sorted(unknown))}")
+    _hooks.update(hooks)
+
+def _hook(name):
+    hook = _hooks[name]
+    if hook is None:
+        raise RuntimeError(f"স্টোরেজ হুক '{name}' বসানো হয়নি; আগে storage.configure() ডাকুন")
+    return hook
+
+def init_storage_db():
+    """ভিডিওভিত্তিক ডিস্ক ব্যবহারের টেবিল ও LRU ইনডেক্স তৈরি করে।"""
+    conn = get_db()
+    # kind: rendition (সরানো যায়), audio, source বা other; evicted_at সেট থাকলে আইটেমটি ডিস্কে নেই
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS storage_usage (
+            video_id    TEXT NOT NULL,
+            item        TEXT NOT NULL,
+            kind        TEXT NOT NULL,
+            bytes       INTEGER NOT NULL,
+            last_access REAL NOT NULL,
+            evicted_at  REAL,
+            PRIMARY KEY (video_id, item)
+        )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_storage_lru ON storage_usage (kind, evicted_at, last_access)")
+
+def _tree_bytes(path):
+    """একটি ফাইল বা ডিরেক্টরির (ভিতরের সব ফাইলসহ) মোট আকার বাইটে; symlink অনুসরণ করা হয় না।"""
+    try:
+        if not os.path.isdir(path) or os.path.islink(path):
+            return os.lstat(path).st_size
+    except OSError:
+        return 0
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass # গোনার মাঝে মুছে গেছে
+    return total
+
+def account_video_storage(video_id, hls_dir, source_path, last_access=None):
+    """একটি ভিডিওর সোর্স ও HLS আউটপুটের আকার গুনে storage_usage এর সারিগুলো প্রতিস্থাপন করে।
+
+    শুধু এই ভিডিওর ডিরেক্টরি গোনা হয়। রেজোলিউশন চেনা হয় স্টেট ফাইল থেকে; last_access না দিলে এখনকার সময়।
+    """
+    renditions = _hook('rendition_entries')(hls_dir)
+    items = []
+    if source_path and os.path.exists(source_path):
+        items.append((STORAGE_SOURCE_ITEM, 'source', _tree_bytes(source_path)))
+    loose = 0
+    try:
+        names = os.listdir(hls_dir)
+    except OSError:
+        names = []
+    for name in names:
+        path = os.path.join(hls_dir, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            entry = renditions.get(name)
+            if entry is None:
+                kind = 'other'
+            else:
+                kind = 'audio' if entry['rendition'].get('audio_only') else 'rendition'
+            items.append((name, kind, _tree_bytes(path)))
+        else:
+            loose += _tree_bytes(path)
+    items.append((STORAGE_LOOSE_ITEM, 'other', loose))
+
+    last_access = last_access or time.time()
+    conn = get_db()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute("DELETE FROM storage_usage WHERE video_id = ?", (video_id,))
+        conn.executemany("INSERT INTO storage_usage (video_id, item, kind, bytes, last_access) VALUES (?, ?, ?, ?, ?)",
+                         [(video_id, item, kind, size, last_access) for item, kind, size in items])
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return sum(size for _, _, size in items)
+
+def apply_source_retention(video_id, source_path):
+    """SOURCE_RETENTION 'delete' হলে সফল ট্রান্সকোডের পর সোর্স ফাইলটি মুছে ফেলে (পাশের media.json থাকে)।"""
+    if SOURCE_RETENTION != 'delete':
+        return
+    try:
+        os.remove(source_path)
+    except FileNotFoundError:
+        return
+    except OSError as e:
+        logging.warning(f"[{video_id}] সোর্স ফাইল মুছে ফেলা যায়নি ({source_path}): {e}")
+        return
+    logging.info(f"[{video_id}] সোর্স ফাইল মুছে ফেলা হয়েছে (SOURCE_RETENTION=delete); এই ভিডিওর আউটপুট আর সরানো হবে না।")
+
+def update_video_storage(video_id, source_path, hls_dir):
+    """সফল জবের পর: সোর্স রাখার নীতি প্রয়োগ করে, ভিডিওটির ডিস্ক ব্যবহার আবার গোনে এবং বাজেট পরীক্ষা করে।"""
+    try:
+        apply_source_retention(video_id, source_path)
+        size = account_video_storage(video_id, hls_dir, source_path)
+        logging.info(f"[{video_id}] ডিস্ক ব্যবহার: {size / metrics.MIB:.1f} MiB।")
+        enforce_storage_budget()
+    except (sqlite3.Error, OSError) as e:
+        # শুধু হিসাব পিছিয়ে থাকে; পরের বাজেট পরীক্ষা বা প্রসেস চালুর সময় আবার ঠিক হয়
+        logging.error(f"[{video_id}] ডিস্ক ব্যবহারের হিসাব আপডেট করতে ব্যর্থ: {e}")
+
+def backfill_storage_usage():
+    """যে রেডি ভিডিওগুলোর হিসাব এখনও নেই (যেমন এই ফিচারের আগে প্রসেস হওয়া) সেগুলো একবার গোনে।"""
+    rows = get_db().execute(
+        "SELECT video_id, source_path, hls_dir, finished_at FROM jobs AS j WHERE state = ? "
+        "AND NOT EXISTS (SELECT 1 FROM storage_usage AS u WHERE u.video_id = j.video_id)",
+        (JOB_STATE_READY,)).fetchall()
+    for row in rows:
+        account_video_storage(row['video_id'], row['hls_dir'], row['source_path'], row['finished_at'])
+    if rows:
+        logging.info(f"{len(rows)}টি পুরনো ভিডিওর ডিস্ক ব্যবহার গোনা হয়েছে।")
+
+def storage_used_bytes():
+    """সব ভিডিওর ডিস্কে থাকা (সরানো হয়নি এমন) আইটেমের মোট আকার।"""
+    return get_db().execute("SELECT COALESCE(SUM(bytes), 0) FROM storage_usage WHERE evicted_at IS NULL").fetchone()[0]
+
+def record_upload_usage(uploads, incoming_bytes):
+    """অসম্পূর্ণ আপলোডগুলোর আকার 'upload' হিসেবে লেখে, যাতে ডিস্কের বাজেটে সেগুলোও গোনা হয়।
+
+    uploads: (video_id, .part এর আকার) এর তালিকা; incoming_bytes: চলমান ফর্ম আপলোডের অস্থায়ী ফাইলগুলোর মোট আকার
+    (এগুলো কোনো ভিডিওর নয়, তাই একটি আলাদা সারিতে একসাথে গোনা হয়)।
+    """
+    now = time.time()
+    rows = [(video_id, STORAGE_UPLOAD_ITEM, size, now) for video_id, size in uploads]
+    rows.append((STORAGE_INCOMING_ID, STORAGE_UPLOAD_ITEM, incoming_bytes, now))
+    get_db().executemany(
+        "INSERT OR REPLACE INTO storage_usage (video_id, item, kind, bytes, last_access) VALUES (?, ?, 'upload', ?, ?)", rows)
+
+def clear_upload_usage(video_id):
+    """একটি আপলোডের 'upload' সারি মুছে ফেলে (আপলোড মুছে গেলে বা সোর্স ফাইলে রূপান্তরিত হলে)।"""
+    get_db().execute("DELETE FROM storage_usage WHERE video_id = ? AND item = ?", (video_id, STORAGE_UPLOAD_ITEM))
+
+def storage_gauges(conn):
+    """/metrics এর জন্য ধরনভিত্তিক ডিস্ক ব্যবহার ও বাজেটের গেজ।"""
+    gauges = [('storage_bytes', {'kind': row['kind']}, row['bytes']) for row in conn.execute(
+        "SELECT kind, SUM(bytes) AS bytes FROM storage_usage WHERE evicted_at IS NULL GROUP BY kind")]
+    gauges.append(('storage_budget_bytes', {}, STORAGE_BUDGET_BYTES))
+    return gauges
+
+metrics.register_gauges(storage_gauges)
+
+def evict_rendition(video_id, item):
+    """একটি রেডি ভিডিওর একটি রেজোলিউশন সরিয়ে ফেলে এবং কত বাইট খালি হলো তা রিটার্ন করে।
+
+    এটিই ভিডিওর শেষ ভিডিও রেজোলিউশন হলে পুরো HLS আউটপুট (স্টেট ফাইল ছাড়া) সরিয়ে জবটি 'evicted' করা হয়।
+    কোন প্রসেস সরাবে তা লেনদেনে সারিগুলো চিহ্নিত করে ঠিক হয়; জবটি রেডি না থাকলে (যেমন আবার প্রসেস হচ্ছে) কিছু হয় না।
+    """
+    conn = get_db()
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        job = conn.execute("SELECT hls_dir FROM jobs WHERE video_id = ? AND state = ?", (video_id, JOB_STATE_READY)).fetchone()
+        claimed = job is not None and conn.execute(
+            "UPDATE storage_usage SET evicted_at = ? WHERE video_id = ? AND item = ? AND evicted_at IS NULL",
+            (now, video_id, item)).rowcount
+        whole = False
+        if claimed:
+            whole = not conn.execute("SELECT 1 FROM storage_usage WHERE video_id = ? AND kind = 'rendition' AND evicted_at IS NULL",
+                                     (video_id,)).fetchone()
+            if whole:
+                conn.execute("UPDATE storage_usage SET evicted_at = ? WHERE video_id = ? AND kind != 'source' AND evicted_at IS NULL",
+                             (now, video_id))
+            freed = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM storage_usage WHERE video_id = ? AND evicted_at = ?",
+                                 (video_id, now)).fetchone()[0]
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    if not claimed:
+        return 0
+
+    hls_dir = job['hls_dir']
+    if whole:
+        # ডিরেক্টরিটি থাকে, যাতে ডুপ্লিকেট আপলোডের symlink গুলো ভেঙে না যায়
+        _hook('remove_output')(hls_dir)
+        get_db().execute("UPDATE jobs SET state = ?, updated_at = ? WHERE video_id = ? AND state = ?",
+                         (JOB_STATE_EVICTED, time.time(), video_id, JOB_STATE_READY))
+        _hook('jobs_changed')()
+        logging.info(f"[{video_id}] ডিস্কের বাজেটের জন্য পুরো HLS আউটপুট সরানো হয়েছে ({freed / metrics.MIB:.1f} MiB); আবার চাওয়া হলে তৈরি হবে।")
+    else:
+        # প্লেয়ার যেন সরানো রেজোলিউশন আর না চায়, তাই আগে মাস্টার প্লেলিস্ট থেকে বাদ দিয়ে তারপর ফাইলগুলো মুছুন
+        entries = _hook('rendition_entries')(hls_dir)
+        remaining = [entry['rendition'] for name, entry in entries.items()
+                     if entry.get('complete') and name != item and os.path.isdir(os.path.join(hls_dir, name))]
+        _hook('write_master_playlist')(video_id, hls_dir, remaining)
+        shutil.rmtree(os.path.join(hls_dir, item), ignore_errors=True)
+        logging.info(f"[{video_id}] ডিস্কের বাজেটের জন্য কম দেখা রেজোলিউশন {item} সরানো হয়েছে ({freed / metrics.MIB:.1f} MiB)।")
+    _hook('output_changed')(video_id)
+    metrics.inc('storage_evictions_total', scope='video' if whole else 'rendition')
+    return freed
+
+def enforce_storage_budget():
+    """ব্যবহার STORAGE_BUDGET_BYTES পেরোলে সবচেয়ে পুরনো শেষ অ্যাক্সেসের রেজোলিউশন থেকে শুরু করে সরাতে থাকে,
+    যতক্ষণ না ব্যবহার বাজেটের STORAGE_EVICT_TARGET অংশে নামে। কত বাইট খালি হলো তা রিটার্ন করে।
+    """
+    if not STORAGE_BUDGET_BYTES:
+        return 0
+    used = storage_used_bytes()
+    if used <= STORAGE_BUDGET_BYTES:
+        return 0
+    target = STORAGE_BUDGET_BYTES * STORAGE_EVICT_TARGET
+    # শুধু রেডি জবের, অন্তত STORAGE_EVICT_MIN_IDLE ধরে অলস এবং যাদের সোর্স আছে (আবার তৈরি করা যায়) এমন রেজোলিউশন
+    candidates = get_db().execute(
+        "SELECT u.video_id, u.item FROM storage_usage AS u JOIN jobs AS j ON j.video_id = u.video_id "
+        "WHERE u.kind = 'rendition' AND u.evicted_at IS NULL AND u.last_access < ? AND j.state = ? "
+        "AND EXISTS (SELECT 1 FROM storage_usage AS s WHERE s.video_id = u.video_id AND s.kind = 'source' AND s.evicted_at IS NULL) "
+        "ORDER BY u.last_access", (time.time() - STORAGE_EVICT_MIN_IDLE, JOB_STATE_READY)).fetchall()
+    freed = 0
+    for candidate in candidates:
+        if used - freed <= target:
+            break
+        freed += evict_rendition(candidate['video_id'], candidate['item'])
+    if used - freed > STORAGE_BUDGET_BYTES:
+        logging.warning(f"ডিস্ক ব্যবহার ({(used - freed) / metrics.MIB:.1f} MiB) এখনও বাজেটের ({STORAGE_BUDGET_BYTES / metrics.MIB:.1f} MiB) বেশি; "
+                        f"সরানোর মতো আর কোনো রেজোলিউশন নেই (সোর্স, চলমান জবের এবং সম্প্রতি দেখা আউটপুট সরানো হয় না)।")
+    return freed
+
+def request_regeneration(video_id):
+    """'evicted' ভিডিওটি উঁচু অগ্রাধিকারে আবার কিউতে পাঠায়। কিউতে পাঠানো হলে True রিটার্ন করে।
+
+    আগের চেষ্টার সংখ্যা ও ত্রুটি মুছে যায়; কিউয়ের সীমা প্রযোজ্য নয়, কারণ প্রতিটি সংরক্ষিত ভিডিও একবারই যোগ হতে পারে।
+    """
+    job = get_job(video_id)
+    if job is None or job['state'] != JOB_STATE_EVICTED:
+        return False
+    video_id = job['video_id'] # ডুপ্লিকেট আপলোড হলে মূল ভিডিও
+    now = time.time()
+    if not os.path.exists(job['source_path']):
+        get_db().execute("UPDATE jobs SET state = ?, finished_at = ?, updated_at = ?, error = ? WHERE video_id = ? AND state = ?",
+                         (JOB_STATE_ERROR, now, now, "HLS আউটপুট সরানো হয়েছিল এবং সোর্স ফাইলটি আর নেই; আবার তৈরি করা সম্ভব নয়।",
+                          video_id, JOB_STATE_EVICTED))
+        logging.error(f"[{video_id}] সরানো ভিডিও আবার তৈরি করা যাচ্ছে না: সোর্স ফাইল নেই ({job['source_path']})।")
+        _hook('jobs_changed')()
+        return False
+    cursor = get_db().execute(
+        "UPDATE jobs SET state = ?, priority = ?, enqueued_at = ?, updated_at = ?, started_at = NULL, finished_at = NULL, "
+        "attempts = 0, retry_at = NULL, progress = NULL, error = NULL WHERE video_id = ? AND state = ?",
+        (JOB_STATE_QUEUED, STORAGE_REGENERATE_PRIORITY, now, now, video_id, JOB_STATE_EVICTED))
+    if not cursor.rowcount:
+        return False # অন্য প্রসেস ইতিমধ্যে কিউতে পাঠিয়েছে
+    metrics.inc('storage_regenerations_total')
+    _hook('job_queued')()
+    _hook('jobs_changed')()
+    logging.info(f"[{video_id}] সরানো ভিডিওটি আবার চাওয়া হয়েছে; নতুন করে তৈরির জন্য কিউতে পাঠানো হয়েছে।")
+    return True
+
+class StorageAccessTracker:
+    """HLS রিকোয়েস্ট থেকে (ভিডিও, রেজোলিউশন) এর শেষ অ্যাক্সেসের সময় মেমরিতে জমায় এবং নির্দিষ্ট সময় পরপর ডাটাবেসে লেখে।
+
+    প্রতি রিকোয়েস্টে ডাটাবেসে লেখা হয় না; একই রেজোলিউশনের অনেক সেগমেন্ট রিকোয়েস্ট একটি আপডেটে মিলে যায়।
+    """
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self._pending = {} # (video_id, item) -> শেষ অ্যাক্সেসের সময়
+        self._lock = threading.Lock()
+        self._flusher_pid = None # যে প্রসেসে flush থ্রেড চলছে (fork এর পর নতুন প্রসেসে আবার চালু করতে হয়)
+
+    def touch(self, video_id, filename):
+        """একটি রেজোলিউশনের ফাইল সার্ভ হওয়ার সময় লেখে (মাস্টার প্লেলিস্টের মতো উপরের স্তরের ফাইল গোনা হয় না)।"""
+        item, sep, _ = filename.partition('/')
+        if not sep:
+            return
+        with self._lock:
+            if self._flusher_pid != os.getpid():
+                self._pending.clear() # fork এর আগে জমা হওয়া সময় প্যারেন্ট প্রসেস নিজেই লিখবে
+                self._flusher_pid = os.getpid()
+                threading.Thread(target=self._flush_loop, name="StorageAccessFlush", daemon=True).start()
+            self._pending[(video_id, item)] = time.time()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """জমা হওয়া অ্যাক্সেসের সময়গুলো লেখে (ডুপ্লিকেট আপলোডের অ্যাক্সেস মূল ভিডিওর হিসাবে যায়)।"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            get_db().executemany(
+                "UPDATE storage_usage SET last_access = MAX(last_access, ?) "
+                "WHERE video_id = COALESCE((SELECT alias_of FROM jobs WHERE video_id = ?), ?) AND item = ?",
+                [(accessed, video_id, video_id, item) for (video_id, item), accessed in pending.items()])
+        except sqlite3.Error as e:
+            with self._lock:
+                for key, accessed in pending.items():
+                    self._pending[key] = max(accessed, self._pending.get(key, 0))
+            logging.warning(f"শেষ অ্যাক্সেসের সময় ডাটাবেসে লিখতে ব্যর্থ (পরের বার আবার চেষ্টা হবে): {e}")
+
+storage_access = StorageAccessTracker(STORAGE_ACCESS_FLUSH_INTERVAL)
+atexit.register(storage_access.flush)
+
+def storage_maintenance_loop(sweep_uploads):
+    """ওয়ার্কার প্রসেসের থ্রেড: একবার পুরনো ভিডিওর হিসাব পূরণ করে, তারপর নির্দিষ্ট সময় পরপর বাজেট পরীক্ষা করে।
+
+    sweep_uploads() প্রতিবার বাজেট পরীক্ষার আগে ডাকা হয় (মেয়াদোত্তীর্ণ আপলোড মোছা ও চলমানগুলোর আকার লেখা)।
+    """
+    try:
+        backfill_storage_usage()
+    except (sqlite3.Error, OSError) as e:
+        logging.error(f"পুরনো ভিডিওর ডিস্ক ব্যবহার গুনতে ব্যর্থ: {e}")
+    while True:
+        try:
+            sweep_uploads() # বাতিল আপলোড মুছুন এবং চলমানগুলোর আকার হিসাবে নিন
+            storage_access.flush() # এই প্রসেসের সদ্য জমা হওয়া অ্যাক্সেসও যেন বিবেচনায় আসে
+            enforce_storage_budget()
+        except (sqlite3.Error, OSError) as e:
+            logging.error(f"ডিস্কের বাজেট পরীক্ষা করতে ব্যর্থ: {e}")
+        time.sleep(STORAGE_CHECK_INTERVAL)
@@ -0,0 +1,83 @@
+"""টেস্টের সাধারণ সেটআপ: app ইমপোর্টের আগেই আলাদা জব ডাটাবেস এবং এমবেডেড ওয়ার্কার বন্ধ করা হয়।"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+_TMP_DIR = tempfile.mkdtemp(prefix='hls-tests-')
+os.environ['JOBS_DB_PATH'] = os.path.join(_TMP_DIR, 'jobs.db')
+os.environ['RUN_EMBEDDED_WORKERS'] = '0' # টেস্টে কোনো ট্রান্সকোডিং থ্রেড চলবে না
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+
+RENDITION_360 = {'name': '360', 'height': 360, 'v_bitrate': '800k', 'a_bitrate': '96k', 'playlist_path': '360/playlist.m3u8'}
+RENDITION_720 = {'name': '720', 'height': 720, 'v_bitrate': '2800k', 'a_bitrate': '128k', 'playlist_path': '720/playlist.m3u8'}
+
+
+@pytest.fixture
+def app():
+    return app_module
+
+
+@pytest.fixture
+def hls_dir(tmp_path, monkeypatch):
+    """প্রতিটি টেস্টের জন্য আলাদা HLS ডিরেক্টরি (এবং খালি ফাইল ক্যাশ)।"""
+    directory = tmp_path / 'hls'
+    directory.mkdir()
+    monkeypatch.setattr(app_module, 'HLS_DIR', str(directory))
+    monkeypatch.setattr(app_module, 'hls_cache', app_module.HlsFileCache(app_module.HLS_CACHE_MAX_ENTRIES, app_module.HLS_CACHE_TTL))
+    return directory
+
+
+@pytest.fixture
+def output_dir(tmp_path):
+    """একটি ভিডিওর HLS আউটপুট ডিরেক্টরি (টুকরো জোড়া লাগানো ও আগের চেষ্টা চালিয়ে যাওয়ার টেস্টের জন্য)।"""
+    return tmp_path / 'hls' / 'vid'
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    """প্রতিটি টেস্টের জন্য আলাদা আপলোড ডিরেক্টরি।"""
+    directory = tmp_path / 'uploads'
+    directory.mkdir()
+    monkeypatch.setattr(app_module, 'UPLOAD_DIR', str(directory))
+    monkeypatch.setattr(app_module, 'UPLOAD_INCOMING_DIR', str(directory / '.incoming'))
+    return directory
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def write_playlist(path, segments, version=3, ended=False, header=()):
+    """[(দৈর্ঘ্য, URI, [অতিরিক্ত ট্যাগ...]), ...] থেকে একটি মিডিয়া প্লেলিস্ট লেখে।"""
+    lines = ['#EXTM3U', f'#EXT-X-VERSION:{version}', '#EXT-X-TARGETDURATION:6', '#EXT-X-MEDIA-SEQUENCE:0', *header]
+    for duration, uri, tags in segments:
+        # ffmpeg এর মতো: EXT-X-MAP/DISCONTINUITY আগে, EXT-X-BYTERANGE EXTINF এর পরে
+        byterange = [tag for tag in tags if tag.startswith('#EXT-X-BYTERANGE')]
+        lines += [tag for tag in tags if tag not in byterange] + [f'#EXTINF:{duration:.6f},', *byterange, uri]
+    if ended:
+        lines.append('#EXT-X-ENDLIST')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text('\n'.join(lines) + '\n')
+
+
+@pytest.fixture
+def job_db():
+    """খালি জব স্টোর (সব টেস্ট একই অস্থায়ী জব ডাটাবেস ব্যবহার করে, তাই আগের টেস্টের সারি মুছে ফেলা হয়)।"""
+    conn = app_module.get_db()
+    for table in ('jobs', 'content_index', 'uploads', 'storage_usage'):
+        conn.execute(f"DELETE FROM {table}")
+    return conn
+
+
+def write_source(directory, data=b'video'):
+    """একটি আপলোড হওয়া সোর্স ফাইল uploads/<id>/source.mp4 এর মতো করে লেখে এবং তার পাথ রিটার্ন করে।"""
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / 'source.mp4'
+    path.write_bytes(data)
+    return str(path)
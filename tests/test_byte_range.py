@@ -0,0 +1,77 @@
+"""একক ফাইল মোডের media ফাইলের বাইট-রেঞ্জ সার্ভিং (send_hls_byte_range) এর টেস্ট।"""
+import pytest
+
+MEDIA = bytes(range(256)) * 40 # 10240 বাইট, প্রতিটি অফসেটের মান আলাদা করে চেনা যায়
+MEDIA_URL = '/hls/vid/360/media.ts'
+
+
+@pytest.fixture
+def media(hls_dir):
+    rendition_dir = hls_dir / 'vid' / '360'
+    rendition_dir.mkdir(parents=True)
+    (rendition_dir / 'media.ts').write_bytes(MEDIA)
+    return rendition_dir / 'media.ts'
+
+
+def test_single_range(client, media):
+    response = client.get(MEDIA_URL, headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.data == MEDIA[100:200]
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(MEDIA)}'
+    assert response.headers['Content-Length'] == '100'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+
+
+def test_suffix_range(client, media):
+    response = client.get(MEDIA_URL, headers={'Range': 'bytes=-500'})
+    assert response.status_code == 206
+    assert response.data == MEDIA[-500:]
+    assert response.headers['Content-Range'] == f'bytes {len(MEDIA) - 500}-{len(MEDIA) - 1}/{len(MEDIA)}'
+
+
+def test_open_ended_range(client, media):
+    response = client.get(MEDIA_URL, headers={'Range': 'bytes=10000-'})
+    assert response.status_code == 206
+    assert response.data == MEDIA[10000:]
+    assert response.headers['Content-Range'] == f'bytes 10000-{len(MEDIA) - 1}/{len(MEDIA)}'
+
+
+def test_range_past_end_is_clamped(client, media):
+    response = client.get(MEDIA_URL, headers={'Range': 'bytes=10200-20000'})
+    assert response.status_code == 206
+    assert response.data == MEDIA[10200:]
+
+
+def test_multiple_ranges_fall_back_to_full_file(client, media):
+    response = client.get(MEDIA_URL, headers={'Range': 'bytes=0-9,100-109'})
+    assert response.status_code == 200
+    assert response.data == MEDIA
+    assert response.headers['ETag']
+
+
+def test_if_range_mismatch_sends_full_file(client, media):
+    response = client.get(MEDIA_URL, headers={'Range': 'bytes=0-9', 'If-Range': '"stale-etag"'})
+    assert response.status_code == 200
+    assert response.data == MEDIA
+
+
+def test_if_range_match_sends_range(client, media):
+    etag = client.get(MEDIA_URL, headers={'Range': 'bytes=0-0'}).headers['ETag']
+    response = client.get(MEDIA_URL, headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    assert response.status_code == 206
+    assert response.data == MEDIA[:10]
+
+
+def test_out_of_bounds_range(client, media):
+    response = client.get(MEDIA_URL, headers={'Range': f'bytes={len(MEDIA)}-{len(MEDIA) + 99}'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(MEDIA)}'
+
+
+def test_range_reads_grown_file(client, media):
+    # এনকোড চলাকালীন ফাইল বাড়ে; ক্যাশে পুরনো আকার থাকলেও নতুন অংশ পাওয়া যায়
+    client.get(MEDIA_URL, headers={'Range': 'bytes=0-0'})
+    media.write_bytes(MEDIA + b'tail')
+    response = client.get(MEDIA_URL, headers={'Range': f'bytes={len(MEDIA)}-'})
+    assert response.status_code == 206
+    assert response.data == b'tail'
@@ -0,0 +1,148 @@
+"""টুকরো করে এনকোডের (plan_chunks, ChunkStitcher) টেস্ট।
+
+ffmpeg চালানো হয় না; টুকরোগুলোর প্লেলিস্ট হাতে লেখা ফিক্সচার।
+"""
+import pytest
+
+from conftest import RENDITION_360, RENDITION_720, write_playlist
+
+
+def media_lines(playlist_path):
+    """প্লেলিস্টের হেডারের পরের (সেগমেন্ট ও তাদের ট্যাগের) লাইনগুলো।"""
+    lines = playlist_path.read_text().splitlines()
+    return [line for line in lines if not line.startswith(('#EXTM3U', '#EXT-X-VERSION', '#EXT-X-TARGETDURATION',
+                                                           '#EXT-X-MEDIA-SEQUENCE', '#EXT-X-PLAYLIST-TYPE'))]
+
+
+# === plan_chunks ===
+
+def test_plan_chunks_cuts_on_first_keyframe_after_target(app):
+    keyframes = [0.0, 50.0, 119.0, 125.0, 130.0, 250.0, 590.0]
+    chunks = app.plan_chunks(600.0, keyframes, workers=2)
+    # লক্ষ্য 120 সেকেন্ড: 125 ও 250 এ কাটা হয়; 590 থেকে শেষ টুকরো খুব ছোট হত, তাই বাদ
+    assert [c['start'] for c in chunks] == [0.0, 125.0, 250.0]
+    assert [c['duration'] for c in chunks] == [125.0, 125.0, None]
+    assert [c['name'] for c in chunks] == ['chunk0000', 'chunk0001', 'chunk0002']
+    assert [c['index'] for c in chunks] == [0, 1, 2]
+
+
+def test_plan_chunks_length_is_segment_multiple(app):
+    keyframes = [i * 2.0 for i in range(300)]
+    chunks = app.plan_chunks(600.0, keyframes, workers=2)
+    assert [c['start'] for c in chunks] == [0.0, 120.0, 240.0, 360.0, 480.0]
+    assert all(c['duration'] % app.HLS_SEGMENT_SECONDS == 0 for c in chunks[:-1])
+
+
+def test_plan_chunks_short_video_is_one_chunk(app):
+    chunks = app.plan_chunks(40.0, [i * 2.0 for i in range(20)], workers=4)
+    assert chunks == [{'index': 0, 'name': 'chunk0000', 'start': 0.0, 'duration': None}]
+
+
+def test_plan_chunks_resume_starts_mid_video(app):
+    chunks = app.plan_chunks(600.0, [i * 2.0 for i in range(300)], workers=2, start=200.5)
+    # (600 - 200.5) / 4 -> 102 সেকেন্ড (সেগমেন্টের গুণিতক), কাটা হয় এর পরের প্রথম কীফ্রেমে
+    assert [c['start'] for c in chunks] == [200.5, 304.0, 406.0, 508.0]
+    assert chunks[0]['duration'] == pytest.approx(103.5)
+    assert chunks[0]['name'] == 'resume200500_chunk0000'
+    assert all(c['name'].startswith('resume200500_') for c in chunks)
+
+
+# === ChunkStitcher ===
+
+def make_stitcher(app, output_dir, chunk_count, renditions=(RENDITION_360,)):
+    chunks = [{'index': i, 'name': f'chunk{i:04d}', 'start': i * 12.0, 'duration': 12.0} for i in range(chunk_count)]
+    chunks[-1]['duration'] = None
+    return app.ChunkStitcher('vid', str(output_dir), list(renditions), chunks), chunks
+
+
+def test_stitcher_waits_for_contiguous_chunks(app, output_dir, monkeypatch):
+    monkeypatch.setattr(app, 'PROGRESSIVE_PUBLISH', True)
+    stitcher, chunks = make_stitcher(app, output_dir, 3)
+    for chunk in chunks:
+        write_playlist(output_dir / '360' / f"{chunk['name']}.m3u8",
+                       [(6.0, f"{chunk['name']}_{i}.ts", ()) for i in range(2)], ended=True)
+    playlist = output_dir / '360' / 'playlist.m3u8'
+
+    stitcher.chunk_done(chunks[1])
+    assert not playlist.exists() # টুকরো 0 এখনো বাকি
+    assert not (output_dir / '360' / 'chunk0001.m3u8').exists()
+
+    stitcher.chunk_done(chunks[0])
+    text = playlist.read_text()
+    assert '#EXT-X-PLAYLIST-TYPE:EVENT' in text and '#EXT-X-ENDLIST' not in text
+    assert media_lines(playlist) == [
+        '#EXTINF:6.000000,', 'chunk0000_0.ts', '#EXTINF:6.000000,', 'chunk0000_1.ts',
+        '#EXT-X-DISCONTINUITY',
+        '#EXTINF:6.000000,', 'chunk0001_0.ts', '#EXTINF:6.000000,', 'chunk0001_1.ts',
+    ]
+
+    stitcher.chunk_done(chunks[2])
+    text = playlist.read_text()
+    assert '#EXT-X-PLAYLIST-TYPE:VOD' in text and text.rstrip().endswith('#EXT-X-ENDLIST')
+    assert text.count('#EXT-X-DISCONTINUITY') == 2
+    assert text.count('#EXTINF') == 6
+
+
+def test_stitcher_without_progressive_publish_marks_only_complete_playlist(app, output_dir, monkeypatch):
+    monkeypatch.setattr(app, 'PROGRESSIVE_PUBLISH', False)
+    stitcher, chunks = make_stitcher(app, output_dir, 2)
+    for chunk in chunks:
+        write_playlist(output_dir / '360' / f"{chunk['name']}.m3u8", [(6.0, f"{chunk['name']}.ts", ())])
+    stitcher.chunk_done(chunks[0])
+    assert '#EXT-X-PLAYLIST-TYPE' not in (output_dir / '360' / 'playlist.m3u8').read_text()
+    stitcher.chunk_done(chunks[1])
+    assert '#EXT-X-PLAYLIST-TYPE:VOD' in (output_dir / '360' / 'playlist.m3u8').read_text()
+
+
+def test_stitcher_carries_map_and_byterange_and_merges_version(app, output_dir):
+    stitcher, chunks = make_stitcher(app, output_dir, 2)
+    # টুকরো 0: একক ফাইল মোড (বাইট-রেঞ্জ); টুকরো 1: fMP4, নিজস্ব init সেগমেন্টসহ উঁচু ভার্সন
+    write_playlist(output_dir / '360' / 'chunk0000.m3u8',
+                   [(6.0, 'chunk0000.ts', ['#EXT-X-BYTERANGE:1000@0']),
+                    (6.0, 'chunk0000.ts', ['#EXT-X-BYTERANGE:1200@1000'])], version=4)
+    write_playlist(output_dir / '360' / 'chunk0001.m3u8',
+                   [(6.0, 'chunk0001_0.m4s', ()), (7.5, 'chunk0001_1.m4s', ())], version=7,
+                   header=['#EXT-X-MAP:URI="chunk0001_init.mp4"'])
+    stitcher.chunk_done(chunks[0])
+    stitcher.chunk_done(chunks[1])
+
+    playlist = output_dir / '360' / 'playlist.m3u8'
+    text = playlist.read_text()
+    assert '#EXT-X-VERSION:7' in text
+    assert '#EXT-X-TARGETDURATION:8' in text # সবচেয়ে লম্বা সেগমেন্ট 7.5 সেকেন্ড
+    assert media_lines(playlist) == [
+        '#EXTINF:6.000000,', '#EXT-X-BYTERANGE:1000@0', 'chunk0000.ts',
+        '#EXTINF:6.000000,', '#EXT-X-BYTERANGE:1200@1000', 'chunk0000.ts',
+        '#EXT-X-DISCONTINUITY',
+        '#EXT-X-MAP:URI="chunk0001_init.mp4"', '#EXTINF:6.000000,', 'chunk0001_0.m4s',
+        '#EXTINF:7.500000,', 'chunk0001_1.m4s',
+        '#EXT-X-ENDLIST',
+    ]
+
+
+def test_stitcher_keeps_discontinuities_of_resumed_segments(app, output_dir):
+    # আগের চেষ্টায় জোড়া লাগানো প্লেলিস্ট (ভিতরে DISCONTINUITY সহ) টুকরো 0 হিসেবে ফিরে আসে
+    previous = output_dir / '360' / 'previous.m3u8'
+    write_playlist(previous, [(6.0, 'chunk0000_0.ts', ()), (6.0, 'chunk0001_0.ts', ['#EXT-X-DISCONTINUITY'])])
+    resumed = app.read_playlist_segments(str(previous))
+    assert resumed[1][1][1] == ['#EXT-X-DISCONTINUITY', '#EXTINF:6.000000,', 'chunk0001_0.ts']
+
+    stitcher, chunks = make_stitcher(app, output_dir, 2)
+    stitcher.add_segments(0, {'360': resumed})
+    write_playlist(output_dir / '360' / 'chunk0001.m3u8', [(6.0, 'resume_0.ts', ())])
+    stitcher.chunk_done(chunks[1])
+    assert media_lines(output_dir / '360' / 'playlist.m3u8') == [
+        '#EXTINF:6.000000,', 'chunk0000_0.ts',
+        '#EXT-X-DISCONTINUITY', '#EXTINF:6.000000,', 'chunk0001_0.ts',
+        '#EXT-X-DISCONTINUITY', '#EXTINF:6.000000,', 'resume_0.ts',
+        '#EXT-X-ENDLIST',
+    ]
+
+
+def test_stitcher_writes_every_rendition(app, output_dir):
+    stitcher, chunks = make_stitcher(app, output_dir, 1, renditions=(RENDITION_360, RENDITION_720))
+    for name in ('360', '720'):
+        write_playlist(output_dir / name / 'chunk0000.m3u8', [(6.0, f'{name}.ts', ())])
+    stitcher.chunk_done(chunks[0])
+    for name in ('360', '720'):
+        assert media_lines(output_dir / name / 'playlist.m3u8') == ['#EXTINF:6.000000,', f'{name}.ts', '#EXT-X-ENDLIST']
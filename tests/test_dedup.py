@@ -0,0 +1,86 @@
+"""ডুপ্লিকেট আপলোডের টেস্ট: enqueue_or_alias_job ও submit_uploaded_video একই কনটেন্টের জন্য কখন alias বানায়,
+এবং একই আপলোড দুবার শেষ করলে (finalize_upload) একটিই জব থাকে।"""
+import os
+import time
+
+import pytest
+
+from conftest import write_source
+
+
+def submit(app, upload_dir, video_id, digest):
+    return app.submit_uploaded_video(video_id, write_source(upload_dir / video_id), f'{video_id}.mp4', digest)
+
+
+def set_state(conn, video_id, state):
+    conn.execute("UPDATE jobs SET state = ?, updated_at = ? WHERE video_id = ?", (state, time.time(), video_id))
+
+
+@pytest.mark.parametrize('state', ['ready', 'queued', 'processing'])
+def test_duplicate_of_live_job_becomes_alias(app, hls_dir, upload_dir, job_db, state):
+    assert submit(app, upload_dir, 'orig', 'same') == (None, 1)
+    set_state(job_db, 'orig', state)
+
+    assert submit(app, upload_dir, 'dup', 'same') == ('orig', None)
+    row = job_db.execute("SELECT state, alias_of, source_path, hls_dir FROM jobs WHERE video_id = 'dup'").fetchone()
+    assert row['state'] == app.JOB_STATE_ALIAS and row['alias_of'] == 'orig'
+    assert row['hls_dir'] == str(hls_dir / 'orig')
+    # অবস্থা ও আউটপুট মূল ভিডিওর; ডুপ্লিকেট সোর্স মুছে HLS ডিরেক্টরি মূলটির symlink হয়
+    assert app.get_job('dup')['video_id'] == 'orig'
+    assert not (upload_dir / 'dup').exists()
+    assert os.readlink(hls_dir / 'dup') == 'orig'
+    assert app.queue_depth() == (1 if state == 'queued' else 0)
+
+
+def test_duplicate_of_failed_job_is_not_reused(app, hls_dir, upload_dir, job_db):
+    submit(app, upload_dir, 'orig', 'same')
+    set_state(job_db, 'orig', app.JOB_STATE_ERROR)
+
+    assert submit(app, upload_dir, 'dup', 'same') == (None, 1)
+    assert app.get_job('dup')['state'] == app.JOB_STATE_QUEUED
+    assert (upload_dir / 'dup' / 'source.mp4').exists()
+    assert not os.path.islink(hls_dir / 'dup')
+    # পরের একই আপলোড নতুন জবটির alias হবে, ব্যর্থটির নয়
+    assert job_db.execute("SELECT video_id FROM content_index WHERE digest = 'same'").fetchone()[0] == 'dup'
+    assert submit(app, upload_dir, 'third', 'same') == ('dup', None)
+
+
+def test_different_content_is_not_aliased(app, hls_dir, upload_dir, job_db):
+    submit(app, upload_dir, 'orig', 'one')
+    assert submit(app, upload_dir, 'other', 'two') == (None, 2)
+
+
+def test_dedup_disabled_ignores_digest(app, hls_dir, upload_dir, job_db, monkeypatch):
+    monkeypatch.setattr(app, 'DEDUP_ENABLED', False)
+    submit(app, upload_dir, 'orig', 'same')
+    assert submit(app, upload_dir, 'dup', 'same') == (None, 2)
+
+
+def test_second_enqueue_of_same_video_changes_nothing(app, hls_dir, upload_dir, job_db):
+    # একই আপলোডের দুটি শেষ PATCH একসাথে এলে দুটোই enqueue_or_alias_job ডাকতে পারে
+    source = write_source(upload_dir / 'vid')
+    assert app.enqueue_or_alias_job('vid', source, str(hls_dir / 'vid'), 'a.mp4', 'digest') == (None, 1)
+    assert app.enqueue_or_alias_job('vid', source, str(hls_dir / 'vid'), 'a.mp4', 'digest') == (None, None)
+    assert app.queue_depth() == 1
+    assert job_db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 1
+    # নিজের আগের কনটেন্ট ইনডেক্স এন্ট্রির কারণে ভিডিওটি নিজের alias হয় না
+    assert app.get_job('vid')['alias_of'] is None
+
+
+def test_double_finalize_enqueues_once(app, hls_dir, upload_dir, job_db):
+    now = time.time()
+    job_db.execute("INSERT INTO uploads (video_id, original_filename, file_ext, upload_length, created_at, content_digest) "
+                   "VALUES ('vid', 'a.mp4', 'mp4', 5, ?, 'digest')", (now,))
+    (upload_dir / 'vid').mkdir()
+    (upload_dir / 'vid' / 'source.mp4.part').write_bytes(b'video')
+    stale = app.get_upload('vid') # দ্বিতীয় রিকোয়েস্টটি প্রথমটি শেষ হওয়ার আগে রেকর্ড পড়েছিল
+
+    app.finalize_upload(stale)
+    app.finalize_upload(stale)
+
+    assert (upload_dir / 'vid' / 'source.mp4').read_bytes() == b'video'
+    assert not (upload_dir / 'vid' / 'source.mp4.part').exists()
+    assert app.get_upload('vid')['completed_at'] is not None
+    job = app.get_job('vid')
+    assert job['state'] == app.JOB_STATE_QUEUED and job['content_digest'] == 'digest'
+    assert app.queue_depth() == 1
@@ -0,0 +1,49 @@
+"""ইনজেস্ট আবার চালানোর টেস্ট: আগে ব্যর্থ হওয়া ফাইল একই ভিডিও আইডিতে আবার জমা দিলে জবটি নতুন করে কিউতে যায়।"""
+import time
+
+import pytest
+
+from conftest import write_source
+
+
+def fail_job(conn, app, video_id):
+    now = time.time()
+    conn.execute("UPDATE jobs SET state = ?, attempts = 3, error = 'ffmpeg failed', finished_at = ?, retry_at = ? "
+                 "WHERE video_id = ?", (app.JOB_STATE_ERROR, now, now + 600, video_id))
+
+
+def test_resubmitting_failed_video_requeues_it(app, hls_dir, job_db, tmp_path):
+    source = write_source(tmp_path / 'uploads' / 'vid')
+    assert app.submit_uploaded_video('vid', source, 'a.mp4', 'digest-a') == (None, 1)
+    fail_job(job_db, app, 'vid')
+
+    assert app.submit_uploaded_video('vid', source, 'a.mp4', 'digest-a') == (None, 1)
+    job = app.get_job('vid')
+    assert job['state'] == app.JOB_STATE_QUEUED
+    assert job['attempts'] == 0
+    assert job['error'] is None and job['retry_at'] is None and job['finished_at'] is None
+    # কনটেন্ট ইনডেক্স এখনও এই ভিডিওকেই দেখায়, তাই পরের একই আপলোড এর alias হবে
+    assert job_db.execute("SELECT video_id FROM content_index WHERE digest = 'digest-a'").fetchone()[0] == 'vid'
+
+
+def test_resubmitting_failed_video_respects_queue_limit(app, hls_dir, job_db, tmp_path, monkeypatch):
+    source = write_source(tmp_path / 'uploads' / 'vid')
+    app.submit_uploaded_video('vid', source, 'a.mp4')
+    fail_job(job_db, app, 'vid')
+    app.submit_uploaded_video('other', write_source(tmp_path / 'uploads' / 'other'), 'b.mp4')
+    monkeypatch.setattr(app, 'JOB_QUEUE_MAX', 1)
+
+    with pytest.raises(app.QueueFullError):
+        app.submit_uploaded_video('vid', source, 'a.mp4')
+    # লেনদেন ফিরিয়ে নেওয়া হয়েছে; জবটি ব্যর্থ অবস্থাতেই থাকে এবং কিউ খালি হলে আবার চেষ্টা করা যায়
+    assert app.get_job('vid')['state'] == app.JOB_STATE_ERROR
+
+
+def test_resubmitting_unfinished_video_keeps_job(app, hls_dir, job_db, tmp_path):
+    source = write_source(tmp_path / 'uploads' / 'vid')
+    app.submit_uploaded_video('vid', source, 'a.mp4')
+    job_db.execute("UPDATE jobs SET state = ?, attempts = 1 WHERE video_id = 'vid'", (app.JOB_STATE_PROCESSING,))
+
+    assert app.submit_uploaded_video('vid', source, 'a.mp4') == (None, None)
+    job = app.get_job('vid')
+    assert job['state'] == app.JOB_STATE_PROCESSING and job['attempts'] == 1
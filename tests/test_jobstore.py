@@ -0,0 +1,22 @@
+"""জব ডাটাবেসের জার্নাল মোডের টেস্ট: একই হোস্টে WAL, শেয়ার করা স্টোরেজে (JOBS_DB_SHARED) রোলব্যাক জার্নাল।"""
+import threading
+
+import pytest
+
+import jobstore
+
+
+def journal_mode_in_new_thread():
+    # কানেকশন প্রতি থ্রেডে একটি, তাই নতুন থ্রেডে নতুন কানেকশন তৈরি হয়
+    result = []
+    thread = threading.Thread(target=lambda: result.append(jobstore.get_db().execute('PRAGMA journal_mode').fetchone()[0]))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+@pytest.mark.parametrize('shared, mode', [(False, 'wal'), (True, 'delete')])
+def test_journal_mode(tmp_path, monkeypatch, shared, mode):
+    monkeypatch.setattr(jobstore, 'JOBS_DB_PATH', str(tmp_path / 'jobs.db'))
+    monkeypatch.setattr(jobstore, 'JOBS_DB_SHARED', shared)
+    assert journal_mode_in_new_thread() == mode
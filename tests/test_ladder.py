@@ -0,0 +1,140 @@
+"""প্রতি-ভিডিও সিঁড়ির টেস্ট: measure_complexity এর মাপ, complexity_exponent এর ফিটিং এবং plan_per_title_ladder
+এর রেজোলিউশন ও বিটরেট বাছাই। ffmpeg এর বদলে নমুনা ফাইলগুলো নির্দিষ্ট আকারে লেখা হয় (নির্দিষ্ট kbps)।"""
+import json
+import os
+import subprocess
+
+import pytest
+
+
+def complexity(*points, crf=23):
+    return {'points': [list(point) for point in points], 'crf': crf}
+
+
+# === complexity_exponent ===
+
+@pytest.mark.parametrize('points, exponent', [
+    ([(240, 100), (480, 400)], 1.0),                # পিক্সেল 4 গুণ, বিটরেট 4 গুণ
+    ([(240, 100), (480, 200)], 0.5),                # পিক্সেল 4 গুণ, বিটরেট 2 গুণ
+    ([(240, 100), (480, 3200)], 1.5),               # 2.5, উপরের সীমায় আটকানো
+    ([(240, 100), (480, 110)], 0.3),                # প্রায় 0.07, নিচের সীমায় আটকানো
+    ([(240, 100)], 0.75),                           # একটি উচ্চতা: ডিফল্ট
+    ([(240, 0), (480, 400)], 0.75),                 # শূন্য বিটরেটে লগ নেওয়া যায় না
+])
+def test_complexity_exponent(app, points, exponent):
+    assert app.complexity_exponent(complexity(*points)) == pytest.approx(exponent)
+
+
+# === measure_complexity ===
+
+@pytest.fixture
+def fake_encoder(app, monkeypatch):
+    """run_ffmpeg এর বদলে প্রতিটি .mkv আউটপুট নির্দিষ্ট kbps এর সমান আকারে লেখে এবং কমান্ডগুলো রাখে।"""
+    calls = []
+
+    def encode(kbps_by_height):
+        def run_ffmpeg(cmd, **kwargs):
+            calls.append(cmd)
+            inputs = cmd.count('-i')
+            seconds = sum(float(cmd[i + 1]) for i, arg in enumerate(cmd) if arg == '-t')
+            assert inputs == cmd.count('-t')
+            graph = cmd[cmd.index('-filter_complex') + 1]
+            heights = [int(part.split('scale=-2:')[1].split(',')[0]) for part in graph.split(';') if 'scale=' in part]
+            outputs = [arg for arg in cmd if arg.endswith('.mkv')]
+            for height, output in zip(heights, outputs):
+                with open(output, 'wb') as f:
+                    f.write(b'\0' * int(kbps_by_height[height] * 1000 * seconds / 8))
+        monkeypatch.setattr(app, 'run_ffmpeg', run_ffmpeg)
+        return calls
+    return encode
+
+
+def test_measure_complexity_samples_and_caches(app, fake_encoder, tmp_path):
+    calls = fake_encoder({240: 100, 480: 400})
+    source = str(tmp_path / 'source.mp4')
+    media = {'duration': 60.0, 'height': 1080}
+
+    result = app.measure_complexity('vid', source, media)
+
+    assert result == complexity((240, 100.0), (480, 400.0), crf=app.VIDEO_CRF)
+    cmd = calls[0]
+    # সমান দূরত্বে LADDER_SAMPLE_COUNT টি নমুনা, প্রতিটি LADDER_SAMPLE_SECONDS সেকেন্ড
+    starts = [float(cmd[i + 1]) for i, arg in enumerate(cmd) if arg == '-ss']
+    assert starts == pytest.approx([5.5, 20.5, 35.5, 50.5])
+    assert cmd.count('-crf') == 2 and cmd[cmd.index('-crf') + 1] == str(app.VIDEO_CRF)
+    # ফলাফল মিডিয়া তথ্যের ক্যাশে লেখা হয় এবং পরের বার ffmpeg চলে না
+    with open(os.path.join(tmp_path, app.MEDIA_INFO_FILENAME)) as f:
+        assert json.load(f)['complexity'] == result
+    assert app.measure_complexity('vid', source, media) == result
+    assert len(calls) == 1
+
+
+def test_measure_complexity_short_small_source(app, fake_encoder, tmp_path):
+    # পুরো ভিডিও একটি নমুনা এবং সোর্সের চেয়ে বড় নমুনার উচ্চতা বাদ
+    calls = fake_encoder({240: 150})
+    result = app.measure_complexity('vid', str(tmp_path / 'source.mp4'), {'duration': 10.0, 'height': 360})
+    assert result['points'] == [[240, 150.0]]
+    assert calls[0].count('-i') == 1 and calls[0][calls[0].index('-t') + 1] == '10.000'
+
+
+def test_measure_complexity_recomputes_for_other_crf(app, fake_encoder, tmp_path):
+    calls = fake_encoder({240: 100, 480: 200})
+    media = {'duration': 60.0, 'height': 1080, 'complexity': complexity((240, 1), (480, 2), crf=app.VIDEO_CRF + 5)}
+    assert app.measure_complexity('vid', str(tmp_path / 'source.mp4'), media)['points'] == [[240, 100.0], [480, 200.0]]
+    assert len(calls) == 1
+
+
+def test_measure_complexity_failure(app, monkeypatch, tmp_path):
+    def failing(cmd, **kwargs):
+        raise subprocess.CalledProcessError(1, cmd)
+    monkeypatch.setattr(app, 'run_ffmpeg', failing)
+    media = {'duration': 60.0, 'height': 1080}
+    assert app.measure_complexity('vid', str(tmp_path / 'source.mp4'), media) is None
+    assert 'complexity' not in media
+    assert app.measure_complexity('vid', str(tmp_path / 'source.mp4'), {'duration': None, 'height': 1080}) is None
+
+
+# === plan_per_title_ladder ===
+# মিডিয়া তথ্যে জটিলতা আগেই ক্যাশ করা থাকে, তাই ffmpeg চলে না
+
+@pytest.mark.parametrize('points, height, ladder', [
+    # exponent 1: 360p এর অনুমান 480p এর মাপ থেকে, 400 x (360/480)^2 x 1.5 = 337.5
+    ([(240, 100), (480, 400)], 1080,
+     [(360, '337k', '96k'), (480, '600k', '128k'), (720, '1350k', '128k'), (1080, '3037k', '160k')]),
+    # খুব জটিল ভিডিও: প্রতিটি রেজোলিউশন তার সর্বোচ্চ সীমায়
+    ([(240, 2000), (480, 8000)], 1080,
+     [(360, '1200k', '96k'), (480, '2000k', '128k'), (720, '4000k', '128k'), (1080, '7000k', '160k')]),
+    # স্থির স্লাইড: 1080p এর অনুমান (202.5k) 480p ও 720p এর সর্বনিম্ন বিটরেটেই এঁটে যায়, তাই মাঝের দুটি বাদ
+    ([(240, 30), (480, 60)], 1080,
+     [(360, '200k', '96k'), (1080, '1200k', '160k')]),
+    # কম জটিল: 720p বাদ (1080p এর অনুমান 303.75k < 600k), 480p থাকে (303.75k > 300k)
+    ([(240, 10), (480, 40)], 1080,
+     [(360, '200k', '96k'), (480, '300k', '128k'), (1080, '1200k', '160k')]),
+    # সোর্সের চেয়ে বড় রেজোলিউশন বাদ (সহনশীলতা 10 পিক্সেল)
+    ([(240, 100), (480, 400)], 720,
+     [(360, '337k', '96k'), (480, '600k', '128k'), (720, '1350k', '128k')]),
+    ([(240, 100), (480, 400)], 1440 - 10,
+     [(360, '337k', '96k'), (480, '600k', '128k'), (720, '1350k', '128k'), (1080, '3037k', '160k'), (1440, '5400k', '160k')]),
+    # একটিমাত্র রেজোলিউশন, একটি উচ্চতার মাপ (ডিফল্ট exponent 0.75): 100 x 1.5^1.5 x 1.5 = 275.6
+    ([(240, 100)], 360, [(360, '275k', '96k')]),
+])
+def test_plan_per_title_ladder(app, points, height, ladder):
+    media = {'duration': 60.0, 'height': height, 'complexity': complexity(*points, crf=app.VIDEO_CRF)}
+    assert app.plan_per_title_ladder('vid', '/nonexistent/source.mp4', media) == ladder
+
+
+def test_plan_per_title_ladder_headroom(app, monkeypatch):
+    monkeypatch.setattr(app, 'LADDER_PEAK_HEADROOM', 1.0)
+    media = {'duration': 60.0, 'height': 1080, 'complexity': complexity((240, 100), (480, 400), crf=app.VIDEO_CRF)}
+    assert [v for _, v, _ in app.plan_per_title_ladder('vid', '/nonexistent/source.mp4', media)] == ['225k', '400k', '900k', '2025k']
+
+
+def test_plan_per_title_ladder_source_below_smallest_rung(app):
+    media = {'duration': 60.0, 'height': 240, 'complexity': complexity((240, 100), crf=app.VIDEO_CRF)}
+    assert app.plan_per_title_ladder('vid', '/nonexistent/source.mp4', media) is None
+
+
+def test_plan_per_title_ladder_without_analysis(app, monkeypatch):
+    monkeypatch.setattr(app, 'measure_complexity', lambda video_id, input_path, media: None)
+    assert app.plan_per_title_ladder('vid', '/nonexistent/source.mp4', {'duration': 60.0, 'height': 1080}) is None
+
@@ -0,0 +1,202 @@
+"""জব কিউয়ের টেস্ট: কিউয়ের সীমা, অগ্রাধিকার অনুযায়ী জব নেওয়া (claim_next_job), এবং ব্যর্থ জবের
+ব্যাকঅফসহ আবার চেষ্টা (finish_job, retry_backoff), প্রতি হোস্টের সীমা এবং লিজ শেষ হওয়া জব উদ্ধার
+(recover_orphaned_jobs)। সব টেস্ট conftest এর অস্থায়ী JOBS_DB_PATH ব্যবহার করে।"""
+import subprocess
+import sys
+import time
+
+import pytest
+
+
+def add_job(app, hls_dir, video_id, priority=0, enqueued_at=None):
+    app.enqueue_job(video_id, f'/uploads/{video_id}/source.mp4', str(hls_dir / video_id), priority=priority)
+    if enqueued_at is not None:
+        app.get_db().execute("UPDATE jobs SET enqueued_at = ? WHERE video_id = ?", (enqueued_at, video_id))
+
+
+def claim(app):
+    job = app.claim_next_job()
+    return job['video_id'] if job is not None else None
+
+
+# === Queue bound & order ===
+
+def test_queue_bound(app, hls_dir, job_db, monkeypatch):
+    monkeypatch.setattr(app, 'JOB_QUEUE_MAX', 2)
+    add_job(app, hls_dir, 'a')
+    add_job(app, hls_dir, 'b')
+    with pytest.raises(app.QueueFullError):
+        add_job(app, hls_dir, 'c')
+    assert app.get_job('c') is None
+    # শুধু অপেক্ষমাণ জব গোনা হয়; একটি প্রসেসিংয়ে গেলে আবার জায়গা হয়
+    assert claim(app) == 'a'
+    add_job(app, hls_dir, 'c')
+    assert app.queue_depth() == 2
+
+
+def test_claim_order_priority_then_fifo(app, hls_dir, job_db, monkeypatch):
+    monkeypatch.setattr(app, 'TRANSCODE_WORKERS', 10)
+    now = time.time()
+    add_job(app, hls_dir, 'old', enqueued_at=now - 30)
+    add_job(app, hls_dir, 'new', enqueued_at=now - 10)
+    add_job(app, hls_dir, 'urgent', priority=10, enqueued_at=now)
+    add_job(app, hls_dir, 'ingest', priority=-1, enqueued_at=now - 60)
+
+    assert [app.get_queue_position(v) for v in ('urgent', 'old', 'new', 'ingest')] == [1, 2, 3, 4]
+    assert [claim(app) for _ in range(5)] == ['urgent', 'old', 'new', 'ingest', None]
+    assert app.get_queue_position('old') is None # আর অপেক্ষমাণ নয়
+
+
+def test_claim_records_owner_and_attempt(app, hls_dir, job_db):
+    add_job(app, hls_dir, 'vid')
+    job = app.claim_next_job()
+    assert job['state'] == app.JOB_STATE_QUEUED # নেওয়ার আগের রেকর্ড রিটার্ন হয়
+    row = app.get_job('vid')
+    assert row['state'] == app.JOB_STATE_PROCESSING and row['attempts'] == 1
+    assert row['owner_host'] == app.HOSTNAME
+    assert row['lease_expires_at'] == pytest.approx(time.time() + app.JOB_LEASE_SECONDS, abs=5)
+
+
+# === Retry backoff ===
+
+@pytest.mark.parametrize('attempts, delay', [(0, 30), (1, 30), (2, 60), (3, 120), (5, 480), (6, 900), (20, 900)])
+def test_retry_backoff(app, monkeypatch, attempts, delay):
+    monkeypatch.setattr(app, 'JOB_RETRY_BACKOFF', 30)
+    monkeypatch.setattr(app, 'JOB_RETRY_BACKOFF_MAX', 900)
+    assert app.retry_backoff(attempts) == delay
+
+
+def test_failed_job_waits_for_backoff_then_retries(app, hls_dir, job_db, monkeypatch):
+    monkeypatch.setattr(app, 'JOB_MAX_ATTEMPTS', 2)
+    add_job(app, hls_dir, 'vid')
+    assert claim(app) == 'vid'
+    app.set_job_error('vid', 'ffmpeg failed')
+
+    assert app.finish_job('vid', False) is False # চূড়ান্ত নয়, আবার চেষ্টা হবে
+    job = app.get_job('vid')
+    assert job['state'] == app.JOB_STATE_QUEUED
+    assert job['retry_at'] == pytest.approx(time.time() + app.retry_backoff(1), abs=5)
+    assert job['error'] == 'ffmpeg failed' # অপেক্ষার সময় কারণটি দেখা যায়
+    assert claim(app) is None # ব্যাকঅফ চলছে
+
+    job_db.execute("UPDATE jobs SET retry_at = ? WHERE video_id = 'vid'", (time.time() - 1,))
+    assert claim(app) == 'vid'
+    job = app.get_job('vid')
+    assert job['attempts'] == 2 and job['retry_at'] is None and job['error'] is None
+
+    # সর্বোচ্চ চেষ্টার পর চূড়ান্ত ব্যর্থতা
+    assert app.finish_job('vid', False) is True
+    job = app.get_job('vid')
+    assert job['state'] == app.JOB_STATE_ERROR and job['error'] and job['finished_at']
+
+
+def test_backoff_does_not_block_other_jobs(app, hls_dir, job_db, monkeypatch):
+    monkeypatch.setattr(app, 'TRANSCODE_WORKERS', 10)
+    now = time.time()
+    add_job(app, hls_dir, 'waiting', priority=5, enqueued_at=now - 60)
+    job_db.execute("UPDATE jobs SET retry_at = ? WHERE video_id = 'waiting'", (now + 600,))
+    add_job(app, hls_dir, 'next', enqueued_at=now)
+    assert claim(app) == 'next'
+
+
+def test_successful_job_is_ready(app, hls_dir, job_db):
+    add_job(app, hls_dir, 'vid')
+    claim(app)
+    assert app.finish_job('vid', True) is True
+    job = app.get_job('vid')
+    assert job['state'] == app.JOB_STATE_READY and job['error'] is None and job['lease_expires_at'] is None
+
+
+# === Per-host limit & leases ===
+
+def set_owner(conn, video_id, **fields):
+    assignments = ', '.join(f'{name} = ?' for name in fields)
+    conn.execute(f"UPDATE jobs SET {assignments} WHERE video_id = ?", (*fields.values(), video_id))
+
+
+def dead_pid():
+    """এমন একটি PID রিটার্ন করে যার প্রসেস আর বেঁচে নেই।"""
+    proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+    proc.wait()
+    return proc.pid
+
+
+def test_per_host_concurrency_limit(app, hls_dir, job_db, monkeypatch):
+    monkeypatch.setattr(app, 'TRANSCODE_WORKERS', 1)
+    now = time.time()
+    for i, video_id in enumerate(('a', 'b', 'c')):
+        add_job(app, hls_dir, video_id, enqueued_at=now + i)
+    assert claim(app) == 'a'
+    assert claim(app) is None # এই হোস্টের সব স্লট ভর্তি
+
+    # অন্য হোস্টের চলমান জব এই হোস্টের সীমায় গোনা হয় না
+    set_owner(job_db, 'a', owner_host='other-host')
+    assert app.running_job_count(app.HOSTNAME) == 0 and app.running_job_count() == 1
+    assert claim(app) == 'b'
+    assert claim(app) is None
+    app.finish_job('b', True)
+    assert claim(app) == 'c'
+
+
+def test_expired_lease_is_reclaimed_with_backoff(app, hls_dir, job_db):
+    add_job(app, hls_dir, 'vid')
+    claim(app)
+    set_owner(job_db, 'vid', owner_host='other-host', lease_expires_at=time.time() - 1)
+
+    assert app.recover_orphaned_jobs() == 1
+    job = app.get_job('vid')
+    assert job['state'] == app.JOB_STATE_QUEUED
+    assert job['retry_at'] == pytest.approx(time.time() + app.retry_backoff(1), abs=5)
+    assert app.claim_next_job() is None # ব্যাকঅফ শেষ না হওয়া পর্যন্ত কেউ নেয় না
+
+
+def test_valid_lease_on_other_host_is_left_alone(app, hls_dir, job_db):
+    add_job(app, hls_dir, 'vid')
+    claim(app)
+    set_owner(job_db, 'vid', owner_host='other-host', owner_pid=1)
+    assert app.recover_orphaned_jobs() == 0
+    assert app.get_job('vid')['state'] == app.JOB_STATE_PROCESSING
+
+
+def test_dead_process_on_this_host_is_reclaimed_before_lease_expiry(app, hls_dir, job_db):
+    add_job(app, hls_dir, 'vid')
+    claim(app)
+    assert app.recover_orphaned_jobs() == 0 # নিজের জীবিত প্রসেস
+    set_owner(job_db, 'vid', owner_pid=dead_pid())
+    assert app.get_job('vid')['lease_expires_at'] > time.time()
+    assert app.recover_orphaned_jobs() == 1
+    assert app.get_job('vid')['state'] == app.JOB_STATE_QUEUED
+
+
+def test_reclaim_after_max_attempts_marks_error(app, hls_dir, job_db):
+    add_job(app, hls_dir, 'vid')
+    claim(app)
+    set_owner(job_db, 'vid', attempts=app.JOB_MAX_ATTEMPTS, lease_expires_at=time.time() - 1)
+    assert app.recover_orphaned_jobs() == 1
+    job = app.get_job('vid')
+    assert job['state'] == app.JOB_STATE_ERROR and job['error']
+
+
+def test_stale_owner_cannot_finish_reclaimed_job(app, hls_dir, job_db):
+    add_job(app, hls_dir, 'vid')
+    claim(app)
+    # লিজ হারানোর পর অন্য হোস্ট জবটি নিয়ে নিয়েছে
+    set_owner(job_db, 'vid', owner_host='other-host', owner_pid=1234)
+    assert app.finish_job('vid', True) is False
+    job = app.get_job('vid')
+    assert job['state'] == app.JOB_STATE_PROCESSING and job['owner_host'] == 'other-host'
+
+
+def test_renew_job_leases_only_touches_own_jobs(app, hls_dir, job_db, monkeypatch):
+    monkeypatch.setattr(app, 'TRANSCODE_WORKERS', 10)
+    add_job(app, hls_dir, 'mine')
+    add_job(app, hls_dir, 'theirs')
+    claim(app)
+    claim(app)
+    soon = time.time() + 5
+    set_owner(job_db, 'mine', lease_expires_at=soon)
+    set_owner(job_db, 'theirs', owner_host='other-host', lease_expires_at=soon)
+
+    app.renew_job_leases()
+    assert app.get_job('mine')['lease_expires_at'] == pytest.approx(time.time() + app.JOB_LEASE_SECONDS, abs=5)
+    assert app.get_job('theirs')['lease_expires_at'] == soon
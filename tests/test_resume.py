@@ -0,0 +1,131 @@
+"""আগের চেষ্টার আউটপুট থেকে চালিয়ে যাওয়ার (plan_resume, _group_resumable) টেস্ট।
+
+আগের চেষ্টার প্লেলিস্ট, সেগমেন্ট ও স্টেট ফাইল হাতে লেখা ফিক্সচার।
+"""
+import json
+
+from conftest import RENDITION_360, RENDITION_720, write_playlist
+
+
+# === _group_resumable ===
+
+def segments(*durations):
+    return [(d, [f'#EXTINF:{d:.6f},', f'seg{i}.ts']) for i, d in enumerate(durations)]
+
+
+def test_group_resumable_empty(app):
+    assert app._group_resumable({}) == []
+
+
+def test_group_resumable_trims_aligned_renditions_to_slowest(app):
+    groups = app._group_resumable({'360': (3, segments(6, 6, 6, 6)), '720': (3, segments(6, 6, 6))})
+    assert len(groups) == 1
+    start, group = groups[0]
+    assert start == 18
+    assert group['360'] == (3, segments(6, 6, 6))
+    assert group['720'] == (3, segments(6, 6, 6))
+
+
+def test_group_resumable_unaligned_renditions_resume_separately(app):
+    groups = app._group_resumable({'360': (3, segments(6, 6, 6, 6)), '720': (3, segments(5, 5, 5, 5, 5))})
+    assert [(start, sorted(group)) for start, group in groups] == [(24, ['360']), (25, ['720'])]
+    assert groups[1][1]['720'] == (3, segments(5, 5, 5, 5, 5)) # নিজের পুরো অংশ থেকে চলে
+
+
+def test_group_resumable_tolerates_rounding(app):
+    groups = app._group_resumable({'360': (3, segments(6.0, 6.0)), '720': (3, segments(6.04, 6.04, 6.0))})
+    assert len(groups) == 1
+    assert len(groups[0][1]['720'][1]) == 2
+
+
+# === plan_resume ===
+
+def write_state(app, output_dir, renditions, complete=()):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    state = {'renditions': {r['name']: {'signature': app.rendition_signature(r), 'complete': r['name'] in complete, 'rendition': r}
+                            for r in renditions}}
+    (output_dir / app.TRANSCODE_STATE_FILENAME).write_text(json.dumps(state))
+
+
+def write_output(output_dir, name, count, ended, missing=()):
+    """count টি 6 সেকেন্ডের সেগমেন্টসহ একটি রেজোলিউশনের আগের আউটপুট লেখে (missing এর ফাইলগুলো বাদে)।"""
+    write_playlist(output_dir / name / 'playlist.m3u8', [(6.0, f'seg{i}.ts', ()) for i in range(count)], ended=ended)
+    for i in range(count):
+        if i not in missing:
+            (output_dir / name / f'seg{i}.ts').write_bytes(b'x')
+
+
+def fresh(rendition, **changes):
+    return dict(rendition, **changes)
+
+
+def test_plan_resume_keeps_complete_rendition(app, output_dir):
+    previous = fresh(RENDITION_360, bandwidth=900000, passthrough=True)
+    write_state(app, output_dir, [previous], complete={'360'})
+    write_output(output_dir, '360', 5, ended=True)
+    (output_dir / 'master.m3u8').write_text('#EXTM3U\n')
+
+    rendition = fresh(RENDITION_360)
+    complete, groups = app.plan_resume('vid', str(output_dir), [rendition], 30.0)
+    assert complete == [rendition] and groups == []
+    assert rendition['bandwidth'] == 900000 and rendition['passthrough'] # আগের পরিকল্পনা ফিরে আসে
+    assert sorted(p.name for p in (output_dir / '360').iterdir()) == ['playlist.m3u8'] + [f'seg{i}.ts' for i in range(5)]
+    assert not (output_dir / 'master.m3u8').exists() # মাস্টার আবার লেখা হবে
+    state = json.loads((output_dir / app.TRANSCODE_STATE_FILENAME).read_text())
+    assert state['renditions']['360']['complete'] is True
+
+
+def test_plan_resume_continues_after_last_intact_segment(app, output_dir):
+    write_state(app, output_dir, [RENDITION_360])
+    write_output(output_dir, '360', 8, ended=False, missing={6})
+    (output_dir / '360' / 'seg7.ts.tmp').write_bytes(b'x')
+
+    complete, groups = app.plan_resume('vid', str(output_dir), [fresh(RENDITION_360)], 120.0)
+    assert complete == []
+    assert [(start, sorted(group)) for start, group in groups] == [(36.0, ['360'])]
+    assert len(groups[0][1]['360'][1]) == 6
+    # রাখা সেগমেন্টের পরের ফাইলগুলো মুছে যায়
+    assert sorted(p.name for p in (output_dir / '360').iterdir()) == ['playlist.m3u8'] + [f'seg{i}.ts' for i in range(6)]
+
+
+def test_plan_resume_aligns_renditions(app, output_dir):
+    write_state(app, output_dir, [RENDITION_360, RENDITION_720])
+    write_output(output_dir, '360', 7, ended=False)
+    write_output(output_dir, '720', 5, ended=False)
+
+    complete, groups = app.plan_resume('vid', str(output_dir), [fresh(RENDITION_360), fresh(RENDITION_720)], 120.0)
+    assert [(start, sorted(group)) for start, group in groups] == [(30.0, ['360', '720'])]
+    assert not (output_dir / '360' / 'seg5.ts').exists() # 30 সেকেন্ডের পরের অংশ ছেঁটে ফেলা
+    assert (output_dir / '360' / 'seg4.ts').exists()
+
+
+def test_plan_resume_discards_too_little_progress(app, output_dir):
+    write_state(app, output_dir, [RENDITION_360])
+    write_output(output_dir, '360', 4, ended=False) # 24 সেকেন্ড < RESUME_MIN_SECONDS
+
+    complete, groups = app.plan_resume('vid', str(output_dir), [fresh(RENDITION_360)], 120.0)
+    assert complete == [] and groups == []
+    assert list((output_dir / '360').iterdir()) == []
+
+
+def test_plan_resume_restarts_when_settings_changed(app, output_dir):
+    write_state(app, output_dir, [RENDITION_360], complete={'360'})
+    write_output(output_dir, '360', 5, ended=True)
+
+    rendition = fresh(RENDITION_360, v_bitrate='1200k')
+    complete, groups = app.plan_resume('vid', str(output_dir), [rendition], 30.0)
+    assert complete == [] and groups == []
+    assert list((output_dir / '360').iterdir()) == []
+    state = json.loads((output_dir / app.TRANSCODE_STATE_FILENAME).read_text())
+    assert state['renditions']['360']['signature'] == app.rendition_signature(rendition)
+
+
+def test_plan_resume_rejects_truncated_byte_range(app, output_dir):
+    write_state(app, output_dir, [RENDITION_360])
+    write_playlist(output_dir / '360' / 'playlist.m3u8',
+                   [(6.0, 'media.ts', [f'#EXT-X-BYTERANGE:100@{i * 100}']) for i in range(8)])
+    (output_dir / '360' / 'media.ts').write_bytes(b'x' * 650) # সেগমেন্ট 6 এর মাঝপথে কাটা
+
+    complete, groups = app.plan_resume('vid', str(output_dir), [fresh(RENDITION_360)], 120.0)
+    assert [(start, len(group['360'][1])) for start, group in groups] == [(36.0, 6)]
+    assert (output_dir / '360' / 'media.ts').exists()
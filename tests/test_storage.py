@@ -0,0 +1,194 @@
+"""স্টোরেজ লাইফসাইকেলের টেস্ট: ডিস্কের বাজেটে কম দেখা রেজোলিউশন আগে সরানো (evict_rendition,
+enforce_storage_budget), মাস্টার প্লেলিস্ট আবার লেখা, পুরো ভিডিও 'evicted' হওয়া এবং আবার চাওয়া হলে
+কিউতে পাঠানো (request_regeneration)।"""
+import math
+import os
+import time
+
+import pytest
+
+import storage
+from conftest import RENDITION_360, RENDITION_720, write_playlist, write_source
+
+SIZES = {'360': 1000, '720': 4000} # প্রতিটি রেজোলিউশনের সেগমেন্টের মোট বাইট
+
+
+def rendition(base):
+    width = base['height'] * 16 // 9
+    return dict(base, width=width, bandwidth=(int(base['v_bitrate'][:-1]) + int(base['a_bitrate'][:-1])) * 1000)
+
+
+@pytest.fixture
+def make_ready_video(app, hls_dir, upload_dir, job_db):
+    """360p ও 720p সহ একটি রেডি ভিডিও (সোর্স, সেগমেন্ট, মাস্টার প্লেলিস্ট, স্টেট ফাইল ও ডিস্কের হিসাব) তৈরি করে।"""
+    def make(video_id, last_access):
+        source = write_source(upload_dir / video_id, b'\0' * 100)
+        output = hls_dir / video_id
+        renditions = [rendition(RENDITION_360), rendition(RENDITION_720)]
+        for entry in renditions:
+            write_playlist(output / entry['playlist_path'], [(6.0, 'seg0.ts', [])], ended=True)
+            (output / entry['name'] / 'seg0.ts').write_bytes(b'\0' * SIZES[entry['name']])
+        app.write_master_playlist(video_id, str(output), renditions)
+        app.mark_renditions_complete(str(output), renditions)
+        app.enqueue_job(video_id, source, str(output))
+        job_db.execute("UPDATE jobs SET state = ?, finished_at = ? WHERE video_id = ?",
+                       (app.JOB_STATE_READY, last_access, video_id))
+        storage.account_video_storage(video_id, str(output), source, last_access)
+        return output
+    return make
+
+
+def usage(conn, video_id):
+    return {row['item']: (row['kind'], row['evicted_at'] is not None) for row in conn.execute(
+        "SELECT item, kind, evicted_at FROM storage_usage WHERE video_id = ?", (video_id,))}
+
+
+def touch(conn, video_id, item, when):
+    conn.execute("UPDATE storage_usage SET last_access = ? WHERE video_id = ? AND item = ?", (when, video_id, item))
+
+
+def test_accounting_by_kind(make_ready_video, job_db):
+    make_ready_video('vid', time.time())
+    assert usage(job_db, 'vid') == {'@source': ('source', False), '360': ('rendition', False),
+                                    '720': ('rendition', False), '@hls': ('other', False)}
+    sizes = dict(job_db.execute("SELECT item, bytes FROM storage_usage WHERE video_id = 'vid'").fetchall())
+    assert sizes['@source'] == 100
+    assert sizes['720'] > SIZES['720'] and sizes['360'] > SIZES['360'] # সেগমেন্ট ও প্লেলিস্ট
+
+
+def test_evicting_one_rendition_rewrites_master_playlist(app, make_ready_video, job_db):
+    output = make_ready_video('vid', time.time() - 7200)
+    app.hls_cache.lookup('vid', app.MASTER_PLAYLIST_NAME) # ক্যাশে তুলুন
+
+    freed = storage.evict_rendition('vid', '720')
+
+    assert freed == job_db.execute("SELECT bytes FROM storage_usage WHERE video_id = 'vid' AND item = '720'").fetchone()[0]
+    assert not (output / '720').exists() and (output / '360' / 'seg0.ts').exists()
+    master = (output / app.MASTER_PLAYLIST_NAME).read_text()
+    assert '360/playlist.m3u8' in master and '720' not in master
+    # সার্ভিং ক্যাশ পুরনো মাস্টার প্লেলিস্ট দেয় না
+    assert b'720' not in app.hls_cache.lookup('vid', app.MASTER_PLAYLIST_NAME)['body']
+    assert app.get_job('vid')['state'] == app.JOB_STATE_READY
+    assert usage(job_db, 'vid')['720'] == ('rendition', True)
+    # একই রেজোলিউশন দুবার সরানো যায় না (আরেক প্রসেস আগেই সরিয়েছে)
+    assert storage.evict_rendition('vid', '720') == 0
+
+
+def test_evicting_last_rendition_evicts_whole_video(app, make_ready_video, job_db):
+    output = make_ready_video('vid', time.time() - 7200)
+    storage.evict_rendition('vid', '720')
+    storage.evict_rendition('vid', '360')
+
+    assert app.get_job('vid')['state'] == app.JOB_STATE_EVICTED
+    # ডিরেক্টরি ও স্টেট ফাইল থাকে (ডুপ্লিকেটের symlink ও পরের চেষ্টার জন্য), বাকি সব মুছে যায়
+    assert sorted(os.listdir(output)) == [app.TRANSCODE_STATE_FILENAME]
+    assert usage(job_db, 'vid') == {'@source': ('source', False), '360': ('rendition', True),
+                                    '720': ('rendition', True), '@hls': ('other', True)}
+
+
+def test_evict_skips_jobs_that_are_not_ready(app, make_ready_video, job_db):
+    output = make_ready_video('vid', time.time() - 7200)
+    job_db.execute("UPDATE jobs SET state = ? WHERE video_id = 'vid'", (app.JOB_STATE_PROCESSING,))
+    assert storage.evict_rendition('vid', '720') == 0
+    assert (output / '720').exists()
+
+
+def test_budget_evicts_least_recently_used_first(app, make_ready_video, job_db, monkeypatch):
+    now = time.time()
+    make_ready_video('a', now - 7200)
+    make_ready_video('b', now - 7200)
+    touch(job_db, 'a', '720', now - 9000) # সবচেয়ে পুরনো
+    touch(job_db, 'b', '360', now - 8000)
+    touch(job_db, 'a', '360', now - 5000)
+    touch(job_db, 'b', '720', now - 4000)
+    used = storage.storage_used_bytes()
+
+    # বাজেট সামান্য পেরোলে শুধু সবচেয়ে পুরনোটি (বাজেটের STORAGE_EVICT_TARGET অংশে নামা পর্যন্ত)
+    monkeypatch.setattr(storage, 'STORAGE_BUDGET_BYTES', used - 1)
+    assert storage.enforce_storage_budget() > 0
+    assert [(video_id, item) for video_id in 'ab' for item, (_, gone) in usage(job_db, video_id).items() if gone] == [('a', '720')]
+
+    # আরও কম বাজেট, ঠিক পরের দুটির (b/360, তারপর a/360) জায়গা খালি করার মতো; a এর শেষ রেজোলিউশন
+    # গেলে a এর উপরের স্তরের ফাইলও যায়, এবং সবচেয়ে সম্প্রতি দেখা b/720 থাকে
+    sizes = {(row['video_id'], row['item']): row['bytes'] for row in job_db.execute("SELECT * FROM storage_usage")}
+    needed = sizes[('b', '360')] + sizes[('a', '360')] + sizes[('a', '@hls')]
+    target = storage.storage_used_bytes() - needed
+    monkeypatch.setattr(storage, 'STORAGE_BUDGET_BYTES', math.ceil(target / storage.STORAGE_EVICT_TARGET) + 1)
+    assert storage.enforce_storage_budget() == needed
+    assert usage(job_db, 'b') == {'@source': ('source', False), '360': ('rendition', True),
+                                  '720': ('rendition', False), '@hls': ('other', False)}
+    assert app.get_job('a')['state'] == app.JOB_STATE_EVICTED
+    assert app.get_job('b')['state'] == app.JOB_STATE_READY
+    # সোর্স কখনো সরানো হয় না; বাজেটের নিচে নামা সম্ভব না হলে শুধু সতর্কবার্তা
+    assert usage(job_db, 'a')['@source'] == ('source', False)
+
+
+def test_budget_skips_recently_watched(app, make_ready_video, job_db, monkeypatch):
+    make_ready_video('vid', time.time())
+    monkeypatch.setattr(storage, 'STORAGE_BUDGET_BYTES', 1)
+    assert storage.enforce_storage_budget() == 0
+    assert app.get_job('vid')['state'] == app.JOB_STATE_READY
+
+
+def test_access_tracker_updates_last_access(app, make_ready_video, job_db):
+    storage.storage_access.flush() # আগের টেস্টের সার্ভিং রিকোয়েস্টে জমা হওয়া অ্যাক্সেস
+    make_ready_video('vid', time.time() - 7200)
+    storage.storage_access.touch('vid', '720/seg0.ts')
+    storage.storage_access.touch('vid', app.MASTER_PLAYLIST_NAME) # উপরের স্তরের ফাইল গোনা হয় না
+    storage.storage_access.flush()
+    accessed = dict(job_db.execute("SELECT item, last_access FROM storage_usage WHERE video_id = 'vid'").fetchall())
+    assert accessed['720'] > time.time() - 60
+    assert accessed['360'] < time.time() - 3600
+
+
+def test_request_regeneration_requeues_evicted_video(app, make_ready_video, job_db):
+    make_ready_video('vid', time.time() - 7200)
+    job_db.execute("UPDATE jobs SET attempts = 2, error = 'old' WHERE video_id = 'vid'")
+    storage.evict_rendition('vid', '720')
+    assert storage.request_regeneration('vid') is False # এখনও রেডি
+
+    storage.evict_rendition('vid', '360')
+    assert storage.request_regeneration('vid') is True
+    job = app.get_job('vid')
+    assert job['state'] == app.JOB_STATE_QUEUED
+    assert job['priority'] == storage.STORAGE_REGENERATE_PRIORITY
+    assert job['attempts'] == 0 and job['error'] is None
+    assert storage.request_regeneration('vid') is False # ইতিমধ্যে কিউতে
+
+
+def test_master_playlist_request_triggers_regeneration(app, make_ready_video, job_db, client):
+    make_ready_video('vid', time.time() - 7200)
+    storage.evict_rendition('vid', '720')
+    storage.evict_rendition('vid', '360')
+
+    response = client.get(f'/hls/vid/{app.MASTER_PLAYLIST_NAME}')
+
+    assert response.status_code == 503 and 'Retry-After' in response.headers
+    assert app.get_job('vid')['state'] == app.JOB_STATE_QUEUED
+
+
+def test_deleted_source_is_never_evicted(app, make_ready_video, job_db, monkeypatch):
+    output = make_ready_video('vid', time.time() - 7200)
+    source = app.get_job('vid')['source_path']
+    monkeypatch.setattr(storage, 'SOURCE_RETENTION', 'delete')
+
+    storage.update_video_storage('vid', source, str(output))
+
+    assert not os.path.exists(source)
+    assert '@source' not in usage(job_db, 'vid')
+    job_db.execute("UPDATE storage_usage SET last_access = ? WHERE video_id = 'vid'", (time.time() - 7200,))
+    monkeypatch.setattr(storage, 'STORAGE_BUDGET_BYTES', 1)
+    assert storage.enforce_storage_budget() == 0
+    assert (output / '720' / 'seg0.ts').exists()
+    assert app.get_job('vid')['state'] == app.JOB_STATE_READY
+
+
+def test_regeneration_without_source_fails_job(app, make_ready_video, job_db):
+    make_ready_video('vid', time.time() - 7200)
+    storage.evict_rendition('vid', '720')
+    storage.evict_rendition('vid', '360')
+    os.remove(app.get_job('vid')['source_path'])
+
+    assert storage.request_regeneration('vid') is False
+    job = app.get_job('vid')
+    assert job['state'] == app.JOB_STATE_ERROR and job['error']
@@ -0,0 +1,56 @@
+"""স্বতন্ত্র ট্রান্সকোডিং ওয়ার্কার।
+
+ওয়েব সার্ভার (gunicorn) RUN_EMBEDDED_WORKERS=0 দিয়ে চালালে সেটি শুধু জব কিউতে যোগ করে, আর এই কমান্ড
+শেয়ার করা জব ডাটাবেস (JOBS_DB_PATH) থেকে লিজসহ জব নিয়ে run_processing_job চালায়। একই হোস্টে একাধিক
+ওয়ার্কার চালানো যায়; প্রতি হোস্টে একসাথে চলা জবের সীমা TRANSCODE_WORKERS।
+
+একাধিক হোস্টে চালাতে uploads, static/hls ও জব ডাটাবেস সব হোস্টের শেয়ার করা স্টোরেজে থাকতে হবে এবং সব
+প্রসেসে JOBS_DB_SHARED=1 দিতে হবে: ডিফল্ট WAL মোড একাধিক হোস্ট থেকে একই SQLite ফাইলে নিরাপদ নয়। শেয়ার করা
+স্টোরেজে ঠিকমতো POSIX ফাইল লক কাজ না করলে (অনেক NFS সেটআপ) একাধিক হোস্টে চালানো সমর্থিত নয়।
+
+ব্যবহার:
+    RUN_EMBEDDED_WORKERS=0 gunicorn --bind 0.0.0.0:8000 app:app   # ওয়েব টিয়ার
+    python worker.py [--concurrency N]                              # ট্রান্সকোডিং টিয়ার
+
+প্রথম SIGTERM/SIGINT এ ওয়ার্কার নতুন জব নেওয়া বন্ধ করে এবং চলমান জবগুলো শেষ করে থামে; দ্বিতীয়টিতে
+সাথে সাথে বেরিয়ে যায় (অসম্পূর্ণ জবগুলো লিজের মেয়াদ শেষে অন্য ওয়ার্কার আবার কিউতে পাঠায়)।
+"""
+import argparse
+import logging
+import os
+import signal
+import sys
+
+# app ইমপোর্ট করার সময় ওয়েব প্রসেসের মতো নিজে থেকে ওয়ার্কার থ্রেড চালু হবে না; এখানে নিচে চালু করা হবে
+os.environ['RUN_EMBEDDED_WORKERS'] = '0'
+
+import app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="শেয়ার করা জব কিউ থেকে ভিডিও ট্রান্সকোডিং জব প্রসেস করে।")
+    parser.add_argument('--concurrency', type=int, default=app.TRANSCODE_WORKERS,
+                        help="এই প্রসেসে একসাথে কতগুলো জব চলবে (ডিফল্ট: TRANSCODE_WORKERS)")
+    args = parser.parse_args()
+
+    if not app.tool_available('ffmpeg'):
+        logging.critical("ffmpeg উপলব্ধ নেই; ওয়ার্কার চালু করা সম্ভব নয়।")
+        return 1
+
+    def handle_signal(signum, frame):
+        if app._workers_stop.is_set():
+            logging.warning("আবার থামার সিগন্যাল পাওয়া গেছে; চলমান জব শেষ না করেই বের হওয়া হচ্ছে।")
+            os._exit(1)
+        logging.info("থামার সিগন্যাল পাওয়া গেছে; নতুন জব নেওয়া বন্ধ, চলমান জবগুলো শেষ হওয়ার অপেক্ষা...")
+        app.stop_transcode_workers()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    logging.info(f"ট্রান্সকোডিং ওয়ার্কার চালু হচ্ছে (হোস্ট: {app.HOSTNAME}, PID: {os.getpid()}, জব ডাটাবেস: {app.JOBS_DB_PATH})...")
+    app.run_transcode_workers(args.concurrency)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())